@@ -490,7 +490,7 @@ class Base(object):
 
             for curName, curMode, curOptions in waveclients2Add:
                 if curMode == 'psysmonDb':
-                    waveclient = PsysmonDbWaveClient(curName, self.project)
+                    waveclient = PsysmonDbWaveClient(curName, self.project, **curOptions)
                 elif curMode == 'earthworm':
                     waveclient = EarthwormWaveclient(name=curName, **curOptions)
                 else:
@@ -513,8 +513,10 @@ class Base(object):
         Close a pSysmon project.
 
         Close the currently active project by setting the project attribute to 
-        None.
+        None. The waveclients of the project are closed.
         '''
+        if self.project:
+            self.project.close_waveclients()
         del(self.project)
         self.project = None
 
@@ -95,7 +95,7 @@ if __name__ == "__main__":
 
     for curName, curMode, curAttributes in waveclients:
         if curMode == 'PsysmonDbWaveClient':
-            waveclient = PsysmonDbWaveClient(curName, project)
+            waveclient = PsysmonDbWaveClient(curName, project, **curAttributes)
         elif curMode == 'EarthwormWaveclient':
             waveclient = EarthwormWaveclient(curName, **curAttributes)
         else:
@@ -32,6 +32,7 @@ Utility functions to interact with the database.
 import sqlalchemy as sqa
 import logging
 import re
+import numpy as np
 
 logger_name = __name__
 logger = logging.getLogger(logger_name)
@@ -78,6 +79,9 @@ def update_db_table(engine, table, metadata, prefix):
                        table = table,
                        column = new_table.columns[cur_col],
                        prefix = prefix)
+            fill_column(engine = engine,
+                        table = table,
+                        column = new_table.columns[cur_col])
 
         table_updated = True
 
@@ -153,9 +157,20 @@ def update_db_table(engine, table, metadata, prefix):
         if isinstance(cur_const, sqa.schema.PrimaryKeyConstraint):
             logger.error("Changing a primary key is not supported. (%s)", cur_const)
             continue
+        if not isinstance(cur_const, sqa.schema.UniqueConstraint):
+            # The foreign keys are handled with the columns.
+            continue
         add_unique_constraint(engine, table, cur_const)
         table_updated = True
 
+    # Check for missing indexes.
+    exist_indexes = [x['name'] for x in insp.get_indexes(exist_table.name)]
+    for cur_index in new_table.indexes:
+        if cur_index.name not in exist_indexes:
+            logger.info('Adding index %s to table %s.', cur_index.name, new_table.name)
+            cur_index.create(engine)
+            table_updated = True
+
     return table_updated
 
 
@@ -175,6 +190,25 @@ def add_column(engine, table, column, prefix):
                         column = column,
                         target = prefix + cur_key.target_fullname)
 
+def fill_column(engine, table, column):
+    ''' Set the values of a column added to an existing table.
+
+    If the info dictionary of the column contains the key
+    'migration_value', the column values of the existing rows are set using
+    the expression returned by the info value. The info value is a
+    function accepting the sqlalchemy table and returning the expression.
+    '''
+    if 'migration_value' not in column.info:
+        return
+
+    db_table = table.__table__
+    value = column.info['migration_value'](db_table)
+    logger.info('Setting the values of column %s in table %s.', column.name, db_table.name)
+    engine.execute(db_table.update().\
+                   where(db_table.c[column.name] == None).\
+                   values({column.name: value}))
+
+
 def remove_column(engine, table, column):
     ''' Remove a column from the database table.
     '''
@@ -265,3 +299,196 @@ def compare_column_type(col1, col2):
     return is_equal
 
 
+
+
+def bulk_write(engine, table, rows, chunk_size = None, return_ids = False):
+    ''' Insert and update the rows of a table in bulk.
+
+    Rows with an id equal to None are inserted, the other rows update the
+    existing rows with the same id. All rows of a chunk are written in one
+    transaction. The inserts and the updates are executed as executemany
+    statements. The ids assigned by an executemany insert can't be fetched
+    portably. So if the ids are requested, they are allocated following the
+    largest existing id, which is selected with a lock preventing
+    concurrent inserts until the transaction of the chunk is committed, and
+    the rows are inserted with these ids.
+
+    When the transaction of a chunk is committed, the assigned ids are
+    written to the id field of the inserted row dictionaries. So if a later
+    chunk fails, the ids of the already written rows are available to the
+    caller.
+
+    Parameters
+    ----------
+    engine : :class:`sqlalchemy.engine.Engine`
+        The database engine.
+
+    table : SQLAlchemy ORM class
+        The mapper class of the database table.
+
+    rows : List of dict
+        The column values of the rows. Each row has to contain the key 'id'.
+        All rows to insert and all rows to update have to contain the same
+        keys.
+
+    chunk_size : Integer
+        The number of rows written in one transaction. If None, all rows
+        are written in one transaction.
+
+    return_ids : Boolean
+        If True, the ids of the inserted rows are allocated and returned.
+
+    Returns
+    -------
+    ids : List of Integer
+        The ids of the rows in the order of the rows. None for inserted rows
+        if return_ids is False.
+    '''
+    db_table = table.__table__
+    if not chunk_size:
+        chunk_size = max(len(rows), 1)
+
+    ids = []
+    connection = engine.connect()
+    try:
+        for k in range(0, len(rows), chunk_size):
+            cur_rows = rows[k:k + chunk_size]
+            insert_rows = [x for x in cur_rows if x['id'] is None]
+            update_rows = [x for x in cur_rows if x['id'] is not None]
+            inserted_ids = []
+
+            transaction = connection.begin()
+            try:
+                if insert_rows:
+                    insert_values = [dict([(key, value) for key, value in x.iteritems() if key != 'id']) for x in insert_rows]
+                    if return_ids:
+                        query = sqa.select([sqa.func.max(db_table.c.id)]).with_for_update()
+                        max_id = connection.execute(query).scalar()
+                        if max_id is None:
+                            max_id = 0
+                        inserted_ids = range(max_id + 1, max_id + 1 + len(insert_values))
+                        for cur_values, cur_id in zip(insert_values, inserted_ids):
+                            cur_values['id'] = cur_id
+                    connection.execute(db_table.insert(), insert_values)
+
+                if update_rows:
+                    update_values = []
+                    for cur_row in update_rows:
+                        cur_values = dict([('b_' + key, value) for key, value in cur_row.iteritems()])
+                        update_values.append(cur_values)
+                    columns = [x for x in update_rows[0].keys() if x != 'id']
+                    query = db_table.update().\
+                        where(db_table.c.id == sqa.bindparam('b_id')).\
+                        values(dict([(x, sqa.bindparam('b_' + x)) for x in columns]))
+                    connection.execute(query, update_values)
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+
+            for cur_row, cur_id in zip(insert_rows, inserted_ids):
+                cur_row['id'] = cur_id
+            ids.extend([x['id'] for x in cur_rows])
+            logger.debug('Wrote %d rows to table %s.', len(cur_rows), db_table.name)
+    finally:
+        connection.close()
+
+    return ids
+
+
+def iter_query_pages(query, id_column, page_size = 1000):
+    ''' Iterate over the results of an ORM query in pages.
+
+    The pages are loaded using keyset pagination on the id column. Each
+    page is requested with a separate query limited to page_size rows
+    following the last id of the previous page. So only one page of ORM
+    instances is held in memory, independent of the database driver.
+
+    Parameters
+    ----------
+    query : :class:`sqlalchemy.orm.query.Query`
+        The query to execute. The query must not be ordered or limited.
+
+    id_column : SQLAlchemy column
+        The unique integer id column used for the pagination.
+
+    page_size : Integer
+        The number of rows requested with one query.
+
+    Returns
+    -------
+    pages : generator
+        The generator yielding the pages as lists of the query results.
+    '''
+    last_id = None
+    while True:
+        cur_query = query
+        if last_id is not None:
+            cur_query = cur_query.filter(id_column > last_id)
+        page = cur_query.order_by(id_column).limit(page_size).all()
+        if not page:
+            break
+        yield page
+        if len(page) < page_size:
+            break
+        last_id = page[-1].id
+
+
+def query_to_array(engine, query, dtype, id_column, page_size = 10000):
+    ''' Load the results of a Core select statement into a numpy array.
+
+    No ORM instances are created. The rows are loaded in pages using keyset
+    pagination on the id column.
+
+    Parameters
+    ----------
+    engine : :class:`sqlalchemy.engine.Engine`
+        The database engine.
+
+    query : :class:`sqlalchemy.sql.expression.Select`
+        The select statement. The selected columns have to match the
+        fields of the dtype. The statement must not be ordered or limited.
+
+    dtype : :class:`numpy.dtype`
+        The structured data type of the array. NULL values of float
+        fields are converted to NaN.
+
+    id_column : SQLAlchemy column
+        The unique integer id column used for the pagination. It has to be
+        selected in the query.
+
+    page_size : Integer
+        The number of rows requested with one query.
+
+    Returns
+    -------
+    data : :class:`numpy.ndarray`
+        The structured array of the rows ordered by the id.
+    '''
+    dtype = np.dtype(dtype)
+    id_pos = [x.name for x in query.inner_columns].index(id_column.name)
+    # The positions of the float fields. NULL values are set to NaN.
+    float_pos = set([k for k, x in enumerate(dtype.names) if dtype[x].kind == 'f'])
+    pages = []
+    last_id = None
+    connection = engine.connect()
+    try:
+        while True:
+            cur_query = query
+            if last_id is not None:
+                cur_query = cur_query.where(id_column > last_id)
+            rows = connection.execute(cur_query.order_by(id_column).limit(page_size)).fetchall()
+            if not rows:
+                break
+            if float_pos:
+                rows = [[np.nan if x[k] is None and k in float_pos else x[k] for k in range(len(x))] for x in rows]
+            pages.append(np.array([tuple(x) for x in rows], dtype = dtype))
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1][id_pos]
+    finally:
+        connection.close()
+
+    if not pages:
+        return np.zeros(0, dtype = dtype)
+    return np.concatenate(pages)
@@ -1473,7 +1473,9 @@ class DataSourceDlg(wx.Dialog):
         selectedItem = self.wcListCtrl.GetItemText(selectedRow)
 
         if selectedItem != 'main client':
-            self.psyBase.project.removeWaveClient(selectedItem)
+            waveclient = self.psyBase.project.removeWaveClient(selectedItem)
+            if waveclient is not None:
+                waveclient.close()
             self.updateWcListCtrl()
         else:
             msg = "The main client can't be deleted"
@@ -1549,6 +1551,67 @@ class DataSourceDlg(wx.Dialog):
         self.Destroy()
 
 
+class WaveclientStockOptions(wx.Panel):
+    ''' The options of the waveclient data stock.
+
+    This panel is used by the waveclient option panels to edit the size
+    limit and the eviction policy of the waveclient stock.
+    '''
+
+    def __init__(self, parent=None, client=None, size=(-1, -1)):
+        ''' The constructor.
+
+        '''
+        wx.Panel.__init__(self, parent, wx.ID_ANY, size = size)
+
+        # The waveclient holding the options.
+        self.client = client
+
+        self.policies = ['lru', 'lfu']
+
+        self.sizeLabel = wx.StaticText(self, -1, "stock size [MB]:")
+        self.sizeEdit = wx.SpinCtrl(self, -1, size=(100, -1), min = 0, max = 1000000)
+        self.policyLabel = wx.StaticText(self, -1, "eviction policy:")
+        self.policyChoice = wx.Choice(self, -1, choices = self.policies)
+        self.statisticsLabel = wx.StaticText(self, -1, "stock usage:")
+        self.statisticsText = wx.StaticText(self, -1, "")
+
+        if self.client is not None:
+            self.sizeEdit.SetValue(self.client.stock_size)
+            if self.client.stock_policy in self.policies:
+                self.policyChoice.SetSelection(self.policies.index(self.client.stock_policy))
+            stats = self.client.stock.statistics
+            self.statisticsText.SetLabel('%d hits, %d misses, %d evictions, %.1f MB' % (stats['hits'],
+                                                                                        stats['misses'],
+                                                                                        stats['evictions'],
+                                                                                        stats['nbytes'] / (1024. * 1024.)))
+        else:
+            self.policyChoice.SetSelection(0)
+
+        # Layout using sizers.
+        sizer = wx.GridBagSizer(5,5)
+
+        sizer.Add(self.sizeLabel, pos=(0,0), flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, border=5)
+        sizer.Add(self.sizeEdit, pos=(0,1), flag=wx.EXPAND|wx.ALL, border=5)
+        sizer.Add(self.policyLabel, pos=(1,0), flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, border=5)
+        sizer.Add(self.policyChoice, pos=(1,1), flag=wx.EXPAND|wx.ALL, border=5)
+        sizer.Add(self.statisticsLabel, pos=(2,0), flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, border=5)
+        sizer.Add(self.statisticsText, pos=(2,1), flag=wx.EXPAND|wx.ALL, border=5)
+
+        sizer.AddGrowableCol(1)
+
+        self.SetSizerAndFit(sizer)
+
+
+    def onOk(self):
+        ''' Apply the stock options to the waveclient.
+        '''
+        if self.client is not None:
+            self.client.set_stock_limits(stock_size = self.sizeEdit.GetValue(),
+                                         stock_policy = self.policies[self.policyChoice.GetSelection()])
+
+
+
 class PsysmonDbWaveclientOptions(wx.Panel):
 
     def __init__(self, parent=None, client=None, project=None, size=(-1, -1)):
@@ -1590,6 +1653,10 @@ class PsysmonDbWaveclientOptions(wx.Panel):
         sizer.Add(self.wfListCtrl, pos=(0,0), flag=wx.EXPAND|wx.ALL, border=5)
         sizer.Add(gridButtonSizer, pos=(0,1), flag=wx.EXPAND|wx.ALL, border=5)
 
+        # The stock options.
+        self.stockOptions = WaveclientStockOptions(parent = self, client = self.client)
+        sizer.Add(self.stockOptions, pos=(1,0), span=(1,2), flag=wx.EXPAND|wx.ALL, border=5)
+
         sizer.AddGrowableRow(0)
         sizer.AddGrowableCol(0)
 
@@ -1745,6 +1812,7 @@ class PsysmonDbWaveclientOptions(wx.Panel):
         # Reload the project's waveform directory list to make sure, that it's 
         # consistent with the database.
         self.client.loadWaveformDirList()
+        self.stockOptions.onOk()
 
 
     def onCancel(self):
@@ -1788,6 +1856,10 @@ class EarthwormWaveclientOptions(wx.Panel):
         sizer.Add(self.portLabel, pos=(2,0), flag=wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, border=5)
         sizer.Add(self.portEdit, pos=(2,1), flag=wx.EXPAND|wx.ALL, border=5)
 
+        # The stock options.
+        self.stockOptions = WaveclientStockOptions(parent = self, client = self.client)
+        sizer.Add(self.stockOptions, pos=(3,0), span=(1,2), flag=wx.EXPAND|wx.ALL, border=5)
+
         sizer.AddGrowableCol(1)
 
         self.SetSizerAndFit(sizer)
@@ -1805,6 +1877,7 @@ class EarthwormWaveclientOptions(wx.Panel):
         self.client.name = self.nameEdit.GetValue()
         self.client.host = self.hostEdit.GetValue()
         self.client.port = int(self.portEdit.GetValue())
+        self.stockOptions.onOk()
         self.logger.debug(self.client.name)
         return self.client
 
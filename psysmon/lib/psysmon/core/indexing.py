@@ -0,0 +1,494 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Indexes used to search the items of catalogs.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import bisect
+import math
+
+
+def insert_sorted(keys, items, entries):
+    ''' Insert items into lists sorted by the keys.
+
+    Parameters
+    ----------
+    keys : List
+        The sorted keys.
+
+    items : List
+        The items in the order of the keys.
+
+    entries : List of Tuples (key, item)
+        The items to insert.
+    '''
+    if len(entries) > 10:
+        # Rebuild the lists when adding many items. The sort is stable, so
+        # items with equal keys keep the order in which they have been
+        # added.
+        entries = zip(keys, items) + entries
+        entries.sort(key = lambda x: x[0])
+        keys[:] = [x[0] for x in entries]
+        items[:] = [x[1] for x in entries]
+    else:
+        for cur_key, cur_item in entries:
+            pos = bisect.bisect_right(keys, cur_key)
+            keys.insert(pos, cur_key)
+            items.insert(pos, cur_item)
+
+
+def remove_sorted(keys, items, key):
+    ''' Remove an item with a unique key from lists sorted by the keys.
+    '''
+    pos = bisect.bisect_left(keys, key)
+    del keys[pos]
+    del items[pos]
+
+
+class TimeIndex(object):
+    ''' A time index of the items of a catalog.
+
+    The items are kept sorted by their start time. Time range and nearest
+    time queries use a binary search. Additional attributes of the items
+    are indexed in hash tables. For each value of a hash index the items
+    are also kept sorted by their start time, so that the queries and the
+    nearest time search of filtered items use a binary search as well. If
+    an end time is specified, queries for
+    items overlapping a time span are supported. For these queries the
+    items are additionally kept in buckets of the item lengths, each
+    sorted by the start time. The length limits of the buckets are powers
+    of two, so a long item only widens the search in its own bucket.
+
+    The index holds the values of the items at the time they were added.
+    If an indexed attribute of an item is changed, the item has to be
+    updated using :meth:`update`.
+    '''
+
+    def __init__(self, start_key, end_key = None, keys = None):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        start_key : Callable
+            The function returning the start time of an item as a float
+            (e.g. the timestamp).
+
+        end_key : Callable
+            The function returning the end time of an item as a float. If
+            None, the items are points in time.
+
+        keys : dict of Callable
+            The functions returning the values of the hash indexed
+            attributes of an item. The dictionary keys are the names used in
+            the queries.
+        '''
+        # The function returning the start time of an item.
+        self.start_key = start_key
+
+        # The function returning the end time of an item.
+        self.end_key = end_key
+
+        # The functions returning the values of the hash indexes.
+        if keys is None:
+            keys = {}
+        self.keys = keys
+
+        self.clear()
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def __contains__(self, item):
+        return id(item) in self.indexed
+
+
+    def clear(self):
+        ''' Remove all items from the index.
+        '''
+        # The sorted start times of the items.
+        self.start_times = []
+
+        # The items in the order of the start times.
+        self.items = []
+
+        # The hash indexes. For each key a dictionary of the key values
+        # holding the items with this value.
+        self.hash_index = dict([(x, {}) for x in self.keys])
+
+        # The items of the hash index values sorted by the start time. For
+        # each key a dictionary of the key values holding tuples of the
+        # sorted (start, seq) keys and the items.
+        self.hash_sorted = dict([(x, {}) for x in self.keys])
+
+        # The indexed values of the items. The keys are the ids of the
+        # items. The values are tuples (start, values, end, seq).
+        self.indexed = {}
+
+        # The buckets of the item lengths used for the overlap queries.
+        # The keys are the exponents of the length limits. The values are
+        # tuples of the sorted (start, seq) keys and the items.
+        self.length_buckets = {}
+
+        # The sequence number of the next added item. It orders items with
+        # equal start times by the time they were added.
+        self.next_seq = 0
+
+
+    def add(self, items):
+        ''' Add items to the index.
+
+        Items already contained in the index are ignored.
+
+        Parameters
+        ----------
+        items : List
+            The items to add.
+        '''
+        items = [x for x in items if id(x) not in self.indexed]
+        if not items:
+            return
+
+        entries = []
+        bucket_entries = {}
+        hash_entries = {}
+        for cur_item in items:
+            cur_start = self.start_key(cur_item)
+            cur_values = dict([(name, fn(cur_item)) for name, fn in self.keys.iteritems()])
+            cur_end = None
+            if self.end_key is not None:
+                cur_end = self.end_key(cur_item)
+                cur_bucket = self.get_length_bucket(cur_end - cur_start)
+                bucket_entries.setdefault(cur_bucket, []).append(((cur_start, self.next_seq), cur_item))
+            for name, value in cur_values.iteritems():
+                self.hash_index[name].setdefault(value, {})[id(cur_item)] = cur_item
+                hash_entries.setdefault((name, value), []).append(((cur_start, self.next_seq), cur_item))
+            self.indexed[id(cur_item)] = (cur_start, cur_values, cur_end, self.next_seq)
+            self.next_seq += 1
+            entries.append((cur_start, cur_item))
+
+        for cur_bucket, cur_entries in bucket_entries.iteritems():
+            bucket_keys, bucket_items = self.length_buckets.setdefault(cur_bucket, ([], []))
+            insert_sorted(bucket_keys, bucket_items, cur_entries)
+
+        for (name, value), cur_entries in hash_entries.iteritems():
+            sorted_keys, sorted_items = self.hash_sorted[name].setdefault(value, ([], []))
+            insert_sorted(sorted_keys, sorted_items, cur_entries)
+
+        insert_sorted(self.start_times, self.items, entries)
+
+
+    def remove(self, items):
+        ''' Remove items from the index.
+
+        Items not contained in the index are ignored.
+
+        Parameters
+        ----------
+        items : List
+            The items to remove.
+        '''
+        for cur_item in items:
+            if id(cur_item) not in self.indexed:
+                continue
+            cur_start, cur_values, cur_end, cur_seq = self.indexed.pop(id(cur_item))
+
+            pos = bisect.bisect_left(self.start_times, cur_start)
+            while self.items[pos] is not cur_item:
+                pos += 1
+            del self.start_times[pos]
+            del self.items[pos]
+
+            if cur_end is not None:
+                cur_bucket = self.get_length_bucket(cur_end - cur_start)
+                bucket_keys, bucket_items = self.length_buckets[cur_bucket]
+                remove_sorted(bucket_keys, bucket_items, (cur_start, cur_seq))
+                if not bucket_keys:
+                    del self.length_buckets[cur_bucket]
+
+            for name, value in cur_values.iteritems():
+                bucket = self.hash_index[name][value]
+                del bucket[id(cur_item)]
+                if not bucket:
+                    del self.hash_index[name][value]
+
+                sorted_keys, sorted_items = self.hash_sorted[name][value]
+                remove_sorted(sorted_keys, sorted_items, (cur_start, cur_seq))
+                if not sorted_keys:
+                    del self.hash_sorted[name][value]
+
+
+    def update(self, items):
+        ''' Update the indexed values of items.
+
+        Parameters
+        ----------
+        items : List
+            The items which have been changed.
+        '''
+        items = [x for x in items if id(x) in self.indexed]
+        self.remove(items)
+        self.add(items)
+
+
+    def get_length_bucket(self, length):
+        ''' Get the length bucket of an item.
+
+        The bucket is the exponent of the smallest power of two greater
+        than the length. All lengths below 1 share the bucket 0.
+        '''
+        return max(math.frexp(length)[1], 0)
+
+
+    def get_overlapping(self, start_time, end_time = None):
+        ''' Get the items starting before and overlapping a time span.
+
+        Parameters
+        ----------
+        start_time : float
+            The start of the time span.
+
+        end_time : float
+            The end of the time span.
+
+        Returns
+        -------
+        items : List
+            The items starting before start_time and ending at or after
+            start_time sorted by their start time.
+        '''
+        search_end = start_time
+        if end_time is not None and end_time < start_time:
+            search_end = end_time
+
+        entries = []
+        for cur_bucket, (bucket_keys, bucket_items) in self.length_buckets.iteritems():
+            lo = bisect.bisect_left(bucket_keys, (start_time - 2. ** cur_bucket, ))
+            hi = bisect.bisect_left(bucket_keys, (search_end, ))
+            if search_end < start_time:
+                hi = bisect.bisect_right(bucket_keys, (search_end, float('inf')))
+            for k in range(lo, hi):
+                cur_item = bucket_items[k]
+                if self.indexed[id(cur_item)][2] >= start_time:
+                    entries.append((bucket_keys[k], cur_item))
+
+        entries.sort(key = lambda x: x[0])
+        return [x[1] for x in entries]
+
+
+    def get_range_limits(self, start_time = None, end_time = None):
+        ''' Get the positions of the items starting in a time span.
+        '''
+        if start_time is None:
+            lo = 0
+        else:
+            lo = bisect.bisect_left(self.start_times, start_time)
+
+        if end_time is None:
+            hi = len(self.start_times)
+        else:
+            hi = bisect.bisect_right(self.start_times, end_time)
+
+        return lo, hi
+
+
+    def get_sorted_limits(self, keys, start_time = None, end_time = None):
+        ''' Get the positions of the (start, seq) keys in a time span.
+        '''
+        if start_time is None:
+            lo = 0
+        else:
+            lo = bisect.bisect_left(keys, (start_time, ))
+
+        if end_time is None:
+            hi = len(keys)
+        else:
+            hi = bisect.bisect_right(keys, (end_time, float('inf')))
+
+        return lo, hi
+
+
+    def get_sorted_items(self, **kwargs):
+        ''' Get the sorted items of the smallest matching hash index value.
+
+        Returns
+        -------
+        keys : List of Tuples (start, seq)
+            The sorted keys of the items.
+
+        items : List
+            The items with the value of the smallest hash index.
+
+        others : dict
+            The remaining hash index values which have to be checked.
+        '''
+        selected = None
+        for name, value in kwargs.iteritems():
+            cur_sorted = self.hash_sorted[name].get(value, None)
+            if cur_sorted is None:
+                return ([], [], {})
+            if selected is None or len(cur_sorted[0]) < len(selected[1][0]):
+                selected = (name, cur_sorted)
+
+        others = dict([(k, v) for k, v in kwargs.iteritems() if k != selected[0]])
+        return (selected[1][0], selected[1][1], others)
+
+
+    def is_matching(self, item, values):
+        ''' Check if the indexed values of an item match the values.
+        '''
+        item_values = self.indexed[id(item)][1]
+        for name, value in values.iteritems():
+            if item_values[name] != value:
+                return False
+        return True
+
+
+    def lookup(self, **kwargs):
+        ''' Get the items matching the values of the hash indexes.
+
+        Returns
+        -------
+        items : dict
+            The matching items. The keys are the ids of the items.
+        '''
+        buckets = []
+        for name, value in kwargs.iteritems():
+            buckets.append(self.hash_index[name].get(value, {}))
+        buckets.sort(key = len)
+
+        matches = buckets[0]
+        for cur_bucket in buckets[1:]:
+            matches = dict([(k, v) for k, v in matches.iteritems() if k in cur_bucket])
+        return matches
+
+
+    def query(self, start_time = None, end_time = None, overlap = False, **kwargs):
+        ''' Get the items matching a time span and hash index values.
+
+        Parameters
+        ----------
+        start_time : float
+            The start of the time span.
+
+        end_time : float
+            The end of the time span.
+
+        overlap : Boolean
+            If True, return the items overlapping the time span. Otherwise
+            return the items starting within the time span.
+
+        kwargs :
+            The values of the hash indexes to match.
+
+        Returns
+        -------
+        items : List
+            The matching items sorted by their start time.
+        '''
+        if kwargs:
+            # Use the sorted items of the smallest hash index value.
+            sorted_keys, sorted_items, others = self.get_sorted_items(**kwargs)
+            lo, hi = self.get_sorted_limits(sorted_keys, start_time, end_time)
+            items = [x for x in sorted_items[lo:hi] if self.is_matching(x, others)]
+        else:
+            lo, hi = self.get_range_limits(start_time, end_time)
+            items = self.items[lo:hi]
+
+        if overlap and start_time is not None and self.end_key is not None:
+            # Add the items starting before the time span.
+            overlapping = self.get_overlapping(start_time, end_time)
+            if kwargs:
+                overlapping = [x for x in overlapping if self.is_matching(x, kwargs)]
+            items = overlapping + items
+
+        return items
+
+
+    def nearest(self, time, start_time = None, end_time = None, **kwargs):
+        ''' Get the item with the start time nearest to a time.
+
+        Parameters
+        ----------
+        time : float
+            The time to search.
+
+        start_time : float
+            The start of the time span of the items to search.
+
+        end_time : float
+            The end of the time span of the items to search.
+
+        kwargs :
+            The values of the hash indexes to match.
+
+        Returns
+        -------
+        item : object
+            The nearest item. None if no item matches.
+        '''
+        if kwargs:
+            # Search the sorted items of the smallest hash index value on
+            # both sides of the time for the nearest matching items.
+            sorted_keys, sorted_items, others = self.get_sorted_items(**kwargs)
+            lo, hi = self.get_sorted_limits(sorted_keys, start_time, end_time)
+            pos = bisect.bisect_left(sorted_keys, (time, ), lo, hi)
+
+            left = pos - 1
+            while left >= lo and not self.is_matching(sorted_items[left], others):
+                left -= 1
+            right = pos
+            while right < hi and not self.is_matching(sorted_items[right], others):
+                right += 1
+
+            if left < lo and right >= hi:
+                return None
+            if right >= hi:
+                return sorted_items[left]
+            if left < lo:
+                return sorted_items[right]
+
+            if abs(sorted_keys[left][0] - time) <= abs(sorted_keys[right][0] - time):
+                return sorted_items[left]
+            else:
+                return sorted_items[right]
+
+        lo, hi = self.get_range_limits(start_time, end_time)
+        if lo >= hi:
+            return None
+
+        pos = bisect.bisect_left(self.start_times, time, lo, hi)
+        if pos == lo:
+            return self.items[lo]
+        if pos == hi:
+            return self.items[hi - 1]
+
+        if abs(self.start_times[pos - 1] - time) <= abs(self.start_times[pos] - time):
+            return self.items[pos - 1]
+        else:
+            return self.items[pos]
@@ -44,3 +44,96 @@ clib_signal.moving_average.argtypes = [ctypes.c_int,
                                        np.ctypeslib.ndpointer(dtype = np.float64,
                                                               ndim=1,
                                                               flags='C_CONTIGUOUS')]
+
+# Define the event_limits types.
+clib_signal.event_limits.argtypes = [ctypes.c_long,
+                                     np.ctypeslib.ndpointer(dtype = np.float64,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     np.ctypeslib.ndpointer(dtype = np.float64,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     ctypes.c_double,
+                                     ctypes.c_long,
+                                     ctypes.c_int,
+                                     ctypes.c_long,
+                                     np.ctypeslib.ndpointer(dtype = np.float64,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     ctypes.c_long,
+                                     ctypes.c_long,
+                                     np.ctypeslib.ndpointer(dtype = np.float64,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     np.ctypeslib.ndpointer(dtype = np.int_,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     ctypes.c_long,
+                                     np.ctypeslib.ndpointer(dtype = np.int_,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     np.ctypeslib.ndpointer(dtype = np.int_,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     np.ctypeslib.ndpointer(dtype = np.float64,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     np.ctypeslib.ndpointer(dtype = np.int_,
+                                                            ndim=1,
+                                                            flags='C_CONTIGUOUS'),
+                                     ctypes.POINTER(ctypes.c_long),
+                                     ctypes.POINTER(ctypes.c_int)]
+
+# Define the classic_sta_lta types.
+clib_signal.classic_sta_lta.argtypes = [ctypes.c_long,
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS'),
+                                        ctypes.c_int,
+                                        ctypes.c_long,
+                                        ctypes.c_long,
+                                        ctypes.c_long,
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS'),
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS'),
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS'),
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS'),
+                                        np.ctypeslib.ndpointer(dtype = np.float64,
+                                                               ndim=1,
+                                                               flags='C_CONTIGUOUS')]
+
+# Define the recursive_sta_lta types.
+clib_signal.recursive_sta_lta.argtypes = [ctypes.c_long,
+                                          np.ctypeslib.ndpointer(dtype = np.float64,
+                                                                 ndim=1,
+                                                                 flags='C_CONTIGUOUS'),
+                                          ctypes.c_int,
+                                          ctypes.c_long,
+                                          ctypes.c_long,
+                                          ctypes.POINTER(ctypes.c_double),
+                                          ctypes.POINTER(ctypes.c_double),
+                                          np.ctypeslib.ndpointer(dtype = np.float64,
+                                                                 ndim=1,
+                                                                 flags='C_CONTIGUOUS'),
+                                          np.ctypeslib.ndpointer(dtype = np.float64,
+                                                                 ndim=1,
+                                                                 flags='C_CONTIGUOUS'),
+                                          np.ctypeslib.ndpointer(dtype = np.float64,
+                                                                 ndim=1,
+                                                                 flags='C_CONTIGUOUS'),
+                                          np.ctypeslib.ndpointer(dtype = np.float64,
+                                                                 ndim=1,
+                                                                 flags='C_CONTIGUOUS')]
+
+# The codes of the characteristic function types used by the STA/LTA
+# functions.
+cf_types = {'raw': 0,
+            'abs': 1,
+            'square': 2}
@@ -135,19 +135,55 @@ class ProcessingStack:
 
 
 
-    def execute(self, stream, process_limits = None):
+    def execute(self, stream, process_limits = None, state = None):
         ''' Execute the stack.
 
         Parameters
         ----------
 
         stream : :class:`obspy.core.Stream`
-            The data to process.
+            The data to process. Read-only trace data (e.g. views of the
+            waveclient stock) is copied before the first node which
+            modifies the data is executed.
+
+        state : Dictionary
+            The processing state used to process consecutive parts of
+            continuous data, e.g. the filter state. Stateful nodes continue
+            the processing of the previous data using this state. Pass the
+            same dictionary for each consecutive part of the data. If None,
+            each call is processed independently.
         '''
-        for curNode in self.nodes:
+        data_copied = False
+        for k, curNode in enumerate(self.nodes):
             curNode.clear_results()
             if curNode.isEnabled():
-                curNode.execute(stream, process_limits)
+                if curNode.modifies_data and not data_copied:
+                    for cur_trace in stream:
+                        if not cur_trace.data.flags.writeable:
+                            cur_trace.data = cur_trace.data.copy()
+                    data_copied = True
+                if curNode.stateful and state is not None:
+                    if k not in state:
+                        state[k] = {}
+                    curNode.execute(stream, process_limits, state = state[k])
+                else:
+                    curNode.execute(stream, process_limits)
+
+
+    def is_stateful(self):
+        ''' Check if the stack can continue the processing of the previous data.
+
+        The stack is stateful if all enabled nodes modifying the data
+        continue the processing using the state passed to
+        :meth:`execute`. Otherwise, the result of processing consecutive
+        parts of continuous data depends on the limits of the parts.
+
+        Returns
+        -------
+        stateful : Boolean
+            True if the stack is stateful.
+        '''
+        return all([x.is_stateful() for x in self.nodes if x.isEnabled() and x.modifies_data])
 
 
     def clear_results(self):
@@ -182,6 +218,15 @@ class ProcessingNode:
     # argument.
     nodeClass = 'common'
 
+    # Indicates if the node modifies the data of the stream passed to
+    # execute. Nodes which only read the data can work on read-only
+    # views of the waveclient stock.
+    modifies_data = True
+
+    # Indicates if the node accepts the state keyword argument in execute
+    # to continue the processing of the previous data.
+    stateful = False
+
     def __init__(self, name, mode, category, tags, enabled = True, docEntryPoint=None, parentStack=None):
         ''' The constructor
 
@@ -230,6 +275,19 @@ class ProcessingNode:
 
 
 
+    def is_stateful(self):
+        ''' Check if the node continues the processing of the previous data.
+
+        Returns
+        -------
+        stateful : Boolean
+            True if the node uses the state passed to execute with the
+            current preferences.
+        '''
+        return self.stateful
+
+
+
 
     def getEditPanel(self, parent):
         ''' The method to build and return the edit panel for the processing 
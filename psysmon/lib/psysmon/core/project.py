@@ -38,6 +38,8 @@ import sys
 import thread
 import subprocess
 import copy
+import itertools
+import multiprocessing.pool
 from wx.lib.pubsub import setupkwargs
 from wx.lib.pubsub import pub
 from wx import CallAfter
@@ -54,6 +56,7 @@ import psysmon.core.util as psy_util
 import psysmon.core.json_util
 from psysmon.packages.geometry.db_inventory import DbInventory
 import psysmon.core.database_util as db_util
+from psysmon.core.waveclient import PsysmonDbWaveClient, EarthwormWaveclient
 
 
 class Project(object):
@@ -520,6 +523,36 @@ class Project(object):
         self.waveclient[waveclient.name] = waveclient
 
 
+    def init_worker_process(self):
+        ''' Reinitialize the project in a forked worker process.
+
+        The database connections and the waveclients inherited from the
+        parent process can't be shared with the worker process. A new
+        database engine and new waveclient instances with the same
+        settings are created. The connections of the inherited engine are
+        not closed to keep the connections of the parent process intact.
+        Worker processes can't start processes on their own, so the
+        waveclients decode the waveform files using threads.
+        '''
+        if self.dbEngine is not None:
+            self.dbEngine = create_engine(self.dbEngine.url)
+            self.dbEngine.echo = False
+            self.dbSessionClass = sessionmaker(bind = self.dbEngine)
+
+        for cur_name, cur_waveclient in self.waveclient.items():
+            attributes = cur_waveclient.pickle_attributes
+            if cur_waveclient.mode == 'PsysmonDbWaveClient':
+                if attributes['decode_mode'] == 'process':
+                    attributes['decode_mode'] = 'thread'
+                waveclient = PsysmonDbWaveClient(cur_name, self, **attributes)
+            elif cur_waveclient.mode == 'EarthwormWaveclient':
+                waveclient = EarthwormWaveclient(cur_name, **attributes)
+            else:
+                self.logger.error('The waveclient %s of mode %s is not supported in a worker process.', cur_name, cur_waveclient.mode)
+                continue
+            self.waveclient[cur_name] = waveclient
+
+
     def removeWaveClient(self, name):
         ''' Remove the waveclient with name 'name' from the project.
         The client with the name 'main client' can't be removed from 
@@ -543,6 +576,15 @@ class Project(object):
 
 
 
+    def close_waveclients(self):
+        ''' Close all waveclients of the project.
+
+        The background threads of the waveclients are stopped.
+        '''
+        for cur_waveclient in self.waveclient.itervalues():
+            cur_waveclient.close()
+
+
     def handleWaveclientNameChange(self, oldName, client):
         ''' Make all changes needed if the name of a waveclient has been changed.
 
@@ -556,9 +598,41 @@ class Project(object):
             self.defaultWaveclient = client.name
 
 
-    def request_data_stream(self, start_time, end_time, scnl):
+    def get_data_sources(self, scnl):
+        ''' Group SCNLs by the waveclients providing the data.
+
+        SCNLs without an assigned data source are assigned to the default
+        waveclient.
+
+        Parameters
+        ----------
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels to group.
+
+        Returns
+        -------
+        data_sources : Dictionary
+            The key is the name of the waveclient, the value the list of
+            SCNLs assigned to the waveclient.
+        '''
+        data_sources = {}
+        for cur_scnl in scnl:
+            cur_name = self.scnlDataSources.get(cur_scnl, self.defaultWaveclient)
+            if cur_name not in data_sources:
+                data_sources[cur_name] = []
+            data_sources[cur_name].append(cur_scnl)
+
+        return data_sources
+
+
+    def request_data_stream(self, start_time, end_time, scnl, read_only = False,
+                            prefetch = None):
         ''' Get a data stream from the waveclient(s).
 
+        Each waveclient is asked only for the SCNLs assigned to it. If the
+        SCNLs are assigned to more than one waveclient, the waveclients are
+        queried concurrently.
+
         Parameters
         ----------
         startTime : UTCDateTime
@@ -570,37 +644,106 @@ class Project(object):
         scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
             The channels for which to get the waveform data.
 
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views of
+            the waveclient stock.
+
+        prefetch : Boolean
+            If True, the waveclients prefetch the predicted next time window
+            in the background. If None, the auto_prefetch setting of the
+            waveclients is used.
+
         Returns
         -------
         stream : :class:`obspy.core.Stream`
             The requested waveform data. All traces are packed into one stream.
 
         '''
-        data_sources = {}
-        for cur_scnl in scnl:
-            if cur_scnl in self.scnlDataSources.keys():
-                if self.scnlDataSources[cur_scnl] not in data_sources.keys():
-                    data_sources[self.scnlDataSources[cur_scnl]] = [cur_scnl, ]
-                else:
-                    data_sources[self.scnlDataSources[cur_scnl]].append(cur_scnl)
-            else:
-                if self.defaultWaveclient not in data_sources.keys():
-                    data_sources[self.defaultWaveclient] = [cur_scnl, ]
-                else:
-                    data_sources[self.defaultWaveclient].append(cur_scnl)
+        data_sources = self.get_data_sources(scnl)
+
+        def request(name):
+            return self.waveclient[name].getWaveform(startTime = start_time,
+                                                     endTime = end_time,
+                                                     scnl = data_sources[name],
+                                                     read_only = read_only,
+                                                     prefetch = prefetch)
+
+        names = sorted(data_sources.keys())
+        if len(names) > 1:
+            pool = multiprocessing.pool.ThreadPool(len(names))
+            try:
+                results = pool.map(request, names)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [request(x) for x in names]
 
         stream = obspy.core.Stream()
-
-        for cur_name in data_sources.iterkeys():
-            curWaveclient = self.waveclient[cur_name]
-            curStream =  curWaveclient.getWaveform(startTime = start_time,
-                                                   endTime = end_time,
-                                                   scnl = scnl)
-            stream += curStream
+        for cur_stream in results:
+            stream += cur_stream
 
         return stream
 
 
+    def iter_data_stream(self, start_time, end_time, scnl, chunk_length,
+                         overlap = 0., read_only = False):
+        ''' Iterate over the data stream of a time span in chunks.
+
+        The data of the SCNLs is requested from the assigned waveclients
+        using :meth:`~psysmon.core.waveclient.WaveClient.iter_waveform`.
+        The data of the next chunk is prefetched while the current chunk
+        is processed.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
+
+        chunk_length : float
+            The length of the chunks in seconds.
+
+        overlap : float
+            The length in seconds of the data preceding each chunk which is
+            added to the chunk stream.
+
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views of
+            the waveclient stock.
+
+        Yields
+        ------
+        window_start : UTCDateTime
+            The begin of the chunk.
+
+        window_end : UTCDateTime
+            The end of the chunk.
+
+        stream : :class:`obspy.core.Stream`
+            The waveform data from window_start - overlap to window_end.
+        '''
+        data_sources = self.get_data_sources(scnl)
+        iterators = [self.waveclient[x].iter_waveform(start_time = start_time,
+                                                      end_time = end_time,
+                                                      scnl = data_sources[x],
+                                                      chunk_length = chunk_length,
+                                                      overlap = overlap,
+                                                      read_only = read_only)
+                     for x in sorted(data_sources.keys())]
+
+        for chunks in itertools.izip(*iterators):
+            stream = obspy.core.Stream()
+            for window_start, window_end, cur_stream in chunks:
+                stream += cur_stream
+            yield (window_start, window_end, stream)
+
+
 
 
     def connect2Db(self):
@@ -776,6 +919,10 @@ class Project(object):
                     # Add the table prefix.
                     curName = curTable.__table__.name
                     curTable.__table__.name = self.slug + "_" + curTable.__table__.name
+                    # The index names have to be unique in the database
+                    # for some database systems.
+                    for cur_index in curTable.__table__.indexes:
+                        cur_index.name = self.slug + "_" + cur_index.name
                     try:
                         if psy_util.version_tuple(curPkg.version) > psy_util.version_tuple(self.pkg_version[curPkg.name]):
                             pkg_version_changed = True
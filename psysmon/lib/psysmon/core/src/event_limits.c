@@ -0,0 +1,157 @@
+// LICENSE
+//
+// This file is part of pSysmon.
+//
+// If you use pSysmon in any program or publication, please inform and
+// acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+//
+// pSysmon is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+// copyright: Stefan Mertl
+
+
+#include <stdlib.h>
+
+// The heap of the events waiting for their end is a max-heap of the stop
+// values. It holds the indices of the events, the negative indices -1,
+// -2, ... refer to the open events of the previous data.
+#define STOP_VALUE(index) ((index) < 0 ? open_stop[-(index) - 1] : event_stop[(index)])
+
+
+static void heap_push(long *heap, long *n_heap, long index,
+                      const double *open_stop, const double *event_stop)
+{
+    long i, parent, tmp;
+
+    i = (*n_heap)++;
+    heap[i] = index;
+
+    while (i > 0) {
+        parent = (i - 1) / 2;
+        if (STOP_VALUE(heap[parent]) >= STOP_VALUE(heap[i])) {
+            break;
+        }
+        tmp = heap[parent];
+        heap[parent] = heap[i];
+        heap[i] = tmp;
+        i = parent;
+    }
+}
+
+
+static long heap_pop(long *heap, long *n_heap,
+                     const double *open_stop, const double *event_stop)
+{
+    long i, child, top, tmp;
+
+    top = heap[0];
+    heap[0] = heap[--(*n_heap)];
+
+    i = 0;
+    while (1) {
+        child = 2 * i + 1;
+        if (child >= *n_heap) {
+            break;
+        }
+        if (child + 1 < *n_heap && STOP_VALUE(heap[child + 1]) > STOP_VALUE(heap[child])) {
+            child++;
+        }
+        if (STOP_VALUE(heap[i]) >= STOP_VALUE(heap[child])) {
+            break;
+        }
+        tmp = heap[child];
+        heap[child] = heap[i];
+        heap[i] = tmp;
+        i = child;
+    }
+
+    return top;
+}
+
+
+// Compute the start and end indices of the STA/LTA events in a single pass.
+//
+// An event starts at a sample where the STA/LTA ratio exceeds the
+// threshold and the ratio of the previous sample is below the threshold.
+// The samples before first_valid are treated as triggered. The stop value
+// of an event is the STA stop_delay samples before the event start. The
+// STA values preceding the data are passed in sta_tail. The event ends at
+// the first sample at or after the event start with an STA below the
+// stop value.
+// The events still open from the previous data are passed with their stop
+// values in open_stop. Their end indices are written to open_end.
+// The end index of events not ending within the data is -1.
+//
+// The output buffers are filled while walking the data. The heap buffer is
+// used as workspace and must hold max_events + n_open items. If the number
+// of events exceeds max_events, the following events are only counted and
+// the output buffers are incomplete.
+//
+// Returns 0 on success and 1 if the number of events exceeds max_events.
+// The number of events is written to n_events in any case.
+int event_limits(const long n_data, const double *thrf, const double *sta,
+                 const double thr, const long first_valid, const int prev_on,
+                 const long n_tail, const double *sta_tail, const long stop_delay,
+                 const long n_open, const double *open_stop, long *open_end,
+                 const long max_events, long *event_start, long *event_end,
+                 double *event_stop, long *heap, long *n_events, int *last_on)
+{
+    long i, k, n_heap, stop_ind, index;
+    int on, prev;
+
+    n_heap = 0;
+    for (i = 0; i < n_open; i++) {
+        open_end[i] = -1;
+        heap_push(heap, &n_heap, -(i + 1), open_stop, event_stop);
+    }
+
+    k = 0;
+    prev = prev_on;
+    for (i = 0; i < n_data; i++) {
+        on = (i < first_valid) || (thrf[i] >= thr);
+        if (on && !prev) {
+            if (k < max_events) {
+                stop_ind = i + n_tail - stop_delay;
+                if (stop_ind < 0) {
+                    stop_ind = 0;
+                }
+                event_start[k] = i;
+                event_end[k] = -1;
+                event_stop[k] = stop_ind < n_tail ? sta_tail[stop_ind] : sta[stop_ind - n_tail];
+                heap_push(heap, &n_heap, k, open_stop, event_stop);
+            }
+            k++;
+        }
+        prev = on;
+
+        // End all events with a stop value above the STA.
+        while (n_heap > 0 && sta[i] < STOP_VALUE(heap[0])) {
+            index = heap_pop(heap, &n_heap, open_stop, event_stop);
+            if (index < 0) {
+                open_end[-index - 1] = i;
+            } else {
+                event_end[index] = i;
+            }
+        }
+    }
+
+    *n_events = k;
+    *last_on = prev;
+
+    if (k > max_events) {
+        return 1;
+    }
+
+    return 0;
+}
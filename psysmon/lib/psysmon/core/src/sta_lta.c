@@ -0,0 +1,163 @@
+// LICENSE
+//
+// This file is part of pSysmon.
+//
+// If you use pSysmon in any program or publication, please inform and
+// acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+//
+// pSysmon is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+// copyright: Stefan Mertl
+
+
+#include <math.h>
+
+// The types of the characteristic function.
+#define CF_RAW 0
+#define CF_ABS 1
+#define CF_SQUARE 2
+
+
+static double cf_value(const double x, const int cf_type)
+{
+    switch (cf_type) {
+        case CF_ABS:
+            return fabs(x);
+        case CF_SQUARE:
+            return x * x;
+        default:
+            return x;
+    }
+}
+
+
+// Add a value to a sum using the Kahan compensated summation.
+static void kahan_add(double *sum, double *comp, const double value)
+{
+    double y, t;
+
+    y = value - *comp;
+    t = *sum + y;
+    *comp = (t - *sum) - y;
+    *sum = t;
+}
+
+
+// Compute the classic STA/LTA.
+//
+// The characteristic function of the data, the STA, the LTA and the
+// STA/LTA ratio are computed in a single pass and written to the caller
+// provided buffers cf, sta, lta and ratio. The STA and LTA are the means of
+// the last n_sta and n_lta values of the characteristic function. The
+// window sums are accumulated using a compensated summation. The
+// characteristic function of the data preceding the data is passed in
+// hist. At the start of the data, the missing values are treated as zeros.
+// The ratio is 0 where the LTA is 0.
+//
+// Returns 0 on success and -1 for invalid window lengths.
+int classic_sta_lta(const long n_data, const double *data, const int cf_type,
+                    const long n_sta, const long n_lta,
+                    const long n_hist, const double *hist,
+                    double *cf, double *sta, double *lta, double *ratio)
+{
+    long i, j;
+    double sta_sum, sta_comp, lta_sum, lta_comp;
+
+    if (n_sta < 1 || n_lta < 1) {
+        return -1;
+    }
+
+    sta_sum = 0.;
+    sta_comp = 0.;
+    lta_sum = 0.;
+    lta_comp = 0.;
+
+    // Initialize the window sums with the history.
+    for (i = n_hist - n_sta < 0 ? 0 : n_hist - n_sta; i < n_hist; i++) {
+        kahan_add(&sta_sum, &sta_comp, hist[i]);
+    }
+    for (i = n_hist - n_lta < 0 ? 0 : n_hist - n_lta; i < n_hist; i++) {
+        kahan_add(&lta_sum, &lta_comp, hist[i]);
+    }
+
+    for (i = 0; i < n_data; i++) {
+        cf[i] = cf_value(data[i], cf_type);
+
+        kahan_add(&sta_sum, &sta_comp, cf[i]);
+        j = i - n_sta;
+        if (j >= 0) {
+            kahan_add(&sta_sum, &sta_comp, -cf[j]);
+        } else if (n_hist + j >= 0) {
+            kahan_add(&sta_sum, &sta_comp, -hist[n_hist + j]);
+        }
+
+        kahan_add(&lta_sum, &lta_comp, cf[i]);
+        j = i - n_lta;
+        if (j >= 0) {
+            kahan_add(&lta_sum, &lta_comp, -cf[j]);
+        } else if (n_hist + j >= 0) {
+            kahan_add(&lta_sum, &lta_comp, -hist[n_hist + j]);
+        }
+
+        sta[i] = sta_sum / n_sta;
+        lta[i] = lta_sum / n_lta;
+        ratio[i] = lta[i] > 0. ? sta[i] / lta[i] : 0.;
+    }
+
+    return 0;
+}
+
+
+// Compute the recursive STA/LTA.
+//
+// The characteristic function of the data, the STA, the LTA and the
+// STA/LTA ratio are computed in a single pass and written to the caller
+// provided buffers cf, sta, lta and ratio. The STA and LTA are
+// exponentially weighted averages with the time constants n_sta and n_lta.
+// The averages at the end of the previous data are passed in sta_state and
+// lta_state and are updated with the averages at the end of the data.
+// The ratio is 0 where the LTA is 0.
+//
+// Returns 0 on success and -1 for invalid window lengths.
+int recursive_sta_lta(const long n_data, const double *data, const int cf_type,
+                      const long n_sta, const long n_lta,
+                      double *sta_state, double *lta_state,
+                      double *cf, double *sta, double *lta, double *ratio)
+{
+    long i;
+    double c_sta, c_lta, cur_sta, cur_lta;
+
+    if (n_sta < 1 || n_lta < 1) {
+        return -1;
+    }
+
+    c_sta = 1. / n_sta;
+    c_lta = 1. / n_lta;
+    cur_sta = *sta_state;
+    cur_lta = *lta_state;
+
+    for (i = 0; i < n_data; i++) {
+        cf[i] = cf_value(data[i], cf_type);
+        cur_sta = c_sta * cf[i] + (1. - c_sta) * cur_sta;
+        cur_lta = c_lta * cf[i] + (1. - c_lta) * cur_lta;
+        sta[i] = cur_sta;
+        lta[i] = cur_lta;
+        ratio[i] = cur_lta > 0. ? cur_sta / cur_lta : 0.;
+    }
+
+    *sta_state = cur_sta;
+    *lta_state = cur_lta;
+
+    return 0;
+}
@@ -5,6 +5,7 @@ Created on May 17, 2011
 '''
 
 import unittest
+import ctypes
 import psysmon.core.lib_signal as lib_signal
 import numpy as np
 import numpy.testing as np_test
@@ -59,6 +60,107 @@ class CLibSignalTestCase(unittest.TestCase):
         np_test.assert_almost_equal(np.min(avg[9:]), 2)
 
 
+    def test_classic_sta_lta(self):
+        ''' Test the classic STA/LTA function.
+        '''
+        clib_signal = lib_signal.clib_signal
+
+        n_sta = 5
+        n_lta = 20
+        data = np.random.randn(200)
+        data = np.ascontiguousarray(data, dtype = np.float64)
+
+        def run(data, hist):
+            n_data = len(data)
+            cf = np.empty(n_data, dtype = np.float64)
+            sta = np.empty(n_data, dtype = np.float64)
+            lta = np.empty(n_data, dtype = np.float64)
+            ratio = np.empty(n_data, dtype = np.float64)
+            ret_val = clib_signal.classic_sta_lta(n_data, data,
+                                                  lib_signal.cf_types['square'],
+                                                  n_sta, n_lta, len(hist), hist,
+                                                  cf, sta, lta, ratio)
+            self.assertEqual(ret_val, 0)
+            return cf, sta, lta, ratio
+
+        no_hist = np.zeros(0, dtype = np.float64)
+        cf, sta, lta, ratio = run(data, no_hist)
+        padded = np.concatenate([np.zeros(n_lta), data**2])
+        exp_sta = np.array([np.sum(padded[k - n_sta + 1:k + 1]) / n_sta for k in range(n_lta, len(padded))])
+        exp_lta = np.array([np.sum(padded[k - n_lta + 1:k + 1]) / n_lta for k in range(n_lta, len(padded))])
+        np_test.assert_almost_equal(cf, data**2)
+        np_test.assert_almost_equal(sta, exp_sta)
+        np_test.assert_almost_equal(lta, exp_lta)
+        np_test.assert_almost_equal(ratio, exp_sta / exp_lta)
+
+        # Continuing the data with the history of the characteristic
+        # function gives the same result as a single pass.
+        cf_1, sta_1, lta_1, ratio_1 = run(np.ascontiguousarray(data[:73]), no_hist)
+        cf_2, sta_2, lta_2, ratio_2 = run(np.ascontiguousarray(data[73:]),
+                                          np.ascontiguousarray(cf_1[-n_lta:]))
+        np_test.assert_almost_equal(np.concatenate([sta_1, sta_2]), sta)
+        np_test.assert_almost_equal(np.concatenate([ratio_1, ratio_2]), ratio)
+
+        # Invalid window lengths.
+        buf = np.empty(10, dtype = np.float64)
+        ret_val = clib_signal.classic_sta_lta(10, buf, 0, 0, n_lta, 0, no_hist,
+                                              buf, buf, buf, buf)
+        self.assertEqual(ret_val, -1)
+
+
+    def test_recursive_sta_lta(self):
+        ''' Test the recursive STA/LTA function.
+        '''
+        clib_signal = lib_signal.clib_signal
+
+        n_sta = 5
+        n_lta = 20
+        data = np.random.randn(200)
+        data = np.ascontiguousarray(data, dtype = np.float64)
+
+        def run(data, sta_value, lta_value):
+            n_data = len(data)
+            cf = np.empty(n_data, dtype = np.float64)
+            sta = np.empty(n_data, dtype = np.float64)
+            lta = np.empty(n_data, dtype = np.float64)
+            ratio = np.empty(n_data, dtype = np.float64)
+            ret_val = clib_signal.recursive_sta_lta(n_data, data,
+                                                    lib_signal.cf_types['abs'],
+                                                    n_sta, n_lta,
+                                                    ctypes.byref(sta_value),
+                                                    ctypes.byref(lta_value),
+                                                    cf, sta, lta, ratio)
+            self.assertEqual(ret_val, 0)
+            return sta, lta, ratio
+
+        sta_value = ctypes.c_double(0.)
+        lta_value = ctypes.c_double(0.)
+        sta, lta, ratio = run(data, sta_value, lta_value)
+
+        exp_sta = np.zeros(len(data))
+        exp_lta = np.zeros(len(data))
+        cur_sta = 0.
+        cur_lta = 0.
+        for k, x in enumerate(np.abs(data)):
+            cur_sta = x / n_sta + (1. - 1. / n_sta) * cur_sta
+            cur_lta = x / n_lta + (1. - 1. / n_lta) * cur_lta
+            exp_sta[k] = cur_sta
+            exp_lta[k] = cur_lta
+        np_test.assert_almost_equal(sta, exp_sta)
+        np_test.assert_almost_equal(lta, exp_lta)
+        np_test.assert_almost_equal(ratio, exp_sta / exp_lta)
+        self.assertAlmostEqual(sta_value.value, exp_sta[-1])
+        self.assertAlmostEqual(lta_value.value, exp_lta[-1])
+
+        # Continuing the data with the state gives the same result as a
+        # single pass.
+        sta_value = ctypes.c_double(0.)
+        lta_value = ctypes.c_double(0.)
+        sta_1, lta_1, ratio_1 = run(np.ascontiguousarray(data[:73]), sta_value, lta_value)
+        sta_2, lta_2, ratio_2 = run(np.ascontiguousarray(data[73:]), sta_value, lta_value)
+        np_test.assert_almost_equal(np.concatenate([ratio_1, ratio_2]), ratio)
+
+
 def suite():
     return unittest.makeSuite(CLibSignalTestCase, 'test')
 
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Test the database utility functions.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+
+'''
+
+import unittest
+
+import sqlalchemy as sqa
+from sqlalchemy.ext.declarative import declarative_base
+
+import psysmon.core.database_util as db_util
+import psysmon.packages.obspyImportWaveform as obspy_import
+
+
+class DatabaseUtilTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.core.database_util
+    """
+
+    def setUp(self):
+        self.engine = sqa.create_engine('sqlite://')
+        base = declarative_base()
+        tables = obspy_import.databaseFactory(base)
+        self.traceheader = [x for x in tables if x.__tablename__ == 'traceheader'][0]
+
+
+    def test_table_migration(self):
+        ''' Test the migration of the traceheader table to the stored end time.
+        '''
+        new_table = self.traceheader.__table__
+
+        # Create the table without the end_time column and the indexes.
+        old_metadata = sqa.MetaData()
+        old_table = sqa.Table(new_table.name, old_metadata,
+                              *[x.copy() for x in new_table.columns if x.name != 'end_time'])
+        old_metadata.create_all(self.engine)
+
+        rows = []
+        for k in range(10):
+            rows.append({'file_type': 'mseed',
+                         'wf_id': 1,
+                         'filename': 'file_%02d.msd' % k,
+                         'orig_path': '/data',
+                         'recorder_serial': 'ALBA',
+                         'stream': 'HHZ',
+                         'sps': 100,
+                         'numsamp': 360000 + k,
+                         'begin_date': '',
+                         'begin_time': 3600. * k})
+        self.engine.execute(old_table.insert(), rows)
+
+        metadata = sqa.MetaData()
+        metadata.reflect(self.engine)
+        table_updated = db_util.update_db_table(engine = self.engine,
+                                                table = self.traceheader,
+                                                metadata = metadata,
+                                                prefix = '')
+        self.assertTrue(table_updated)
+
+        # The end time of the existing rows is computed.
+        result = self.engine.execute(sqa.select([new_table.c.numsamp,
+                                                 new_table.c.begin_time,
+                                                 new_table.c.end_time]).order_by(new_table.c.id)).fetchall()
+        self.assertEqual(len(result), 10)
+        for cur_row in result:
+            self.assertAlmostEqual(cur_row.end_time, cur_row.begin_time + cur_row.numsamp / 100.)
+
+        # The indexes are created.
+        index_names = [x['name'] for x in sqa.inspect(self.engine).get_indexes(new_table.name)]
+        for cur_index in new_table.indexes:
+            self.assertIn(cur_index.name, index_names)
+
+        # A second migration doesn't change the table.
+        metadata = sqa.MetaData()
+        metadata.reflect(self.engine)
+        table_updated = db_util.update_db_table(engine = self.engine,
+                                                table = self.traceheader,
+                                                metadata = metadata,
+                                                prefix = '')
+        self.assertFalse(table_updated)
+
+
+    def test_bulk_write(self):
+        ''' Test the bulk insert and update of rows with the allocated ids.
+        '''
+        db_table = self.traceheader.__table__
+        db_table.create(self.engine)
+
+        def create_row(k):
+            return {'id': None,
+                    'file_type': 'mseed',
+                    'wf_id': 1,
+                    'filename': 'file_%02d.msd' % k,
+                    'orig_path': '/data',
+                    'recorder_serial': 'ALBA',
+                    'stream': 'HHZ',
+                    'sps': 100,
+                    'numsamp': 360000,
+                    'begin_date': '',
+                    'begin_time': 3600. * k,
+                    'end_time': 3600. * (k + 1)}
+
+        # Insert rows without requesting the ids.
+        rows = [create_row(k) for k in range(3)]
+        ids = db_util.bulk_write(self.engine, table = self.traceheader,
+                                 rows = rows)
+        self.assertEqual(ids, [None, None, None])
+
+        # The ids of the inserted rows follow the existing ones.
+        rows = [create_row(k) for k in range(3, 28)]
+        ids = db_util.bulk_write(self.engine, table = self.traceheader,
+                                 rows = rows, chunk_size = 10,
+                                 return_ids = True)
+        self.assertEqual(ids, range(4, 29))
+        self.assertEqual([x['id'] for x in rows], ids)
+        result = self.engine.execute(sqa.select([db_table.c.id,
+                                                 db_table.c.filename]).order_by(db_table.c.id)).fetchall()
+        self.assertEqual(len(result), 28)
+        for cur_row in rows:
+            self.assertEqual(result[cur_row['id'] - 1].filename, cur_row['filename'])
+
+        # Update existing rows and insert new ones in the same chunk.
+        rows[0]['filename'] = 'changed.msd'
+        rows = [rows[0], create_row(28)]
+        ids = db_util.bulk_write(self.engine, table = self.traceheader,
+                                 rows = rows, return_ids = True)
+        self.assertEqual(ids, [4, 29])
+        result = self.engine.execute(sqa.select([db_table.c.filename]).where(db_table.c.id.in_(ids)).order_by(db_table.c.id)).fetchall()
+        self.assertEqual([x.filename for x in result], ['changed.msd', 'file_28.msd'])
+
+
+
+def suite():
+    return unittest.makeSuite(DatabaseUtilTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Test the time index of the catalogs.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+
+'''
+
+import unittest
+import random
+
+from psysmon.core.indexing import TimeIndex
+
+
+class Item(object):
+    ''' A catalog item used for the tests.
+    '''
+    def __init__(self, start, end, label):
+        self.start = start
+        self.end = end
+        self.label = label
+
+
+class TimeIndexTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.core.indexing.TimeIndex
+    """
+
+    def setUp(self):
+        random.seed(1)
+        self.items = []
+        for k in range(500):
+            start = random.uniform(0, 1000)
+            self.items.append(Item(start = start,
+                                   end = start + random.uniform(0, 20),
+                                   label = random.choice(['P', 'S', 'Sg'])))
+
+        self.index = TimeIndex(start_key = lambda x: x.start,
+                               end_key = lambda x: x.end,
+                               keys = {'label': lambda x: x.label})
+        # Add the items in bulk and one by one.
+        self.index.add(self.items[:400])
+        for cur_item in self.items[400:]:
+            self.index.add([cur_item, ])
+
+
+    def test_query(self):
+        ''' Test the time span and hash index queries.
+        '''
+        self.assertEqual(len(self.index), 500)
+        self.assertEqual(self.index.query(), sorted(self.items, key = lambda x: x.start))
+
+        for start, end in [(100, 200), (0, 10), (990, 1100), (-10, -1)]:
+            expected = [x for x in self.items if start <= x.start <= end]
+            expected.sort(key = lambda x: x.start)
+            self.assertEqual(self.index.query(start_time = start, end_time = end), expected)
+
+            expected = [x for x in expected if x.label == 'S']
+            self.assertEqual(self.index.query(start_time = start, end_time = end, label = 'S'), expected)
+
+            expected = [x for x in self.items if x.end >= start and x.start <= end]
+            expected.sort(key = lambda x: x.start)
+            self.assertEqual(self.index.query(start_time = start, end_time = end, overlap = True), expected)
+
+        self.assertEqual(self.index.query(label = 'X'), [])
+
+
+    def test_overlap_long_item(self):
+        ''' Test the overlap queries with items of very different lengths.
+        '''
+        long_item = Item(start = -5000, end = 5000, label = 'P')
+        self.index.add([long_item, ])
+        self.items.append(long_item)
+        self.assertEqual(sorted(self.index.length_buckets.keys())[-1], 14)
+
+        for start, end in [(100, 200), (0, 10), (990, 1100), (-10, -1), (50, 40)]:
+            expected = [x for x in self.items if x.end >= start and x.start <= end]
+            expected.sort(key = lambda x: x.start)
+            self.assertEqual(self.index.query(start_time = start, end_time = end, overlap = True), expected)
+
+            expected = [x for x in expected if x.label == 'P']
+            self.assertEqual(self.index.query(start_time = start, end_time = end, overlap = True, label = 'P'), expected)
+
+        # The bucket of the long item is removed with the item.
+        long_item.end = -4990
+        self.index.update([long_item, ])
+        self.assertEqual(sorted(self.index.length_buckets.keys())[-1], 5)
+        self.assertEqual(self.index.query(start_time = 100, end_time = 101, overlap = True),
+                         sorted([x for x in self.items if x.end >= 100 and x.start <= 101], key = lambda x: x.start))
+        self.assertEqual(self.index.query(start_time = -4995, end_time = -4994, overlap = True), [long_item, ])
+
+
+    def test_nearest(self):
+        ''' Test the nearest item search.
+        '''
+        for cur_time in [-5, 0, 123.4, 500, 999.9, 2000]:
+            dist = [abs(x.start - cur_time) for x in self.items]
+            expected = self.items[dist.index(min(dist))]
+            self.assertIs(self.index.nearest(cur_time), expected)
+
+            candidates = [x for x in self.items if x.label == 'P' and 100 <= x.start <= 200]
+            dist = [abs(x.start - cur_time) for x in candidates]
+            expected = candidates[dist.index(min(dist))]
+            self.assertIs(self.index.nearest(cur_time, start_time = 100, end_time = 200, label = 'P'), expected)
+
+            candidates = [x for x in self.items if 100 <= x.start <= 200]
+            dist = [abs(x.start - cur_time) for x in candidates]
+            expected = candidates[dist.index(min(dist))]
+            self.assertIs(self.index.nearest(cur_time, start_time = 100, end_time = 200), expected)
+
+        self.assertIsNone(self.index.nearest(10, start_time = 2000))
+
+
+    def test_nearest_multiple_keys(self):
+        ''' Test the nearest item search matching several hash indexes.
+        '''
+        index = TimeIndex(start_key = lambda x: x.start,
+                          keys = {'label': lambda x: x.label,
+                                  'long': lambda x: x.end - x.start > 10})
+        index.add(self.items)
+        index.remove(self.items[:50])
+        items = self.items[50:]
+
+        for cur_time in [-5, 0, 123.4, 500, 999.9, 2000]:
+            candidates = [x for x in items if x.label == 'Sg' and x.end - x.start > 10]
+            dist = [abs(x.start - cur_time) for x in candidates]
+            expected = candidates[dist.index(min(dist))]
+            self.assertIs(index.nearest(cur_time, label = 'Sg', long = True), expected)
+
+            candidates = [x for x in candidates if 300 <= x.start <= 400]
+            dist = [abs(x.start - cur_time) for x in candidates]
+            expected = candidates[dist.index(min(dist))]
+            self.assertIs(index.nearest(cur_time, start_time = 300, end_time = 400,
+                                        label = 'Sg', long = True), expected)
+
+        self.assertIsNone(index.nearest(10, label = 'X'))
+        self.assertIsNone(index.nearest(10, start_time = 2000, label = 'P'))
+
+
+    def test_remove_and_update(self):
+        ''' Test the removing and updating of items.
+        '''
+        removed = self.items[::2]
+        self.index.remove(removed)
+        self.assertEqual(len(self.index), 250)
+        for cur_item in removed:
+            self.assertNotIn(cur_item, self.index)
+        kept = self.items[1::2]
+        self.assertEqual(self.index.query(label = 'P'),
+                         sorted([x for x in kept if x.label == 'P'], key = lambda x: x.start))
+
+        # Change an indexed item.
+        cur_item = kept[0]
+        cur_item.start = 2000
+        cur_item.end = 2100
+        cur_item.label = 'X'
+        self.index.update([cur_item, ])
+        self.assertEqual(self.index.query(start_time = 1500), [cur_item, ])
+        self.assertEqual(self.index.query(label = 'X'), [cur_item, ])
+
+        # Updating items not contained in the index doesn't add them.
+        self.index.update(removed[:1])
+        self.assertNotIn(removed[0], self.index)
+
+        self.index.clear()
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.query(label = 'P'), [])
+
+
+
+def suite():
+    return unittest.makeSuite(TimeIndexTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
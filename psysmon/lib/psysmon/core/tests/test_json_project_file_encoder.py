@@ -439,9 +439,18 @@ class ProjectFileEncoderTestCase(unittest.TestCase):
             ], 
             "__class__": "PsysmonDbWaveClient", 
             "__module__": "psysmon.core.waveclient", 
+            "auto_prefetch": true, 
+            "decode_mode": "thread", 
+            "decode_workers": 1, 
+            "header_cache_ttl": 300, 
             "name": "db client", 
             "options": {}, 
-            "stock_window": 3600
+            "prefetch_workers": 1, 
+            "stock_policy": "lru", 
+            "stock_size": 0, 
+            "stock_window": 3600, 
+            "waveform_cache_dir": null, 
+            "waveform_cache_size": 1024
         }
     }
 }'''
@@ -11,6 +11,32 @@ import psysmon.core.test_util as test_util
 import os
 import shutil
 from obspy.core.utcdatetime import UTCDateTime
+from obspy.core import Stream, Trace
+import numpy as np
+
+
+class RecordingWaveClient(object):
+    ''' A waveclient recording the requested SCNLs.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = []
+
+    def getWaveform(self, startTime, endTime, scnl, read_only = False,
+                    prefetch = None):
+        self.requests.append(list(scnl))
+        stream = Stream()
+        for cur_station, cur_channel, cur_network, cur_location in scnl:
+            cur_trace = Trace(data = np.zeros(10))
+            cur_trace.stats.station = cur_station
+            cur_trace.stats.channel = cur_channel
+            cur_trace.stats.network = cur_network
+            cur_trace.stats.location = cur_location
+            cur_trace.stats.starttime = startTime
+            stream.append(cur_trace)
+        return stream
+
 
 class ProjectTestCase(unittest.TestCase):
     """
@@ -202,6 +228,36 @@ class ProjectTestCase(unittest.TestCase):
         shutil.rmtree(self.db_project.projectDir)
 
 
+    def test_request_data_stream(self):
+        ''' Test the routing of the data requests to the waveclients.
+        '''
+        client_1 = RecordingWaveClient('client_1')
+        client_2 = RecordingWaveClient('client_2')
+        self.db_project.waveclient = {'client_1': client_1,
+                                      'client_2': client_2}
+        self.db_project.defaultWaveclient = 'client_1'
+        self.db_project.scnlDataSources = {('ST02', 'HHZ', 'XX', '00'): 'client_2',
+                                           ('ST03', 'HHZ', 'XX', '00'): 'client_2'}
+
+        scnl = [('ST01', 'HHZ', 'XX', '00'),
+                ('ST02', 'HHZ', 'XX', '00'),
+                ('ST03', 'HHZ', 'XX', '00')]
+        data_sources = self.db_project.get_data_sources(scnl)
+        self.assertEqual(data_sources, {'client_1': [('ST01', 'HHZ', 'XX', '00')],
+                                        'client_2': [('ST02', 'HHZ', 'XX', '00'),
+                                                     ('ST03', 'HHZ', 'XX', '00')]})
+
+        start_time = UTCDateTime('2010-08-31T08:00:00')
+        stream = self.db_project.request_data_stream(start_time = start_time,
+                                                     end_time = start_time + 10,
+                                                     scnl = scnl)
+
+        # Each waveclient is asked only for its own SCNLs.
+        self.assertEqual(client_1.requests, [[('ST01', 'HHZ', 'XX', '00')]])
+        self.assertEqual(client_2.requests, [[('ST02', 'HHZ', 'XX', '00'),
+                                              ('ST03', 'HHZ', 'XX', '00')]])
+        self.assertEqual([x.stats.station for x in stream], ['ST01', 'ST02', 'ST03'])
+
 
 
 
@@ -32,13 +32,33 @@ import nose.plugins.attrib as nose_attrib
 import unittest
 import logging
 
+import numpy as np
+from obspy.core import Trace, Stream, UTCDateTime
+
 import psysmon
+from psysmon.core.waveclient import WaveformStock
+from psysmon.core.waveclient import WaveClient
+from psysmon.core.waveclient import stream_view
+from psysmon.core.waveclient import coalesce_intervals
+from psysmon.core.waveclient import get_chunk_windows
+from psysmon.core.waveclient import PsysmonDbWaveClient
+from psysmon.core.waveclient import TraceheaderCache
+from psysmon.core.waveclient import DecodedWaveformCache
+from psysmon.core.waveclient import PrefetchScheduler
+from psysmon.core.waveclient import EarthwormWaveclient
+from psysmon.core.waveclient import WaveServerConnectionPool
 from psysmon.core.test_util import create_psybase
 from psysmon.core.test_util import create_empty_project
 from psysmon.core.test_util import drop_project_database_tables
 from psysmon.core.test_util import clear_project_database_tables
 from psysmon.core.test_util import remove_project_filestructure
 import os
+import shutil
+import tempfile
+import threading
+import socket
+import struct
+import time
 
 @nose_attrib.attr('network')
 class WaveclientTestCase(unittest.TestCase):
@@ -155,8 +175,1083 @@ class WaveclientTestCase(unittest.TestCase):
 
 
 
+class WaveformStockTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.core.waveclient.WaveformStock
+    """
+
+    def create_trace(self, start_time, npts, sps = 100., station = 'STAT', channel = 'HHZ'):
+        ''' Create a test trace with a linear ramp as data.
+        '''
+        trace = Trace(data = np.arange(npts, dtype = np.float64))
+        trace.stats.station = station
+        trace.stats.channel = channel
+        trace.stats.network = 'XX'
+        trace.stats.location = ''
+        trace.stats.sampling_rate = sps
+        trace.stats.starttime = start_time
+        return trace
+
+
+    def test_add_and_get(self):
+        ''' Test the adding and the selection of stock data.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000),
+                                   self.create_trace(start_time, 1000, station = 'OTHR')]))
+
+        self.assertEqual(len(stock.scnl), 2)
+        traces = stock.get(scnl = ('STAT', 'HHZ', 'XX', '--'),
+                           start_time = start_time + 1,
+                           end_time = start_time + 2)
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0].stats.starttime, start_time + 1)
+        self.assertEqual(traces[0].stats.npts, 101)
+        self.assertEqual(traces[0].stats.station, 'STAT')
+
+        traces = stock.get(scnl = ('MISS', 'HHZ', 'XX', '--'),
+                           start_time = start_time,
+                           end_time = start_time + 10)
+        self.assertEqual(traces, [])
+
+
+    def test_merge_adjacent(self):
+        ''' Test the merging of adjacent and overlapping traces.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time + 20, 1000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time + 10, 1000), ]))
+
+        channel = stock.get_channel(('STAT', 'HHZ', 'XX', ''))
+        self.assertEqual(len(channel.traces), 1)
+        self.assertEqual(channel.traces[0].stats.starttime, start_time)
+        self.assertEqual(channel.traces[0].stats.npts, 3000)
+
+
+    def test_sequential_append(self):
+        ''' Test the appending of consecutive traces to a stock segment.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        traces = [self.create_trace(start_time + k * 10, 1000) for k in range(20)]
+        # The traces overlap by one sample.
+        traces.append(self.create_trace(start_time + 199.99, 1001))
+        stock.add(Stream(traces = [traces[0], ]))
+        channel = stock.get_channel(('STAT', 'HHZ', 'XX', ''))
+        view = channel.traces[0].data
+
+        n_realloc = 0
+        for cur_trace in traces[1:]:
+            data_address = channel.traces[0].data.ctypes.data
+            stock.add(Stream(traces = [cur_trace, ]))
+            if channel.traces[0].data.ctypes.data != data_address:
+                n_realloc += 1
+
+        # The buffer grows geometrically.
+        self.assertTrue(n_realloc <= 6)
+        self.assertEqual(len(channel.traces), 1)
+        self.assertEqual(channel.traces[0].stats.npts, 21000)
+        expected = np.concatenate([np.tile(np.arange(1000.), 20), np.arange(1., 1001.)])
+        self.assertTrue(np.all(channel.traces[0].data == expected))
+        # The added traces and the data held before are not modified.
+        self.assertEqual(traces[0].stats.npts, 1000)
+        self.assertTrue(np.all(view == np.arange(1000.)))
+
+        # Data prepended and bridging a gap.
+        stock.add(Stream(traces = [self.create_trace(start_time + 230, 1000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time + 210, 2000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time - 10, 1000), ]))
+        self.assertEqual(len(channel.traces), 1)
+        self.assertEqual(channel.traces[0].stats.starttime, start_time - 10)
+        self.assertEqual(channel.traces[0].stats.npts, 25000)
+
+
+    def test_location_wildcard(self):
+        ''' Test the selection of all locations using the location wildcard.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        trace = self.create_trace(start_time, 1000)
+        trace.stats.location = '00'
+        stock.add(Stream(traces = [trace, ]))
+
+        for cur_location in [None, '--']:
+            traces = stock.get(scnl = ('STAT', 'HHZ', 'XX', cur_location),
+                               start_time = start_time,
+                               end_time = start_time + 5)
+            self.assertEqual(len(traces), 1)
+            self.assertEqual(traces[0].stats.location, '00')
+            missing = stock.get_missing(scnl = ('STAT', 'HHZ', 'XX', cur_location),
+                                        start_time = start_time,
+                                        end_time = start_time + 20)
+            self.assertEqual(missing, [(start_time + 10, start_time + 20)])
+
+        self.assertEqual(stock.get(scnl = ('STAT', 'HHZ', 'XX', ''),
+                                   start_time = start_time,
+                                   end_time = start_time + 5), [])
+
+
+    def test_sampling_rate_mismatch(self):
+        ''' Test the adding of data with a different sampling rate.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000), ]))
+        # Overlapping data with a different sampling rate is not added.
+        stock.add(Stream(traces = [self.create_trace(start_time + 5, 1000, sps = 50.), ]))
+        # Adjacent data with a different sampling rate is kept separately.
+        stock.add(Stream(traces = [self.create_trace(start_time + 10, 1000, sps = 50.), ]))
+
+        channel = stock.get_channel(('STAT', 'HHZ', 'XX', ''))
+        self.assertEqual([x.stats.sampling_rate for x in channel.traces], [100., 50.])
+        self.assertEqual([x.stats.npts for x in channel.traces], [1000, 1000])
+
+
+    def test_gaps(self):
+        ''' Test the handling of data gaps.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time + 30, 1000), ]))
+
+        channel = stock.get_channel(('STAT', 'HHZ', 'XX', ''))
+        self.assertEqual(len(channel.traces), 2)
+        self.assertEqual(channel.start_times, [start_time.timestamp, (start_time + 30).timestamp])
+
+        traces = stock.get(scnl = ('STAT', 'HHZ', 'XX', ''),
+                           start_time = start_time + 5,
+                           end_time = start_time + 35)
+        self.assertEqual(len(traces), 2)
+
+        # Fill the gap.
+        stock.add(Stream(traces = [self.create_trace(start_time + 10, 2000), ]))
+        self.assertEqual(len(channel.traces), 1)
+        self.assertEqual(channel.traces[0].stats.npts, 4000)
+
+
+    def test_get_missing(self):
+        ''' Test the computation of the data missing in the stock.
+        '''
+        stock = WaveformStock()
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+
+        missing = stock.get_missing(scnl = scnl,
+                                    start_time = start_time,
+                                    end_time = start_time + 60)
+        self.assertEqual(missing, [(start_time, start_time + 60)])
+
+        stock.add(Stream(traces = [self.create_trace(start_time + 10, 1000), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time + 30, 1000), ]))
+        missing = stock.get_missing(scnl = scnl,
+                                    start_time = start_time,
+                                    end_time = start_time + 60)
+        self.assertEqual(missing, [(start_time, start_time + 10),
+                                   (start_time + 20, start_time + 30),
+                                   (start_time + 40, start_time + 60)])
+
+        missing = stock.get_missing(scnl = scnl,
+                                    start_time = start_time + 12,
+                                    end_time = start_time + 18)
+        self.assertEqual(missing, [])
+
+        stats = stock.statistics
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+
+    def test_coalesce_intervals(self):
+        ''' Test the merging of time intervals.
+        '''
+        intervals = [(20, 30), (0, 10), (10, 15), (31, 40), (50, 60)]
+        self.assertEqual(coalesce_intervals(intervals),
+                         [(0, 15), (20, 30), (31, 40), (50, 60)])
+        self.assertEqual(coalesce_intervals(intervals, tolerance = 1),
+                         [(0, 15), (20, 40), (50, 60)])
+
+
+    def test_trim(self):
+        ''' Test the trimming of the stock.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000),
+                                   self.create_trace(start_time + 100, 1000, station = 'OTHR')]))
+        stock.trim(start_time = start_time + 2,
+                   end_time = start_time + 5)
+
+        self.assertEqual(stock.scnl, [('STAT', 'HHZ', 'XX', ''), ])
+        channel = stock.get_channel(('STAT', 'HHZ', 'XX', ''))
+        self.assertEqual(channel.traces[0].stats.starttime, start_time + 2)
+        self.assertEqual(channel.traces[0].stats.endtime, start_time + 5)
+
+
+
+    def test_eviction(self):
+        ''' Test the eviction of stock data exceeding the size limit.
+        '''
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        # Each trace has a size of 8000 bytes.
+        stock = WaveformStock(max_size = 20000, policy = 'lru')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA1'), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA2'), ]))
+        stock.get(scnl = ('STA1', 'HHZ', 'XX', ''),
+                  start_time = start_time,
+                  end_time = start_time + 5)
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA3'), ]))
+
+        # The needed size is trimmed from the start of the least recently
+        # used segment.
+        channel = stock.get_channel(('STA2', 'HHZ', 'XX', ''))
+        self.assertEqual(channel.traces[0].stats.starttime, start_time + 5)
+        self.assertEqual(channel.traces[0].stats.npts, 500)
+        self.assertEqual(channel.traces[0].data[0], 500.)
+        self.assertEqual(stock.nbytes, 20000)
+        stats = stock.statistics
+        self.assertEqual(stats['evictions'], 1)
+
+        # Test the least frequently used policy.
+        stock = WaveformStock(max_size = 20000, policy = 'lfu')
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA1'), ]))
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA2'), ]))
+        for k in range(3):
+            stock.get(scnl = ('STA1', 'HHZ', 'XX', ''),
+                      start_time = start_time,
+                      end_time = start_time + 5)
+        stock.get(scnl = ('STA2', 'HHZ', 'XX', ''),
+                  start_time = start_time,
+                  end_time = start_time + 5)
+        stock.get(scnl = ('STA2', 'HHZ', 'XX', ''),
+                  start_time = start_time + 20,
+                  end_time = start_time + 25)
+        stock.add(Stream(traces = [self.create_trace(start_time, 1000, station = 'STA3'), ]))
+
+        self.assertEqual(stock.get_channel(('STA1', 'HHZ', 'XX', '')).traces[0].stats.npts, 1000)
+        self.assertEqual(stock.get_channel(('STA2', 'HHZ', 'XX', '')).traces[0].stats.npts, 500)
+
+
+    def test_eviction_sequential_access(self):
+        ''' Test the eviction of a segment growing by sequential requests.
+        '''
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+        client = RampWaveClient('ramp', auto_prefetch = False)
+        # The ramp has 1 sample per second, the limit holds 2500 samples.
+        client.stock.max_size = 20000
+        for k in range(20):
+            cur_start = start_time + k * 1000
+            stream = client.getWaveform(startTime = cur_start,
+                                        endTime = cur_start + 1000,
+                                        scnl = scnl)
+            self.assertEqual(stream[0].stats.starttime, cur_start)
+            self.assertEqual(stream[0].stats.endtime, cur_start + 999)
+            self.assertTrue(client.stock.nbytes <= 20000)
+
+        # The data of the last request is kept in the stock.
+        channel = client.stock.get_channel(scnl[0])
+        self.assertEqual(len(channel.traces), 1)
+        self.assertTrue(channel.traces[0].stats.starttime <= start_time + 19000)
+        self.assertTrue(client.stock.statistics['evictions'] > 0)
+
+
+    def test_nbytes(self):
+        ''' Test the size of the stock data owning arrays.
+        '''
+        stock = WaveformStock()
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        trace = self.create_trace(start_time, 1000)
+        # A trace holding a view of a larger array.
+        view_trace = self.create_trace(start_time, 1000, station = 'VIEW')
+        view_trace.data = np.zeros(4000)[:1000]
+        stock.add(Stream(traces = [trace, view_trace]))
+        self.assertEqual(stock.nbytes, 8000 + 32000)
+        self.assertEqual(stock.get_channel(('VIEW', 'HHZ', 'XX', '')).nbytes, 32000)
+
+
+    def test_read_only(self):
+        ''' Test the zero-copy read path of the stock.
+        '''
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        client = WaveClient(name = 'test client')
+        client.add_to_stock(Stream(traces = [self.create_trace(start_time, 1000), ]))
+        stock_trace = client.stock.get_channel(('STAT', 'HHZ', 'XX', '')).traces[0]
+
+        stream = client.get_from_stock(station = 'STAT',
+                                       channel = 'HHZ',
+                                       network = 'XX',
+                                       location = '',
+                                       start_time = start_time + 1,
+                                       end_time = start_time + 2,
+                                       read_only = True)
+        self.assertEqual(len(stream), 1)
+        self.assertFalse(stream[0].data.flags.writeable)
+        self.assertTrue(np.may_share_memory(stream[0].data, stock_trace.data))
+        self.assertRaises(ValueError, stream[0].data.__setitem__, 0, 1.)
+
+        stream = client.get_from_stock(station = 'STAT',
+                                       channel = 'HHZ',
+                                       network = 'XX',
+                                       location = '',
+                                       start_time = start_time + 1,
+                                       end_time = start_time + 2)
+        self.assertTrue(stream[0].data.flags.writeable)
+        self.assertFalse(np.may_share_memory(stream[0].data, stock_trace.data))
+
+        view = stream_view(stream)
+        self.assertFalse(view[0].data.flags.writeable)
+        self.assertTrue(np.may_share_memory(view[0].data, stream[0].data))
+        view[0].stats.station = 'TEST'
+        self.assertEqual(stream[0].stats.station, 'STAT')
+
+
+
+class FilePlanWaveClient(PsysmonDbWaveClient):
+    ''' A database waveclient planning the file access using a fixed list
+    of files instead of the traceheader table.
+    '''
+
+    def __init__(self, name, files, **kwargs):
+        PsysmonDbWaveClient.__init__(self, name = name, **kwargs)
+        # The files as tuples (filename, start_time, end_time).
+        self.files = files
+        self.missing = []
+
+    def get_file_plan(self, missing):
+        self.missing.append(missing)
+        file_plan = {}
+        for cur_scnl, cur_intervals in missing.iteritems():
+            for cur_start, cur_end in cur_intervals:
+                for cur_filename, cur_file_start, cur_file_end in self.files:
+                    if cur_file_start > cur_end or cur_file_end < cur_start:
+                        continue
+                    cur_plan = file_plan.setdefault(cur_filename, {'file_type': 'MSEED',
+                                                                   'requests': []})
+                    cur_plan['requests'].append({'scnl': cur_scnl,
+                                                 'serial': 'SER01',
+                                                 'stream': ':' + cur_scnl[1],
+                                                 'start_time': max(cur_start, cur_file_start),
+                                                 'end_time': min(cur_end, cur_file_end)})
+        return file_plan
+
+
+
+class FilePlanTestCase(unittest.TestCase):
+    ''' Test the loading of the file plan of the pSysmon database waveclient.
+    '''
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.start_time = UTCDateTime('2015-01-01T00:00:00')
+        self.file_plan = {}
+        for k in range(4):
+            cur_start = self.start_time + k * 60
+            stream = Stream()
+            for cur_channel in ['HHZ', 'HHN']:
+                trace = Trace(data = np.arange(6000, dtype = np.int32) + k)
+                trace.stats.station = 'SER01'
+                trace.stats.channel = cur_channel
+                trace.stats.sampling_rate = 100.
+                trace.stats.starttime = cur_start
+                stream.append(trace)
+            filename = os.path.join(self.data_dir, 'file_%02d.msd' % k)
+            stream.write(filename, format = 'MSEED')
+            requests = [{'scnl': ('STAT', 'HHZ', 'XX', '00'),
+                         'serial': 'SER01',
+                         'stream': ':HHZ',
+                         'start_time': cur_start + 10,
+                         'end_time': cur_start + 20},
+                        {'scnl': ('STAT', 'HHN', 'XX', '00'),
+                         'serial': 'SER01',
+                         'stream': ':HHN',
+                         'start_time': cur_start + 30,
+                         'end_time': cur_start + 40}]
+            self.file_plan[filename] = {'file_type': 'MSEED',
+                                        'requests': requests}
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+
+    def test_get_waveform(self):
+        ''' Test the loading of the data missing in the stock.
+        '''
+        files = [(x, self.start_time + k * 60, self.start_time + k * 60 + 59.99) for k, x in enumerate(sorted(self.file_plan.keys()))]
+        client = FilePlanWaveClient(name = 'test client',
+                                    files = files,
+                                    auto_prefetch = False)
+        scnl = ('STAT', 'HHZ', 'XX', '00')
+        stream = client.getWaveform(startTime = self.start_time + 10,
+                                    endTime = self.start_time + 100,
+                                    scnl = [scnl, ])
+        self.assertEqual(len(stream), 1)
+        self.assertEqual(stream[0].id, 'XX.STAT.00.HHZ')
+        self.assertEqual(stream[0].stats.starttime, self.start_time + 10)
+        self.assertEqual(stream[0].stats.endtime, self.start_time + 100)
+        self.assertEqual(stream[0].data[0], 1000)
+        self.assertEqual(stream[0].data[-1], 4001)
+
+        # Only the data missing in the stock is loaded.
+        stream = client.getWaveform(startTime = self.start_time + 50,
+                                    endTime = self.start_time + 150,
+                                    scnl = [scnl, ])
+        self.assertEqual(len(stream), 1)
+        self.assertEqual(stream[0].stats.starttime, self.start_time + 50)
+        self.assertEqual(stream[0].stats.endtime, self.start_time + 150)
+        self.assertEqual(len(client.missing), 2)
+        self.assertEqual(client.missing[1].keys(), [scnl, ])
+        self.assertEqual(client.missing[1][scnl][0][0], self.start_time + 100.01)
+
+
+    def test_load_file_plan(self):
+        ''' Test the serial and parallel loading of the file plan.
+        '''
+        client = PsysmonDbWaveClient(name = 'test client')
+        serial_stream = client.load_file_plan(self.file_plan)
+        self.assertEqual(len(serial_stream), 8)
+        self.assertEqual(serial_stream[0].id, 'XX.STAT.00.HHZ')
+        self.assertEqual(serial_stream[0].stats.starttime, self.start_time + 10)
+        self.assertEqual(serial_stream[0].stats.endtime, self.start_time + 20)
+        self.assertEqual(serial_stream[1].id, 'XX.STAT.00.HHN')
+        self.assertEqual(serial_stream[1].stats.starttime, self.start_time + 30)
+        self.assertEqual(serial_stream[1].data.dtype, np.float64)
+        # The traces follow the order of the sorted filenames.
+        self.assertEqual([x.stats.starttime for x in serial_stream[::2]],
+                         [self.start_time + k * 60 + 10 for k in range(4)])
+        np.testing.assert_array_equal(serial_stream[2].data, np.arange(1000, 2001) + 1)
+
+        for cur_mode, cur_workers in [('thread', 3), ('process', 3), ('thread', 0)]:
+            client = PsysmonDbWaveClient(name = 'test client',
+                                         decode_workers = cur_workers,
+                                         decode_mode = cur_mode)
+            stream = client.load_file_plan(self.file_plan)
+            self.assertEqual(len(stream), len(serial_stream))
+            for cur_trace, cur_serial_trace in zip(stream, serial_stream):
+                self.assertEqual(cur_trace.id, cur_serial_trace.id)
+                self.assertEqual(cur_trace.stats.starttime, cur_serial_trace.stats.starttime)
+                np.testing.assert_array_equal(cur_trace.data, cur_serial_trace.data)
+
+
+    def test_load_file_plan_cached(self):
+        ''' Test the loading of the file plan using the decoded waveform cache.
+        '''
+        cache_dir = os.path.join(self.data_dir, 'cache')
+        client = PsysmonDbWaveClient(name = 'test client')
+        expected_stream = client.load_file_plan(self.file_plan)
+
+        client = PsysmonDbWaveClient(name = 'test client',
+                                     waveform_cache_dir = cache_dir)
+        for k in range(2):
+            stream = client.load_file_plan(self.file_plan)
+            self.assertEqual(len(stream), len(expected_stream))
+            for cur_trace, cur_expected_trace in zip(stream, expected_stream):
+                self.assertEqual(cur_trace.id, cur_expected_trace.id)
+                self.assertEqual(cur_trace.stats.starttime, cur_expected_trace.stats.starttime)
+                np.testing.assert_array_equal(cur_trace.data, cur_expected_trace.data)
+
+        cache = DecodedWaveformCache(cache_dir = cache_dir)
+        self.assertEqual(len(cache.get_entries()), 8)
+
+        # Cached data is memory mapped.
+        self.assertFalse(stream[0].data.flags.writeable)
+
+
+    def test_waveform_cache_cleanup(self):
+        ''' Test the cleanup of the decoded waveform cache.
+        '''
+        cache_dir = os.path.join(self.data_dir, 'cache')
+        client = PsysmonDbWaveClient(name = 'test client',
+                                     waveform_cache_dir = cache_dir,
+                                     waveform_cache_size = 1)
+        client.load_file_plan(self.file_plan)
+        cache = DecodedWaveformCache(cache_dir = cache_dir)
+        self.assertEqual(client.waveform_cache_nbytes, cache.nbytes)
+
+        # Loading cached data doesn't change the estimated size.
+        client.load_file_plan(self.file_plan)
+        self.assertEqual(client.waveform_cache_nbytes, cache.nbytes)
+
+        # The cache is only scanned if the estimated size exceeds the
+        # limit.
+        for cur_key, last_access, nbytes, filenames in cache.get_entries()[:4]:
+            os.remove(filenames[0])
+        client.check_waveform_cache(written_bytes = 1000)
+        self.assertNotEqual(client.waveform_cache_nbytes, cache.nbytes)
+        client.check_waveform_cache(written_bytes = 1024 * 1024)
+        self.assertEqual(client.waveform_cache_nbytes, cache.nbytes)
+        self.assertEqual(len(cache.get_entries()), 4)
+
+        client.waveform_cache_size = 0.06
+        client.check_waveform_cache(written_bytes = 1024 * 1024)
+        self.assertEqual(len(cache.get_entries()), 1)
+        self.assertEqual(client.waveform_cache_nbytes, cache.nbytes)
+
+
+
+class TraceheaderCacheTestCase(unittest.TestCase):
+    ''' Test the traceheader cache of the pSysmon database waveclient.
+    '''
+
+    def test_buckets(self):
+        ''' Test the computation of the time buckets.
+        '''
+        cache = TraceheaderCache(bucket_length = 3600)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        buckets = cache.get_buckets(start_time + 10, start_time + 3600)
+        self.assertEqual(len(buckets), 1)
+        buckets = cache.get_buckets(start_time + 10, start_time + 3601)
+        self.assertEqual(len(buckets), 2)
+        self.assertEqual(cache.get_bucket_span(buckets[1]), (start_time + 3600, start_time + 7200))
+
+
+    def test_get_put(self):
+        ''' Test the lookup of cached entries.
+        '''
+        cache = TraceheaderCache(ttl = 0)
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        self.assertIsNone(cache.get(scnl, 10))
+        cache.put(scnl, 10, ['header_1', ])
+        cache.put(scnl, 11, [])
+        self.assertEqual(cache.get(scnl, 10), ['header_1', ])
+        self.assertEqual(cache.get(scnl, 11), [])
+        stats = cache.statistics
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 2)
+
+
+    def test_ttl(self):
+        ''' Test the expiration of the cache entries.
+        '''
+        cache = TraceheaderCache(ttl = 10)
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        cache.put(scnl, 10, ['header_1', ])
+        self.assertEqual(cache.get(scnl, 10), ['header_1', ])
+        cache.entries[(scnl, 10)] = (cache.entries[(scnl, 10)][0] - 20, ['header_1', ])
+        self.assertIsNone(cache.get(scnl, 10))
+        self.assertEqual(cache.statistics['entries'], 0)
+
+
+    def test_invalidate(self):
+        ''' Test the invalidation of the cache entries.
+        '''
+        cache = TraceheaderCache(ttl = 0, bucket_length = 3600)
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        buckets = cache.get_buckets(start_time, start_time + 4 * 3600)
+        for cur_bucket in buckets:
+            cache.put(scnl, cur_bucket, [])
+
+        cache.invalidate(start_time = start_time + 3700, end_time = start_time + 7300)
+        self.assertEqual(sorted([x[1] for x in cache.entries.keys()]), [buckets[0], buckets[3]])
+        self.assertEqual(cache.statistics['invalidations'], 2)
+
+        cache.invalidate()
+        self.assertEqual(len(cache.entries), 0)
+
+
+    def test_max_entries(self):
+        ''' Test the limit of the number of entries.
+        '''
+        cache = TraceheaderCache(ttl = 0, max_entries = 2)
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        for k in range(3):
+            cache.put(scnl, k, [])
+        self.assertEqual(list(cache.entries.keys()), [(scnl, 1), (scnl, 2)])
+
+
+
+class DecodedWaveformCacheTestCase(unittest.TestCase):
+    ''' Test the persistent decoded waveform cache.
+    '''
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def create_trace(self, npts):
+        trace = Trace(data = np.arange(npts, dtype = np.float64))
+        trace.stats.station = 'STAT'
+        trace.stats.channel = 'HHZ'
+        trace.stats.network = 'XX'
+        trace.stats.sampling_rate = 100.
+        trace.stats.starttime = UTCDateTime('2015-01-01T00:00:00')
+        return trace
+
+
+    def test_save_and_load(self):
+        ''' Test the saving and loading of cache entries.
+        '''
+        cache = DecodedWaveformCache(cache_dir = self.cache_dir)
+        key = cache.get_key(filename = 'test.msd',
+                            mtime = 1000.,
+                            file_type = 'MSEED',
+                            serial = 'SER01',
+                            stream = ':HHZ',
+                            scnl = ('STAT', 'HHZ', 'XX', ''))
+        self.assertNotEqual(key, cache.get_key(filename = 'test.msd',
+                                               mtime = 1001.,
+                                               file_type = 'MSEED',
+                                               serial = 'SER01',
+                                               stream = ':HHZ',
+                                               scnl = ('STAT', 'HHZ', 'XX', '')))
+        self.assertIsNone(cache.load(key))
+
+        trace = self.create_trace(1000)
+        traces = cache.save(key, [trace, ])
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0].id, trace.id)
+        self.assertEqual(traces[0].stats.starttime, trace.stats.starttime)
+        self.assertEqual(traces[0].stats.sampling_rate, trace.stats.sampling_rate)
+        np.testing.assert_array_equal(traces[0].data, trace.data)
+
+        traces = cache.load(key)
+        self.assertEqual(len(traces), 1)
+        np.testing.assert_array_equal(traces[0].data, trace.data)
+
+
+    def test_cleanup(self):
+        ''' Test the removal of the least recently used entries.
+        '''
+        cache = DecodedWaveformCache(cache_dir = self.cache_dir)
+        for k in range(3):
+            cache.save('key_%d' % k, [self.create_trace(10000), ])
+            meta_filename = cache.get_meta_filename('key_%d' % k)
+            os.utime(meta_filename, (1000 + k, 1000 + k))
+        # Access the oldest entry.
+        cache.load('key_0')
+        entry_size = cache.nbytes / 3
+
+        cache.max_size = 2 * entry_size
+        cache.cleanup()
+        self.assertEqual(sorted([x[0] for x in cache.get_entries()]), ['key_0', 'key_2'])
+        self.assertIsNone(cache.load('key_1'))
+
+
+
+class PrefetchSchedulerTestCase(unittest.TestCase):
+    ''' Test the prefetch scheduler of the waveclients.
+    '''
+
+    def setUp(self):
+        self.loaded = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def load(self, start_time, end_time, scnl):
+        self.release.wait()
+        self.loaded.append((start_time, end_time, scnl))
+
+
+    def test_predict(self):
+        ''' Test the prediction of the next time window.
+        '''
+        scheduler = PrefetchScheduler(target = self.load)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        self.assertIsNone(scheduler.predict([(start_time, start_time + 10)]))
+        # Forward scrolling.
+        self.assertEqual(scheduler.predict([(start_time, start_time + 10), (start_time + 5, start_time + 15)]),
+                         (start_time + 10, start_time + 20))
+        # Backward scrolling.
+        self.assertEqual(scheduler.predict([(start_time, start_time + 10), (start_time - 10, start_time)]),
+                         (start_time - 20, start_time - 10))
+        # Changed window length.
+        self.assertIsNone(scheduler.predict([(start_time, start_time + 10), (start_time + 10, start_time + 30)]))
+        # Jump.
+        self.assertIsNone(scheduler.predict([(start_time, start_time + 10), (start_time + 100, start_time + 110)]))
+
+
+    def test_record_access(self):
+        ''' Test the prefetching of sequential requests.
+        '''
+        scheduler = PrefetchScheduler(target = self.load, n_workers = 2)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+        self.assertIsNone(scheduler.record_access(start_time, start_time + 3600, scnl))
+        request = scheduler.record_access(start_time + 3600, start_time + 7200, scnl)
+        self.assertTrue(request.join(timeout = 10))
+        self.assertFalse(request.cancelled)
+        self.assertEqual(self.loaded, [(start_time + 7200, start_time + 10800, scnl)])
+        self.assertEqual(scheduler.statistics['completed'], 1)
+
+
+    def test_cancel_stale(self):
+        ''' Test the cancellation of stale requests.
+        '''
+        self.release.clear()
+        scheduler = PrefetchScheduler(target = self.load, n_workers = 1)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+        # Block the worker.
+        blocking = scheduler.submit(start_time - 100, start_time - 90, [('BLCK', 'HHZ', 'XX', ''), ])
+
+        scheduler.record_access(start_time, start_time + 10, scnl)
+        stale = scheduler.record_access(start_time + 10, start_time + 20, scnl)
+        # Jump to another time.
+        scheduler.record_access(start_time + 1000, start_time + 1010, scnl)
+        self.assertTrue(stale.cancelled)
+        self.assertTrue(stale.done)
+
+        # A request overlapping a foreground request is cancelled.
+        scheduler.record_access(start_time + 1010, start_time + 1020, scnl)
+        pending = scheduler.queue[-1]
+        scheduler.wait_for(start_time + 1015, start_time + 1025, scnl)
+        self.assertTrue(pending.cancelled)
+
+        self.release.set()
+        blocking.join(timeout = 10)
+        self.assertEqual(len(self.loaded), 1)
+        self.assertEqual(scheduler.statistics['cancelled'], 2)
+
+
+    def test_stop(self):
+        ''' Test the stop of the worker threads.
+        '''
+        self.release.clear()
+        scheduler = PrefetchScheduler(target = self.load, n_workers = 2)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+        running = [scheduler.submit(start_time + k * 10, start_time + (k + 1) * 10, scnl) for k in range(2)]
+        # Wait for the workers to start the requests.
+        for k in range(100):
+            if all([x in scheduler.running for x in running]):
+                break
+            time.sleep(0.1)
+        queued = scheduler.submit(start_time + 20, start_time + 30, scnl)
+        workers = list(scheduler.workers)
+        self.assertEqual(len(workers), 2)
+
+        # The queued request is cancelled, the running requests are
+        # finished before the workers stop.
+        stopper = threading.Thread(target = scheduler.stop,
+                                   kwargs = {'timeout': 10})
+        stopper.start()
+        self.assertTrue(queued.join(timeout = 10))
+        self.assertTrue(queued.cancelled)
+        self.assertFalse(any([x.done for x in running]))
+        self.release.set()
+        stopper.join(timeout = 10)
+        self.assertTrue(all([x.done for x in running]))
+        self.assertFalse(any([x.cancelled for x in running]))
+        self.assertFalse(any([x.is_alive() for x in workers]))
+        self.assertEqual(scheduler.workers, [])
+
+        # The workers are started again by a new request.
+        request = scheduler.submit(start_time + 30, start_time + 40, scnl)
+        self.assertTrue(request.join(timeout = 10))
+        self.assertFalse(request.cancelled)
+        scheduler.stop(timeout = 10)
+
+
+    def test_waveclient_prefetch(self):
+        ''' Test the prefetch setting of the waveclient requests.
+        '''
+        client = RampWaveClient('ramp')
+        self.assertFalse(client.auto_prefetch)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+        client.getWaveform(start_time, start_time + 10, scnl)
+        client.getWaveform(start_time + 10, start_time + 20, scnl)
+        self.assertEqual(client.prefetcher.statistics['submitted'], 0)
+
+        # Prefetch the next window of the requests with the prefetch flag.
+        client.getWaveform(start_time + 20, start_time + 30, scnl, prefetch = True)
+        client.getWaveform(start_time + 30, start_time + 40, scnl, prefetch = True)
+        self.assertEqual(client.prefetcher.statistics['submitted'], 1)
+        for k in range(100):
+            if client.prefetcher.statistics['completed'] == 1:
+                break
+            time.sleep(0.1)
+        self.assertEqual(client.stock.get_missing(scnl[0], start_time + 40, start_time + 50), [])
+
+        # Closing the waveclient stops the prefetch workers.
+        workers = list(client.prefetcher.workers)
+        client.close()
+        self.assertFalse(any([x.is_alive() for x in workers]))
+        self.assertEqual(client.prefetcher.workers, [])
+
+
+
+class RampWaveClient(WaveClient):
+    ''' A waveclient creating a ramp sampled with 1 Hz for each request.
+    '''
+
+    def __init__(self, name, **kwargs):
+        WaveClient.__init__(self, name = name, **kwargs)
+        self.loaded = []
+
+    def fill_stock(self, start_time, end_time, scnl):
+        stream = Stream()
+        for cur_scnl in scnl:
+            for cur_start, cur_end in self.stock.get_missing(cur_scnl, start_time, end_time):
+                self.loaded.append((cur_start, cur_end))
+                trace = Trace(data = np.arange(int(round(cur_end - cur_start)), dtype = np.float64))
+                trace.stats.station, trace.stats.channel, trace.stats.network, trace.stats.location = cur_scnl
+                trace.stats.sampling_rate = 1.
+                trace.stats.starttime = cur_start
+                stream.append(trace)
+        self.add_to_stock(stream)
+
+
+
+class ChunkIteratorTestCase(unittest.TestCase):
+    ''' Test the chunked iteration over the waveform data.
+    '''
+
+    def test_chunk_windows(self):
+        ''' Test the splitting of a time span into chunks.
+        '''
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        self.assertEqual(get_chunk_windows(start_time, start_time + 25, 10),
+                         [(start_time, start_time + 10),
+                          (start_time + 10, start_time + 20),
+                          (start_time + 20, start_time + 25)])
+        self.assertEqual(get_chunk_windows(start_time, start_time + 20, 10),
+                         [(start_time, start_time + 10),
+                          (start_time + 10, start_time + 20)])
+        self.assertEqual(get_chunk_windows(start_time, start_time, 10), [])
+        self.assertRaises(ValueError, get_chunk_windows, start_time, start_time + 10, 0)
+
+
+    def test_iter_waveform(self):
+        ''' Test the iteration with overlap, prefetch and trimmed stock.
+        '''
+        client = RampWaveClient('ramp', auto_prefetch = False)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('STAT', 'HHZ', 'XX', ''), ]
+
+        # The data of another SCNL held in the stock.
+        other_scnl = ('OTHR', 'HHZ', 'XX', '')
+        client.getWaveform(startTime = start_time - 500,
+                           endTime = start_time - 400,
+                           scnl = [other_scnl, ])
+
+        windows = []
+        for window_start, window_end, stream in client.iter_waveform(start_time = start_time,
+                                                                     end_time = start_time + 3600,
+                                                                     scnl = scnl,
+                                                                     chunk_length = 1000,
+                                                                     overlap = 100,
+                                                                     read_only = True):
+            windows.append((window_start, window_end))
+            self.assertEqual(len(stream), 1)
+            self.assertEqual(stream[0].stats.starttime, window_start - 100)
+            self.assertFalse(stream[0].data.flags.writeable)
+
+            # The stock holds at most the current and the next chunk.
+            channel = client.stock.get_channel(scnl[0])
+            self.assertTrue(channel.traces[0].stats.starttime >= window_start - 100)
+            self.assertTrue(channel.traces[-1].stats.endtime <= window_end + 1000)
+
+        self.assertEqual(windows, get_chunk_windows(start_time, start_time + 3600, 1000))
+        # The stock data of the other SCNL is not trimmed.
+        self.assertEqual(client.stock.get_missing(other_scnl, start_time - 500, start_time - 400), [])
+        # The following chunks have been prefetched.
+        self.assertEqual(client.prefetcher.statistics['submitted'], 3)
+
+
+
+class FakeWaveServer(threading.Thread):
+    ''' A local Earthworm wave_serverV answering GETSCNLRAW requests.
+
+    The server returns a ramp sampled with 100 Hz for each requested SCNL.
+    The station FAIL is answered with a FR flag, the station SLOW after
+    a delay of 2 seconds and the station WAIT after a delay of 0.3
+    seconds.
+    '''
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen(10)
+        self.port = self.server_socket.getsockname()[1]
+        self.n_connections = 0
+        self.n_requests = 0
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.server_socket.accept()
+            except socket.error:
+                break
+            self.n_connections += 1
+            t = threading.Thread(target = self.handle, args = (conn,))
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        self.server_socket.close()
+
+    def create_packet(self, station, channel, network, location, start_time, npts):
+        header = struct.pack('<iiddd7s9s4s3s2s3s2s2s', 1, npts, start_time,
+                             start_time + (npts - 1) / 100., 100.,
+                             station, network, channel, location, '20', 'i4', '', '')
+        return header + np.arange(npts, dtype = '<i4').tostring()
+
+    def handle(self, conn):
+        buf = ''
+        while True:
+            try:
+                data = conn.recv(4096)
+            except socket.error:
+                break
+            if not data:
+                break
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                self.n_requests += 1
+                tokens = line.split()
+                request_id, station, channel, network, location = tokens[1:6]
+                start_time = float(tokens[6])
+                end_time = float(tokens[7])
+                if station == 'FAIL':
+                    conn.sendall('%s 1 %s %s %s %s FR i4 %f\n' % (request_id, station, channel, network, location, end_time))
+                    continue
+                if station == 'SLOW':
+                    time.sleep(2)
+                elif station == 'WAIT':
+                    time.sleep(0.3)
+                # Send the data in packets of 1 second.
+                packets = ''
+                cur_start = start_time
+                while cur_start < end_time:
+                    packets += self.create_packet(station, channel, network, location, cur_start, 100)
+                    cur_start += 1.
+                conn.sendall('%s 1 %s %s %s %s F i4 %f %f %d\n' % (request_id, station, channel, network, location,
+                                                                     start_time, cur_start, len(packets)))
+                conn.sendall(packets)
+        conn.close()
+
+
+class EarthwormWaveclientTestCase(unittest.TestCase):
+    ''' Test the earthworm waveclient using a local fake waveserver.
+    '''
+
+    def setUp(self):
+        self.server = FakeWaveServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+
+    def test_concurrent_requests(self):
+        ''' Test the concurrent requests using the connection pool.
+        '''
+        client = EarthwormWaveclient(name = 'test client',
+                                     host = '127.0.0.1',
+                                     port = self.server.port,
+                                     n_connections = 2,
+                                     auto_prefetch = False)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('ST%02d' % k, 'HHZ', 'XX', '') for k in range(6)]
+        for k in range(2):
+            stream = client.getWaveform(startTime = start_time + k * 10,
+                                        endTime = start_time + (k + 1) * 10,
+                                        scnl = scnl)
+            self.assertEqual(len(stream), 6)
+            for cur_trace in stream:
+                self.assertEqual(cur_trace.stats.starttime, start_time + k * 10)
+                self.assertEqual(cur_trace.stats.sampling_rate, 100.)
+                self.assertEqual(cur_trace.stats.location, '')
+                self.assertEqual(cur_trace.stats.unit, 'counts')
+
+        self.assertEqual(sorted([x.stats.station for x in stream]), [x[0] for x in scnl])
+        self.assertEqual(self.server.n_requests, 12)
+        # The connections are reused.
+        self.assertTrue(self.server.n_connections <= 2)
+
+        # The data is served from the stock.
+        stream = client.getWaveform(startTime = start_time,
+                                    endTime = start_time + 20,
+                                    scnl = scnl)
+        self.assertEqual(len(stream), 6)
+        self.assertEqual(self.server.n_requests, 12)
+
+
+    def test_missing_data_and_deadline(self):
+        ''' Test the handling of unavailable data and slow responses.
+        '''
+        client = EarthwormWaveclient(name = 'test client',
+                                     host = '127.0.0.1',
+                                     port = self.server.port,
+                                     n_connections = 3,
+                                     request_timeout = 0.5,
+                                     auto_prefetch = False)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        scnl = [('FAIL', 'HHZ', 'XX', ''), ('SLOW', 'HHZ', 'XX', ''), ('GOOD', 'HHZ', 'XX', '')]
+        stream = client.getWaveform(startTime = start_time,
+                                    endTime = start_time + 10,
+                                    scnl = scnl)
+        self.assertEqual([x.stats.station for x in stream], ['GOOD'])
+
+
+    def test_queued_requests(self):
+        ''' Test the timeout of requests waiting for a pooled connection.
+        '''
+        pool = WaveServerConnectionPool(host = '127.0.0.1',
+                                        port = self.server.port,
+                                        size = 1,
+                                        timeout = 0.5)
+        start_time = UTCDateTime('2015-01-01T00:00:00')
+        results = []
+        def request():
+            results.append(pool.request(station = 'WAIT',
+                                        channel = 'HHZ',
+                                        network = 'XX',
+                                        location = '',
+                                        start_time = start_time,
+                                        end_time = start_time + 1))
+        threads = [threading.Thread(target = request) for k in range(3)]
+        for cur_thread in threads:
+            cur_thread.start()
+        for cur_thread in threads:
+            cur_thread.join()
+        pool.close()
+
+        # The requests took longer than the timeout in total, but each
+        # request was completed within the timeout.
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.server.n_connections, 1)
+
+
+    def test_shared_connection_pool(self):
+        ''' Test the creation of the connection pool by concurrent threads.
+        '''
+        client = EarthwormWaveclient(name = 'test client',
+                                     host = '127.0.0.1',
+                                     port = self.server.port,
+                                     auto_prefetch = False)
+        pools = []
+        threads = [threading.Thread(target = lambda: pools.append(client.get_connection_pool())) for k in range(8)]
+        for cur_thread in threads:
+            cur_thread.start()
+        for cur_thread in threads:
+            cur_thread.join()
+        self.assertEqual(len(pools), 8)
+        self.assertEqual(len(set([id(x) for x in pools])), 1)
+
+
+
 def suite():
-    return unittest.makeSuite(WaveclientTestCase, 'test')
+    suite = unittest.makeSuite(WaveclientTestCase, 'test')
+    suite.addTest(unittest.makeSuite(WaveformStockTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(FilePlanTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(TraceheaderCacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DecodedWaveformCacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(PrefetchSchedulerTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ChunkIteratorTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(EarthwormWaveclientTestCase, 'test'))
+    return suite
 
 
 if __name__ == '__main__':
@@ -31,10 +31,255 @@ Module for providing the waveform data from various sources.
 import logging
 import os
 import threading
-from obspy.core import read, Stream
+import bisect
+import itertools
+import collections
+import math
+import time
+import glob
+import hashlib
+import json
+import socket
+import struct
+import Queue
+import multiprocessing
+import multiprocessing.pool
+import sqlalchemy
+from obspy.core import read, Stream, Trace, UTCDateTime
 from obspy.earthworm import Client
 import numpy as np
 
+
+def stream_view(stream):
+    ''' Create a new stream sharing the data of the passed stream.
+
+    The traces of the new stream have their own stats but the data is a
+    read-only view of the data of the original traces. Use this instead of
+    :meth:`obspy.core.Stream.copy` if the new stream is processed with a
+    :class:`~psysmon.core.processingStack.ProcessingStack`.
+
+    Parameters
+    ----------
+    stream : :class:`obspy.core.Stream`
+        The stream to view.
+
+    Returns
+    -------
+    stream : :class:`obspy.core.Stream`
+        The stream holding the data views.
+    '''
+    traces = []
+    for cur_trace in stream:
+        cur_data = cur_trace.data.view()
+        cur_data.flags.writeable = False
+        traces.append(Trace(data = cur_data, header = cur_trace.stats.copy()))
+    return Stream(traces = traces)
+
+
+def get_base_array(data):
+    ''' Get the array owning the memory of a data array.
+
+    Parameters
+    ----------
+    data : :class:`numpy.ndarray`
+        The data array.
+
+    Returns
+    -------
+    base : :class:`numpy.ndarray`
+        The array owning the memory of the data. The data array itself, if
+        it is not a view of another array.
+    '''
+    base = data
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    return base
+
+
+def coalesce_intervals(intervals, tolerance = 0.):
+    ''' Merge overlapping or adjacent time intervals.
+
+    Parameters
+    ----------
+    intervals : List of Tuples (start_time, end_time)
+        The intervals to merge.
+
+    tolerance : float
+        The maximum gap in seconds between two intervals which are merged.
+
+    Returns
+    -------
+    intervals : List of Tuples (start_time, end_time)
+        The merged intervals sorted by the start time.
+    '''
+    coalesced = []
+    for cur_start, cur_end in sorted(intervals):
+        if coalesced and cur_start - coalesced[-1][1] <= tolerance:
+            if cur_end > coalesced[-1][1]:
+                coalesced[-1] = (coalesced[-1][0], cur_end)
+        else:
+            coalesced.append((cur_start, cur_end))
+    return coalesced
+
+
+def get_chunk_windows(start_time, end_time, chunk_length):
+    ''' Split a time span into consecutive chunks.
+
+    Parameters
+    ----------
+    start_time : UTCDateTime
+        The begin of the time span.
+
+    end_time : UTCDateTime
+        The end of the time span.
+
+    chunk_length : float
+        The length of the chunks in seconds. The last chunk is clipped
+        at the end of the time span.
+
+    Returns
+    -------
+    windows : List of Tuples (window_start, window_end)
+        The time windows of the chunks.
+    '''
+    if chunk_length <= 0:
+        raise ValueError('The chunk length has to be larger than zero.')
+
+    windows = []
+    n_chunks = int(math.ceil((end_time - start_time) / float(chunk_length) - 1e-9))
+    for k in range(n_chunks):
+        window_start = start_time + k * chunk_length
+        window_end = min(window_start + chunk_length, end_time)
+        windows.append((window_start, window_end))
+    return windows
+
+
+def load_plan_file(filename, file_type, requests, cache = None):
+    ''' Load the requested data from a waveform file.
+
+    The file is read only once for the time span covering all requests.
+    The data of each request is selected by the recorder serial and the
+    recorder stream name and relabeled with the SCNL of the request.
+
+    If a cache is given, the decoded data is taken from the
+    :class:`DecodedWaveformCache`. Data not available in the cache is
+    decoded from the whole file and added to the cache.
+
+    Parameters
+    ----------
+    filename : String
+        The full path of the file.
+
+    file_type : String
+        The obspy format of the file.
+
+    requests : List of dict
+        The requests of the file plan created by
+        :meth:`PsysmonDbWaveClient.get_file_plan`.
+
+    cache : :class:`DecodedWaveformCache`
+        The decoded waveform cache.
+
+    Returns
+    -------
+    traces : List of :class:`~obspy.core.Trace`
+        The data loaded for the requests.
+    '''
+    # The full traces of each request.
+    request_traces = [None for x in requests]
+
+    if cache is not None:
+        mtime = os.path.getmtime(filename)
+        keys = [cache.get_key(filename = filename,
+                              mtime = mtime,
+                              file_type = file_type,
+                              serial = x['serial'],
+                              stream = x['stream'],
+                              scnl = x['scnl']) for x in requests]
+        request_traces = [cache.load(x) for x in keys]
+
+    missing = [k for k, x in enumerate(request_traces) if x is None]
+    if missing:
+        if cache is not None:
+            file_stream = read(pathname_or_url = filename,
+                               format = file_type,
+                               dtype = 'float64')
+        else:
+            start_time = min([x['start_time'] for x in requests])
+            end_time = max([x['end_time'] for x in requests])
+            file_stream = read(pathname_or_url = filename,
+                               format = file_type,
+                               starttime = start_time,
+                               endtime = end_time,
+                               dtype = 'float64')
+
+        for k in missing:
+            cur_request = requests[k]
+            location, channel = cur_request['stream'].split(':', 1)
+            selected = file_stream.select(station = cur_request['serial'],
+                                          location = location,
+                                          channel = channel)
+            cur_traces = []
+            for cur_file_trace in selected:
+                cur_trace = Trace(data = cur_file_trace.data,
+                                  header = cur_file_trace.stats.copy())
+                cur_trace.stats.station = cur_request['scnl'][0]
+                cur_trace.stats.channel = cur_request['scnl'][1]
+                cur_trace.stats.network = cur_request['scnl'][2]
+                cur_trace.stats.location = cur_request['scnl'][3]
+                cur_trace.stats.unit = 'counts'
+                cur_traces.append(cur_trace)
+
+            if cache is not None:
+                cur_traces = cache.save(keys[k], cur_traces)
+            request_traces[k] = cur_traces
+
+    traces = []
+    for cur_request, cur_traces in zip(requests, request_traces):
+        for cur_full_trace in cur_traces:
+            cur_trace = cur_full_trace.slice(starttime = cur_request['start_time'],
+                                             endtime = cur_request['end_time'])
+            if cur_trace.stats.npts == 0:
+                continue
+            if cache is None:
+                cur_trace = StockChannel.compact(cur_trace)
+            traces.append(cur_trace)
+
+    return traces
+
+
+def decode_plan_file(job):
+    ''' Load a file of a file plan.
+
+    The wrapper of :func:`load_plan_file` used by the decoding pool.
+
+    Parameters
+    ----------
+    job : Tuple (filename, file_type, requests, cache_dir)
+        The arguments passed to :func:`load_plan_file`. If cache_dir is
+        not None, the decoded waveform cache in this directory is used.
+
+    Returns
+    -------
+    traces : List of :class:`~obspy.core.Trace`
+        The data loaded for the requests.
+
+    written_bytes : Integer
+        The number of bytes written to the decoded waveform cache.
+    '''
+    filename, file_type, requests, cache_dir = job
+    cache = None
+    if cache_dir:
+        cache = DecodedWaveformCache(cache_dir = cache_dir)
+    traces = load_plan_file(filename = filename,
+                            file_type = file_type,
+                            requests = requests,
+                            cache = cache)
+    if cache is None:
+        return traces, 0
+    return traces, cache.written_bytes
+
+
 class WaveClient(object):
     '''The WaveClient class.
 
@@ -44,7 +289,8 @@ class WaveClient(object):
 
     '''
 
-    def __init__(self, name, stock_window = 3600):
+    def __init__(self, name, stock_window = 3600, stock_size = 0, stock_policy = 'lru',
+                 prefetch_workers = 1, auto_prefetch = False):
         '''The constructor.
 
         Create an instance of the Project class.
@@ -57,6 +303,21 @@ class WaveClient(object):
             - sqlDB (A pSymson formatted SQL database)
             - earthworm (A earthworm waverserver)
             - css (A CSS formatted flat file database)
+
+        stock_size : Integer
+            The maximum size of the stock in MB. Use 0 for an unlimited stock.
+
+        stock_policy : String (lru, lfu)
+            The eviction policy used when the stock exceeds its size limit.
+
+        prefetch_workers : Integer
+            The number of threads used to prefetch data.
+
+        auto_prefetch : Boolean
+            If True, the next time window is predicted from the request
+            history and prefetched in the background. Interactive clients
+            like the tracedisplay can enable the prefetch for single
+            requests using the prefetch argument of :meth:`getWaveform`.
         '''
         # The logger.
         loggerName = __name__ + "." + self.__class__.__name__
@@ -68,19 +329,29 @@ class WaveClient(object):
         # The available data of the waveclient. This includes the
         # currently displayed time period and the preloaded data in
         # front and behind the time period.
-        self.stock = Stream()
+        self.stock = WaveformStock(max_size = stock_size * 1024 * 1024,
+                                   policy = stock_policy)
 
+        # The scheduler of the background prefetch requests.
+        self.prefetcher = PrefetchScheduler(target = self.prefetch_stock,
+                                            n_workers = prefetch_workers)
 
-        # The threading lock object for the stock stream.
-        self.stock_lock = threading.Lock()
+        # The number of threads used to prefetch data.
+        self.prefetch_workers = prefetch_workers
 
-        # The threads used for preloading data.
-        self.preload_threads = []
+        # Predict and prefetch the next time window.
+        self.auto_prefetch = auto_prefetch
 
         # The time-window in seconds of the stock stream before and after the currently
         # displayed time-period. 
         self.stock_window = stock_window
 
+        # The maximum size of the stock in MB. 0 for an unlimited stock.
+        self.stock_size = stock_size
+
+        # The eviction policy of the stock.
+        self.stock_policy = stock_policy
+
     @property
     def mode(self):
         ''' The mode of the waveclient.
@@ -94,10 +365,32 @@ class WaveClient(object):
         '''
         d = {}
         d['stock_window'] = self.stock_window
+        d['stock_size'] = self.stock_size
+        d['stock_policy'] = self.stock_policy
+        d['prefetch_workers'] = self.prefetch_workers
+        d['auto_prefetch'] = self.auto_prefetch
         return d
 
 
-    def get_from_stock(self, network, station, location, channel, start_time, end_time):
+    def set_stock_limits(self, stock_size, stock_policy):
+        ''' Set the size limit and the eviction policy of the stock.
+
+        Parameters
+        ----------
+        stock_size : Integer
+            The maximum size of the stock in MB. Use 0 for an unlimited stock.
+
+        stock_policy : String (lru, lfu)
+            The eviction policy used when the stock exceeds its size limit.
+        '''
+        self.stock_size = stock_size
+        self.stock_policy = stock_policy
+        self.stock.policy = stock_policy
+        self.stock.max_size = stock_size * 1024 * 1024
+        self.stock.enforce_limit()
+
+
+    def get_from_stock(self, network, station, location, channel, start_time, end_time, read_only = False):
         ''' Get the data of the specified scnl from the stock data.
 
         Parameters
@@ -120,106 +413,1935 @@ class WaveClient(object):
         endTime : UTCDateTime
             The end datetime of the data to fetch.
 
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views of
+            the stock data. No data is copied. If False, the returned traces
+            hold a copy of the stock data.
+
         Returns
         -------
         stream : :class:`obspy.core.Stream`
             The requested waveform data. All traces are packed into one stream.
 
         '''
-        if location == '--':
-            location = None
-        self.stock_lock.acquire()
-        curStream = self.stock.select(station = station,
-                                      channel = channel,
-                                      network = network,
-                                      location = location)
-        curStream = curStream.copy()
-        self.stock_lock.release()
+        traces = self.stock.get(scnl = (station, channel, network, location),
+                                start_time = start_time,
+                                end_time = end_time)
+        if read_only:
+            for cur_trace in traces:
+                cur_trace.data = cur_trace.data.view()
+                cur_trace.data.flags.writeable = False
+            curStream = Stream(traces = traces)
+        else:
+            curStream = Stream(traces = [x.copy() for x in traces])
         self.logger.debug('Selected stream from stock: %s', curStream)
-        curStream.trim(starttime = start_time,
-                       endtime = end_time)
-        self.logger.debug('Trimmed stream to: %s', curStream)
 
         return curStream
 
 
+    def get_stock_stream(self, start_time, end_time, scnl, read_only = False):
+        ''' Get the stock data of several SCNLs.
+
+        The traces of each SCNL are merged.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
+
+        read_only : Boolean
+            If True, return read-only views of the stock data.
+
+        Returns
+        -------
+        stream : :class:`obspy.core.Stream`
+            The requested waveform data. All traces are packed into one stream.
+        '''
+        stream = Stream()
+        for stat, chan, net, loc in scnl:
+            cur_stream = self.get_from_stock(station = stat,
+                                             channel = chan,
+                                             network = net,
+                                             location = loc,
+                                             start_time = start_time,
+                                             end_time = end_time,
+                                             read_only = read_only)
+            if len(cur_stream) > 1:
+                cur_stream.merge()
+            stream += cur_stream
+
+        return stream
+
+
     def add_to_stock(self, stream):
         ''' Add the passed stream to the stock data.
 
+        The size limit of the stock is enforced by the caller of
+        :meth:`fill_stock` after the requested data has been selected.
+        '''
+        self.stock.add(stream, enforce = False)
+
+
+    def prefetch_stock(self, start_time, end_time, scnl):
+        ''' Load the data missing in the stock in the background.
+
+        The size limit of the stock is enforced protecting the prefetched
+        time span.
         '''
-        self.stock_lock.acquire()
-        self.stock += stream
-        self.stock.merge(stream)
-        self.stock_lock.release()
+        self.fill_stock(start_time = start_time,
+                        end_time = end_time,
+                        scnl = scnl)
+        self.stock.enforce_limit(protect = self.stock.get_protected_spans(start_time = start_time,
+                                                                          end_time = end_time,
+                                                                          scnl = scnl))
 
 
     def trim_stock(self, start_time, end_time):
         ''' Trim the stock streams.
 
+        At least one window length is kept before and after the time span,
+        so that the data of a prefetched neighbouring window is kept.
         '''
-        self.stock_lock.acquire()
-        self.stock.trim(starttime = start_time - self.stock_window, endtime = end_time + self.stock_window)
-        self.stock_lock.release()
-        self.logger.debug('Trimmed stock stream to %s - %s.', start_time - self.stock_window, end_time + self.stock_window)
+        stock_window = max(self.stock_window, end_time - start_time)
+        self.stock.trim(start_time = start_time - stock_window,
+                        end_time = end_time + stock_window)
+        self.logger.debug('Trimmed stock stream to %s - %s.', start_time - stock_window, end_time + stock_window)
         self.logger.debug('stock: %s', self.stock)
 
 
     def getWaveform(self,
                     startTime,
                     endTime,
-                    network = None,
-                    station = None,
-                    location = None,
-                    channel = None):
+                    scnl,
+                    read_only = False,
+                    prefetch = None):
         ''' Get the waveform data for the specified parameters.
 
         Parameters
         ----------
-        network : String
-            The network name.
+        startTime : UTCDateTime
+            The begin datetime of the data to fetch.
 
-        station : String
-            The station name.
+        endTime : UTCDateTime
+            The end datetime of the data to fetch.
 
-        location : String
-            The location specifier.
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
 
-        channel : String
-            The channel name.
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views
+            of the waveclient stock. Use this mode if the data is not
+            modified or if the data is processed using a
+            :class:`~psysmon.core.processingStack.ProcessingStack` which
+            copies the data only if needed.
 
-        startTime : UTCDateTime
+        prefetch : Boolean
+            If True, the next time window is predicted from the request
+            history and prefetched in the background. If None, the
+            auto_prefetch setting of the waveclient is used.
+
+        Returns
+        -------
+        stream : :class:`obspy.core.Stream`
+            The requested waveform data. All traces are packed into one stream.
+        '''
+        # Wait for running prefetches of the requested data.
+        self.prefetcher.wait_for(start_time = startTime,
+                                 end_time = endTime,
+                                 scnl = scnl)
+
+        self.fill_stock(start_time = startTime,
+                        end_time = endTime,
+                        scnl = scnl)
+
+        stream = self.get_stock_stream(start_time = startTime,
+                                       end_time = endTime,
+                                       scnl = scnl,
+                                       read_only = read_only)
+
+        # Enforce the size limit of the stock. Only the requested time span
+        # is protected from the eviction.
+        self.stock.enforce_limit(protect = self.stock.get_protected_spans(start_time = startTime,
+                                                                          end_time = endTime,
+                                                                          scnl = scnl))
+
+        if prefetch is None:
+            prefetch = self.auto_prefetch
+
+        if prefetch:
+            self.prefetcher.record_access(start_time = startTime,
+                                          end_time = endTime,
+                                          scnl = scnl)
+
+        return stream
+
+
+    def fill_stock(self, start_time, end_time, scnl):
+        ''' Load the data missing in the stock.
+
+        The loaded data has to be added to the stock using a single call
+        of :meth:`add_to_stock`.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
             The begin datetime of the data to fetch.
 
-        endTime : UTCDateTime
+        end_time : UTCDateTime
             The end datetime of the data to fetch.
 
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
+        '''
+        assert False, 'fill_stock must be defined'
+
+
+    def preload(self, start_time, end_time, scnl):
+        ''' Preload the data for the given timespan and the scnl.
+
+        The data is loaded in the background by the prefetch scheduler.
+
         Returns
         -------
+        request : :class:`PrefetchRequest`
+            The prefetch request. Use the join method to wait for the
+            completion of the request.
+        '''
+        return self.prefetcher.submit(start_time = start_time,
+                                      end_time = end_time,
+                                      scnl = scnl)
+
+
+    def stop_prefetch(self):
+        ''' Stop the prefetch of the data.
+
+        The queued prefetch requests are cancelled and the worker threads
+        are stopped after finishing the running requests.
+        '''
+        self.prefetcher.stop()
+
+
+    def close(self):
+        ''' Close the waveclient.
+
+        Stop the background threads of the waveclient. Call this method
+        when the waveclient is removed or the project is closed.
+        '''
+        self.stop_prefetch()
+
+
+    def iter_waveform(self, start_time, end_time, scnl, chunk_length,
+                      overlap = 0., read_only = False, prefetch = True):
+        ''' Iterate over the waveform data of a time span in chunks.
+
+        The time span is split into consecutive chunks. While a chunk is
+        processed, the data of the next chunk is prefetched in the
+        background. The stock data of the SCNLs is trimmed to the current
+        and the next chunk, or to the current chunk for the last one, so
+        that the memory usage is bounded to about two chunks. The stock data
+        of other SCNLs is kept.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
+
+        chunk_length : float
+            The length of the chunks in seconds.
+
+        overlap : float
+            The length in seconds of the data preceding each chunk which is
+            added to the chunk stream, e.g. the warm-up of a STA/LTA.
+
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views
+            of the waveclient stock.
+
+        prefetch : Boolean
+            If True, prefetch the data of the next chunk.
+
+        Yields
+        ------
+        window_start : UTCDateTime
+            The begin of the chunk.
+
+        window_end : UTCDateTime
+            The end of the chunk.
+
         stream : :class:`obspy.core.Stream`
-            The requested waveform data. All traces are packed into one stream.
+            The waveform data from window_start - overlap to window_end.
+        '''
+        windows = get_chunk_windows(start_time, end_time, chunk_length)
+
+        for k, (window_start, window_end) in enumerate(windows):
+            stream = self.getWaveform(startTime = window_start - overlap,
+                                      endTime = window_end,
+                                      scnl = scnl,
+                                      read_only = read_only)
+
+            if k + 1 < len(windows):
+                next_start, next_end = windows[k + 1]
+                self.stock.trim(start_time = window_start - overlap,
+                                end_time = next_end,
+                                scnl = scnl)
+                if prefetch:
+                    self.preload(start_time = next_start - overlap,
+                                 end_time = next_end,
+                                 scnl = scnl)
+            else:
+                self.stock.trim(start_time = window_start - overlap,
+                                end_time = window_end,
+                                scnl = scnl)
+
+            yield (window_start, window_end, stream)
+
+
+class WaveformStock(object):
+    ''' The waveform data stock of a waveclient.
+
+    The stock is a cache of the waveform data already loaded by a
+    waveclient. The data is organized by SCNL. Each SCNL holds its own
+    :class:`StockChannel` with a sorted list of non-overlapping traces and
+    its own threading lock. Therefore, the lookup, the insertion and the
+    trimming of data only touch the data of one channel.
+
+    The memory used by the stock can be limited. The size of the stock is
+    the size of the data arrays owning the memory of the traces. If the
+    size of the stock data exceeds the limit, the traces (segments) are
+    selected for the eviction using either a least recently used (lru) or
+    a least frequently used (lfu) policy. The data of the selected segment
+    outside the protected time span of the last request is trimmed.
+    '''
+
+    def __init__(self, max_size = 0, policy = 'lru'):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        max_size : Integer
+            The maximum size of the stock data in bytes. Use 0 for an
+            unlimited stock.
+
+        policy : String (lru, lfu)
+            The eviction policy.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The stock channels. The key is the SCNL tuple.
+        self.channels = {}
+
+        # The lock protecting the channels dictionary. The data of the
+        # channels is protected by the lock of each channel.
+        self.lock = threading.Lock()
+
+        # The lock serializing the addition of data. A stream is added to
+        # the stock as a whole.
+        self.add_lock = threading.Lock()
+
+        # The maximum size of the stock data in bytes.
+        self.max_size = max_size
+
+        # The eviction policy.
+        self.policy = policy
+
+        # The access clock used to track the usage of the stock segments.
+        self.clock = itertools.count(1)
+
+        # The number of requests completely served by the stock.
+        self.hits = 0
+
+        # The number of requests not or only partially served by the stock.
+        self.misses = 0
+
+        # The number of evicted segments.
+        self.evictions = 0
+
+
+    def __str__(self):
+        ''' The string representation of the stock.
+        '''
+        with self.lock:
+            channels = self.channels.values()
+        return '\n'.join([str(x) for x in channels])
+
+
+    @property
+    def scnl(self):
+        ''' The SCNLs available in the stock.
+        '''
+        with self.lock:
+            return self.channels.keys()
+
+
+    @property
+    def nbytes(self):
+        ''' The size of the stock data in bytes.
+        '''
+        with self.lock:
+            channels = self.channels.values()
+
+        # Data arrays shared by several traces are counted once.
+        bases = {}
+        for cur_channel in channels:
+            bases.update(cur_channel.get_base_arrays())
+        return sum([x.nbytes for x in bases.itervalues()])
+
+
+    @property
+    def statistics(self):
+        ''' The usage statistics of the stock.
+        '''
+        d = {}
+        with self.lock:
+            d['hits'] = self.hits
+            d['misses'] = self.misses
+            d['evictions'] = self.evictions
+        d['nbytes'] = self.nbytes
+        return d
+
+
+    @staticmethod
+    def get_key(station, channel, network, location):
+        ''' Build the stock key of a SCNL.
+
+        The location '--' is mapped to None, which matches all locations
+        of a station, channel and network.
+
+        Returns
+        -------
+        key : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL key used to index the stock.
+        '''
+        if location == '--':
+            location = None
+
+        return (station, channel, network, location)
+
+
+    def get_channel(self, scnl, create = False):
+        ''' Get the stock channel of a SCNL.
+
+        Parameters
+        ----------
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the channel.
+
+        create : Boolean
+            If True, create a new stock channel if the SCNL is not yet
+            available in the stock.
+
+        Returns
+        -------
+        channel : :class:`StockChannel`
+            The stock channel of the SCNL. None, if no channel is available.
+        '''
+        key = self.get_key(*scnl)
+        with self.lock:
+            channel = self.channels.get(key, None)
+            if channel is None and create:
+                channel = StockChannel(scnl = key, clock = self.clock)
+                self.channels[key] = channel
+        return channel
+
+
+    def get_channels(self, scnl):
+        ''' Get the stock channels matching a SCNL.
+
+        Parameters
+        ----------
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the channels. A location None or '--' matches all
+            locations.
+
+        Returns
+        -------
+        channels : List of :class:`StockChannel`
+            The matching stock channels.
+        '''
+        key = self.get_key(*scnl)
+        with self.lock:
+            if key[3] is None:
+                return [y for x, y in self.channels.iteritems() if x[:3] == key[:3]]
+            channel = self.channels.get(key, None)
+
+        if channel is None:
+            return []
+        else:
+            return [channel, ]
+
+
+    def get(self, scnl, start_time, end_time):
+        ''' Get the stock data of a SCNL for a given time span.
+
+        Parameters
+        ----------
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the data.
+
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The traces of the time span sorted by time. The data of the
+            traces share the memory with the stock data.
+        '''
+        traces = []
+        for cur_channel in self.get_channels(scnl):
+            traces.extend(cur_channel.get(start_time = start_time,
+                                          end_time = end_time))
+
+        return traces
+
+
+    def get_missing(self, scnl, start_time, end_time):
+        ''' Get the time intervals not covered by the stock data.
+
+        Each call is counted as a hit if the time span is completely
+        available in the stock, otherwise as a miss.
+
+        Parameters
+        ----------
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the data.
+
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span.
+
+        Returns
+        -------
+        missing : List of Tuples (start_time, end_time)
+            The missing time intervals sorted by time. If the location
+            matches several channels, the intervals not covered by any of
+            the channels are returned.
+        '''
+        missing = [(start_time, end_time), ]
+        for cur_channel in self.get_channels(scnl):
+            missing = [x for cur_start, cur_end in missing for x in cur_channel.get_missing(start_time = cur_start,
+                                                                                            end_time = cur_end)]
+
+        with self.lock:
+            if missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return missing
+
+
+    def get_protected_spans(self, start_time, end_time, scnl):
+        ''' Get the time spans of the stock channels protected from eviction.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the protected time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the protected time span.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs of the protected channels.
+
+        Returns
+        -------
+        protect : dict
+            The protected time spans (start, end) as timestamps. The keys
+            are the SCNL keys of the stock channels.
+        '''
+        protect = {}
+        for cur_scnl in scnl:
+            for cur_channel in self.get_channels(cur_scnl):
+                protect[cur_channel.scnl] = (start_time.timestamp, end_time.timestamp)
+        return protect
+
+
+    def add(self, stream, enforce = True):
+        ''' Add the traces of a stream to the stock.
+
+        Parameters
+        ----------
+        stream : :class:`~obspy.core.Stream`
+            The data to add to the stock.
+
+        enforce : Boolean
+            If True, enforce the size limit of the stock protecting the time
+            spans of the added data.
+        '''
+        with self.add_lock:
+            protect = {}
+            for cur_trace in stream:
+                if cur_trace.stats.npts == 0:
+                    continue
+                cur_scnl = (cur_trace.stats.station,
+                            cur_trace.stats.channel,
+                            cur_trace.stats.network,
+                            cur_trace.stats.location)
+                channel = self.get_channel(cur_scnl, create = True)
+                if channel.add(cur_trace) is None:
+                    continue
+                cur_start = cur_trace.stats.starttime.timestamp
+                cur_end = cur_trace.stats.endtime.timestamp
+                if channel.scnl in protect:
+                    cur_start = min(cur_start, protect[channel.scnl][0])
+                    cur_end = max(cur_end, protect[channel.scnl][1])
+                protect[channel.scnl] = (cur_start, cur_end)
+
+            if enforce and protect:
+                self.enforce_limit(protect = protect)
+
+
+    def enforce_limit(self, protect = None):
+        ''' Evict stock data until the stock size is below the limit.
+
+        The segment selected by the eviction policy is trimmed by the
+        needed size, but by at least a quarter of its data which can be
+        evicted, so that the remaining data is not copied too often.
+
+        Parameters
+        ----------
+        protect : dict
+            The time spans (start, end) as timestamps which are not
+            evicted. The keys are the SCNL keys of the stock channels. This
+            prevents the eviction of the data just requested.
+        '''
+        if not self.max_size:
+            return
+
+        if protect is None:
+            protect = {}
+
+        with self.lock:
+            channels = self.channels.values()
+
+        size = self.nbytes
+        while size > self.max_size:
+            candidates = [x.get_eviction_candidate(policy = self.policy,
+                                                   protect = protect.get(x.scnl, None)) for x in channels]
+            candidates = [x for x in candidates if x is not None]
+
+            if not candidates:
+                self.logger.warning('The stock size %d exceeds the limit of %d bytes. No more data available for eviction.', size, self.max_size)
+                break
+
+            rank, channel, trace = min(candidates, key = lambda x: x[0])
+            channel.evict(trace,
+                          nbytes = size - self.max_size,
+                          protect = protect.get(channel.scnl, None))
+            size = self.nbytes
+            with self.lock:
+                self.evictions += 1
+
+        with self.lock:
+            for cur_key in [x for x, y in self.channels.items() if y.is_empty]:
+                self.channels.pop(cur_key)
+
+
+    def trim(self, start_time, end_time, scnl = None):
+        ''' Remove the stock data outside the given time span.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span to keep.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span to keep.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs of the channels to trim. If None, all channels are
+            trimmed.
+        '''
+        if scnl is None:
+            with self.lock:
+                channels = self.channels.items()
+        else:
+            channels = [(x.scnl, x) for cur_scnl in scnl for x in self.get_channels(cur_scnl)]
+
+        for cur_key, cur_channel in channels:
+            cur_channel.trim(start_time = start_time,
+                             end_time = end_time)
+            if cur_channel.is_empty:
+                with self.lock:
+                    if cur_channel.is_empty:
+                        self.channels.pop(cur_key, None)
+
+
+    def clear(self):
+        ''' Remove all data from the stock.
+        '''
+        with self.lock:
+            self.channels = {}
+
+
+    def reset_statistics(self):
+        ''' Reset the usage counters.
+        '''
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+
+class StockChannel(object):
+    ''' The stock data of a single SCNL.
+
+    The data is held in a list of traces sorted by their start time. The
+    traces don't overlap. Overlapping or adjacent traces are merged when
+    new data is added to the channel. The start- and end-times of the traces
+    are kept in separate lists which are used for a bisect search of the
+    traces matching a time span. For each trace, the last access time and
+    the number of accesses is tracked for the eviction of stock data.
+    '''
+
+    def __init__(self, scnl, clock = None):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the channel.
+
+        clock : iterator
+            The access clock providing increasing integer values.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The SCNL of the channel.
+        self.scnl = scnl
+
+        # The lock protecting the channel data.
+        self.lock = threading.RLock()
+
+        # The traces sorted by start time.
+        self.traces = []
+
+        # The start timestamps of the traces.
+        self.start_times = []
+
+        # The end timestamps of the traces.
+        self.end_times = []
+
+        # The access statistics of the traces. A list of [last_access,
+        # access_count] lists.
+        self.access = []
+
+        # The buffers holding the data of the traces to which samples have
+        # been appended. The keys are the ids of the traces, the values are
+        # tuples of the buffer and the number of used samples.
+        self.buffers = {}
+
+        # The access clock.
+        if clock is None:
+            clock = itertools.count(1)
+        self.clock = clock
+
+
+    def __str__(self):
+        ''' The string representation of the channel.
+        '''
+        with self.lock:
+            return '%s: %s' % (':'.join(self.scnl),
+                               ', '.join(['%s - %s' % (x.stats.starttime.isoformat(), x.stats.endtime.isoformat()) for x in self.traces]))
+
+    @property
+    def is_empty(self):
+        ''' Indicate if the channel holds any data.
+        '''
+        return len(self.traces) == 0
+
+
+    @property
+    def nbytes(self):
+        ''' The size of the data arrays holding the channel data in bytes.
+        '''
+        return sum([x.nbytes for x in self.get_base_arrays().itervalues()])
+
+
+    def get_base_arrays(self):
+        ''' Get the data arrays owning the memory of the traces.
+
+        The data of a trace may be a view of a larger array, e.g. a buffer
+        with spare capacity or the data of a whole file.
+
+        Returns
+        -------
+        bases : dict of :class:`numpy.ndarray`
+            The arrays owning the memory. The keys are the ids of the
+            arrays.
+        '''
+        with self.lock:
+            bases = [get_base_array(x.data) for x in self.traces]
+        return dict([(id(x), x) for x in bases])
+
+
+    def get_index_range(self, start, end, tolerance = 0.):
+        ''' Get the index range of the traces overlapping a time span.
+
+        Parameters
+        ----------
+        start : float
+            The start timestamp of the time span.
+
+        end : float
+            The end timestamp of the time span.
+
+        tolerance : float
+            The time in seconds to extend the time span on both sides.
+
+        Returns
+        -------
+        index_range : Tuple (first, last)
+            The slice indices of the overlapping traces.
+        '''
+        first = bisect.bisect_left(self.end_times, start - tolerance)
+        last = bisect.bisect_right(self.start_times, end + tolerance)
+        return (first, max(first, last))
+
+
+    def get(self, start_time, end_time):
+        ''' Get the data of the channel for a given time span.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The traces sliced to the time span. The data arrays are views of
+            the stock data.
+        '''
+        with self.lock:
+            first, last = self.get_index_range(start_time.timestamp,
+                                               end_time.timestamp)
+            traces = [x.slice(starttime = start_time, endtime = end_time) for x in self.traces[first:last]]
+            if first < last:
+                tick = next(self.clock)
+                for cur_access in self.access[first:last]:
+                    cur_access[0] = tick
+                    cur_access[1] += 1
+
+        return [x for x in traces if x.stats.npts > 0]
+
+
+    def get_missing(self, start_time, end_time):
+        ''' Get the time intervals of a time span not covered by the channel data.
+
+        Gaps smaller than one sample are ignored.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span.
+
+        Returns
+        -------
+        missing : List of Tuples (start_time, end_time)
+            The missing time intervals sorted by time.
+        '''
+        missing = []
+        cur_start = start_time
+        tolerance = 0.
+        with self.lock:
+            first, last = self.get_index_range(start_time.timestamp,
+                                               end_time.timestamp)
+            for cur_trace in self.traces[first:last]:
+                tolerance = cur_trace.stats.delta
+                if cur_trace.stats.starttime - cur_start > tolerance:
+                    missing.append((cur_start, cur_trace.stats.starttime))
+                cur_end = cur_trace.stats.endtime + cur_trace.stats.delta
+                if cur_end > cur_start:
+                    cur_start = cur_end
+
+        if end_time - cur_start > tolerance:
+            missing.append((cur_start, end_time))
+
+        return missing
+
+
+    def add(self, trace):
+        ''' Add a trace to the channel.
+
+        The trace is joined with the overlapping or adjacent traces of the
+        channel having the same sampling rate. Only the samples not yet
+        available in the stock are appended to the touching trace, the
+        existing samples are kept. If the trace overlaps stock data with a
+        different sampling rate, the trace is not added.
+
+        Parameters
+        ----------
+        trace : :class:`~obspy.core.Trace`
+            The trace to add.
+
+        Returns
+        -------
+        tick : Integer
+            The access clock value assigned to the added data. None, if
+            the trace has not been added.
+        '''
+        sps = trace.stats.sampling_rate
+        with self.lock:
+            first, last = self.get_index_range(trace.stats.starttime.timestamp,
+                                               trace.stats.endtime.timestamp,
+                                               tolerance = 1.5 * trace.stats.delta)
+            neighbours = self.traces[first:last]
+            access = self.access[first:last]
+
+            conflicts = [x for x in neighbours if x.stats.sampling_rate != sps and x.stats.starttime <= trace.stats.endtime and x.stats.endtime >= trace.stats.starttime]
+            if conflicts:
+                self.logger.warning("The sampling rate %f of the data of %s from %s to %s doesn't match the stock data. The data is not added to the stock.",
+                                    sps, ':'.join(self.scnl), trace.stats.starttime.isoformat(),
+                                    trace.stats.endtime.isoformat())
+                return None
+
+            # Keep the traces with a different sampling rate. They are only
+            # adjacent to the new trace.
+            entries = [(x, y) for x, y in zip(neighbours, access) if x.stats.sampling_rate != sps]
+            joined = [(x, y) for x, y in zip(neighbours, access) if x.stats.sampling_rate == sps]
+            access_count = sum([x[1][1] for x in joined])
+
+            # Don't modify the passed trace when data is appended to it.
+            trace = Trace(data = trace.data, header = trace.stats.copy())
+            pieces = sorted([x[0] for x in joined] + [trace, ], key = lambda x: x.stats.starttime)
+            segments = []
+            for cur_piece in pieces:
+                if segments:
+                    cur_segment = segments[-1]
+                    n_skip = int(round((cur_segment.stats.endtime - cur_piece.stats.starttime) * sps)) + 1
+                    if n_skip >= 0:
+                        if n_skip < cur_piece.stats.npts:
+                            self.append_data(cur_segment, cur_piece.data[n_skip:])
+                        continue
+                segments.append(cur_piece)
+
+            tick = next(self.clock)
+            entries.extend([(x, [tick, access_count]) for x in segments])
+            entries.sort(key = lambda x: x[0].stats.starttime)
+            self.traces[first:last] = [x[0] for x in entries]
+            self.access[first:last] = [x[1] for x in entries]
+            self.update_index()
+
+        return tick
+
+
+    def append_data(self, trace, data):
+        ''' Append samples to the data of a trace.
+
+        The data of the trace is held in a buffer with spare capacity at
+        its end, which is grown geometrically. Appending samples copies
+        only the new samples, unless the buffer has to be grown. The
+        buffer is only extended if the trace data starts at the beginning
+        of the buffer and ends at the last used sample, so that views of
+        the data held by other traces are not overwritten.
+
+        Parameters
+        ----------
+        trace : :class:`~obspy.core.Trace`
+            The trace to which the samples are appended.
+
+        data : :class:`numpy.ndarray`
+            The samples to append.
+        '''
+        n_data = trace.stats.npts
+        n_new = len(data)
+        buf, n_used = self.buffers.get(id(trace), (None, 0))
+        if (buf is None or n_used != n_data or len(buf) < n_data + n_new
+                or buf.dtype != trace.data.dtype or np.result_type(buf, data) != buf.dtype
+                or trace.data.ctypes.data != buf.ctypes.data):
+            buf = np.empty(n_data + n_new + max(n_new, n_data // 2),
+                           dtype = np.result_type(trace.data, data))
+            buf[:n_data] = trace.data
+
+        buf[n_data:n_data + n_new] = data
+        trace.data = buf[:n_data + n_new]
+        self.buffers[id(trace)] = (buf, n_data + n_new)
+
+
+    def trim(self, start_time, end_time):
+        ''' Remove the data outside the given time span.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span to keep.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span to keep.
+        '''
+        with self.lock:
+            first, last = self.get_index_range(start_time.timestamp,
+                                               end_time.timestamp)
+            traces = self.traces[first:last]
+            access = self.access[first:last]
+            if traces:
+                if traces[0].stats.starttime < start_time:
+                    traces[0] = self.compact(traces[0].slice(starttime = start_time))
+                if traces[-1].stats.endtime > end_time:
+                    traces[-1] = self.compact(traces[-1].slice(endtime = end_time))
+            keep = [k for k, x in enumerate(traces) if x.stats.npts > 0]
+            self.traces = [traces[k] for k in keep]
+            self.access = [access[k] for k in keep]
+            self.update_index()
+
+
+    def get_eviction_candidate(self, policy = 'lru', protect = None):
+        ''' Get the trace to be evicted first from the channel.
+
+        Parameters
+        ----------
+        policy : String (lru, lfu)
+            The eviction policy.
+
+        protect : Tuple (start, end)
+            The timestamps of the time span which is not evicted. Traces
+            completely within the time span are no eviction candidates.
+
+        Returns
+        -------
+        candidate : Tuple (rank, channel, trace)
+            The rank of the trace used to compare the candidates of all
+            channels, the channel and the candidate trace. None if no
+            candidate is available.
+        '''
+        with self.lock:
+            if policy == 'lfu':
+                ranks = [((x[1], x[0]), k) for k, x in enumerate(self.access)]
+            else:
+                ranks = [((x[0], ), k) for k, x in enumerate(self.access)]
+
+            if protect is not None:
+                ranks = [x for x in ranks if self.start_times[x[1]] < protect[0] or self.end_times[x[1]] > protect[1]]
+
+            if not ranks:
+                return None
+
+            rank, ind = min(ranks)
+            return (rank, self, self.traces[ind])
+
+
+    def evict(self, trace, nbytes = None, protect = None):
+        ''' Evict the data of a trace.
+
+        The data outside the protected time span is trimmed. The data
+        farthest from the protected time span is evicted first. At least
+        the requested size, but at least a quarter of the data which can be
+        evicted, is removed. The remaining data is copied to release the
+        memory of the evicted data.
+
+        Parameters
+        ----------
+        trace : :class:`~obspy.core.Trace`
+            The trace to evict.
+
+        nbytes : Integer
+            The number of bytes to release. If None, all data outside the
+            protected time span is evicted.
+
+        protect : Tuple (start, end)
+            The timestamps of the time span which is not evicted.
+        '''
+        with self.lock:
+            ind = [k for k, x in enumerate(self.traces) if x is trace]
+            if not ind:
+                return
+            ind = ind[0]
+
+            # The number of samples which can be evicted before and after
+            # the protected time span.
+            npts = trace.stats.npts
+            if protect is None:
+                n_before = npts
+                n_after = 0
+            else:
+                sps = trace.stats.sampling_rate
+                n_before = int(math.ceil((protect[0] - self.start_times[ind]) * sps))
+                n_after = int(math.ceil((self.end_times[ind] - protect[1]) * sps))
+                n_before = min(max(n_before, 0), npts)
+                n_after = min(max(n_after, 0), npts - n_before)
+
+            n_evict = n_before + n_after
+            if nbytes is not None:
+                n_needed = int(math.ceil(float(nbytes) / trace.data.itemsize))
+                n_evict = min(max(n_needed, n_evict // 4, 1), n_evict)
+            n_evict_before = min(n_evict, n_before)
+            n_evict_after = n_evict - n_evict_before
+
+            if n_evict >= npts:
+                self.traces.pop(ind)
+                self.access.pop(ind)
+            else:
+                # Copy the remaining data to release the memory.
+                evicted = Trace(header = trace.stats.copy())
+                evicted.data = trace.data[n_evict_before:npts - n_evict_after].copy()
+                evicted.stats.starttime = trace.stats.starttime + n_evict_before * trace.stats.delta
+                self.traces[ind] = evicted
+            self.update_index()
+
+
+    @staticmethod
+    def compact(trace):
+        ''' Release the memory of trimmed data.
+
+        A sliced trace holds a view of the original data array. If the
+        view is much smaller than the original array, copy the data to
+        release the memory of the original array.
+
+        Parameters
+        ----------
+        trace : :class:`~obspy.core.Trace`
+            The trace to compact.
+
+        Returns
+        -------
+        trace : :class:`~obspy.core.Trace`
+            The compacted trace.
+        '''
+        base = get_base_array(trace.data)
+        if trace.data.nbytes < base.nbytes / 2:
+            trace.data = trace.data.copy()
+
+        return trace
+
+
+    def update_index(self):
+        ''' Update the start- and end-time lists used for the bisect search.
+        '''
+        self.start_times = [x.stats.starttime.timestamp for x in self.traces]
+        self.end_times = [x.stats.endtime.timestamp for x in self.traces]
+        if self.buffers:
+            trace_ids = set([id(x) for x in self.traces])
+            self.buffers = dict([(x, y) for x, y in self.buffers.iteritems() if x in trace_ids])
+
+
+
+class TraceheaderCache(object):
+    ''' A cache of traceheader query results.
+
+    The traceheaders are cached per SCNL and time bucket. A time bucket is
+    a time-span of fixed length (e.g. one hour) aligned to the epoch. The
+    cached entries expire after a given time to live, so that data added
+    to a shared database by other users is found. Data imported by the
+    local project has to be invalidated explicitly.
+    '''
+
+    def __init__(self, ttl = 300, bucket_length = 3600, max_entries = 100000):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        ttl : float
+            The time to live of the cache entries in seconds. Use 0 for
+            entries which don't expire.
+
+        bucket_length : float
+            The length of the time buckets in seconds.
+
+        max_entries : Integer
+            The maximum number of cache entries. If the limit is exceeded,
+            the oldest entries are removed.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The time to live of the entries in seconds.
+        self.ttl = ttl
+
+        # The length of the time buckets in seconds.
+        self.bucket_length = bucket_length
+
+        # The maximum number of entries.
+        self.max_entries = max_entries
+
+        # The cache entries. The key is the tuple (scnl, bucket), the value
+        # the tuple (creation_time, headers). The entries are sorted by
+        # their creation time.
+        self.entries = collections.OrderedDict()
+
+        # The lock protecting the entries.
+        self.lock = threading.Lock()
+
+        # The number of cache hits.
+        self.hits = 0
+
+        # The number of cache misses.
+        self.misses = 0
+
+        # The number of invalidated entries.
+        self.invalidations = 0
+
+
+    @property
+    def statistics(self):
+        ''' The usage statistics of the cache.
+        '''
+        d = {}
+        d['hits'] = self.hits
+        d['misses'] = self.misses
+        d['invalidations'] = self.invalidations
+        d['entries'] = len(self.entries)
+        return d
+
+
+    def get_buckets(self, start_time, end_time):
+        ''' Get the time buckets covering a time span.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span.
+
+        Returns
+        -------
+        buckets : List of Integer
+            The bucket indices.
+        '''
+        first = int(math.floor(start_time.timestamp / self.bucket_length))
+        last = int(math.ceil(end_time.timestamp / self.bucket_length))
+        return range(first, max(first + 1, last))
+
+
+    def get_bucket_span(self, bucket):
+        ''' Get the time span of a bucket.
+
+        Returns
+        -------
+        span : Tuple (start_time, end_time)
+            The begin and the end of the bucket.
+        '''
+        return (UTCDateTime(bucket * self.bucket_length),
+                UTCDateTime((bucket + 1) * self.bucket_length))
+
+
+    def get(self, scnl, bucket):
+        ''' Get the cached traceheaders of a SCNL and time bucket.
+
+        Returns
+        -------
+        headers : List
+            The cached traceheader query results. None, if no valid entry
+            is available.
+        '''
+        key = (scnl, bucket)
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and self.ttl and time.time() - entry[0] > self.ttl:
+                self.entries.pop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            else:
+                self.hits += 1
+                return entry[1]
+
+
+    def put(self, scnl, bucket, headers):
+        ''' Add the traceheaders of a SCNL and time bucket to the cache.
+        '''
+        key = (scnl, bucket)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time(), headers)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+
+    def invalidate(self, start_time = None, end_time = None):
+        ''' Remove the entries overlapping a time span from the cache.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span. If None, the time span is open to
+            the past.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span. If None, the time span is open to the
+            future.
+        '''
+        first = None
+        last = None
+        if start_time is not None:
+            first = int(math.floor(start_time.timestamp / self.bucket_length))
+        if end_time is not None:
+            last = int(math.floor(end_time.timestamp / self.bucket_length))
+
+        with self.lock:
+            remove = [x for x in self.entries.iterkeys() if (first is None or x[1] >= first) and (last is None or x[1] <= last)]
+            for cur_key in remove:
+                self.entries.pop(cur_key)
+            self.invalidations += len(remove)
+
+        self.logger.debug('Invalidated %d traceheader cache entries.', len(remove))
+
+
+    def clear(self):
+        ''' Remove all entries from the cache.
+        '''
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries = collections.OrderedDict()
+
+
+    def reset_statistics(self):
+        ''' Reset the usage counters.
+        '''
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+
+class DecodedWaveformCache(object):
+    ''' A persistent cache of decoded waveform data.
+
+    The decoded data of a recorder stream of a waveform file is saved as
+    float64 numpy files in the cache directory and is loaded using memory
+    mapping. The cache key is built from the filename, the modification
+    time and the file type of the waveform file, the recorder stream and
+    the SCNL used to relabel the data. A changed waveform file therefore
+    results in a new cache entry.
+
+    Each cache entry consists of a JSON metadata file and one numpy file
+    per trace. The metadata file is written last, so that only complete
+    entries are used. The files are written to temporary files and renamed,
+    so several processes can share the cache directory. The modification
+    time of the metadata file is updated on each access and is used to
+    remove the least recently used entries if the cache size exceeds the
+    limit.
+    '''
+
+    def __init__(self, cache_dir, max_size = 0):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        cache_dir : String
+            The cache directory.
+
+        max_size : Integer
+            The maximum size of the cache in bytes. Use 0 for an unlimited
+            cache.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The cache directory.
+        self.cache_dir = cache_dir
+
+        # The maximum size of the cache in bytes.
+        self.max_size = max_size
+
+        # The number of bytes written by :meth:`save`.
+        self.written_bytes = 0
+
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # The directory might have been created by another process.
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+
+    @property
+    def nbytes(self):
+        ''' The size of the cache files in bytes.
+        '''
+        return sum([x[2] for x in self.get_entries()])
+
+
+    def get_key(self, filename, mtime, file_type, serial, stream, scnl):
+        ''' Build the cache key.
+
+        Returns
+        -------
+        key : String
+            The SHA1 hex digest of the key parameters.
+        '''
+        key = repr((os.path.abspath(filename), mtime, file_type, serial, stream, tuple(scnl)))
+        return hashlib.sha1(key).hexdigest()
+
+
+    def get_meta_filename(self, key):
+        ''' The filename of the metadata file of a cache entry.
+        '''
+        return os.path.join(self.cache_dir, key + '.json')
+
+
+    def get_data_filename(self, key, index):
+        ''' The filename of the data file of a trace of a cache entry.
+        '''
+        return os.path.join(self.cache_dir, '%s_%d.npy' % (key, index))
+
+
+    def load(self, key):
+        ''' Load a cache entry.
+
+        Parameters
+        ----------
+        key : String
+            The cache key.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The cached traces. The data arrays are read-only memory maps of
+            the cache files. None, if the entry is not available.
+        '''
+        meta_filename = self.get_meta_filename(key)
+        if not os.path.exists(meta_filename):
+            return None
+
+        try:
+            with open(meta_filename, 'r') as fid:
+                meta = json.load(fid)
+
+            traces = []
+            for k, cur_segment in enumerate(meta['segments']):
+                data = np.load(self.get_data_filename(key, k), mmap_mode = 'r')
+                header = {'network': str(cur_segment['network']),
+                          'station': str(cur_segment['station']),
+                          'location': str(cur_segment['location']),
+                          'channel': str(cur_segment['channel']),
+                          'sampling_rate': cur_segment['sampling_rate'],
+                          'starttime': UTCDateTime(cur_segment['starttime'])}
+                cur_trace = Trace(data = np.asarray(data), header = header)
+                cur_trace.stats.unit = 'counts'
+                traces.append(cur_trace)
+
+            # Mark the entry as recently used.
+            os.utime(meta_filename, None)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            # The entry might have been removed by another process.
+            self.logger.debug('Error when loading the cache entry %s: %s', key, e)
+            return None
+
+        return traces
+
+
+    def save(self, key, traces):
+        ''' Save traces as a cache entry.
+
+        Parameters
+        ----------
+        key : String
+            The cache key.
+
+        traces : List of :class:`~obspy.core.Trace`
+            The traces to save.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The traces loaded from the cache. If the entry couldn't be
+            saved, the passed traces are returned.
+        '''
+        meta = {'segments': []}
+        try:
+            for k, cur_trace in enumerate(traces):
+                self.write_atomic(self.get_data_filename(key, k),
+                                  lambda fid: np.save(fid, np.ascontiguousarray(cur_trace.data, dtype = np.float64)))
+                meta['segments'].append({'network': cur_trace.stats.network,
+                                         'station': cur_trace.stats.station,
+                                         'location': cur_trace.stats.location,
+                                         'channel': cur_trace.stats.channel,
+                                         'sampling_rate': cur_trace.stats.sampling_rate,
+                                         'starttime': cur_trace.stats.starttime.timestamp})
+            self.write_atomic(self.get_meta_filename(key),
+                              lambda fid: json.dump(meta, fid))
+        except (IOError, OSError) as e:
+            self.logger.error('Error when saving the cache entry %s: %s', key, e)
+            return traces
+
+        self.written_bytes += sum([x.data.size * 8 for x in traces])
+
+        cached_traces = self.load(key)
+        if cached_traces is None:
+            return traces
+        return cached_traces
+
+
+    def write_atomic(self, filename, write_function):
+        ''' Write a file using a temporary file which is renamed.
+        '''
+        tmp_filename = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp_filename, 'wb') as fid:
+                write_function(fid)
+            os.rename(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+
+    def get_entries(self):
+        ''' Get the cache entries.
+
+        Returns
+        -------
+        entries : List of Tuples (key, last_access, nbytes, filenames)
+            The cache entries.
+        '''
+        entries = []
+        for cur_meta_filename in glob.glob(os.path.join(self.cache_dir, '*.json')):
+            key = os.path.splitext(os.path.basename(cur_meta_filename))[0]
+            filenames = [cur_meta_filename, ] + glob.glob(os.path.join(self.cache_dir, key + '_*.npy'))
+            try:
+                last_access = os.path.getmtime(cur_meta_filename)
+                nbytes = sum([os.path.getsize(x) for x in filenames])
+            except OSError:
+                continue
+            entries.append((key, last_access, nbytes, filenames))
+        return entries
+
+
+    def cleanup(self):
+        ''' Remove the least recently used entries exceeding the size limit.
+
+        Returns
+        -------
+        nbytes : Integer
+            The size of the cache files in bytes after the cleanup. None,
+            if the cache size is not limited.
+        '''
+        if not self.max_size:
+            return None
+
+        entries = sorted(self.get_entries(), key = lambda x: x[1])
+        size = sum([x[2] for x in entries])
+        for key, last_access, nbytes, filenames in entries:
+            if size <= self.max_size:
+                break
+            self.logger.debug('Removing the cache entry %s.', key)
+            # Remove the metadata file first to invalidate the entry.
+            for cur_filename in filenames:
+                try:
+                    os.remove(cur_filename)
+                except OSError:
+                    pass
+            size -= nbytes
+
+        return size
+
+
+    def clear(self):
+        ''' Remove all entries from the cache.
+        '''
+        for key, last_access, nbytes, filenames in self.get_entries():
+            for cur_filename in filenames:
+                try:
+                    os.remove(cur_filename)
+                except OSError:
+                    pass
+
+
+
+class PrefetchRequest(object):
+    ''' A request of the prefetch scheduler.
+
+    '''
+
+    def __init__(self, start_time, end_time, scnl):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to fetch the waveform data.
+        '''
+        self.start_time = start_time
+
+        self.end_time = end_time
+
+        self.scnl = list(scnl)
+
+        # Indicates if the request has been cancelled before its execution.
+        self.cancelled = False
+
+        # The exception raised when executing the request.
+        self.error = None
+
+        # The event set when the request is finished or cancelled.
+        self.finished = threading.Event()
+
+
+    @property
+    def done(self):
+        ''' Indicate if the request is finished or cancelled.
+        '''
+        return self.finished.is_set()
+
+
+    def matches(self, start_time, end_time, scnl):
+        ''' Check if the request has the same parameters.
+        '''
+        return self.start_time == start_time and self.end_time == end_time and self.scnl == list(scnl)
+
+
+    def overlaps(self, start_time, end_time, scnl):
+        ''' Check if the request overlaps the data of a time span and SCNLs.
+        '''
+        if self.start_time >= end_time or self.end_time <= start_time:
+            return False
+        return len(set(self.scnl).intersection(scnl)) > 0
+
+
+    def join(self, timeout = None):
+        ''' Wait for the request to finish.
+
+        Returns
+        -------
+        done : Boolean
+            True if the request is finished or cancelled.
+        '''
+        self.finished.wait(timeout)
+        return self.done
+
+
+
+class PrefetchScheduler(object):
+    ''' The scheduler of the waveclient prefetch requests.
+
+    The requests are executed by a bounded pool of worker threads. The
+    scheduler records the requests of the waveclient for each set of SCNLs
+    and predicts the next time window of sequential requests, e.g. forward
+    scrolling in the tracedisplay or processing of consecutive time
+    intervals. Queued requests not matching the latest prediction are
+    cancelled.
+    '''
+
+    def __init__(self, target, n_workers = 1, max_pending = 100, max_history = 100):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        target : Callable
+            The function loading the data into the stock. It is called
+            with the keyword arguments start_time, end_time and scnl.
+
+        n_workers : Integer
+            The number of worker threads.
+
+        max_pending : Integer
+            The maximum number of queued requests. If the limit is
+            exceeded, the oldest requests are cancelled.
+
+        max_history : Integer
+            The maximum number of SCNL sets for which the request history
+            is kept.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The function loading the data.
+        self.target = target
+
+        # The number of worker threads.
+        self.n_workers = max(1, n_workers)
+
+        # The maximum number of queued requests.
+        self.max_pending = max_pending
+
+        # The maximum number of SCNL sets in the request history.
+        self.max_history = max_history
+
+        # The queued requests.
+        self.queue = collections.deque()
+
+        # The requests currently executed.
+        self.running = []
+
+        # The worker threads.
+        self.workers = []
+
+        # Indicates if the worker threads have to stop.
+        self.stopped = False
+
+        # The condition protecting the queue and notifying the workers.
+        self.condition = threading.Condition()
+
+        # The history of the requests. The key is the sorted tuple of the
+        # SCNLs, the value the list of the last two requested time spans.
+        self.history = collections.OrderedDict()
+
+        # The number of submitted requests.
+        self.submitted = 0
+
+        # The number of cancelled requests.
+        self.cancelled = 0
+
+        # The number of completed requests.
+        self.completed = 0
+
+
+    @property
+    def statistics(self):
+        ''' The usage statistics of the scheduler.
+        '''
+        d = {}
+        d['submitted'] = self.submitted
+        d['cancelled'] = self.cancelled
+        d['completed'] = self.completed
+        d['pending'] = len(self.queue)
+        return d
+
+
+    def submit(self, start_time, end_time, scnl):
+        ''' Submit a prefetch request.
+
+        Returns
+        -------
+        request : :class:`PrefetchRequest`
+            The submitted request. If an identical request is already
+            queued or running, this request is returned.
+        '''
+        with self.condition:
+            for cur_request in itertools.chain(self.running, self.queue):
+                if cur_request.matches(start_time, end_time, scnl):
+                    return cur_request
+
+            request = PrefetchRequest(start_time = start_time,
+                                      end_time = end_time,
+                                      scnl = scnl)
+            self.queue.append(request)
+            self.submitted += 1
+
+            while len(self.queue) > self.max_pending:
+                self.cancel_request(self.queue.popleft())
+
+            self.stopped = False
+            self.start_workers()
+            self.condition.notify()
+
+        return request
+
+
+    def record_access(self, start_time, end_time, scnl):
+        ''' Record a request of the waveclient and prefetch the next window.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the requested data.
+
+        end_time : UTCDateTime
+            The end datetime of the requested data.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The requested channels.
+
+        Returns
+        -------
+        request : :class:`PrefetchRequest`
+            The prefetch request of the predicted window. None, if no window
+            was predicted.
+        '''
+        key = tuple(sorted(scnl))
+        with self.condition:
+            history = self.history.pop(key, [])
+            history = (history + [(start_time, end_time), ])[-2:]
+            self.history[key] = history
+            while len(self.history) > self.max_history:
+                self.history.popitem(last = False)
+
+            prediction = self.predict(history)
+
+            # Cancel the stale requests of the SCNLs.
+            stale = [x for x in self.queue if tuple(sorted(x.scnl)) == key]
+            if prediction is not None:
+                stale = [x for x in stale if not x.matches(prediction[0], prediction[1], scnl)]
+            for cur_request in stale:
+                self.queue.remove(cur_request)
+                self.cancel_request(cur_request)
+
+        if prediction is None:
+            return None
+
+        self.logger.debug('Prefetching predicted window %s - %s of %s.', prediction[0], prediction[1], scnl)
+        return self.submit(start_time = prediction[0],
+                           end_time = prediction[1],
+                           scnl = scnl)
+
+
+    def predict(self, history):
+        ''' Predict the next time window from the request history.
+
+        A next window is predicted if the last two requests have the same
+        length and are shifted by not more than two window lengths.
+
+        Parameters
+        ----------
+        history : List of Tuples (start_time, end_time)
+            The last requested time spans.
+
+        Returns
+        -------
+        window : Tuple (start_time, end_time)
+            The predicted time window. None, if no window can be predicted.
+        '''
+        if len(history) < 2:
+            return None
+
+        (prev_start, prev_end), (cur_start, cur_end) = history[-2:]
+        length = cur_end - cur_start
+        if length <= 0 or abs((prev_end - prev_start) - length) > 1e-3 * length:
+            return None
+
+        step = cur_start - prev_start
+        if step == 0 or abs(step) > 2 * length:
+            return None
+
+        return (cur_start + step, cur_end + step)
+
+
+    def wait_for(self, start_time, end_time, scnl):
+        ''' Wait for the prefetch requests overlapping a requested time span.
+
+        Queued requests overlapping the time span are cancelled, running
+        requests are joined.
+        '''
+        with self.condition:
+            overlapping = [x for x in self.queue if x.overlaps(start_time, end_time, scnl)]
+            for cur_request in overlapping:
+                self.queue.remove(cur_request)
+                self.cancel_request(cur_request)
+            running = [x for x in self.running if x.overlaps(start_time, end_time, scnl)]
+
+        for cur_request in running:
+            cur_request.join()
+
+
+    def cancel_request(self, request):
+        ''' Mark a request removed from the queue as cancelled.
+
+        The caller has to hold the condition lock.
+        '''
+        request.cancelled = True
+        request.finished.set()
+        self.cancelled += 1
+
+
+    def cancel_all(self):
+        ''' Cancel all queued requests.
+        '''
+        with self.condition:
+            while self.queue:
+                self.cancel_request(self.queue.popleft())
+
+
+    def stop(self, timeout = None):
+        ''' Stop the worker threads.
+
+        The queued requests are cancelled. The running requests are
+        finished before the workers stop. The workers are started again
+        when a new request is submitted.
+
+        Parameters
+        ----------
+        timeout : float
+            The time in seconds to wait for each worker thread. If None,
+            wait until the worker has finished.
         '''
-        assert False, 'getWaveform must be defined'
+        with self.condition:
+            self.stopped = True
+            while self.queue:
+                self.cancel_request(self.queue.popleft())
+            self.condition.notify_all()
+            workers = self.workers
 
+        for cur_worker in workers:
+            if cur_worker is not threading.current_thread():
+                cur_worker.join(timeout)
 
-class PreloadThread(threading.Thread):
-    ''' The waveclient preload thread.
+        with self.condition:
+            self.workers = [x for x in self.workers if x.is_alive()]
 
-    This thread is used to preload the data of a waveclient.
-    '''
 
-    def __init__(self, start_time, end_time, scnl, group=None, target=None, name=None, verbose=None):
-        threading.Thread.__init__(self, group=group, target=target, name=name,
-                                  verbose=verbose)
-        self.start_time = start_time
+    def start_workers(self):
+        ''' Start the worker threads.
 
-        self.end_time = end_time
+        The caller has to hold the condition lock.
+        '''
+        self.workers = [x for x in self.workers if x.is_alive()]
+        while len(self.workers) < self.n_workers:
+            worker = threading.Thread(target = self.run_worker,
+                                      name = 'prefetch worker %d' % len(self.workers))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
 
-        self.scnl = scnl
 
-        self.target = target
+    def run_worker(self):
+        ''' The loop of the worker threads.
+        '''
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                request = self.queue.popleft()
+                self.running.append(request)
+
+            try:
+                self.target(start_time = request.start_time,
+                            end_time = request.end_time,
+                            scnl = request.scnl)
+            except Exception as e:
+                self.logger.exception('Error when prefetching the data of %s - %s.', request.start_time, request.end_time)
+                request.error = e
+            finally:
+                with self.condition:
+                    self.running.remove(request)
+                    self.completed += 1
+                request.finished.set()
 
-    def run(self):
-        self.target(self.start_time, self.end_time, self.scnl)
 
 
 class PsysmonDbWaveClient(WaveClient):
@@ -229,13 +2351,42 @@ class PsysmonDbWaveClient(WaveClient):
     database.
     '''
 
-    def __init__(self, name = 'psysmon db waveclient', project = None, **kwargs):
+    def __init__(self, name = 'psysmon db waveclient', project = None,
+                 decode_workers = 1, decode_mode = 'thread',
+                 header_cache_ttl = 300, waveform_cache_dir = None,
+                 waveform_cache_size = 1024, **kwargs):
 
         WaveClient.__init__(self, name=name, **kwargs)
 
         # The psysmon project owning the waveclient.
         self.project = project
 
+        # The number of workers used to decode the waveform files. Use 1
+        # to decode the files serially, 0 to use one worker per CPU.
+        self.decode_workers = decode_workers
+
+        # The kind of the decoding pool (thread, process).
+        self.decode_mode = decode_mode
+
+        # The time to live of the traceheader cache entries in seconds.
+        self.header_cache_ttl = header_cache_ttl
+
+        # The cache of the traceheader query results.
+        self.header_cache = TraceheaderCache(ttl = header_cache_ttl)
+
+        # The directory of the decoded waveform cache. If None, the
+        # decoded waveform data is not cached.
+        self.waveform_cache_dir = waveform_cache_dir
+
+        # The maximum size of the decoded waveform cache in MB. Use 0 for
+        # an unlimited cache.
+        self.waveform_cache_size = waveform_cache_size
+
+        # The estimated size of the decoded waveform cache in bytes. It is
+        # computed by the first cleanup of the cache and is increased by
+        # the bytes written when loading data. None, if not yet known.
+        self.waveform_cache_nbytes = None
+
         # The list of the associated waveform directories.
         self.waveformDirList = []
 
@@ -243,6 +2394,19 @@ class PsysmonDbWaveClient(WaveClient):
         self.loadWaveformDirList()
 
 
+    @property
+    def pickle_attributes(self):
+        ''' The attributes which can be pickled.
+        '''
+        d = super(PsysmonDbWaveClient, self).pickle_attributes
+        d['decode_workers'] = self.decode_workers
+        d['decode_mode'] = self.decode_mode
+        d['header_cache_ttl'] = self.header_cache_ttl
+        d['waveform_cache_dir'] = self.waveform_cache_dir
+        d['waveform_cache_size'] = self.waveform_cache_size
+        return d
+
+
     @property
     def traceheader(self):
         # The traceheader database table.
@@ -296,7 +2460,8 @@ class PsysmonDbWaveClient(WaveClient):
 
 
 
-    def getWaveform(self, startTime, endTime, scnl):
+    def getWaveform(self, startTime, endTime, scnl, read_only = False,
+                    prefetch = None):
         ''' Get the waveform data for the specified parameters.
 
         Parameters
@@ -310,6 +2475,14 @@ class PsysmonDbWaveClient(WaveClient):
         scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
             The channels for which to get the waveform data.
 
+        read_only : Boolean
+            If True, the data of the returned traces are read-only views
+            of the waveclient stock.
+
+        prefetch : Boolean
+            If True, the next time window is prefetched in the background.
+            If None, the auto_prefetch setting of the waveclient is used.
+
         Returns
         -------
         stream : :class:`obspy.core.Stream`
@@ -317,95 +2490,53 @@ class PsysmonDbWaveClient(WaveClient):
         '''
         self.logger.debug("Getting the waveform...")
 
-        new_data = False
-        stream = Stream()
-
         # Trim the stock stream to new limits.
         self.trim_stock(start_time = startTime, end_time = endTime)
 
-        # Filter the SCNL selections.
-        if scnl:
-            for stat, chan, net, loc in scnl:
-                stock_stream = self.get_from_stock(station = stat,
-                                                   channel = chan,
-                                                   network = net,
-                                                   location = loc,
-                                                   start_time = startTime,
-                                                   end_time = endTime)
-
-                if len(stock_stream) > 0:
-                    self.logger.debug('Found data in stock....\n%s', stock_stream)
-                    stock_stream.merge()
-                    cur_trace = stock_stream.traces[0]
-                    cur_start_time = cur_trace.stats.starttime
-                    cur_end_time = cur_trace.stats.starttime + cur_trace.stats.npts / cur_trace.stats.sampling_rate
-
-                    stream += stock_stream.split()
-
-                    if (cur_start_time - startTime) > 1/cur_trace.stats.sampling_rate:
-                        self.logger.debug('Get missing data in front...')
-                        self.logger.debug('Loading data from %s to %s.', startTime, cur_start_time)
-                        curStream = self.load_from_file(station = stat,
-                                                        channel = chan,
-                                                        network = net,
-                                                        location = loc,
-                                                        start_time = startTime,
-                                                        end_time = cur_start_time)
-                        stream += curStream
-                        new_data = True
-
-                    if (endTime - cur_end_time) > 1/cur_trace.stats.sampling_rate:
-                        self.logger.debug('Get missing data in back...')
-                        self.logger.debug('Loading data from %s to %s.', cur_end_time, endTime)
-                        curStream = self.load_from_file(station = stat,
-                                                        channel = chan,
-                                                        network = net,
-                                                        location = loc,
-                                                        start_time = cur_end_time,
-                                                        end_time = endTime)
-                        stream += curStream
-                        new_data = True
-
-                    if isinstance(stock_stream.traces[0].data, np.ma.masked_array):
-                        # Try to fill the data gaps.
-                        self.logger.debug('There are gaps in the stock stream. Try to fill them...')
-                        stock_stream = stock_stream.split()
-                        gaps = stock_stream.getGaps()
-                        for cur_gap in gaps:
-                            self.logger.debug('Loading data for gap %s.', cur_gap)
-                            curStream = self.load_from_file(station = stat,
-                                                            channel = chan,
-                                                            network = net,
-                                                            location = loc,
-                                                            start_time = cur_gap[4],
-                                                            end_time = cur_gap[5])
-                            stream += curStream
-                            new_data = True
-
-
-                else:
-                    self.logger.debug('No stock data available...')
-                    self.logger.debug('Loading data from %s to %s.', startTime, endTime)
-                    curStream = self.load_from_file(station = stat,
-                                                    channel = chan,
-                                                    network = net,
-                                                    location = loc,
-                                                    start_time = startTime,
-                                                    end_time = endTime)
-
-                    stream += curStream
-                    new_data = True
-
-                stream.merge()
-        if new_data:
-            self.add_to_stock(stream)
-            #self.trim_stock(start_time = startTime, end_time = endTime)
+        stream = WaveClient.getWaveform(self,
+                                        startTime = startTime,
+                                        endTime = endTime,
+                                        scnl = scnl,
+                                        read_only = read_only,
+                                        prefetch = prefetch)
 
         self.logger.debug("....finished getting the waveform.")
 
         return stream
 
 
+    def fill_stock(self, start_time, end_time, scnl):
+        ''' Load the data missing in the stock from the waveform files.
+
+        Parameters
+        ----------
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The channels for which to get the waveform data.
+        '''
+        # Compute the data missing in the stock.
+        missing = {}
+        if scnl:
+            for cur_scnl in scnl:
+                cur_missing = self.stock.get_missing(scnl = cur_scnl,
+                                                     start_time = start_time,
+                                                     end_time = end_time)
+                if cur_missing:
+                    self.logger.debug('Missing data of %s: %s', cur_scnl, cur_missing)
+                    missing[cur_scnl] = cur_missing
+
+        # Load the missing data. Each file is read only once.
+        if missing:
+            file_plan = self.get_file_plan(missing)
+            stream = self.load_file_plan(file_plan)
+            self.add_to_stock(stream)
+
+
 
     def load_from_file(self, station, channel, network, location, start_time, end_time):
         ''' Load the data from file.
@@ -423,78 +2554,356 @@ class PsysmonDbWaveClient(WaveClient):
         stream : :class:`~obspy.core.Stream`
             The data of the specified SCNL and time period loaded from the files.
         '''
-        data_stream = Stream()
+        missing = {(station, channel, network, location): [(start_time, end_time), ]}
+        file_plan = self.get_file_plan(missing)
+        return self.load_file_plan(file_plan)
 
-        # Get the channel from the inventory. It's expected, that only one
-        # channel is returned. If more than one channels are returned, then
-        # there is an error in the geometry inventory.
-        cur_channel = self.project.geometry_inventory.get_channel(network = network,
-                                                                  station = station,
-                                                                  location = location,
-                                                                  name = channel)
 
-        if cur_channel:
-            if len(cur_channel) > 1:
-                raise RuntimeError('More than 1 channel returned for SCNL: %s:%s:%s:%s. Checkk the geometry inventory for duplicate entries.' % (station, channel, network, location))
+    def get_file_plan(self, missing):
+        ''' Plan the file access needed to load the missing data.
 
-            cur_channel = cur_channel[0]
+        The missing intervals of all SCNLs are resolved to the files
+        containing the data using the traceheader cache. The traceheaders
+        not available in the cache are loaded using a single query of the
+        traceheader database table. The requests are grouped by file, so
+        that each file is read only once.
+
+        Parameters
+        ----------
+        missing : Dictionary
+            The missing time intervals. The key is the SCNL tuple, the
+            value a list of (start_time, end_time) tuples.
+
+        Returns
+        -------
+        file_plan : Dictionary
+            The file plan. The key is the full path of the file, the value
+            is a dictionary with the keys 'file_type' and 'requests'. Each
+            request is a dictionary with the keys 'scnl', 'serial',
+            'stream', 'start_time' and 'end_time'.
+        '''
+        file_plan = {}
+        stream_requests = self.get_stream_requests(missing)
+        if not stream_requests:
+            return file_plan
+
+        # The requested intervals of the recorder streams of each SCNL.
+        scnl_requests = {}
+        for cur_key, cur_requests in stream_requests.iteritems():
+            for cur_scnl, cur_intervals in cur_requests:
+                if cur_scnl not in scnl_requests:
+                    scnl_requests[cur_scnl] = {}
+                scnl_requests[cur_scnl][cur_key] = cur_intervals
+
+        missing = dict([(x, [z for y in scnl_requests[x].values() for z in y]) for x in scnl_requests])
+        headers = self.get_traceheaders(missing)
+        for cur_scnl, cur_headers in headers.iteritems():
+            for cur_header in cur_headers:
+                cur_key = (cur_header.recorder_serial, cur_header.stream)
+                cur_intervals = scnl_requests[cur_scnl].get(cur_key, None)
+                if cur_intervals:
+                    self.add_to_file_plan(file_plan,
+                                          header = cur_header,
+                                          scnl = cur_scnl,
+                                          intervals = cur_intervals)
+
+        return file_plan
+
+
+    def get_traceheaders(self, missing):
+        ''' Get the traceheaders of the SCNLs overlapping time intervals.
+
+        The traceheaders are taken from the traceheader cache. The time
+        buckets not available in the cache are loaded from the database
+        using a single query and are added to the cache.
 
-            dbSession = self.project.getDbSession()
+        Parameters
+        ----------
+        missing : Dictionary
+            The time intervals. The key is the SCNL tuple, the value a list
+            of (start_time, end_time) tuples.
+
+        Returns
+        -------
+        headers : Dictionary
+            The traceheader query results. The key is the SCNL tuple. The
+            headers cover the whole time buckets of the intervals.
+        '''
+        cache = self.header_cache
+        headers = {}
+        uncached = {}
+        for cur_scnl, cur_intervals in missing.iteritems():
+            headers[cur_scnl] = []
+            buckets = set([x for y in cur_intervals for x in cache.get_buckets(*y)])
+            for cur_bucket in sorted(buckets):
+                cur_headers = cache.get(cur_scnl, cur_bucket)
+                if cur_headers is None:
+                    if cur_scnl not in uncached:
+                        uncached[cur_scnl] = []
+                    uncached[cur_scnl].append(cur_bucket)
+                else:
+                    headers[cur_scnl].extend(cur_headers)
+
+        if not uncached:
+            return headers
+
+        # Query the headers of the whole buckets missing in the cache.
+        bucket_headers = {}
+        bucket_missing = {}
+        for cur_scnl, cur_buckets in uncached.iteritems():
+            for cur_bucket in cur_buckets:
+                bucket_headers[(cur_scnl, cur_bucket)] = []
+            bucket_missing[cur_scnl] = coalesce_intervals([cache.get_bucket_span(x) for x in cur_buckets])
+
+        bucket_requests = self.get_stream_requests(bucket_missing)
+        if bucket_requests:
+            db_session = self.project.getDbSession()
+            try:
+                query = self.get_traceheader_query(db_session, bucket_requests)
+                for cur_header in query:
+                    cur_key = (cur_header.recorder_serial, cur_header.stream)
+                    for cur_scnl, cur_intervals in bucket_requests.get(cur_key, []):
+                        for cur_bucket in uncached[cur_scnl]:
+                            bucket_start, bucket_end = cache.get_bucket_span(cur_bucket)
+                            if cur_header.begin_time < bucket_end.timestamp and cur_header.end_time > bucket_start.timestamp:
+                                bucket_headers[(cur_scnl, cur_bucket)].append(cur_header)
+            finally:
+                db_session.close()
+
+        for (cur_scnl, cur_bucket), cur_headers in bucket_headers.iteritems():
+            cache.put(cur_scnl, cur_bucket, cur_headers)
+            headers[cur_scnl].extend(cur_headers)
+
+        return headers
+
+
+    def get_stream_requests(self, missing):
+        ''' Resolve the missing data of the SCNLs to recorder streams.
 
-            # Select the file type, filename and waveform directory.
-            query = dbSession.query(self.traceheader.file_type,
-                                    self.traceheader.filename,
-                                    self.waveformDirAlias.alias).\
-                                    filter(self.traceheader.wf_id ==self.waveformDir.id).\
-                                    filter(self.waveformDir.id == self.waveformDirAlias.wf_id).\
-                                    filter(self.waveformDirAlias.user == self.project.activeUser.name)
+        Parameters
+        ----------
+        missing : Dictionary
+            The missing time intervals. The key is the SCNL tuple, the
+            value a list of (start_time, end_time) tuples.
 
-            # Add the startTime filter option.
-            if start_time:
-                query = query.filter(self.traceheader.begin_time + self.traceheader.numsamp * 1/self.traceheader.sps > start_time.timestamp)
+        Returns
+        -------
+        stream_requests : Dictionary
+            The key is the tuple (recorder_serial, stream_name), the value
+            is a list of (scnl, intervals) tuples. The intervals are limited
+            to the time-span of the assignment of the recorder stream to the
+            channel.
+        '''
+        stream_requests = {}
+        for cur_scnl, cur_intervals in missing.iteritems():
+            station, channel, network, location = cur_scnl
+            # Get the channel from the inventory. It's expected, that only one
+            # channel is returned. If more than one channels are returned, then
+            # there is an error in the geometry inventory.
+            cur_channel = self.project.geometry_inventory.get_channel(network = network,
+                                                                      station = station,
+                                                                      location = location,
+                                                                      name = channel)
+            if not cur_channel:
+                continue
 
-            # Add the endTime filter option.
-            if end_time:
-                query = query.filter(self.traceheader.begin_time < end_time.timestamp)
+            if len(cur_channel) > 1:
+                raise RuntimeError('More than 1 channel returned for SCNL: %s:%s:%s:%s. Checkk the geometry inventory for duplicate entries.' % (station, channel, network, location))
+            cur_channel = cur_channel[0]
 
-            # Get the streams assigned to the channel for the requested
-            # time-span.
-            assigned_streams = cur_channel.get_stream(start_time = start_time,
-                                                      end_time = end_time)
+            cur_intervals = coalesce_intervals(cur_intervals)
+            assigned_streams = cur_channel.get_stream(start_time = cur_intervals[0][0],
+                                                      end_time = cur_intervals[-1][1])
             for cur_timebox in assigned_streams:
                 cur_rec_stream = cur_timebox.item
+                # Limit the intervals to the assignment time-span of the
+                # recorder stream.
+                box_intervals = []
+                for cur_start, cur_end in cur_intervals:
+                    if cur_timebox.start_time is not None and cur_timebox.start_time > cur_start:
+                        cur_start = cur_timebox.start_time
+                    if cur_timebox.end_time is not None and cur_timebox.end_time < cur_end:
+                        cur_end = cur_timebox.end_time
+                    if cur_start < cur_end:
+                        box_intervals.append((cur_start, cur_end))
 
-                # Create a new query with filters for the serial and stream
-                # name.
-                cur_query = query.filter(self.traceheader.recorder_serial == cur_rec_stream.serial).\
-                                  filter(self.traceheader.stream == cur_rec_stream.name)
-
-                # Process the results of the query.
-                for curHeader in cur_query:
-                    filename = os.path.join(curHeader.alias, curHeader.filename)
-                    self.logger.debug("Loading file: %s", filename)
-                    cur_data_stream = read(pathname_or_url = filename,
-                                           format = curHeader.file_type,
-                                           starttime = start_time,
-                                           endtime = end_time,
-                                           dtype = 'float64')
-
-                    if not cur_data_stream:
-                        continue
+                if not box_intervals:
+                    continue
+
+                cur_key = (cur_rec_stream.serial, cur_rec_stream.name)
+                if cur_key not in stream_requests:
+                    stream_requests[cur_key] = []
+                stream_requests[cur_key].append((cur_scnl, box_intervals))
+
+        return stream_requests
+
+
+    def get_traceheader_query(self, db_session, stream_requests):
+        ''' Build the query of the traceheaders matching the stream requests.
+
+        All recorder streams and time intervals are combined into a
+        single query.
+
+        Parameters
+        ----------
+        db_session : :class:`sqlalchemy.orm.Session`
+            The database session used for the query.
+
+        stream_requests : Dictionary
+            The requested recorder streams and time intervals as returned
+            by :meth:`get_stream_requests`.
+
+        Returns
+        -------
+        query : :class:`sqlalchemy.orm.Query`
+            The query selecting the file information and the time-span of
+            the traceheaders.
+        '''
+        header = self.traceheader
+        header_end = header.end_time
+
+        # Select the file type, filename and waveform directory.
+        query = db_session.query(header.file_type,
+                                 header.filename,
+                                 header.recorder_serial,
+                                 header.stream,
+                                 header.begin_time,
+                                 header_end.label('end_time'),
+                                 self.waveformDirAlias.alias).\
+                                 filter(header.wf_id == self.waveformDir.id).\
+                                 filter(self.waveformDir.id == self.waveformDirAlias.wf_id).\
+                                 filter(self.waveformDirAlias.user == self.project.activeUser.name)
+
+        # Limit the query to the time-span covering all requests.
+        intervals = coalesce_intervals([x for y in stream_requests.values() for z in y for x in z[1]])
+        query = query.filter(header.begin_time < intervals[-1][1].timestamp).\
+                      filter(header_end > intervals[0][0].timestamp)
+
+        stream_filter = []
+        for (cur_serial, cur_stream), cur_requests in stream_requests.iteritems():
+            cur_intervals = coalesce_intervals([x for y in cur_requests for x in y[1]])
+            time_filter = [sqlalchemy.and_(header_end > x[0].timestamp, header.begin_time < x[1].timestamp) for x in cur_intervals]
+            stream_filter.append(sqlalchemy.and_(header.recorder_serial == cur_serial,
+                                                 header.stream == cur_stream,
+                                                 sqlalchemy.or_(*time_filter)))
+        query = query.filter(sqlalchemy.or_(*stream_filter))
+
+        return query
+
+
+    def add_to_file_plan(self, file_plan, header, scnl, intervals):
+        ''' Add the intervals covered by a traceheader to the file plan.
+
+        Parameters
+        ----------
+        file_plan : Dictionary
+            The file plan to update.
+
+        header : Query result
+            The traceheader query result.
+
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the data.
+
+        intervals : List of Tuples (start_time, end_time)
+            The requested time intervals.
+        '''
+        filename = os.path.join(header.alias, header.filename)
+        if filename not in file_plan:
+            file_plan[filename] = {'file_type': header.file_type,
+                                   'requests': []}
+        requests = file_plan[filename]['requests']
+
+        for cur_start, cur_end in intervals:
+            if cur_end.timestamp <= header.begin_time or cur_start.timestamp >= header.end_time:
+                continue
+            cur_request = {'scnl': scnl,
+                           'serial': header.recorder_serial,
+                           'stream': header.stream,
+                           'start_time': cur_start,
+                           'end_time': cur_end}
+            if cur_request not in requests:
+                requests.append(cur_request)
+
+
+    def load_file_plan(self, file_plan):
+        ''' Load the data of a file plan.
+
+        The files are decoded in parallel if more than one decoding worker
+        is configured. The traces are returned in the order of the sorted
+        filenames, independent of the number of workers.
+
+        Parameters
+        ----------
+        file_plan : Dictionary
+            The file plan created by :meth:`get_file_plan`.
+
+        Returns
+        -------
+        stream : :class:`~obspy.core.Stream`
+            The data loaded from the files.
+        '''
+        cache_dir = self.waveform_cache_dir
+        jobs = [(x, file_plan[x]['file_type'], file_plan[x]['requests'], cache_dir) for x in sorted(file_plan.keys()) if file_plan[x]['requests']]
+
+        n_workers = self.decode_workers
+        if n_workers == 0:
+            n_workers = multiprocessing.cpu_count()
+        n_workers = min(n_workers, len(jobs))
+
+        if n_workers <= 1:
+            results = []
+            for cur_job in jobs:
+                self.logger.debug("Loading file: %s", cur_job[0])
+                results.append(decode_plan_file(cur_job))
+        else:
+            self.logger.debug("Loading %d files using %d %s workers.", len(jobs), n_workers, self.decode_mode)
+            if self.decode_mode == 'process':
+                pool = multiprocessing.Pool(n_workers)
+            else:
+                pool = multiprocessing.pool.ThreadPool(n_workers)
+
+            try:
+                results = pool.map(decode_plan_file, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+        stream = Stream()
+        for cur_traces, cur_written in results:
+            stream.extend(cur_traces)
+
+        if cache_dir and jobs:
+            self.check_waveform_cache(written_bytes = sum([x[1] for x in results]))
+
+        return stream
 
-                    # Change the header values to the ones stored in the geometry inventory.
-                    for curTrace in cur_data_stream:
-                        curTrace.stats.network = network
-                        curTrace.stats.station = station
-                        curTrace.stats.location = location
-                        curTrace.stats.channel = channel
-                        curTrace.stats.unit = 'counts'
 
-                    data_stream += cur_data_stream
+    def check_waveform_cache(self, written_bytes):
+        ''' Clean up the decoded waveform cache if it exceeds the size limit.
+
+        The cache directory is scanned only on the first call and when the
+        estimated cache size exceeds the limit. Data written to the cache
+        by other processes is not included in the estimate and is
+        accounted for by the next scan.
+
+        Parameters
+        ----------
+        written_bytes : Integer
+            The number of bytes written to the cache since the last call.
+        '''
+        if not self.waveform_cache_size:
+            return
 
-            dbSession.close()
+        max_size = self.waveform_cache_size * 1024 * 1024
+        if self.waveform_cache_nbytes is not None:
+            self.waveform_cache_nbytes += written_bytes
+            if self.waveform_cache_nbytes <= max_size:
+                return
 
-        return data_stream
+        cache = DecodedWaveformCache(cache_dir = self.waveform_cache_dir,
+                                     max_size = max_size)
+        self.waveform_cache_nbytes = cache.cleanup()
 
     def loadWaveformDirList(self):
         '''Load the waveform directories from the database table.
@@ -521,14 +2930,286 @@ class PsysmonDbWaveClient(WaveClient):
 
 
 
+def parse_tracebuf2(data):
+    ''' Convert Earthworm TRACEBUF2 packets to obspy traces.
+
+    Parameters
+    ----------
+    data : String
+        The raw TRACEBUF2 packets.
+
+    Returns
+    -------
+    traces : List of :class:`~obspy.core.Trace`
+        One trace for each packet.
+    '''
+    traces = []
+    pos = 0
+    while pos + 64 <= len(data):
+        datatype = data[pos + 57:pos + 59]
+        if datatype[0] in 'st':
+            endian = '>'
+        else:
+            endian = '<'
+        if datatype[0] in 'si':
+            kind = 'i'
+        else:
+            kind = 'f'
+        sample_size = int(datatype[1])
+
+        header = struct.unpack(endian + 'iiddd7s9s4s3s', data[pos:pos + 55])
+        npts = header[1]
+        samples = np.frombuffer(data,
+                                dtype = np.dtype(endian + kind + str(sample_size)),
+                                count = npts,
+                                offset = pos + 64)
+
+        location = header[8].split('\x00')[0]
+        if location == '--':
+            location = ''
+        trace = Trace(data = samples.astype(np.float64))
+        trace.stats.starttime = UTCDateTime(header[2])
+        trace.stats.sampling_rate = header[4]
+        trace.stats.station = header[5].split('\x00')[0]
+        trace.stats.network = header[6].split('\x00')[0]
+        trace.stats.channel = header[7].split('\x00')[0]
+        trace.stats.location = location
+        trace.stats.unit = 'counts'
+        traces.append(trace)
+        pos += 64 + npts * sample_size
+
+    return traces
+
+
+
+class WaveServerConnection(object):
+    ''' A persistent connection to an Earthworm wave_serverV.
+
+    The connection is used for several GETSCNLRAW requests.
+    '''
+
+    def __init__(self, host, port, timeout = 10):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        host : String
+            The waveserver host.
+
+        port : Integer
+            The waveserver port.
+
+        timeout : float
+            The timeout in seconds used to open the connection.
+        '''
+        self.host = host
+
+        self.port = port
+
+        # The connected socket.
+        self.sock = socket.create_connection((host, port), timeout = timeout)
+
+        # The data received but not yet consumed.
+        self.buffer = ''
+
+        # The counter used to create the request ids.
+        self.request_count = 0
+
+
+    def close(self):
+        ''' Close the connection.
+        '''
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+
+    def receive(self, deadline):
+        ''' Receive data from the socket before the deadline.
+        '''
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise socket.timeout('The request deadline has been exceeded.')
+        self.sock.settimeout(remaining)
+        data = self.sock.recv(65536)
+        if not data:
+            raise socket.error('The connection has been closed by the waveserver.')
+        self.buffer += data
+
+
+    def read_line(self, deadline):
+        ''' Read a line terminated by a newline character.
+        '''
+        while '\n' not in self.buffer:
+            self.receive(deadline)
+        line, self.buffer = self.buffer.split('\n', 1)
+        return line
+
+
+    def read_bytes(self, n_bytes, deadline):
+        ''' Read a given number of bytes.
+        '''
+        while len(self.buffer) < n_bytes:
+            self.receive(deadline)
+        data = self.buffer[:n_bytes]
+        self.buffer = self.buffer[n_bytes:]
+        return data
+
+
+    def get_scnl_raw(self, station, channel, network, location, start_time, end_time, deadline):
+        ''' Request the data of a SCNL.
+
+        Parameters
+        ----------
+        station, channel, network, location : String
+            The SCNL of the data.
+
+        start_time : UTCDateTime
+            The begin datetime of the data to fetch.
+
+        end_time : UTCDateTime
+            The end datetime of the data to fetch.
+
+        deadline : float
+            The time (time.time()) at which the request has to be
+            completed.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The received TRACEBUF2 packets.
+        '''
+        if not location:
+            location = '--'
+        self.request_count += 1
+        request_id = 'psysmon%d' % self.request_count
+        request = 'GETSCNLRAW: %s %s %s %s %s %f %f\n' % (request_id, station, channel,
+                                                          network, location,
+                                                          start_time.timestamp,
+                                                          end_time.timestamp)
+        self.sock.settimeout(max(deadline - time.time(), 0.001))
+        self.sock.sendall(request)
+
+        tokens = self.read_line(deadline).split()
+        if not tokens or tokens[0] != request_id:
+            raise socket.error('Unexpected waveserver response: %s.' % ' '.join(tokens))
+
+        # The flag F indicates a successful request. All other flags
+        # (e.g. FL, FR, FG) indicate, that no data is available.
+        if tokens[6] != 'F':
+            return []
+
+        data = self.read_bytes(int(tokens[-1]), deadline)
+        return parse_tracebuf2(data)
+
+
+
+class WaveServerConnectionPool(object):
+    ''' A pool of persistent connections to an Earthworm wave_serverV.
+
+    '''
+
+    def __init__(self, host, port, size = 4, timeout = 10):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        host : String
+            The waveserver host.
+
+        port : Integer
+            The waveserver port.
+
+        size : Integer
+            The maximum number of open connections.
+
+        timeout : float
+            The timeout in seconds of a request.
+        '''
+        # The logger.
+        loggerName = __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        self.host = host
+
+        self.port = port
+
+        self.size = size
+
+        self.timeout = timeout
+
+        # The idle connections.
+        self.idle = Queue.LifoQueue()
+
+        # The semaphore limiting the number of connections in use.
+        self.slots = threading.BoundedSemaphore(size)
+
+
+    def request(self, station, channel, network, location, start_time, end_time):
+        ''' Request the data of a SCNL using a pooled connection.
+
+        The request has to be completed within the timeout of the pool.
+        The timeout starts when a connection slot is available, so that
+        requests waiting for a connection don't time out early. A
+        connection with a failed request is closed.
+
+        Returns
+        -------
+        traces : List of :class:`~obspy.core.Trace`
+            The received data.
+        '''
+        self.slots.acquire()
+        try:
+            deadline = time.time() + self.timeout
+            try:
+                connection = self.idle.get_nowait()
+            except Queue.Empty:
+                connection = WaveServerConnection(self.host, self.port,
+                                                  timeout = self.timeout)
+
+            try:
+                traces = connection.get_scnl_raw(station = station,
+                                                 channel = channel,
+                                                 network = network,
+                                                 location = location,
+                                                 start_time = start_time,
+                                                 end_time = end_time,
+                                                 deadline = deadline)
+            except Exception:
+                connection.close()
+                raise
+
+            self.idle.put(connection)
+        finally:
+            self.slots.release()
+
+        return traces
+
+
+    def close(self):
+        ''' Close all idle connections.
+        '''
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+
 class EarthwormWaveclient(WaveClient):
     ''' The earthworm waveserver client.
 
     This class provides the connector to a Earthworm waveserver.
-    The client uses the :class:`obspy.earthworm.Client` class.
+    The waveform data is requested concurrently using a pool of persistent
+    connections to the waveserver (:class:`WaveServerConnectionPool`). The
+    :class:`obspy.earthworm.Client` class is available for other requests
+    (e.g. the data availability).
     '''
 
-    def __init__(self, name = 'earthworm waveserver client', host='localhost', port=16022, **kwargs):
+    def __init__(self, name = 'earthworm waveserver client', host='localhost', port=16022,
+                 n_connections = 4, request_timeout = 10, **kwargs):
         WaveClient.__init__(self, name=name, **kwargs)
 
         # The Earthworm waveserver host to which the client should connect.
@@ -537,11 +3218,23 @@ class EarthwormWaveclient(WaveClient):
         # The port on which the Eartworm waveserver is running on host.
         self.port = port
 
+        # The number of concurrent connections to the waveserver.
+        self.n_connections = n_connections
+
+        # The time in seconds in which a request has to be completed.
+        self.request_timeout = request_timeout
+
         # The obspy earthworm waveserver client instance.
         self.client = Client(self.host,
                              self.port,
                              timeout=2)
 
+        # The pool of the waveserver connections.
+        self.connection_pool = None
+
+        # The lock of the creation of the connection pool.
+        self.connection_pool_lock = threading.Lock()
+
     @property
     def pickle_attributes(self):
         ''' The attributes which can be pickled.
@@ -549,137 +3242,127 @@ class EarthwormWaveclient(WaveClient):
         d = super(EarthwormWaveclient, self).pickle_attributes
         d['host'] = self.host
         d['port'] = self.port
+        d['n_connections'] = self.n_connections
+        d['request_timeout'] = self.request_timeout
         return d
 
 
-    def getWaveform(self,
-                    startTime,
-                    endTime,
-                    scnl):
-        ''' Get the waveform data for the specified parameters.
+    def get_connection_pool(self):
+        ''' Get the pool of the waveserver connections.
+
+        A new pool is created if the host or the port of the client have
+        been changed. The method is called by the request and the prefetch
+        threads, so the pool is created holding a lock.
+        '''
+        with self.connection_pool_lock:
+            pool = self.connection_pool
+            if pool is None or pool.host != self.host or pool.port != self.port:
+                if pool is not None:
+                    pool.close()
+                pool = WaveServerConnectionPool(host = self.host,
+                                                port = self.port,
+                                                size = self.n_connections,
+                                                timeout = self.request_timeout)
+                self.connection_pool = pool
+        return pool
+
+
+    def close(self):
+        ''' Close the waveclient.
+
+        Stop the prefetch threads and close the idle waveserver connections.
+        '''
+        WaveClient.close(self)
+        with self.connection_pool_lock:
+            if self.connection_pool is not None:
+                self.connection_pool.close()
+                self.connection_pool = None
+
+
+    def fill_stock(self, start_time, end_time, scnl):
+        ''' Request the data missing in the stock from the waveserver.
 
         Parameters
         ----------
-        startTime : UTCDateTime
+        start_time : UTCDateTime
             The begin datetime of the data to fetch.
 
-        endTime : UTCDateTime
+        end_time : UTCDateTime
             The end datetime of the data to fetch.
 
         scnl : List of tuples
             The SCNL codes of the data to request.
-
-
-        Returns
-        -------
-        stream : :class:`obspy.core.Stream`
-            The requested waveform data. All traces are packed into one stream.
         '''
-        from obspy.core import Stream
-
         self.logger.debug("Querying...")
-        self.logger.debug('startTime: %s', startTime)
-        self.logger.debug('endTime: %s', endTime)
+        self.logger.debug('start_time: %s', start_time)
+        self.logger.debug('end_time: %s', end_time)
         self.logger.debug("%s", scnl)
 
-        stream = Stream()
-        for curScnl in scnl:
-            curStation = curScnl[0]
-            curChannel = curScnl[1]
-            curNetwork = curScnl[2]
-            curLocation = curScnl[3]
-
-            stock_stream = self.get_from_stock(station = curStation,
-                                               channel = curChannel,
-                                               network = curNetwork,
-                                               location = curLocation,
-                                               start_time = startTime,
-                                               end_time = endTime)
-
-            if len(stock_stream) > 0:
-                cur_trace = stock_stream.traces[0]
-                cur_start_time = cur_trace.stats.starttime
-                cur_end_time = cur_trace.stats.starttime + cur_trace.stats.npts / cur_trace.stats.sampling_rate
-
-                stream += stock_stream
-
-                if startTime < cur_start_time:
-                    curStream = self.request_from_server(station = curStation,
-                                                         channel = curChannel,
-                                                         network = curNetwork,
-                                                         location = curLocation,
-                                                         start_time = startTime,
-                                                         end_time = cur_start_time)
-                    stream += curStream
-
-                if cur_end_time < endTime:
-                    curStream = self.request_from_server(station = curStation,
-                                                         channel = curChannel,
-                                                         network = curNetwork,
-                                                         location = curLocation,
-                                                         start_time = cur_end_time,
-                                                         end_time = endTime)
-                    stream += curStream
+        requests = []
+        for cur_scnl in scnl:
+            missing = self.stock.get_missing(scnl = cur_scnl,
+                                             start_time = start_time,
+                                             end_time = end_time)
+            for cur_start_time, cur_end_time in missing:
+                requests.append({'station': cur_scnl[0],
+                                 'channel': cur_scnl[1],
+                                 'network': cur_scnl[2],
+                                 'location': cur_scnl[3],
+                                 'start_time': cur_start_time,
+                                 'end_time': cur_end_time})
+
+        if not requests:
+            return
 
-            else:
-                curStream = self.request_from_server(station = curStation,
-                                                     channel = curChannel,
-                                                     network = curNetwork,
-                                                     location = curLocation,
-                                                     start_time = startTime,
-                                                     end_time = endTime)
-                stream += curStream
+        # Send the requests concurrently using the connection pool.
+        n_threads = min(self.n_connections, len(requests))
+        if n_threads <= 1:
+            results = [self.request_from_server(**x) for x in requests]
+        else:
+            pool = multiprocessing.pool.ThreadPool(n_threads)
+            try:
+                results = pool.map(lambda x: self.request_from_server(**x), requests)
+            finally:
+                pool.close()
+                pool.join()
 
-            stream.merge()
+        stream = Stream()
+        for cur_stream in results:
+            stream += cur_stream
 
+        # Add all data to the stock at once.
         self.add_to_stock(stream)
 
-        return stream
-
 
 
     def request_from_server(self, station, network, channel, location, start_time, end_time):
+        ''' Request the data of a SCNL from the waveserver.
+
+        The request uses a connection of the connection pool and has to be
+        completed within the request timeout.
 
+        Returns
+        -------
+        stream : :class:`obspy.core.Stream`
+            The received data. The TRACEBUF2 packets are merged to
+            contiguous traces.
+        '''
         stream = Stream()
 
         try:
-            self.logger.debug('Before getWaveform....')
-            stream = self.client.getWaveform(network,
-                                             station,
-                                             location,
-                                             channel,
-                                             start_time,
-                                             end_time)
-            for cur_trace in stream:
-                cur_trace.stats.unit = 'counts'
+            pool = self.get_connection_pool()
+            traces = pool.request(station = station,
+                                  channel = channel,
+                                  network = network,
+                                  location = location,
+                                  start_time = start_time,
+                                  end_time = end_time)
+            if traces:
+                stream = Stream(traces = traces)
+                stream.merge(method = 1)
+                stream = stream.split()
             self.logger.debug('got waveform: %s', stream)
-            self.logger.debug('leave try')
         except Exception as e:
             self.logger.exception("Error connecting to waveserver: %s", e)
 
         return stream
-
-
-
-    def preload(self, start_time, end_time, scnl):
-        ''' Preload the data for the given timespan and the scnl.
-
-        Preloading is done as a thread.
-        '''
-        t = PreloadThread(name = 'daemon',
-                          start_time = start_time,
-                          end_time = end_time,
-                          scnl = scnl,
-                          target = self.getWaveform
-                         )
-        t.setDaemon(True)
-        t.start()
-        self.preload_threads.append(t)
-        return t
-
-
-
-
-
-
-
@@ -19,7 +19,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 name = "events"                                 # The package name.
-version = "0.0.1"                               # The package version.
+version = "0.0.4"                               # The package version.
 author = "Stefan Mertl"                         # The package author.
 minPsysmonVersion = "0.0.1"                     # The minimum pSysmon version required.
 description = "The events core package"            # The package description.
@@ -36,6 +36,20 @@ plugin_modules = ['plugins_event_selector', 'plugins_event_create',
 # Specify the module(s) where to search for processing node classes.
 processing_node_modules = ['pn_amplitude_features', ]
 
+'''
+Database change history.
+version 0.0.2 - 2026-10-18
+Added the run_id column to the detection table.
+Added the job_checkpoint table.
+
+version 0.0.3 - 2026-10-18
+Added the indexes of the event and detection time spans.
+
+version 0.0.4 - 2026-10-18
+Added the last_id column to the job_checkpoint table.
+
+'''
+
 def databaseFactory(base):
     from sqlalchemy import Column
     from sqlalchemy import Integer
@@ -44,6 +58,7 @@ def databaseFactory(base):
     from sqlalchemy import Float
     from sqlalchemy import ForeignKey
     from sqlalchemy import UniqueConstraint
+    from sqlalchemy import Index
     from sqlalchemy.orm import relationship
 
     tables = []
@@ -88,6 +103,7 @@ def databaseFactory(base):
     class EventDb(base):
         __tablename__  = 'event'
         __table_args__ = (
+                          Index('ix_ev_catalog_start', 'ev_catalog_id', 'start_time'),
                           {'mysql_engine': 'InnoDB'}
                          )
 
@@ -201,7 +217,11 @@ def databaseFactory(base):
     # DETECTION table mapper class
     class DetectionDb(base):
         __tablename__  = 'detection'
-        __table_args__ = {'mysql_engine': 'InnoDB'}
+        __table_args__ = (
+                          Index('ix_det_catalog_start', 'catalog_id', 'start_time'),
+                          Index('ix_det_catalog_stream_start', 'catalog_id', 'rec_stream_id', 'start_time'),
+                          {'mysql_engine': 'InnoDB'}
+                         )
 
         id = Column(Integer, primary_key = True, autoincrement = True)
         catalog_id = Column(Integer,
@@ -217,18 +237,21 @@ def databaseFactory(base):
         start_time = Column(Float(53), nullable = False)
         end_time = Column(Float(53), nullable = False)
         method = Column(String(255), nullable = True)
+        run_id = Column(String(255), nullable = True)
         agency_uri = Column(String(255), nullable = True)
         author_uri = Column(String(255), nullable = True)
         creation_time = Column(String(30), nullable = True)
 
         def __init__(self, catalog_id, rec_stream_id,
                      start_time, end_time, method,
-                     agency_uri, author_uri, creation_time):
-            self.catalog_id = catalog_id,
-            self.rec_stream_id = rec_stream_id,
-            self.start_time = start_time,
-            self.end_time = end_time,
-            self.method = method,
+                     agency_uri, author_uri, creation_time,
+                     run_id = None):
+            self.catalog_id = catalog_id
+            self.rec_stream_id = rec_stream_id
+            self.start_time = start_time
+            self.end_time = end_time
+            self.method = method
+            self.run_id = run_id
             self.agency_uri = agency_uri
             self.author_uri = author_uri
             self.creation_time = creation_time
@@ -236,5 +259,47 @@ def databaseFactory(base):
     tables.append(DetectionDb)
 
 
+    ###########################################################################
+    # JOB_CHECKPOINT table mapper class
+    class JobCheckpointDb(base):
+        __tablename__  = 'job_checkpoint'
+        __table_args__ = (
+                          UniqueConstraint('run_id', 'job', 'station', 'channel', 'network', 'location'),
+                          {'mysql_engine': 'InnoDB'}
+                         )
+
+        id = Column(Integer, primary_key = True, autoincrement = True)
+        run_id = Column(String(255), nullable = False)
+        job = Column(String(255), nullable = False)
+        station = Column(String(20), nullable = False)
+        channel = Column(String(20), nullable = False)
+        network = Column(String(20), nullable = False)
+        location = Column(String(20), nullable = False)
+        resume_time = Column(Float(53), nullable = False)
+        written_time = Column(Float(53), nullable = False)
+        last_id = Column(Integer, nullable = True)
+        agency_uri = Column(String(255), nullable = True)
+        author_uri = Column(String(255), nullable = True)
+        creation_time = Column(String(30), nullable = True)
+
+        def __init__(self, run_id, job, station, channel, network, location,
+                     resume_time, written_time, agency_uri, author_uri,
+                     creation_time, last_id = None):
+            self.run_id = run_id
+            self.job = job
+            self.station = station
+            self.channel = channel
+            self.network = network
+            self.location = location
+            self.resume_time = resume_time
+            self.written_time = written_time
+            self.last_id = last_id
+            self.agency_uri = agency_uri
+            self.author_uri = author_uri
+            self.creation_time = creation_time
+
+    tables.append(JobCheckpointDb)
+
+
     return tables
 
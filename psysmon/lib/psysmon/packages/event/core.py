@@ -20,7 +20,18 @@
 
 import logging
 import psysmon
+import psysmon.core.database_util as db_util
+import sqlalchemy as sqa
+import warnings
 import obspy.core.utcdatetime as utcdatetime
+from psysmon.core.indexing import TimeIndex
+
+# The data type of the event arrays returned by Catalog.load_event_array.
+event_array_dtype = [('id', 'i8'),
+                     ('start_time', 'f8'),
+                     ('end_time', 'f8'),
+                     ('ev_type_id', 'i8')]
+
 
 class Event(object):
 
@@ -151,6 +162,8 @@ class Event(object):
             db_session.commit()
             self.db_id = db_event.id
             db_session.close()
+            if self.parent is not None:
+                self.parent.reindex_events([self, ])
 
         else:
             # If the db_id is not None, update the existing event.
@@ -182,6 +195,36 @@ class Event(object):
             else:
                 raise RuntimeError("The event with ID=%d was not found in the database.", self.db_id)
 
+    def get_db_values(self):
+        ''' Get the values of the event database table row.
+
+        Returns
+        -------
+        values : dict
+            The column values of the event. The key 'id' holds the db_id.
+        '''
+        if self.creation_time is not None:
+            creation_time = self.creation_time.isoformat()
+        else:
+            creation_time = None
+
+        if self.parent is not None:
+            catalog_id = self.parent.db_id
+        else:
+            catalog_id = None
+
+        return {'id': self.db_id,
+                'ev_catalog_id': catalog_id,
+                'start_time': self.start_time.timestamp,
+                'end_time': self.end_time.timestamp,
+                'public_id': self.public_id,
+                'ev_type_certainty': self.event_type_certainty,
+                'description': self.description,
+                'agency_uri': self.agency_uri,
+                'author_uri': self.author_uri,
+                'creation_time': creation_time}
+
+
     @classmethod
     def from_db_event(cls, db_event):
         ''' Convert a database orm mapper event to a event.
@@ -241,11 +284,18 @@ class Catalog(object):
         else:
             self.creation_time = utcdatetime.UTCDateTime(creation_time);
 
+        # The index of the events used to search the events.
+        self.event_index = TimeIndex(start_key = lambda x: x.start_time.timestamp,
+                                     end_key = lambda x: x.end_time.timestamp,
+                                     keys = {'db_id': lambda x: x.db_id,
+                                             'public_id': lambda x: x.public_id})
+
         # The events of the catalog.
         if events is None:
             self.events = []
         else:
             self.events = events
+            self.event_index.add(events)
 
 
     def add_events(self, events):
@@ -259,14 +309,78 @@ class Catalog(object):
         for cur_event in events:
             cur_event.parent = self
         self.events.extend(events)
+        self.event_index.add(events)
 
 
-    #TODO: Add a get_event method.
+    def reindex_events(self, events):
+        ''' Update the index after changing the events.
 
+        Call this method after changing the start time, end time, db_id or
+        public_id of events contained in the catalog.
 
-    def write_to_database(self, project, only_changed_events = True):
+        Parameters
+        ----------
+        events : list of :class:`Event`
+            The changed events.
+        '''
+        self.event_index.update(events)
+
+
+    def get_event(self, start_time = None, end_time = None, **kwargs):
+        ''' Get events from the catalog.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the time span to search.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the time span to search.
+
+        db_id : Integer
+            The database id of the event.
+
+        public_id : String
+            The public id of the event.
+
+        Returns
+        -------
+        events : list of :class:`Event`
+            The events overlapping the time span sorted by the start time.
+        '''
+        valid_keys = ['db_id', 'public_id']
+
+        search_keys = {}
+        for cur_key, cur_value in kwargs.iteritems():
+            if cur_key in valid_keys:
+                search_keys[cur_key] = cur_value
+            else:
+                warnings.warn('Search attribute %s is not existing.' % cur_key, RuntimeWarning)
+
+        if start_time is not None:
+            start_time = start_time.timestamp
+        if end_time is not None:
+            end_time = end_time.timestamp
+
+        return self.event_index.query(start_time = start_time,
+                                      end_time = end_time,
+                                      overlap = True,
+                                      **search_keys)
+
+
+    def write_to_database(self, project, only_changed_events = True, chunk_size = None):
         ''' Write the catalog to the database.
 
+        The changed events are written in bulk.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
+
+        chunk_size : Integer
+            The number of events written in one transaction. If None, all
+            events are written in one transaction.
         '''
         if self.db_id is None:
             # If the db_id is None, insert a new catalog.
@@ -312,15 +426,62 @@ class Catalog(object):
 
 
         # Write or update all events of the catalog to the database.
-        for cur_event in [x for x in self.events if x.changed is True]:
-            cur_event.write_to_database(project)
+        self.write_events_to_database(project,
+                                      events = [x for x in self.events if x.changed is True],
+                                      chunk_size = chunk_size)
+
+
+    def write_events_to_database(self, project, events, chunk_size = None):
+        ''' Write events of the catalog to the database in bulk.
+
+        New events are inserted, the existing ones are updated. The database
+        ids of the inserted events are set.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
+
+        events : list of :class:`Event`
+            The events to write.
+
+        chunk_size : Integer
+            The number of events written in one transaction. If None, all
+            events are written in one transaction.
+
+        Returns
+        -------
+        ids : List of Integer
+            The database ids of the events.
+        '''
+        rows = [x.get_db_values() for x in events]
+        try:
+            ids = db_util.bulk_write(project.dbEngine,
+                                     table = project.dbTables['event'],
+                                     rows = rows,
+                                     chunk_size = chunk_size,
+                                     return_ids = True)
+        finally:
+            # Set the ids of the events inserted before a possible error.
+            inserted = []
+            for cur_event, cur_row in zip(events, rows):
+                if cur_event.db_id is None and cur_row['id'] is not None:
+                    cur_event.db_id = cur_row['id']
+                    inserted.append(cur_event)
+            self.reindex_events(inserted)
+
+        for cur_event in events:
+            cur_event.changed = False
+
+        return ids
 
 
     def load_events(self, project, start_time = None, end_time = None, event_id = None,
-            min_event_length = None):
+            min_event_length = None, page_size = 1000):
         ''' Load events from the database.
 
-        The query can be limited using the allowed keyword arguments.
+        The query can be limited using the allowed keyword arguments. The
+        events are loaded in pages using :meth:`iter_events`.
 
         Parameters
         ----------
@@ -329,6 +490,48 @@ class Catalog(object):
 
         end_time : :class:`obspy.core.utcdatetime.UTCDateTime`
             The end of the time-span to load.
+
+        event_id : List of Integer
+            The database ids of the events to load.
+
+        min_event_length : float
+            The minimum length of the events in seconds.
+
+        page_size : Integer
+            The number of events loaded with one database query.
+        '''
+        for cur_events in self.iter_events(project,
+                                           start_time = start_time,
+                                           end_time = end_time,
+                                           event_id = event_id,
+                                           min_event_length = min_event_length,
+                                           page_size = page_size,
+                                           pages = True):
+            self.add_events(cur_events)
+
+
+    def iter_events(self, project, start_time = None, end_time = None, event_id = None,
+                    min_event_length = None, page_size = 1000, pages = False):
+        ''' Iterate over the events of the catalog in the database.
+
+        The events are loaded page by page ordered by their database id.
+        Only one page of events is held in memory. The events are not added
+        to the catalog. The arguments limiting the query are the same as in
+        :meth:`load_events`.
+
+        Parameters
+        ----------
+        page_size : Integer
+            The number of events loaded with one database query.
+
+        pages : Boolean
+            If True, yield the lists of the events of each page instead of
+            the single events.
+
+        Returns
+        -------
+        events : generator
+            The generator yielding the :class:`Event` instances.
         '''
         if project is None:
             raise RuntimeError("The project is None. Can't query the database without a project.")
@@ -338,36 +541,97 @@ class Catalog(object):
             events_table = project.dbTables['event']
             query = db_session.query(events_table).\
                     filter(events_table.ev_catalog_id == self.db_id)
+            query = query.filter(*self.get_events_filter(events_table,
+                                                         start_time = start_time,
+                                                         end_time = end_time,
+                                                         event_id = event_id,
+                                                         min_event_length = min_event_length))
+
+            for cur_page in db_util.iter_query_pages(query,
+                                                     id_column = events_table.id,
+                                                     page_size = page_size):
+                cur_events = []
+                for cur_orm in cur_page:
+                    try:
+                        cur_events.append(Event.from_db_event(cur_orm))
+                    except:
+                        self.logger.exception("Error when creating an event object from database values for event %d. Skipping this event.", cur_orm.id)
+                # Release the ORM instances of the page.
+                db_session.expunge_all()
+
+                if pages:
+                    yield cur_events
+                else:
+                    for cur_event in cur_events:
+                        yield cur_event
+        finally:
+            db_session.close()
 
-            if start_time:
-                query = query.filter(events_table.start_time >= start_time.timestamp)
 
-            if end_time:
-                query = query.filter(events_table.start_time <= end_time.timestamp)
+    def load_event_array(self, project, start_time = None, end_time = None, event_id = None,
+                         min_event_length = None, page_size = 10000):
+        ''' Load the time limits of the events as a numpy structured array.
 
-            if event_id:
-                query = query.filter(events_table.id in event_id)
+        Only the columns needed for bulk computations are selected, no
+        event objects are created. The events are not added to the catalog.
+        The arguments limiting the query are the same as in
+        :meth:`load_events`.
 
-            if min_event_length:
-                query = query.filter(events_table.end_time - events_table.start_time >= min_event_length)
+        Returns
+        -------
+        events : :class:`numpy.ndarray`
+            The structured array with the fields id, start_time, end_time
+            and ev_type_id ordered by the id. A missing ev_type_id is set to
+            -1.
+        '''
+        if project is None:
+            raise RuntimeError("The project is None. Can't query the database without a project.")
 
-            events_to_add = []
-            for cur_orm in query:
-                try:
-                    cur_event = Event.from_db_event(cur_orm)
-                    events_to_add.append(cur_event)
-                except:
-                    self.logger.exception("Error when creating an event object from database values for event %d. Skipping this event.", cur_orm.id)
-            self.add_events(events_to_add)
+        events_table = project.dbTables['event']
+        columns = [events_table.id,
+                   events_table.start_time,
+                   events_table.end_time,
+                   sqa.func.coalesce(events_table.ev_type_id, -1).label('ev_type_id')]
+        query = sqa.select(columns).where(events_table.ev_catalog_id == self.db_id)
+        for cur_filter in self.get_events_filter(events_table,
+                                                 start_time = start_time,
+                                                 end_time = end_time,
+                                                 event_id = event_id,
+                                                 min_event_length = min_event_length):
+            query = query.where(cur_filter)
+
+        return db_util.query_to_array(project.dbEngine,
+                                      query = query,
+                                      dtype = event_array_dtype,
+                                      id_column = events_table.id,
+                                      page_size = page_size)
+
+
+    def get_events_filter(self, events_table, start_time = None, end_time = None,
+                          event_id = None, min_event_length = None):
+        ''' Get the filter expressions of an events query.
+        '''
+        filters = []
+        if start_time:
+            filters.append(events_table.start_time >= start_time.timestamp)
 
-        finally:
-            db_session.close()
+        if end_time:
+            filters.append(events_table.start_time <= end_time.timestamp)
+
+        if event_id:
+            filters.append(events_table.id.in_(event_id))
+
+        if min_event_length:
+            filters.append(events_table.end_time - events_table.start_time >= min_event_length)
+
+        return filters
 
 
     def clear_events(self):
         ''' Clear the events list.
         '''
         self.events = []
+        self.event_index.clear()
 
 
     @classmethod
@@ -30,14 +30,26 @@
 '''
 import logging
 import copy
+import ctypes
+import functools
+import multiprocessing
+import Queue
 import numpy as np
 import matplotlib.pyplot as plt
 
 import psysmon
 from psysmon.core.packageNodes import CollectionNode
 import psysmon.core.preferences_manager as psy_pm
+from obspy.core import Stream
+from obspy.core import Trace
 from obspy.core.utcdatetime import UTCDateTime
 import psysmon.core.lib_signal as lib_signal
+from psysmon.packages.event.detection_writer import DetectionWriter
+from psysmon.packages.event.detection_store import DetectionStore
+from psysmon.packages.event.detection_store import coincidence_trigger
+from psysmon.packages.event.job_checkpoint import create_run_id
+from psysmon.packages.event.job_checkpoint import load_checkpoints
+from psysmon.packages.event.job_checkpoint import normalize_scnl
 
 from psysmon.core.gui_preference_dialog import ListbookPrefDialog
 from psysmon.packages.tracedisplay.plugins_processingstack import PStackEditField
@@ -62,6 +74,7 @@ class StaLtaDetectionNode(CollectionNode):
         self.pref_manager.add_page('General')
         self.pref_manager.add_page('STA/LTA')
         self.pref_manager.add_page('Processing')
+        self.pref_manager.add_page('Association')
 
         # The start_time.
         item = psy_pm.DateTimeEditPrefItem(name = 'start_time',
@@ -111,6 +124,15 @@ class StaLtaDetectionNode(CollectionNode):
         self.pref_manager.add_item(pagename = 'STA/LTA',
                                    item = item)
 
+        item = psy_pm.SingleChoicePrefItem(name = 'sta_lta_type',
+                                           label = 'STA/LTA type',
+                                           group = 'detection',
+                                           limit = ('classic', 'recursive'),
+                                           value = 'classic',
+                                           tool_tip = 'The type of the STA/LTA. The classic STA/LTA uses moving averages, the recursive STA/LTA exponentially weighted averages.')
+        self.pref_manager.add_item(pagename = 'STA/LTA',
+                                   item = item)
+
         item = psy_pm.FloatSpinPrefItem(name = 'sta_len',
                                         label = 'STA length [s]',
                                         group = 'detection',
@@ -161,6 +183,23 @@ class StaLtaDetectionNode(CollectionNode):
         self.pref_manager.add_item(pagename = 'STA/LTA',
                                    item = item)
 
+        item = psy_pm.IntegerSpinPrefItem(name = 'n_workers',
+                                          label = 'worker processes',
+                                          group = 'parallel processing',
+                                          value = 1,
+                                          limit = (1, 64),
+                                          tool_tip = 'The number of processes used to process the SCNLs in parallel.')
+        self.pref_manager.add_item(pagename = 'Processing',
+                                   item = item)
+
+        item = psy_pm.TextEditPrefItem(name = 'run_id',
+                                       label = 'resume run id',
+                                       group = 'checkpoint',
+                                       value = '',
+                                       tool_tip = 'The id of an interrupted detection run to resume. Leave empty to start a new run.')
+        self.pref_manager.add_item(pagename = 'Processing',
+                                   item = item)
+
         item = psy_pm.CustomPrefItem(name = 'processing_stack',
                                      label = 'processing stack',
                                      group = 'signal processing',
@@ -170,6 +209,26 @@ class StaLtaDetectionNode(CollectionNode):
         self.pref_manager.add_item(pagename = 'Processing',
                                    item = item)
 
+        # The network coincidence association.
+        item = psy_pm.IntegerSpinPrefItem(name = 'min_stations',
+                                          label = 'min. stations',
+                                          group = 'network coincidence',
+                                          value = 0,
+                                          limit = (0, 1000),
+                                          tool_tip = 'The minimum number of stations with coincident detections to create an event. Set to 0 to disable the association.')
+        self.pref_manager.add_item(pagename = 'Association',
+                                   item = item)
+
+        item = psy_pm.FloatSpinPrefItem(name = 'coincidence_window',
+                                        label = 'coincidence window [s]',
+                                        group = 'network coincidence',
+                                        value = 0,
+                                        limit = (0, 1000),
+                                        digits = 1,
+                                        tool_tip = 'The time added to the end of the detections to allow for the travel time differences between the stations [s].')
+        self.pref_manager.add_item(pagename = 'Association',
+                                   item = item)
+
 
     def edit(self):
         if self.project.geometry_inventory:
@@ -197,25 +256,99 @@ class StaLtaDetectionNode(CollectionNode):
                                            project = self.project,
                                            nodes = self.pref_manager.get_value('processing_stack'))
         detector = StaLtaDetector(cf_type = self.pref_manager.get_value('cf_type'),
+                                  sta_lta_type = self.pref_manager.get_value('sta_lta_type'),
                                   sta_len = self.pref_manager.get_value('sta_len'),
                                   lta_len = self.pref_manager.get_value('lta_len'),
                                   thr = self.pref_manager.get_value('thr'),
                                   project = self.project,
                                   processing_stack = processing_stack)
 
+        # Keep the run id in the preferences until the detection has
+        # finished, so that an interrupted run can be resumed.
+        run_id = self.pref_manager.get_value('run_id').strip()
+        if not run_id:
+            run_id = create_run_id()
+            self.pref_manager.set_value('run_id', run_id)
+
         detector.detect(start_time = self.pref_manager.get_value('start_time'),
                         end_time = self.pref_manager.get_value('end_time'),
                         stations = self.pref_manager.get_value('stations'),
-                        channels = self.pref_manager.get_value('channels'))
+                        channels = self.pref_manager.get_value('channels'),
+                        n_workers = self.pref_manager.get_value('n_workers'),
+                        run_id = run_id)
+
+        if self.pref_manager.get_value('min_stations') > 0:
+            detector.associate(start_time = self.pref_manager.get_value('start_time'),
+                               end_time = self.pref_manager.get_value('end_time'),
+                               stations = self.pref_manager.get_value('stations'),
+                               channels = self.pref_manager.get_value('channels'),
+                               run_id = run_id,
+                               min_stations = self.pref_manager.get_value('min_stations'),
+                               window = self.pref_manager.get_value('coincidence_window'))
+
+        self.pref_manager.set_value('run_id', '')
 
 
  
 
+# The detector used by the worker processes of the parallel detection.
+worker_detector = None
+
+# The queue used by the worker processes to send the results.
+worker_queue = None
+
+
+def init_detection_worker(detector, result_queue):
+    ''' Initialize a worker process of the parallel detection.
+
+    The detector and the result queue are inherited from the parent
+    process when forking the worker process.
+    '''
+    global worker_detector
+    global worker_queue
+    detector.project.init_worker_process()
+    worker_detector = detector
+    worker_queue = result_queue
+
+
+def detect_scnl_job(job):
+    ''' Run the detection of a SCNL in a worker process.
+
+    The results of each interval are put into the result queue as tuples
+    (scnl, detections, checkpoint) as soon as the interval has been
+    processed. The end of the job is signaled with the tuple
+    (scnl, None, None).
+
+    Parameters
+    ----------
+    job : Tuple (scnl, start_time, end_time, interval)
+        The parameters of the detection.
+
+    Returns
+    -------
+    scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+        The processed SCNL.
+    '''
+    scnl, start_time, end_time, interval = job
+    worker_detector.detect_scnl(start_time = start_time,
+                                end_time = end_time,
+                                scnl = [scnl, ],
+                                interval = interval,
+                                callback = lambda x, y, checkpoint = None: worker_queue.put((y, x, checkpoint)))
+    worker_queue.put((scnl, None, None))
+    return scnl
+
+
+
 class StaLtaDetector(object):
 
+    # The job name used for the checkpoints.
+    job_name = 'sta_lta_detection'
+
     def __init__(self, cf_type = 'square', sta_len = 2,
                  lta_len = 10, thr = 3, project = None,
-                 processing_stack = None):
+                 processing_stack = None, sta_lta_type = 'classic',
+                 flush_size = 1000, flush_interval = 60.):
 
         # The logging logger instance.
         logger_prefix = psysmon.logConfig['package_prefix']
@@ -225,6 +358,9 @@ class StaLtaDetector(object):
         # The type of the characteristic function.
         self.cf_type = cf_type
 
+        # The type of the STA/LTA (classic, recursive).
+        self.sta_lta_type = sta_lta_type
+
 
         # The length of the STA in seconds.
         self.sta_len = sta_len
@@ -243,8 +379,17 @@ class StaLtaDetector(object):
         # detection.
         self.processing_stack = processing_stack
 
+        # The number of buffered detections triggering a write to the
+        # database.
+        self.flush_size = flush_size
 
-    def detect(self, start_time, end_time, stations, channels, interval = 3600.):
+        # The time in seconds after which the buffered detections are
+        # written to the database.
+        self.flush_interval = flush_interval
+
+
+    def detect(self, start_time, end_time, stations, channels, interval = 3600.,
+               n_workers = 1, run_id = None):
         ''' Start the detection.
 
         Parameters
@@ -264,15 +409,29 @@ class StaLtaDetector(object):
         interval : float
             The interval into which the time span is split to run successive detections.
 
+        n_workers : Integer
+            The number of worker processes. If larger than 1, the SCNLs are
+            processed in parallel using :meth:`detect_parallel`.
+
+        run_id : String
+            The id of the detection run. If the id of an interrupted run is
+            passed, the detection is resumed at the checkpoints of the run.
+            If None, a new run is started. The processing state is not
+            stored in the checkpoints. The resumed detection starts the
+            processing lta_len before the resume time, which rebuilds the
+            STA/LTA exactly. The processing stack however starts from rest
+            (e.g. the causal filters) or with shifted chunk limits (nodes
+            which are not stateful), so the detections following the
+            resume time can differ slightly from an uninterrupted run until
+            the transients of the processing have decayed.
+
+        Returns
+        -------
+        run_id : String
+            The id of the detection run.
         '''
         interval = float(interval)
 
-        n_intervals = (end_time - start_time) / interval
-        interval_list = [start_time + x*interval for x in range(0, int(n_intervals))]
-
-        if not interval_list:
-            interval_list.append(start_time)
-
         scnl = []
         for cur_station_name in stations:
             for cur_channel_name in channels:
@@ -283,111 +442,459 @@ class StaLtaDetector(object):
                 if cur_channel:
                     scnl.append(cur_channel[0].scnl)
 
+        if run_id is None:
+            run_id = create_run_id()
+            self.logger.info("Starting the detection run %s.", run_id)
+        else:
+            self.logger.info("Resuming the detection run %s.", run_id)
+
+        # Get the times from which to resume the detection of the SCNLs.
+        # The SCNLs with the same resume time are processed together.
+        checkpoints = load_checkpoints(self.project, run_id = run_id,
+                                       job = self.job_name)
+        resume_scnl = {}
+        written_time = {}
+        for cur_scnl in scnl:
+            cur_checkpoint = checkpoints.get(normalize_scnl(cur_scnl), None)
+            if cur_checkpoint is None:
+                cur_resume_time = start_time
+            else:
+                cur_resume_time, written_time[cur_scnl] = cur_checkpoint
+
+            if cur_resume_time >= end_time:
+                self.logger.info("The detection of SCNL %s has already been completed.", cur_scnl)
+                continue
+            resume_scnl.setdefault(cur_resume_time, []).append(cur_scnl)
+
+        # The detections of all intervals and channels are buffered and
+        # written in bulk. The remaining detections are written when the
+        # detection has finished or failed.
+        with DetectionWriter(project = self.project,
+                             flush_size = self.flush_size,
+                             flush_interval = self.flush_interval) as writer:
+            callback = functools.partial(self.write_detections,
+                                         writer = writer,
+                                         run_id = run_id,
+                                         written_time = written_time)
+            for cur_resume_time in sorted(resume_scnl.keys()):
+                cur_scnl = resume_scnl[cur_resume_time]
+                if n_workers > 1 and len(cur_scnl) > 1:
+                    self.detect_parallel(start_time = cur_resume_time,
+                                         end_time = end_time,
+                                         scnl = cur_scnl,
+                                         interval = interval,
+                                         n_workers = n_workers,
+                                         callback = callback)
+                else:
+                    self.detect_scnl(start_time = cur_resume_time,
+                                     end_time = end_time,
+                                     scnl = cur_scnl,
+                                     interval = interval,
+                                     callback = callback)
+
+        return run_id
+
+
+    def detect_scnl(self, start_time, end_time, scnl, interval, callback):
+        ''' Run the detection on a list of SCNLs.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the timespan for which to detect the events.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the timespan for which to detect the events.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs to process.
+
+        interval : float
+            The interval into which the time span is split to run successive detections.
+
+        callback : Callable
+            The function handling the detections. It is called for each
+            interval and SCNL with the list of detections and the SCNL as
+            arguments and the checkpoint keyword argument. The checkpoint
+            is a tuple (resume_time, written_time) from which the detection
+            of the SCNL can be resumed after the interval.
+        '''
+        # Request the data in consecutive chunks starting with a window of
+        # length lta_len to build up the lta. The detection state of each
+        # SCNL is carried over to the next chunk, so that each sample is
+        # processed only once. The chunks include their end time, so the
+        # samples already processed are removed from the next chunk. The
+        # data of the next chunk is prefetched while the current chunk is
+        # processed.
+        # The stock data is not copied. The processing stack copies
+        # the data if a node modifies it. If all nodes of the processing
+        # stack are stateful (e.g. the causal filters), the processing
+        # state is carried over to the next chunk as well. Otherwise (e.g.
+        # the detrend or zero phase filters), each chunk is processed
+        # separately with a preceding window of length lta_len to reduce
+        # the effects at the start of the chunk, and the preceding window
+        # is removed after the processing.
+        stack_stateful = self.processing_stack.is_stateful()
+        if stack_stateful:
+            pre_roll = 0.
+        else:
+            pre_roll = self.lta_len
+        chunks = self.project.iter_data_stream(start_time = start_time - self.lta_len,
+                                               end_time = end_time,
+                                               scnl = scnl,
+                                               chunk_length = interval,
+                                               overlap = pre_roll,
+                                               read_only = True)
 
-        data_sources = self.get_data_sources(scnl)
+        states = dict([(x, StaLtaState()) for x in scnl])
 
-        for cur_start_time in interval_list:
-            cur_end_time = cur_start_time + interval
+        for cur_start_time, cur_end_time, chunk_stream in chunks:
             self.logger.info("Processing timespan %s to %s.", cur_start_time.isoformat(),
                               cur_end_time.isoformat())
 
             for cur_scnl in scnl:
-                try:
-                    cur_channel = self.project.geometry_inventory.get_channel(station = cur_scnl[0], name = cur_scnl[1], network = cur_scnl[2])[0]
-                    cur_timebox = cur_channel.get_stream(start_time = cur_start_time, end_time = cur_end_time)[0]
-                    cur_stream_id = cur_timebox.item.id
-                except:
-                    cur_stream_id = None
-
-                cur_waveclient = self.project.waveclient[data_sources[cur_scnl]]
-                # Request data with a preceding window of length lta_len to
-                # eliminate the lta buildup effects at the start of the time
-                # window.
-                cur_stream = cur_waveclient.getWaveform(startTime = cur_start_time - self.lta_len,
-                                                        endTime = cur_end_time,
-                                                        scnl = [cur_scnl, ])
-                cur_stream = cur_stream.copy()
-
+                cur_state = states[cur_scnl]
+                cur_stream = chunk_stream.select(station = cur_scnl[0],
+                                                 channel = cur_scnl[1],
+                                                 network = cur_scnl[2],
+                                                 location = cur_scnl[3])
+                if stack_stateful:
+                    cur_stream = cur_state.remove_processed(cur_stream)
+
+                detections = []
                 if cur_stream:
                     self.logger.info("Processing stream %s.", cur_stream)
                     try:
                         cur_stream = cur_stream.split()
-                        self.processing_stack.execute(cur_stream)
+                        if stack_stateful:
+                            self.processing_stack.execute(cur_stream,
+                                                          state = cur_state.processing_state)
+                        else:
+                            self.processing_stack.execute(cur_stream)
+                            cur_stream = cur_state.remove_processed(cur_stream)
                         #cur_stream.detrend(type = 'constant')
                         #cur_stream.filter('bandpass', freqmin = 1.0, freqmax = 100.0)
                     except Exception as e:
                         self.logger.error('Error when processing the stream %s:\n%s', str(cur_stream), e)
                         continue
 
-                    db_data = []
+                    cur_stream.sort(keys = ['starttime'])
                     for cur_trace in cur_stream.traces:
-                        cf = self.compute_cf(cur_trace.data)
-                        cur_sps = cur_trace.stats.sampling_rate
-                        thrf, sta, lta = self.compute_thrf(cf, cur_sps)
-                        n_lta = int(self.lta_len * cur_sps)
-                        event_marker = self.compute_event_limits(cur_trace.data[n_lta:],
-                                                                 thrf, sta, lta)
-                        detection_table = self.project.dbTables['detection']
-                        event_table = self.project.dbTables['event']
-                        for det_start_ind, det_end_ind in event_marker:
-                            det_start_time = cur_trace.stats.starttime + (n_lta + det_start_ind) / cur_sps
-                            det_end_time = det_start_time + (det_end_ind - det_start_ind) / cur_sps
-                            cur_orm = detection_table(catalog_id = None,
-                                                      rec_stream_id = cur_stream_id,
-                                                      start_time = det_start_time.timestamp,
-                                                      end_time = det_end_time.timestamp,
-                                                      method = 'STA/LTA',
-                                                      agency_uri = self.project.activeUser.agency_uri,
-                                                      author_uri = self.project.activeUser.author_uri,
-                                                      creation_time = UTCDateTime().isoformat())
-                            db_data.append(cur_orm)
-
-                            # TODO: Remove this export to the events database
-                            # when the event binding is working.
-                            # Add the events detected on station AP01 and
-                            # channel HHZ to the events database.
-                            # This is used as a workaround because of a missing
-                            # event binding.
-                            if cur_scnl == ('AP01', 'HHZ', 'APO', '00'):
-                                comment_string = 'Detected on SCNL %s.' % str(cur_scnl)
-                                #comment_string = 'delete me'
-                                cur_orm = event_table(ev_catalog_id = None,
-                                                      start_time = det_start_time.timestamp,
-                                                      end_time = det_end_time.timestamp,
-                                                      comment = comment_string,
-                                                      agency_uri = self.project.activeUser.agency_uri,
-                                                      author_uri = self.project.activeUser.author_uri,
-                                                      creation_time = UTCDateTime().isoformat())
-                                db_data.append(cur_orm)
-
-                if db_data:
-                    db_session = self.project.getDbSession()
-                    db_session.add_all(db_data)
-                    db_session.commit()
-                    db_session.close()
-
-
-
-
-
-
-
-    def get_data_sources(self, scnl):
-        ''' Get the datasource for a given SCNL.
+                        detections.extend(self.process_trace(cur_trace,
+                                                             state = cur_state,
+                                                             valid_from = start_time))
+
+                # Resume one sample before the start of the first event
+                # still open, so that the event is triggered again.
+                resume_time = cur_end_time
+                if cur_state.open_events:
+                    resume_time = min([cur_end_time, ] + [x[0] - 1. / cur_state.sps for x in cur_state.open_events])
+                callback(detections, cur_scnl,
+                         checkpoint = (resume_time, cur_end_time))
+
+        # End the events still open at the end of the time span.
+        for cur_scnl in scnl:
+            callback(states[cur_scnl].close_events(), cur_scnl,
+                     checkpoint = (end_time, end_time))
+
+
+    def detect_parallel(self, start_time, end_time, scnl, interval, n_workers,
+                        callback):
+        ''' Run the detection of the SCNLs in parallel worker processes.
+
+        Each SCNL is processed completely by one worker process, so that
+        the detection state is carried over between the intervals like in
+        the serial run and the detections are identical. The worker
+        processes use their own waveclients and database connections. The
+        results of each interval are sent back through a queue and are
+        passed to the callback in the calling process while the detection
+        is running, so that they can be written and checkpointed as the
+        run goes. The size of the queue is limited, so the workers wait
+        if the results are not handled fast enough.
 
         Parameters
         ----------
-        scnl : List of Tuple (STATION, CHANNEL, NETWORK, LOCATION)
-            The SCNL for which to get the according waveclient.
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the timespan for which to detect the events.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the timespan for which to detect the events.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs to process.
+
+        interval : float
+            The interval into which the time span is split to run successive detections.
+
+        n_workers : Integer
+            The number of worker processes.
+
+        callback : Callable
+            The function handling the detections. It is called like in
+            :meth:`detect_scnl`.
         '''
-        data_sources = {}
-        for cur_scnl in scnl:
-            if cur_scnl in self.project.scnlDataSources.keys():
-                data_sources[cur_scnl] = self.project.scnlDataSources[cur_scnl]
+        jobs = [(x, start_time, end_time, interval) for x in scnl]
+        n_workers = min(n_workers, len(jobs))
+        result_queue = multiprocessing.Queue(maxsize = 10 * n_workers)
+        pool = multiprocessing.Pool(processes = n_workers,
+                                    initializer = init_detection_worker,
+                                    initargs = (self, result_queue))
+        try:
+            async_result = pool.map_async(detect_scnl_job, jobs)
+            n_finished = 0
+            failed = False
+            while n_finished < len(jobs):
+                try:
+                    cur_scnl, detections, checkpoint = result_queue.get(timeout = 1.)
+                except Queue.Empty:
+                    if failed:
+                        # Raise the error of the worker after handling
+                        # the results already sent.
+                        async_result.get()
+                    failed = async_result.ready() and not async_result.successful()
+                    continue
+
+                if detections is None:
+                    n_finished += 1
+                    self.logger.info("Finished the detection of SCNL %s.", cur_scnl)
+                else:
+                    callback(detections, cur_scnl, checkpoint = checkpoint)
+
+            async_result.get()
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
+    def get_stream_id(self, scnl, start_time, end_time):
+        ''' Get the database id of the recorder stream assigned to a SCNL.
+
+        Returns
+        -------
+        stream_id : Integer
+            The id of the recorder stream. None, if no stream is found.
+        '''
+        try:
+            cur_channel = self.project.geometry_inventory.get_channel(station = scnl[0], name = scnl[1], network = scnl[2])[0]
+            cur_timebox = cur_channel.get_stream(start_time = start_time, end_time = end_time)[0]
+            return cur_timebox.item.id
+        except:
+            return None
+
+
+    def write_detections(self, detections, scnl, checkpoint = None,
+                         writer = None, run_id = None, written_time = None):
+        ''' Write the detections to the database.
+
+        Parameters
+        ----------
+        detections : List of Tuples (start_time, end_time)
+            The start and end times of the detections.
+
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL on which the events have been detected.
+
+        checkpoint : Tuple (resume_time, written_time)
+            The checkpoint of the SCNL after the detections. It is written
+            together with the detections.
+
+        writer : :class:`~psysmon.packages.event.detection_writer.DetectionWriter`
+            The writer buffering the detections. If None, the detections
+            are written immediately.
+
+        run_id : String
+            The id of the detection run. Required to write the checkpoint.
+
+        written_time : dict
+            The times until which the detections of the SCNLs have been
+            written by a previous execution of the run. Detections ending
+            before these times are skipped.
+        '''
+        if writer is None:
+            with DetectionWriter(project = self.project) as single_writer:
+                self.write_detections(detections, scnl,
+                                      checkpoint = checkpoint,
+                                      writer = single_writer,
+                                      run_id = run_id,
+                                      written_time = written_time)
+            return
+
+        if written_time and scnl in written_time:
+            detections = [x for x in detections if x[1] >= written_time[scnl]]
+
+        with writer.batch():
+            self.add_detections(detections, scnl, writer = writer, run_id = run_id)
+            if checkpoint is not None and run_id is not None:
+                writer.set_checkpoint(run_id = run_id,
+                                      job = self.job_name,
+                                      scnl = scnl,
+                                      resume_time = checkpoint[0],
+                                      written_time = checkpoint[1])
+
+
+    def add_detections(self, detections, scnl, writer, run_id = None):
+        ''' Add the detections to the buffer of the writer.
+        '''
+        for det_start_time, det_end_time in detections:
+            cur_stream_id = self.get_stream_id(scnl,
+                                               start_time = det_start_time,
+                                               end_time = det_end_time)
+            writer.add_detection(start_time = det_start_time,
+                                 end_time = det_end_time,
+                                 method = 'STA/LTA',
+                                 rec_stream_id = cur_stream_id,
+                                 run_id = run_id)
+
+
+    def associate(self, start_time, end_time, stations, channels, run_id,
+                  min_stations = 3, window = 0., catalog_id = None):
+        ''' Associate the detections of a run to network events.
+
+        The detections of the run are loaded into a
+        :class:`~psysmon.packages.event.detection_store.DetectionStore`.
+        The events are the time spans with coincident detections on at
+        least min_stations stations. The events and the links to their
+        detections are written to the database.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the detection time span.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the detection time span.
+
+        stations : list of Strings
+            The names of the detection stations.
+
+        channels : list of Strings
+            The names of the detection channels.
+
+        run_id : String
+            The id of the detection run.
+
+        min_stations : Integer
+            The minimum number of stations with coincident detections.
+
+        window : float
+            The time in seconds added to the end of the detections to
+            allow for the travel time differences between the stations.
+
+        catalog_id : Integer
+            The database id of the event catalog.
+
+        Returns
+        -------
+        ev_ids : List of Integer
+            The database ids of the events.
+        '''
+        store = DetectionStore.load(self.project,
+                                    start_time = start_time,
+                                    end_time = end_time,
+                                    run_id = run_id)
+        self.logger.info("Associating %d detections of run %s.", len(store), run_id)
+
+        # Group the detections by station. Detections of recorder streams
+        # not assigned to a station are grouped by the stream.
+        station_index = {}
+        for cur_station_name in stations:
+            for cur_channel_name in channels:
+                for cur_channel in self.project.geometry_inventory.get_channel(station = cur_station_name,
+                                                                               name = cur_channel_name):
+                    for cur_timebox in cur_channel.get_stream(start_time = start_time,
+                                                              end_time = end_time):
+                        station_index[cur_timebox.item.id] = stations.index(cur_station_name)
+
+        rec_stream_id = store.data['rec_stream_id']
+        stream_ids, stream_index = np.unique(rec_stream_id, return_inverse = True)
+        stream_group = np.array([station_index.get(x, len(stations) + k) for k, x in enumerate(stream_ids)],
+                                dtype = np.int64)
+        group = stream_group[stream_index]
+
+        events, links = coincidence_trigger(start_time = store.data['start_time'],
+                                            end_time = store.data['end_time'],
+                                            group = group,
+                                            min_groups = min_stations,
+                                            window = window)
+        self.logger.info("Found %d coincidence events.", len(events))
+
+        return store.write_events(self.project,
+                                  events = events,
+                                  links = links,
+                                  catalog_id = catalog_id,
+                                  comment = 'STA/LTA coincidence of run %s.' % run_id)
+
+
+    def process_trace(self, trace, state, valid_from = None, stop_delay = 10):
+        ''' Run the detection on a trace continuing the previous data.
+
+        If the trace doesn't continue the data previously processed with
+        the state, the state is reset and the events still open are ended
+        at the last sample of the previous data.
+
+        Parameters
+        ----------
+        trace : :class:`obspy.core.Trace`
+            The processed data.
+
+        state : :class:`StaLtaState`
+            The detection state of the SCNL of the trace.
+
+        valid_from : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            No events are triggered before this time.
+
+        stop_delay : Integer
+            The number of samples before the event start used to get the
+            STA value ending the event.
+
+        Returns
+        -------
+        detections : List of Tuples (start_time, end_time)
+            The start and end times of the events ended in the trace.
+        '''
+        detections = []
+        sps = trace.stats.sampling_rate
+        if not state.is_continuous(trace):
+            detections.extend(state.reset())
+            state.sps = sps
+
+        thrf, sta, lta = self.compute_thrf(trace.data, sps, state = state)
+
+        # Don't trigger during the LTA buildup.
+        n_lta = int(self.lta_len * sps)
+        first_valid = max(n_lta - state.n_processed, 0)
+        if valid_from is not None:
+            first_valid = max(first_valid, int(np.ceil((valid_from - trace.stats.starttime) * sps - 1e-6)))
+
+        event_marker, open_end = self.compute_event_limits(thrf, sta,
+                                                           state = state,
+                                                           first_valid = first_valid,
+                                                           stop_delay = stop_delay)
+
+        # The events still open from the previous data.
+        open_events = []
+        for (cur_start_time, cur_stop_value), cur_end_ind in zip(state.open_events, open_end):
+            if cur_end_ind is None:
+                open_events.append((cur_start_time, cur_stop_value))
+            else:
+                detections.append((cur_start_time, trace.stats.starttime + cur_end_ind / sps))
+
+        for det_start_ind, det_end_ind, det_stop_value in event_marker:
+            det_start_time = trace.stats.starttime + det_start_ind / sps
+            if det_end_ind is None:
+                open_events.append((det_start_time, det_stop_value))
             else:
-                data_sources[cur_scnl] = self.project.defaultWaveclient
+                detections.append((det_start_time, trace.stats.starttime + det_end_ind / sps))
 
-        return data_sources
+        state.open_events = open_events
+        state.n_processed += len(thrf)
+        state.last_time = trace.stats.endtime
+        state.next_time = trace.stats.endtime + 1. / sps
+
+        return detections
 
 
     def compute_cf(self, data):
@@ -402,50 +909,82 @@ class StaLtaDetector(object):
             return data
 
 
-    def compute_thrf(self, cf, sps, mode = 'valid'):
+    def compute_thrf(self, data, sps, mode = 'valid', state = None):
         ''' Compute the THRF, STA and LTA function.
 
+        The characteristic function, the STA, the LTA and the STA/LTA
+        ratio are computed in a single pass by the classic_sta_lta or
+        recursive_sta_lta function of the signal C library depending on
+        the sta_lta_type of the detector.
+
         Parameters
         ----------
-        cf : NumpyArray
-            The characteristic function computed from the timeseries.
+        data : NumpyArray
+            The timeseries data.
 
         sps : float
-            The samples per second of the characteristic function.
+            The samples per second of the data.
 
         mode : String (valid, full)
             How to return the computed time series.
                 valid: Return only the valid values without the LTA buildup effect.
                 full: Return the full length of the computed time series.
+
+        state : :class:`StaLtaState`
+            The state of the previously processed data. If a state is
+            passed, the STA and LTA are continued from the previous data
+            and the values of all samples of data are returned. The state
+            is updated with the end of data.
         '''
         clib_signal = lib_signal.clib_signal
 
         n_sta = int(self.sta_len * sps)
         n_lta = int(self.lta_len * sps)
-
-        # The old version using np.correlate. This was way too slow. Switched
-        # to the implementation of the moving average in C. Keep this part of
-        # the code for future reference.
-        #sta_filt_op = np.ones(n_sta) / float(n_sta)
-        #lta_filt_op = np.ones(n_lta) / float(n_lta)
-        #sta_corr = np.correlate(cf, sta_filt_op, 'valid')
-        #lta_corr = np.correlate(cf, lta_filt_op, 'valid')
-        #sta_corr = np.concatenate([np.zeros(n_sta - 1), sta_corr])
-        #lta_corr = np.concatenate([np.zeros(n_lta - 1), lta_corr])
-
-        n_cf = len(cf)
-        cf = np.ascontiguousarray(cf, dtype = np.float64)
-        sta = np.empty(n_cf, dtype = np.float64)
-        ret_val = clib_signal.moving_average(n_cf, n_sta, cf, sta)
-        lta = np.empty(n_cf, dtype = np.float64)
-        ret_val = clib_signal.moving_average(n_cf, n_lta, cf, lta)
-
-
-        #sta[0:n_lta] = 0
-        #lta[0:n_lta] = 1
-        thrf = sta / lta
-
-        if mode == 'valid':
+        if n_sta < 1 or n_lta < 1:
+            raise ValueError("The STA and LTA length have to be at least one sample.")
+
+        cf_type = lib_signal.cf_types.get(self.cf_type, lib_signal.cf_types['raw'])
+
+        n_data = len(data)
+        data = np.ascontiguousarray(data, dtype = np.float64)
+        cf = np.empty(n_data, dtype = np.float64)
+        sta = np.empty(n_data, dtype = np.float64)
+        lta = np.empty(n_data, dtype = np.float64)
+        thrf = np.empty(n_data, dtype = np.float64)
+
+        if self.sta_lta_type == 'recursive':
+            if state is not None:
+                sta_value = ctypes.c_double(state.sta_value)
+                lta_value = ctypes.c_double(state.lta_value)
+            else:
+                sta_value = ctypes.c_double(0.)
+                lta_value = ctypes.c_double(0.)
+            ret_val = clib_signal.recursive_sta_lta(n_data, data, cf_type,
+                                                    n_sta, n_lta,
+                                                    ctypes.byref(sta_value),
+                                                    ctypes.byref(lta_value),
+                                                    cf, sta, lta, thrf)
+            if state is not None:
+                state.sta_value = sta_value.value
+                state.lta_value = lta_value.value
+        else:
+            # Continue the moving averages with the last LTA window of the
+            # characteristic function of the previous data.
+            if state is not None:
+                hist = np.ascontiguousarray(state.cf_tail, dtype = np.float64)
+            else:
+                hist = np.zeros(0, dtype = np.float64)
+            ret_val = clib_signal.classic_sta_lta(n_data, data, cf_type,
+                                                  n_sta, n_lta,
+                                                  len(hist), hist,
+                                                  cf, sta, lta, thrf)
+            if state is not None:
+                state.cf_tail = np.concatenate([hist, cf])[-n_lta:].copy()
+
+        if ret_val != 0:
+            raise RuntimeError("Error when computing the STA/LTA.")
+
+        if state is None and mode == 'valid':
             thrf = thrf[n_lta:]
             sta = sta[n_lta:]
             lta = lta[n_lta:]
@@ -453,40 +992,212 @@ class StaLtaDetector(object):
         return (thrf, sta, lta)
 
 
-    def compute_event_limits(self, data, thrf, sta, lta, stop_delay = 10):
+    def compute_event_limits(self, thrf, sta, state = None, first_valid = 0, stop_delay = 10):
         ''' Compute the event start and end times based on the detection functions.
 
+        The events are computed in a single pass by the event_limits
+        function of the signal C library. The events waiting for their end
+        are kept in a heap ordered by the stop value. The output buffers
+        and the heap workspace are allocated here and are grown only if
+        the data contains more events than the buffers can hold.
+
+        Parameters
+        ----------
+        thrf : NumpyArray
+            The STA/LTA ratio.
+
+        sta : NumpyArray
+            The STA.
+
+        state : :class:`StaLtaState`
+            The state of the previously processed data. It provides the
+            trigger state of the last sample, the STA values preceding
+            thrf and the events still open. The state is updated with the
+            end of thrf. The open events are not changed.
+
+        first_valid : Integer
+            The index of the first sample which can trigger an event.
+
+        stop_delay : Integer
+            The number of samples before the event start used to get the
+            STA value ending the event.
+
+        Returns
+        -------
+        event_marker : List of Tuples (start_index, end_index, stop_value)
+            The events triggered in thrf. The end_index is None if the
+            event doesn't end within thrf. The stop_value is the STA value
+            ending the event.
+
+        open_end : List of Integer
+            The end indices of the open events of the state. None, if
+            the event doesn't end within thrf.
         '''
+        clib_signal = lib_signal.clib_signal
+
+        if state is None:
+            state = StaLtaState()
+
+        thrf = np.ascontiguousarray(thrf, dtype = np.float64)
+        sta = np.ascontiguousarray(sta, dtype = np.float64)
+        sta_tail = np.ascontiguousarray(state.sta_tail, dtype = np.float64)
+        open_stop = np.array([x[1] for x in state.open_events], dtype = np.float64)
+        open_end = np.empty(len(open_stop), dtype = np.int_)
+        n_events = ctypes.c_long()
+        last_on = ctypes.c_int()
+
+        # The number of events is usually small. If the buffers are too
+        # small, the function returns the number of events and is called
+        # again with buffers of the needed size.
+        max_events = 256
+        while True:
+            event_start = np.empty(max_events, dtype = np.int_)
+            event_end = np.empty(max_events, dtype = np.int_)
+            event_stop = np.empty(max_events, dtype = np.float64)
+            heap = np.empty(max_events + len(open_stop), dtype = np.int_)
+            ret_val = clib_signal.event_limits(len(thrf), thrf, sta, self.thr,
+                                               first_valid, int(state.event_on),
+                                               len(sta_tail), sta_tail, stop_delay,
+                                               len(open_stop), open_stop, open_end,
+                                               max_events, event_start, event_end,
+                                               event_stop, heap, ctypes.byref(n_events),
+                                               ctypes.byref(last_on))
+            if ret_val == 0:
+                break
+            max_events = n_events.value
+
         event_marker = []
+        for k in range(n_events.value):
+            cur_event_end = event_end[k] if event_end[k] >= 0 else None
+            event_marker.append((event_start[k], cur_event_end, event_stop[k]))
+
+        open_end = [x if x >= 0 else None for x in open_end]
+
+        state.event_on = bool(last_on.value)
+        sta_ext = np.concatenate([sta_tail, sta[max(len(sta) - stop_delay, 0):]])
+        state.sta_tail = sta_ext[max(len(sta_ext) - stop_delay, 0):].copy()
 
-        # Find the event begins indicated by exceeding the threshold value.
-        event_on = np.zeros(thrf.shape)
-        event_on[thrf >= self.thr] = 1
-        event_start = np.zeros(thrf.shape)
-        event_start[1:] = np.diff(event_on)
+        return (event_marker, open_end)
 
-        # Find the event ends.
-        event_start_ind = np.flatnonzero(event_start == 1)
-        stop_values = sta[np.flatnonzero(event_start == 1) - stop_delay]
 
-        for k, cur_event_start in enumerate(event_start_ind):
-            try:
-                next_end_ind = np.flatnonzero(sta[cur_event_start:] < stop_values[k])[0]
-                cur_event_end = cur_event_start + next_end_ind
-            except:
-                cur_event_end = len(thrf)-1
-            event_marker.append((cur_event_start, cur_event_end))
 
-#        plt.plot(sta, 'r')
-#        plt.plot(self.thr * lta, 'g')
-#        plt.plot(data, 'k')
-#        for event_begin, event_end in event_marker:
-#            plt.axvline(event_begin, color = 'm')
-#            plt.axvline(event_end, color = 'b')
-#        plt.show()
+class StaLtaState(object):
+    ''' The state of the STA/LTA detection of a SCNL.
 
+    The state is carried over between consecutive time intervals, so
+    that each sample is processed only once and events spanning the
+    limits of the intervals are not split.
+    '''
+
+    def __init__(self):
+        ''' Initialize the instance.
+        '''
+        # The state of the processing stack, e.g. the filter states.
+        self.processing_state = {}
+
+        # The events not yet ended. List of Tuples (start_time, stop_value).
+        self.open_events = []
+
+        self.reset()
+
+
+    def reset(self):
+        ''' Reset the detection state.
+
+        The events still open are ended at the last processed sample.
+
+        Returns
+        -------
+        detections : List of Tuples (start_time, end_time)
+            The ended open events.
+        '''
+        detections = self.close_events()
 
-        return event_marker
+        # The sampling rate of the processed data.
+        self.sps = None
 
+        # The time of the next expected sample.
+        self.next_time = None
 
+        # The time of the last processed sample.
+        self.last_time = None
 
+        # The number of samples processed since the reset.
+        self.n_processed = 0
+
+        # The last LTA window of the characteristic function.
+        self.cf_tail = np.zeros(0)
+
+        # The last STA values used to compute the stop values of events.
+        self.sta_tail = np.zeros(0)
+
+        # The STA and LTA values of the last sample of the recursive
+        # STA/LTA.
+        self.sta_value = 0.
+        self.lta_value = 0.
+
+        # The trigger state of the last sample.
+        self.event_on = True
+
+        # The events not yet ended. List of Tuples (start_time, stop_value).
+        self.open_events = []
+
+        return detections
+
+
+    def remove_processed(self, stream):
+        ''' Remove the samples already processed from a stream.
+
+        The samples up to the last processed sample are removed. The data
+        of the returned traces are views of the data of the passed traces.
+
+        Parameters
+        ----------
+        stream : :class:`obspy.core.Stream`
+            The data to process.
+
+        Returns
+        -------
+        stream : :class:`obspy.core.Stream`
+            The data following the last processed sample.
+        '''
+        if self.last_time is None:
+            return stream
+
+        unprocessed = Stream()
+        for cur_trace in stream:
+            sps = cur_trace.stats.sampling_rate
+            n_skip = int(np.floor((self.last_time - cur_trace.stats.starttime) * sps + 0.5)) + 1
+            if n_skip <= 0:
+                unprocessed.append(cur_trace)
+            elif n_skip < cur_trace.stats.npts:
+                cur_header = cur_trace.stats.copy()
+                cur_header.starttime = cur_trace.stats.starttime + n_skip / sps
+                unprocessed.append(Trace(data = cur_trace.data[n_skip:],
+                                         header = cur_header))
+        return unprocessed
+
+
+    def is_continuous(self, trace):
+        ''' Check if a trace continues the processed data.
+        '''
+        if self.next_time is None:
+            return False
+        if trace.stats.sampling_rate != self.sps:
+            return False
+        return abs(trace.stats.starttime - self.next_time) < 0.5 / self.sps
+
+
+    def close_events(self):
+        ''' End the open events at the last processed sample.
+
+        Returns
+        -------
+        detections : List of Tuples (start_time, end_time)
+            The ended open events.
+        '''
+        if not self.open_events:
+            return []
+        detections = [(x[0], self.last_time) for x in self.open_events]
+        self.open_events = []
+        return detections
@@ -0,0 +1,423 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Columnar in-memory storage and network association of detections.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import logging
+
+import numpy as np
+import sqlalchemy as sqa
+from obspy.core.utcdatetime import UTCDateTime
+
+import psysmon
+import psysmon.core.database_util as db_util
+
+
+# The data type of the detection store columns.
+detection_dtype = [('id', 'i8'),
+                   ('start_time', 'f8'),
+                   ('end_time', 'f8'),
+                   ('rec_stream_id', 'i8'),
+                   ('method', 'i4')]
+
+# The data type of the coincidence events.
+coincidence_event_dtype = [('start_time', 'f8'),
+                           ('end_time', 'f8'),
+                           ('n_groups', 'i8')]
+
+
+class DetectionStore(object):
+    ''' A columnar store of detections backed by a numpy structured array.
+
+    The columns are the database id, the start and end time as timestamps,
+    the database id of the recorder stream and the detection method. Missing
+    ids are set to -1. The methods are stored as indexes into the
+    :attr:`methods` list.
+    '''
+
+    def __init__(self, capacity = 1024):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        capacity : Integer
+            The initial number of detections which can be stored without
+            resizing the array.
+        '''
+        # The logging logger instance.
+        logger_prefix = psysmon.logConfig['package_prefix']
+        loggerName = logger_prefix + "." + __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The array holding the detections. Only the first n_detections
+        # rows are valid.
+        self.array = np.zeros(max(capacity, 1), dtype = detection_dtype)
+
+        # The number of detections in the store.
+        self.n_detections = 0
+
+        # The names of the detection methods.
+        self.methods = []
+
+
+    def __len__(self):
+        return self.n_detections
+
+
+    @property
+    def data(self):
+        ''' The structured array of the detections.
+        '''
+        return self.array[:self.n_detections]
+
+
+    def get_method_code(self, method):
+        ''' Get the code of a detection method.
+        '''
+        if method not in self.methods:
+            self.methods.append(method)
+        return self.methods.index(method)
+
+
+    def reserve(self, n_detections):
+        ''' Make sure that the array can hold n_detections detections.
+        '''
+        if n_detections <= len(self.array):
+            return
+        capacity = max(n_detections, 2 * len(self.array))
+        array = np.zeros(capacity, dtype = detection_dtype)
+        array[:self.n_detections] = self.data
+        self.array = array
+
+
+    def extend(self, start_time, end_time, rec_stream_id = -1, method = None,
+               db_id = -1):
+        ''' Add detections to the store.
+
+        Parameters
+        ----------
+        start_time : array_like of float
+            The start times of the detections as timestamps.
+
+        end_time : array_like of float
+            The end times of the detections as timestamps.
+
+        rec_stream_id : Integer or array_like of Integer
+            The database ids of the recorder streams.
+
+        method : String
+            The detection method of the detections.
+
+        db_id : Integer or array_like of Integer
+            The database ids of the detections.
+        '''
+        start_time = np.atleast_1d(np.asarray(start_time, dtype = np.float64))
+        n_new = len(start_time)
+        self.reserve(self.n_detections + n_new)
+
+        new = self.array[self.n_detections:self.n_detections + n_new]
+        new['id'] = db_id
+        new['start_time'] = start_time
+        new['end_time'] = end_time
+        new['rec_stream_id'] = rec_stream_id
+        new['method'] = self.get_method_code(method)
+        self.n_detections += n_new
+
+
+    def add_detections(self, detections, rec_stream_id = -1, method = None):
+        ''' Add detections given as (start_time, end_time) tuples.
+
+        Parameters
+        ----------
+        detections : List of Tuples (start_time, end_time)
+            The detections with the times as
+            :class:`~obspy.core.utcdatetime.UTCDateTime` instances.
+        '''
+        if not detections:
+            return
+        self.extend(start_time = [x[0].timestamp for x in detections],
+                    end_time = [x[1].timestamp for x in detections],
+                    rec_stream_id = rec_stream_id,
+                    method = method)
+
+
+    def sort(self):
+        ''' Sort the detections by their start time.
+        '''
+        self.array[:self.n_detections] = np.sort(self.data, order = ['start_time', 'end_time'])
+
+
+    @classmethod
+    def load(cls, project, start_time = None, end_time = None, catalog_id = None,
+             run_id = None, page_size = 10000):
+        ''' Load the detections from the database.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
+
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The begin of the time span of the detection start times.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end of the time span of the detection start times.
+
+        catalog_id : Integer
+            The database id of the detection catalog.
+
+        run_id : String
+            The id of the run which created the detections.
+
+        page_size : Integer
+            The number of detections loaded with one query.
+
+        Returns
+        -------
+        store : :class:`DetectionStore`
+            The store holding the loaded detections.
+        '''
+        det_table = project.dbTables['detection']
+        columns = [det_table.id,
+                   det_table.start_time,
+                   det_table.end_time,
+                   sqa.func.coalesce(det_table.rec_stream_id, -1).label('rec_stream_id'),
+                   det_table.method]
+        query = sqa.select(columns)
+        if start_time is not None:
+            query = query.where(det_table.start_time >= start_time.timestamp)
+        if end_time is not None:
+            query = query.where(det_table.start_time <= end_time.timestamp)
+        if catalog_id is not None:
+            query = query.where(det_table.catalog_id == catalog_id)
+        if run_id is not None:
+            query = query.where(det_table.run_id == run_id)
+
+        rows = db_util.query_to_array(project.dbEngine,
+                                      query = query,
+                                      dtype = [('id', 'i8'),
+                                               ('start_time', 'f8'),
+                                               ('end_time', 'f8'),
+                                               ('rec_stream_id', 'i8'),
+                                               ('method', 'O')],
+                                      id_column = det_table.id,
+                                      page_size = page_size)
+
+        store = cls(capacity = len(rows))
+        methods, method_codes = np.unique(rows['method'].astype(str), return_inverse = True)
+        store.methods = list(methods)
+        store.reserve(len(rows))
+        for cur_name in ['id', 'start_time', 'end_time', 'rec_stream_id']:
+            store.array[cur_name][:len(rows)] = rows[cur_name]
+        store.array['method'][:len(rows)] = method_codes
+        store.n_detections = len(rows)
+        return store
+
+
+    def write_events(self, project, events, links, catalog_id = None,
+                     comment = None, statement_size = 1000):
+        ''' Write associated events and their detection links to the database.
+
+        The events and the detection_to_event links are written in one
+        transaction. The links are inserted with executemany statements.
+        Links to detections without a database id are skipped.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
+
+        events : :class:`numpy.ndarray`
+            The events returned by :func:`coincidence_trigger`.
+
+        links : :class:`numpy.ndarray` (n_links, 2)
+            The indexes of the events and the associated detections of the
+            store returned by :func:`coincidence_trigger`.
+
+        catalog_id : Integer
+            The database id of the event catalog.
+
+        comment : String
+            The comment of the events.
+
+        statement_size : Integer
+            The number of links inserted with one statement.
+
+        Returns
+        -------
+        ev_ids : List of Integer
+            The database ids of the events.
+        '''
+        event_table = project.dbTables['event'].__table__
+        link_table = project.dbTables['detection_to_event'].__table__
+        creation_time = UTCDateTime().isoformat()
+
+        det_ids = self.data['id'][links[:, 1]]
+        connection = project.dbEngine.connect()
+        transaction = connection.begin()
+        try:
+            insert = event_table.insert()
+            ev_ids = []
+            for cur_start_time, cur_end_time in zip(events['start_time'], events['end_time']):
+                result = connection.execute(insert,
+                                            {'ev_catalog_id': catalog_id,
+                                             'start_time': float(cur_start_time),
+                                             'end_time': float(cur_end_time),
+                                             'comment': comment,
+                                             'agency_uri': project.activeUser.agency_uri,
+                                             'author_uri': project.activeUser.author_uri,
+                                             'creation_time': creation_time})
+                ev_ids.append(result.inserted_primary_key[0])
+
+            link_ev_ids = np.array(ev_ids, dtype = np.int64)[links[:, 0]]
+            rows = [{'ev_id': int(x), 'det_id': int(y)} for x, y in zip(link_ev_ids, det_ids) if y >= 0]
+            for k in range(0, len(rows), statement_size):
+                connection.execute(link_table.insert(), rows[k:k + statement_size])
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+
+        self.logger.info("Wrote %d events and %d detection links.", len(ev_ids), len(rows))
+        return ev_ids
+
+
+
+def coincidence_trigger(start_time, end_time, group, min_groups, window = 0.):
+    ''' Find the time spans with coincident detections of several groups.
+
+    The groups are usually the stations of the detections. Overlapping
+    detections of a group are merged, so that each group is counted once.
+    The start and end points of the merged detections are sorted and swept
+    with a cumulative sum giving the number of active groups at each point.
+    The time spans with at least min_groups active groups are the
+    coincidence events. The detections overlapping an event are associated
+    with it.
+
+    Parameters
+    ----------
+    start_time : :class:`numpy.ndarray` of float
+        The start times of the detections.
+
+    end_time : :class:`numpy.ndarray` of float
+        The end times of the detections.
+
+    group : :class:`numpy.ndarray` of Integer
+        The group of each detection.
+
+    min_groups : Integer
+        The minimum number of groups with coincident detections.
+
+    window : float
+        The time in seconds added to the end of the detections to allow
+        for the travel time differences between the groups.
+
+    Returns
+    -------
+    events : :class:`numpy.ndarray`
+        The structured array of the events with the fields start_time,
+        end_time and n_groups. The time limits of an event are the limits
+        of the associated detections.
+
+    links : :class:`numpy.ndarray` (n_links, 2)
+        The indexes of the events and the associated detections ordered by
+        the event.
+    '''
+    start_time = np.asarray(start_time, dtype = np.float64)
+    end_time = np.asarray(end_time, dtype = np.float64) + window
+    group = np.asarray(group)
+
+    no_events = (np.zeros(0, dtype = coincidence_event_dtype),
+                 np.zeros((0, 2), dtype = np.int64))
+    if len(start_time) == 0:
+        return no_events
+
+    # Merge the overlapping detections of each group.
+    order = np.lexsort((start_time, group))
+    sorted_start = start_time[order]
+    sorted_end = end_time[order]
+    sorted_group = group[order]
+    group_first = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+    group_last = np.r_[group_first[1:], len(order)]
+    cum_end = np.empty_like(sorted_end)
+    for k, m in zip(group_first, group_last):
+        cum_end[k:m] = np.maximum.accumulate(sorted_end[k:m])
+    is_first = np.r_[True, sorted_start[1:] > cum_end[:-1]]
+    is_first[group_first] = True
+    seg_first = np.flatnonzero(is_first)
+    seg_start = sorted_start[seg_first]
+    seg_end = np.maximum.reduceat(sorted_end, seg_first)
+
+    # Sweep the sorted start and end points counting the active groups. At
+    # equal times the start points are processed first, so that touching
+    # detections are coincident.
+    point_time = np.r_[seg_start, seg_end]
+    point_delta = np.r_[np.ones(len(seg_start), dtype = np.int64),
+                        -np.ones(len(seg_end), dtype = np.int64)]
+    order = np.lexsort((-point_delta, point_time))
+    point_time = point_time[order]
+    n_active = np.cumsum(point_delta[order])
+
+    is_active = n_active >= min_groups
+    was_active = np.r_[False, is_active[:-1]]
+    ev_on = point_time[is_active & ~was_active]
+    ev_off = point_time[~is_active & was_active]
+
+    # Skip the events of detections touching in a single point.
+    is_valid = ev_off > ev_on
+    ev_on = ev_on[is_valid]
+    ev_off = ev_off[is_valid]
+    if len(ev_on) == 0:
+        return no_events
+
+    # Associate the detections overlapping the events.
+    first = np.searchsorted(ev_off, start_time, side = 'left')
+    last = np.searchsorted(ev_on, end_time, side = 'right') - 1
+    n_links = np.clip(last - first + 1, 0, None)
+    det_index = np.repeat(np.arange(len(start_time)), n_links)
+    offset = np.arange(len(det_index)) - np.repeat(np.cumsum(n_links) - n_links, n_links)
+    ev_index = np.repeat(first, n_links) + offset
+
+    order = np.lexsort((det_index, ev_index))
+    links = np.column_stack((ev_index[order], det_index[order]))
+
+    # Compute the event limits and the number of associated groups.
+    link_first = np.flatnonzero(np.r_[True, links[1:, 0] != links[:-1, 0]])
+    events = np.zeros(len(ev_on), dtype = coincidence_event_dtype)
+    events['start_time'] = np.minimum.reduceat(start_time[links[:, 1]], link_first)
+    events['end_time'] = np.maximum.reduceat(end_time[links[:, 1]], link_first) - window
+    link_group = group[links[:, 1]]
+    order = np.lexsort((link_group, links[:, 0]))
+    link_event = links[order, 0]
+    link_group = link_group[order]
+    is_new = np.r_[True, (link_event[1:] != link_event[:-1]) | (link_group[1:] != link_group[:-1])]
+    events['n_groups'] = np.bincount(link_event[is_new], minlength = len(events))
+
+    return events, links
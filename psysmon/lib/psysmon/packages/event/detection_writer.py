@@ -0,0 +1,321 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Buffered bulk writing of detections and events to the database.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from obspy.core.utcdatetime import UTCDateTime
+
+import psysmon
+from psysmon.packages.event.job_checkpoint import write_checkpoints
+
+
+class DetectionWriter(object):
+    ''' Write detections and events to the database in bulk.
+
+    The rows are buffered and written with multi-row Core insert statements
+    in a single transaction when the number of buffered rows reaches
+    flush_size or when flush_interval seconds have passed since the last
+    write. Use the writer in a with statement to write the remaining rows
+    at the end of a detection run, also if the detection fails, or call
+    :meth:`close` explicitly.
+
+    Job checkpoints set with :meth:`set_checkpoint` are written in the same
+    transaction as the buffered rows. The rows and the checkpoint of a
+    processed interval have to be added in a :meth:`batch`, so that they
+    are not split by an automatic write.
+    '''
+
+    def __init__(self, project, flush_size = 1000, flush_interval = 60.,
+                 statement_size = 100):
+        ''' Initialize the instance.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database engine and tables.
+
+        flush_size : Integer
+            The number of buffered rows triggering a write to the database.
+
+        flush_interval : float
+            The time in seconds after which the buffered rows are written to
+            the database when new rows are added.
+
+        statement_size : Integer
+            The maximum number of rows written with one insert statement.
+        '''
+        # The logging logger instance.
+        logger_prefix = psysmon.logConfig['package_prefix']
+        loggerName = logger_prefix + "." + __name__ + "." + self.__class__.__name__
+        self.logger = logging.getLogger(loggerName)
+
+        # The psysmon project.
+        self.project = project
+
+        # The number of buffered rows triggering a write.
+        self.flush_size = flush_size
+
+        # The time in seconds triggering a write.
+        self.flush_interval = flush_interval
+
+        # The maximum number of rows of an insert statement.
+        self.statement_size = statement_size
+
+        # The buffered rows. The keys are the table names, the values the
+        # lists of the row dictionaries. The tables are written in the order
+        # in which they have been added.
+        self.buffer = OrderedDict()
+
+        # The number of buffered rows.
+        self.n_buffered = 0
+
+        # The buffered job checkpoints. The keys are the tuples (run_id,
+        # job, scnl), the values the checkpoint dictionaries.
+        self.checkpoints = OrderedDict()
+
+        # The nesting level of the batches. No automatic writes are done
+        # inside a batch.
+        self.batch_level = 0
+
+        # The time of the last write.
+        self.last_flush = time.time()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Write the rows collected before the error without hiding the
+            # original exception.
+            try:
+                self.close()
+            except Exception:
+                self.logger.exception("Error when writing the buffered rows.")
+        return False
+
+
+    def add(self, table_name, rows):
+        ''' Add rows to the buffer.
+
+        Parameters
+        ----------
+        table_name : String
+            The name of the database table as used in the project dbTables.
+
+        rows : List of dict
+            The rows to insert. All rows of a table must contain the same
+            columns.
+        '''
+        if not rows:
+            return
+
+        self.buffer.setdefault(table_name, []).extend(rows)
+        self.n_buffered += len(rows)
+        self.check_flush()
+
+
+    @contextmanager
+    def batch(self):
+        ''' Group rows and checkpoints which have to be written together.
+
+        The automatic write is delayed until the end of the batch. If the
+        batch fails, the rows and checkpoints added in the batch are
+        discarded.
+        '''
+        if self.batch_level == 0:
+            n_rows = dict([(k, len(v)) for k, v in self.buffer.iteritems()])
+            snapshot = (n_rows, self.n_buffered, OrderedDict(self.checkpoints))
+
+        self.batch_level += 1
+        try:
+            yield self
+        except:
+            if self.batch_level == 1:
+                n_rows, self.n_buffered, self.checkpoints = snapshot
+                for cur_name in self.buffer.keys():
+                    if cur_name in n_rows:
+                        del self.buffer[cur_name][n_rows[cur_name]:]
+                    else:
+                        del self.buffer[cur_name]
+            raise
+        finally:
+            self.batch_level -= 1
+        self.check_flush()
+
+
+    def check_flush(self):
+        ''' Write the buffered rows if the size or time threshold is reached.
+        '''
+        if self.batch_level > 0:
+            return
+
+        if self.n_buffered >= self.flush_size or (time.time() - self.last_flush) >= self.flush_interval:
+            self.flush()
+
+
+    def add_detection(self, start_time, end_time, method, rec_stream_id = None,
+                      catalog_id = None, run_id = None):
+        ''' Add a detection to the buffer.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the detection.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the detection.
+
+        method : String
+            The detection method.
+
+        rec_stream_id : Integer
+            The database id of the recorder stream of the detection.
+
+        catalog_id : Integer
+            The database id of the detection catalog.
+
+        run_id : String
+            The id of the job run which created the detection.
+        '''
+        row = {'catalog_id': catalog_id,
+               'rec_stream_id': rec_stream_id,
+               'start_time': start_time.timestamp,
+               'end_time': end_time.timestamp,
+               'method': method,
+               'run_id': run_id,
+               'agency_uri': self.project.activeUser.agency_uri,
+               'author_uri': self.project.activeUser.author_uri,
+               'creation_time': UTCDateTime().isoformat()}
+        self.add('detection', [row, ])
+
+
+    def add_event(self, start_time, end_time, comment = None, catalog_id = None):
+        ''' Add an event to the buffer.
+
+        Parameters
+        ----------
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the event.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the event.
+
+        comment : String
+            The comment of the event.
+
+        catalog_id : Integer
+            The database id of the event catalog.
+        '''
+        row = {'ev_catalog_id': catalog_id,
+               'start_time': start_time.timestamp,
+               'end_time': end_time.timestamp,
+               'comment': comment,
+               'agency_uri': self.project.activeUser.agency_uri,
+               'author_uri': self.project.activeUser.author_uri,
+               'creation_time': UTCDateTime().isoformat()}
+        self.add('event', [row, ])
+
+
+    def set_checkpoint(self, run_id, job, scnl, resume_time, written_time):
+        ''' Set the checkpoint of a job run.
+
+        The checkpoint replaces a buffered checkpoint of the same run, job
+        and SCNL and is written together with the buffered rows.
+
+        Parameters
+        ----------
+        run_id : String
+            The id of the job run.
+
+        job : String
+            The name of the job.
+
+        scnl : Tuple (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNL of the checkpoint. None, if the job is not split by
+            SCNL.
+
+        resume_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The time from which the processing has to be resumed.
+
+        written_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The time until which the results have been written.
+        '''
+        self.checkpoints[(run_id, job, scnl)] = {'run_id': run_id,
+                                                 'job': job,
+                                                 'scnl': scnl,
+                                                 'resume_time': resume_time,
+                                                 'written_time': written_time}
+        self.check_flush()
+
+
+    def flush(self):
+        ''' Write the buffered rows to the database.
+
+        All rows and checkpoints are written in one transaction. If the
+        write fails, the transaction is rolled back and the rows are kept in
+        the buffer.
+        '''
+        self.last_flush = time.time()
+        if self.n_buffered == 0 and not self.checkpoints:
+            return
+
+        connection = self.project.dbEngine.connect()
+        transaction = connection.begin()
+        try:
+            for cur_name, cur_rows in self.buffer.iteritems():
+                cur_table = self.project.dbTables[cur_name].__table__
+                for k in range(0, len(cur_rows), self.statement_size):
+                    connection.execute(cur_table.insert().values(cur_rows[k:k + self.statement_size]))
+            if self.checkpoints:
+                write_checkpoints(connection, self.project, self.checkpoints.values())
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+
+        self.logger.debug("Wrote %d rows to the database.", self.n_buffered)
+        self.buffer = OrderedDict()
+        self.n_buffered = 0
+        self.checkpoints = OrderedDict()
+
+
+    def close(self):
+        ''' Write the remaining buffered rows to the database.
+        '''
+        self.flush()
@@ -35,9 +35,10 @@ from profilehooks import profile
 import os
 import copy
 import logging
+import itertools
+import multiprocessing
 import psysmon
 from psysmon.core.packageNodes import CollectionNode
-import obspy.core
 from obspy.core.utcdatetime import UTCDateTime
 import psysmon.core.preferences_manager as psy_pm
 from psysmon.core.gui_preference_dialog import ListbookPrefDialog
@@ -46,6 +47,11 @@ from psysmon.packages.tracedisplay.plugins_processingstack import PStackEditFiel
 from psysmon.core.processingStack import ProcessingStack
 from psysmon.core.processingStack import ResultBag
 import core as ev_core
+from psysmon.packages.event.job_checkpoint import create_run_id
+from psysmon.packages.event.job_checkpoint import load_checkpoints
+from psysmon.packages.event.job_checkpoint import load_last_ids
+from psysmon.packages.event.job_checkpoint import write_checkpoints
+from psysmon.packages.event.job_checkpoint import NO_SCNL
 
 
 
@@ -172,6 +178,12 @@ class EventProcessorNode(CollectionNode):
 
         interval_start.append(end_time)
 
+        # Keep the run id in the preferences until the processing has
+        # finished, so that an interrupted run can be resumed.
+        run_id = self.pref_manager.get_value('run_id').strip()
+        if not run_id:
+            run_id = create_run_id()
+            self.pref_manager.set_value('run_id', run_id)
 
         for k, cur_start_time in enumerate(interval_start[:-1]):
             processor.process(start_time = cur_start_time,
@@ -179,7 +191,11 @@ class EventProcessorNode(CollectionNode):
                               station_names = self.pref_manager.get_value('stations'),
                               channel_names = self.pref_manager.get_value('channels'),
                               event_catalog = self.pref_manager.get_value('event_catalog'),
-                              event_ids = event_ids)
+                              event_ids = event_ids,
+                              run_id = run_id,
+                              n_workers = self.pref_manager.get_value('n_workers'))
+
+        self.pref_manager.set_value('run_id', '')
 
 
 
@@ -286,6 +302,15 @@ class EventProcessorNode(CollectionNode):
         self.pref_manager.add_item(pagename = 'processing stack',
                                    item = item)
 
+        item = psy_pm.IntegerSpinPrefItem(name = 'n_workers',
+                                          label = 'worker processes',
+                                          group = 'parallel processing',
+                                          value = 1,
+                                          limit = (1, 64),
+                                          tool_tip = 'The number of processes used to process the events in parallel.')
+        self.pref_manager.add_item(pagename = 'processing stack',
+                                   item = item)
+
 
     def create_output_preferences(self):
         ''' Create the preference items of the output section.
@@ -311,6 +336,14 @@ class EventProcessorNode(CollectionNode):
         self.pref_manager.add_item(pagename = 'output',
                                    item = item)
 
+        item = psy_pm.TextEditPrefItem(name = 'run_id',
+                                       label = 'resume run id',
+                                       group = 'checkpoint',
+                                       value = '',
+                                       tool_tip = 'The id of an interrupted processing run to resume. Leave empty to start a new run.')
+        self.pref_manager.add_item(pagename = 'output',
+                                   item = item)
+
 
 
     def load_catalogs(self):
@@ -377,8 +410,50 @@ class EventProcessorNode(CollectionNode):
 
 
 
+# The event processor used by the worker processes of the parallel
+# processing.
+worker_processor = None
+
+
+def init_processing_worker(processor):
+    ''' Initialize a worker process of the parallel event processing.
+
+    The processor and its processing stack are inherited from the parent
+    process when forking the worker process.
+    '''
+    global worker_processor
+    processor.project.init_worker_process()
+    worker_processor = processor
+
+
+def process_block_job(job):
+    ''' Process a block of events in a worker process.
+
+    Parameters
+    ----------
+    job : Tuple (block_start, block_end, events, scnl, pre_event_time, post_event_time)
+        The parameters of :meth:`EventProcessor.process_block`.
+
+    Returns
+    -------
+    results : List of Tuples (resource_id, results)
+        The results of the events in the order of the events.
+    '''
+    block_start, block_end, events, scnl, pre_event_time, post_event_time = job
+    return worker_processor.process_block(block_start = block_start,
+                                          block_end = block_end,
+                                          events = events,
+                                          scnl = scnl,
+                                          pre_event_time = pre_event_time,
+                                          post_event_time = post_event_time)
+
+
+
 class EventProcessor(object):
 
+    # The job name used for the checkpoints.
+    job_name = 'event_processor'
+
     def __init__(self, project, output_dir, processing_stack = None, parent_rid = None):
         ''' Initialize the instance.
 
@@ -407,7 +482,8 @@ class EventProcessor(object):
 
 
     #@profile(immediate=True)
-    def process(self, start_time, end_time, station_names, channel_names, event_catalog, event_ids = None):
+    def process(self, start_time, end_time, station_names, channel_names, event_catalog, event_ids = None,
+                run_id = None, n_workers = 1):
         ''' Start the detection.
 
         Parameters
@@ -430,6 +506,17 @@ class EventProcessor(object):
         event_ids : List of Integer
             If individual events are specified, this list contains the database IDs of the events
             to process.
+
+        run_id : String
+            The id of the processing run. The last event of which the
+            results have been saved is stored as a checkpoint of the run.
+            If the id of an interrupted run is passed, the events up to the
+            checkpoint are skipped.
+
+        n_workers : Integer
+            The number of worker processes. If larger than 1, the blocks of
+            events are processed in parallel. Each worker process uses its
+            own copy of the processing stack.
         '''
         self.logger.info("Processing timespan %s to %s.", start_time.isoformat(), end_time.isoformat())
 
@@ -449,10 +536,27 @@ class EventProcessor(object):
         else:
             # Load the events with the given ids from the database. Ignore the
             # time-span.
-            catalog.load_events(event_id = event_ids)
+            catalog.load_events(project = self.project,
+                                event_id = event_ids)
+
+        # Skip the events already processed by an interrupted run. The
+        # events are processed in the order of their start time and id.
+        # The checkpoint holds the start time and the id of the last
+        # processed event, so that events starting at the same time are
+        # not skipped.
+        events = sorted(catalog.get_event(), key = lambda x: (x.start_time, x.db_id))
+        resume_time = None
+        if run_id is not None:
+            checkpoints = load_checkpoints(self.project, run_id = run_id,
+                                           job = self.job_name)
+            if NO_SCNL in checkpoints:
+                resume_time = checkpoints[NO_SCNL][1]
+                last_id = load_last_ids(self.project, run_id = run_id,
+                                        job = self.job_name)[NO_SCNL]
+                events = [x for x in events if self.is_pending(x, resume_time, last_id)]
 
         # Abort the execution if no events are available for the time span.
-        if not catalog.events:
+        if not events:
             if event_ids is None:
                 self.logger.info('No events found for the timespan %s to %s.', start_time.isoformat(), end_time.isoformat())
             else:
@@ -468,105 +572,322 @@ class EventProcessor(object):
         scnl = [x.scnl for x in channels]
 
 
-        n_events = len(catalog.events)
-        active_timespan = ()
+        # TODO: Add a feature which allows adding a window before and after
+        # the event time limits.
+        pre_event_time = 20
+        post_event_time = 10
+
+        # TODO: Make the length of the waveform load interval user
+        # selectable.
+        waveform_load_interval = 3600
+
+        # When many short events with small gaps inbetween are processed,
+        # it is very ineffective to load the waveform for each event. Load
+        # the waveform of contiguous blocks containing several events and
+        # slice the events out of the block stream.
+        blocks = self.get_event_blocks(events = events,
+                                       pre_event_time = pre_event_time,
+                                       post_event_time = post_event_time,
+                                       block_length = waveform_load_interval)
+
+        block_results = self.iter_block_results(blocks = blocks,
+                                                scnl = scnl,
+                                                pre_event_time = pre_event_time,
+                                                post_event_time = post_event_time,
+                                                n_workers = n_workers)
+        last_processed = None
+        k = 0
+        cur_event = events[0]
         try:
-            for k, cur_event in enumerate(catalog.events):
-                self.logger.info("Processing event %d (%d/%d).", cur_event.db_id, k, n_events)
-
-                # Load the waveform data for the event and the given stations and
-                # channels.
-                # TODO: Add a feature which allows adding a window before and after
-                # the event time limits.
-                pre_event_time = 20
-                post_event_time = 10
-
-                # TODO: Make the length of the waveform load interval user
-                # selectable.
-                waveform_load_interval = 3600
-
-                # When many short events with small gaps inbetween are processed,
-                # it is very ineffective to load the waveform for each event. Load
-                # a larger time-span and then request the waveform data from the
-                # waveclient stock.
-                timespan_begin = UTCDateTime(cur_event.start_time.year, cur_event.start_time.month, cur_event.start_time.day, cur_event.start_time.hour)
-                timespan_end = UTCDateTime(cur_event.end_time.year, cur_event.end_time.month, cur_event.end_time.day, cur_event.start_time.hour) + waveform_load_interval
-                if not active_timespan:
-                    self.logger.info("Initial stream request for hourly time-span: %s to %s.", timespan_begin.isoformat(),
-                                                                                          timespan_end.isoformat())
-                    stream = self.request_stream(start_time = timespan_begin,
-                                                 end_time = timespan_end,
-                                                 scnl = scnl)
-                    active_timespan = (timespan_begin, timespan_end)
-
-
-                cur_start_time = cur_event.start_time - pre_event_time
-                cur_end_time = cur_event.end_time + post_event_time
-
-                if not (((cur_start_time >= active_timespan[0]) and (cur_start_time <= active_timespan[1])) and ((cur_end_time >= active_timespan[0]) and (cur_end_time <= active_timespan[1]))):
-                    self.logger.info("Requesting stream for hourly time-span: %s to %s.", timespan_begin.isoformat(),
-                                                                                          timespan_end.isoformat())
-                    stream = self.request_stream(start_time = timespan_begin,
-                                                 end_time = timespan_end,
-                                                 scnl = scnl)
-                    active_timespan = (timespan_begin, timespan_end)
-
-
-                stream = self.request_stream(start_time = cur_start_time,
-                                             end_time = cur_end_time,
-                                             scnl = scnl)
-
-                # Execute the processing stack.
-                # TODO: The 0.5 seconds where added because there's currently no
-                # access to the event detection of the individual channels. Make
-                # sure, that this hard-coded value is turned into a user-selectable
-                # one or removed completely.
-                process_limits = (cur_event.start_time - 0.5, cur_event.end_time)
-                self.processing_stack.execute(stream = stream,
-                                              process_limits = process_limits)
-
+            for cur_event, resource_id, results in block_results:
                 # Put the results of the processing stack into the results bag.
-                results = self.processing_stack.get_results()
-                resource_id = self.project.rid + cur_event.rid
                 result_bag.add(resource_id = resource_id,
                                     results = results)
+                last_processed = cur_event
+                k += 1
 
         finally:
+            # Stop the worker processes of an interrupted processing.
+            block_results.close()
+
             # Add the time-span directory to the output directory.
-            if k != len(catalog.events) - 1:
+            if k < len(events):
                 cur_end_time = cur_event.end_time
             else:
                 cur_end_time = end_time
-            timespan_dir = start_time.strftime('%Y%m%dT%H%M%S') + '_to_' + cur_end_time.strftime('%Y%m%dT%H%M%S')
+            if resume_time is not None and resume_time > start_time:
+                dir_start_time = resume_time
+            else:
+                dir_start_time = start_time
+            timespan_dir = dir_start_time.strftime('%Y%m%dT%H%M%S') + '_to_' + cur_end_time.strftime('%Y%m%dT%H%M%S')
             cur_output_dir = os.path.join(self.output_dir, timespan_dir)
             # Save the processing results to files.
             result_bag.save(output_dir = cur_output_dir, scnl = scnl)
 
+            # Mark the saved events as processed.
+            if run_id is not None and last_processed is not None:
+                self.write_checkpoint(run_id = run_id,
+                                      last_event = last_processed)
 
-    def request_stream(self, start_time, end_time, scnl):
-        ''' Request a data stream from the waveclient.
 
-        '''
-        data_sources = {}
-        for cur_scnl in scnl:
-            if cur_scnl in self.project.scnlDataSources.keys():
-                if self.project.scnlDataSources[cur_scnl] not in data_sources.keys():
-                    data_sources[self.project.scnlDataSources[cur_scnl]] = [cur_scnl, ]
-                else:
-                    data_sources[self.project.scnlDataSources[cur_scnl]].append(cur_scnl)
-            else:
-                if self.project.defaultWaveclient not in data_sources.keys():
-                    data_sources[self.project.defaultWaveclient] = [cur_scnl, ]
-                else:
-                    data_sources[self.project.defaultWaveclient].append(cur_scnl)
+    def iter_block_results(self, blocks, scnl, pre_event_time, post_event_time, n_workers = 1):
+        ''' Process the events of the blocks.
+
+        Parameters
+        ----------
+        blocks : List of Tuples (start_time, end_time, events)
+            The blocks of events created by :meth:`get_event_blocks`.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs to process.
 
-        stream = obspy.core.Stream()
+        pre_event_time : float
+            The time in seconds processed before the event start.
 
-        for cur_name in data_sources.iterkeys():
-            curWaveclient = self.project.waveclient[cur_name]
-            curStream =  curWaveclient.getWaveform(startTime = start_time,
-                                                   endTime = end_time,
+        post_event_time : float
+            The time in seconds processed after the event end.
+
+        n_workers : Integer
+            The number of worker processes. If larger than 1, the blocks
+            are processed in parallel worker processes.
+
+        Returns
+        -------
+        results : Iterator of Tuples (event, resource_id, results)
+            The results of the events in the order of the events in the
+            blocks, independent of the number of workers.
+        '''
+        n_events = sum([len(x[2]) for x in blocks])
+        if n_workers > 1 and len(blocks) > 1:
+            # The results of the worker processes are returned in the order
+            # of the jobs.
+            jobs = []
+            for block_start, block_end, block_events in blocks:
+                cur_events = [(self.project.rid + x.rid, x.start_time, x.end_time) for x in block_events]
+                jobs.append((block_start, block_end, cur_events, scnl,
+                             pre_event_time, post_event_time))
+            pool = multiprocessing.Pool(processes = min(n_workers, len(jobs)),
+                                        initializer = init_processing_worker,
+                                        initargs = (self, ))
+            try:
+                job_results = pool.imap(process_block_job, jobs)
+                for (block_start, block_end, block_events), cur_results in itertools.izip(blocks, job_results):
+                    self.logger.info("Finished the time-span %s to %s (%d events).",
+                                     block_start.isoformat(), block_end.isoformat(), len(block_events))
+                    for cur_event, (resource_id, results) in zip(block_events, cur_results):
+                        yield (cur_event, resource_id, results)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            k = 0
+            for block_start, block_end, block_events in blocks:
+                self.logger.info("Requesting stream for the time-span %s to %s (%d events).",
+                                 block_start.isoformat(), block_end.isoformat(), len(block_events))
+                block_stream = self.request_stream(start_time = block_start,
+                                                   end_time = block_end,
                                                    scnl = scnl)
-            stream += curStream
 
-        return stream
+                for cur_event in block_events:
+                    self.logger.info("Processing event %d (%d/%d).", cur_event.db_id, k, n_events)
+                    results = self.process_event(block_stream = block_stream,
+                                                 start_time = cur_event.start_time,
+                                                 end_time = cur_event.end_time,
+                                                 pre_event_time = pre_event_time,
+                                                 post_event_time = post_event_time)
+                    yield (cur_event, self.project.rid + cur_event.rid, results)
+                    k += 1
+
+
+    def process_event(self, block_stream, start_time, end_time, pre_event_time, post_event_time):
+        ''' Process an event with the processing stack.
+
+        Parameters
+        ----------
+        block_stream : :class:`obspy.core.Stream`
+            The waveform data of the block containing the event.
+
+        start_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the event.
+
+        end_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the event.
+
+        pre_event_time : float
+            The time in seconds processed before the event start.
+
+        post_event_time : float
+            The time in seconds processed after the event end.
+
+        Returns
+        -------
+        results : List of :class:`~psysmon.core.processingStack.Result`
+            The results of the processing stack.
+        '''
+        # The sliced traces are views of the block stream data.
+        stream = block_stream.slice(starttime = start_time - pre_event_time,
+                                    endtime = end_time + post_event_time)
+
+        # Execute the processing stack.
+        # TODO: The 0.5 seconds where added because there's currently no
+        # access to the event detection of the individual channels. Make
+        # sure, that this hard-coded value is turned into a user-selectable
+        # one or removed completely.
+        process_limits = (start_time - 0.5, end_time)
+        self.processing_stack.execute(stream = stream,
+                                      process_limits = process_limits)
+
+        return self.processing_stack.get_results()
+
+
+    def process_block(self, block_start, block_end, events, scnl, pre_event_time, post_event_time):
+        ''' Load the waveform of a block and process its events.
+
+        Parameters
+        ----------
+        block_start : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the block.
+
+        block_end : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The end time of the block.
+
+        events : List of Tuples (resource_id, start_time, end_time)
+            The events of the block.
+
+        scnl : List of Tuples (STATION, CHANNEL, NETWORK, LOCATION)
+            The SCNLs to process.
+
+        pre_event_time : float
+            The time in seconds processed before the event start.
+
+        post_event_time : float
+            The time in seconds processed after the event end.
+
+        Returns
+        -------
+        results : List of Tuples (resource_id, results)
+            The results of the events in the order of the events.
+        '''
+        block_stream = self.request_stream(start_time = block_start,
+                                           end_time = block_end,
+                                           scnl = scnl)
+        block_results = []
+        for resource_id, start_time, end_time in events:
+            results = self.process_event(block_stream = block_stream,
+                                         start_time = start_time,
+                                         end_time = end_time,
+                                         pre_event_time = pre_event_time,
+                                         post_event_time = post_event_time)
+            block_results.append((resource_id, results))
+        return block_results
+
+
+    def get_event_blocks(self, events, pre_event_time, post_event_time, block_length):
+        ''' Group the events into contiguous blocks of waveform data.
+
+        The events are assigned in the order of their start time. An event
+        is added to the current block, if its time span including the pre-
+        and post-event time ends within the block length. Events longer
+        than the block length get a block of their own.
+
+        Parameters
+        ----------
+        events : List of :class:`~psysmon.packages.event.core.Event`
+            The events sorted by their start time.
+
+        pre_event_time : float
+            The time in seconds loaded before the event start.
+
+        post_event_time : float
+            The time in seconds loaded after the event end.
+
+        block_length : float
+            The preferred length of a block in seconds.
+
+        Returns
+        -------
+        blocks : List of Tuples (start_time, end_time, events)
+            The time limits of the blocks and the events in the blocks.
+        '''
+        blocks = []
+        for cur_event in events:
+            cur_start = cur_event.start_time - pre_event_time
+            cur_end = cur_event.end_time + post_event_time
+            if blocks:
+                block_start, block_end, block_events = blocks[-1]
+                if cur_end <= max(block_start + block_length, block_end):
+                    block_events.append(cur_event)
+                    blocks[-1] = (block_start, max(block_end, cur_end), block_events)
+                    continue
+            blocks.append((cur_start, cur_end, [cur_event, ]))
+
+        return blocks
+
+
+    def is_pending(self, event, resume_time, last_id):
+        ''' Check if an event has not been processed by an interrupted run.
+
+        Parameters
+        ----------
+        event : :class:`~psysmon.packages.event.core.Event`
+            The event to check.
+
+        resume_time : :class:`~obspy.core.utcdatetime.UTCDateTime`
+            The start time of the last processed event.
+
+        last_id : Integer
+            The database id of the last processed event. If None, all
+            events starting at the resume time are treated as processed.
+
+        Returns
+        -------
+        pending : Boolean
+            True if the event has to be processed.
+        '''
+        if event.start_time != resume_time:
+            return event.start_time > resume_time
+        return last_id is not None and event.db_id > last_id
+
+
+    def write_checkpoint(self, run_id, last_event):
+        ''' Write the checkpoint of a processing run to the database.
+
+        Parameters
+        ----------
+        run_id : String
+            The id of the processing run.
+
+        last_event : :class:`~psysmon.packages.event.core.Event`
+            The last event of which the results have been saved.
+        '''
+        checkpoint = {'run_id': run_id,
+                      'job': self.job_name,
+                      'scnl': None,
+                      'resume_time': last_event.start_time,
+                      'written_time': last_event.start_time,
+                      'last_id': last_event.db_id}
+        connection = self.project.dbEngine.connect()
+        transaction = connection.begin()
+        try:
+            write_checkpoints(connection, self.project, [checkpoint, ])
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+    def request_stream(self, start_time, end_time, scnl):
+        ''' Request a data stream from the waveclient.
+
+        The returned traces are read-only views of the waveclient stock.
+        The processing stack copies the data if needed.
+        '''
+        return self.project.request_data_stream(start_time = start_time,
+                                                end_time = end_time,
+                                                scnl = scnl,
+                                                read_only = True)
@@ -0,0 +1,197 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Checkpoints of long-running processing jobs.
+
+A checkpoint records the progress of a job run for a SCNL in the
+job_checkpoint database table. A run is identified by its run id. When a
+job is restarted with the run id of an interrupted run, the processing is
+resumed at the checkpoints.
+
+Each checkpoint holds two times:
+
+    resume_time: The time from which the processing has to be resumed.
+    written_time: The time until which the results have been written.
+
+The resume time can be earlier than the written time, e.g. if an event was
+still open at the end of the last completed interval. Results ending before
+the written time are already stored and have to be skipped when resuming.
+
+Jobs processing database items (e.g. events) in the order of their time
+and id can store the id of the last processed item as well, so that items
+with the same time as the checkpoint are not skipped when resuming.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import uuid
+
+import sqlalchemy as sqa
+from obspy.core.utcdatetime import UTCDateTime
+
+
+# The SCNL used for checkpoints of jobs which are not split by SCNL.
+NO_SCNL = ('', '', '', '')
+
+
+def create_run_id():
+    ''' Create a new unique run id.
+
+    Returns
+    -------
+    run_id : String
+        The run id starting with the creation time.
+    '''
+    return UTCDateTime().strftime('%Y%m%dT%H%M%S') + '_' + uuid.uuid4().hex[:8]
+
+
+def normalize_scnl(scnl):
+    ''' Get the SCNL used to identify a checkpoint.
+
+    None values are replaced by empty strings.
+    '''
+    if scnl is None:
+        return NO_SCNL
+    return tuple(['' if x is None else x for x in scnl])
+
+
+def load_checkpoints(project, run_id, job):
+    ''' Load the checkpoints of a job run from the database.
+
+    Parameters
+    ----------
+    project : :class:`psysmon.core.project.Project`
+        The project providing the database.
+
+    run_id : String
+        The id of the run.
+
+    job : String
+        The name of the job.
+
+    Returns
+    -------
+    checkpoints : dict
+        The checkpoints of the run. The keys are the SCNL tuples
+        normalized with :func:`normalize_scnl`, the values are tuples
+        (resume_time, written_time) of
+        :class:`~obspy.core.utcdatetime.UTCDateTime`.
+    '''
+    table = project.dbTables['job_checkpoint'].__table__
+    query = sqa.select([table]).where(sqa.and_(table.c.run_id == run_id,
+                                               table.c.job == job))
+    connection = project.dbEngine.connect()
+    try:
+        rows = connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+    checkpoints = {}
+    for cur_row in rows:
+        cur_scnl = (cur_row.station, cur_row.channel, cur_row.network, cur_row.location)
+        checkpoints[cur_scnl] = (UTCDateTime(cur_row.resume_time),
+                                 UTCDateTime(cur_row.written_time))
+    return checkpoints
+
+
+def load_last_ids(project, run_id, job):
+    ''' Load the ids of the last processed items of a job run.
+
+    Parameters
+    ----------
+    project : :class:`psysmon.core.project.Project`
+        The project providing the database.
+
+    run_id : String
+        The id of the run.
+
+    job : String
+        The name of the job.
+
+    Returns
+    -------
+    last_ids : dict
+        The keys are the SCNL tuples normalized with
+        :func:`normalize_scnl`, the values are the ids of the last
+        processed items. None if the checkpoint has no id.
+    '''
+    table = project.dbTables['job_checkpoint'].__table__
+    query = sqa.select([table]).where(sqa.and_(table.c.run_id == run_id,
+                                               table.c.job == job))
+    connection = project.dbEngine.connect()
+    try:
+        rows = connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+    return dict([((x.station, x.channel, x.network, x.location), x.last_id) for x in rows])
+
+
+def write_checkpoints(connection, project, checkpoints):
+    ''' Write checkpoints to the database.
+
+    Existing checkpoints of a run are updated. The checkpoints are written
+    using the passed connection, so that they can be written in the same
+    transaction as the results of the job.
+
+    Parameters
+    ----------
+    connection : :class:`sqlalchemy.engine.Connection`
+        The database connection.
+
+    project : :class:`psysmon.core.project.Project`
+        The project providing the database tables and the active user.
+
+    checkpoints : List of dict
+        The checkpoints with the keys run_id, job, scnl, resume_time and
+        written_time and the optional key last_id. The scnl is None for
+        jobs which are not split by SCNL. The times are
+        :class:`~obspy.core.utcdatetime.UTCDateTime` instances.
+    '''
+    table = project.dbTables['job_checkpoint'].__table__
+    creation_time = UTCDateTime().isoformat()
+    for cur_checkpoint in checkpoints:
+        station, channel, network, location = normalize_scnl(cur_checkpoint['scnl'])
+        where = sqa.and_(table.c.run_id == cur_checkpoint['run_id'],
+                         table.c.job == cur_checkpoint['job'],
+                         table.c.station == station,
+                         table.c.channel == channel,
+                         table.c.network == network,
+                         table.c.location == location)
+        values = {'resume_time': cur_checkpoint['resume_time'].timestamp,
+                  'written_time': cur_checkpoint['written_time'].timestamp,
+                  'last_id': cur_checkpoint.get('last_id', None),
+                  'creation_time': creation_time}
+        result = connection.execute(table.update().where(where).values(**values))
+        if result.rowcount == 0:
+            values.update({'run_id': cur_checkpoint['run_id'],
+                           'job': cur_checkpoint['job'],
+                           'station': station,
+                           'channel': channel,
+                           'network': network,
+                           'location': location,
+                           'agency_uri': project.activeUser.agency_uri,
+                           'author_uri': project.activeUser.author_uri})
+            connection.execute(table.insert().values(**values))
@@ -105,9 +105,8 @@ class CreateEvent(InteractivePlugin):
                 selected_event_info = selected_event_info[0]
                 # Update the event data in the database.
                 catalog_name = selected_event_info.value['catalog_name']
-                # TODO: Add a get_event method in the event catalog class to get events based on
-                # search critea.
-                cur_event = [x for x in self.parent.event_library.catalogs[catalog_name].events if x.db_id == selected_event_info.value['id']]
+                cur_catalog = self.parent.event_library.catalogs[catalog_name]
+                cur_event = cur_catalog.get_event(db_id = selected_event_info.value['id'])
 
                 if cur_event:
                     cur_event = cur_event[0]
@@ -120,6 +119,7 @@ class CreateEvent(InteractivePlugin):
                     self.event_start = event.xdata
 
                     cur_event.start_time = UTCDateTime(self.event_start)
+                    cur_catalog.reindex_events([cur_event, ])
                     cur_event.write_to_database(self.parent.project)
                     selected_event_info.value['start_time'] = cur_event.start_time
                     selected_event_info.change_rid = self.rid
@@ -139,9 +139,8 @@ class CreateEvent(InteractivePlugin):
                 selected_event_info = selected_event_info[0]
                 # Update the event data in the database.
                 catalog_name = selected_event_info.value['catalog_name']
-                # TODO: Add a get_event method in the event catalog class to get events based on
-                # search critea.
-                cur_event = [x for x in self.parent.event_library.catalogs[catalog_name].events if x.db_id == selected_event_info.value['id']]
+                cur_catalog = self.parent.event_library.catalogs[catalog_name]
+                cur_event = cur_catalog.get_event(db_id = selected_event_info.value['id'])
 
                 if cur_event:
                     cur_event = cur_event[0]
@@ -154,6 +153,7 @@ class CreateEvent(InteractivePlugin):
                     self.event_end = event.xdata
 
                     cur_event.end_time = UTCDateTime(self.event_end)
+                    cur_catalog.reindex_events([cur_event, ])
                     cur_event.write_to_database(self.parent.project)
                     selected_event_info.value['end_time'] = cur_event.end_time
                     selected_event_info.change_rid = self.rid
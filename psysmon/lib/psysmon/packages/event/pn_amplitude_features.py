@@ -31,6 +31,8 @@ class ComputeAmplitudeFeatures(ProcessingNode):
     '''
     nodeClass = 'common'
 
+    modifies_data = False
+
     def __init__(self, **kwargs):
         ''' The constructor
 
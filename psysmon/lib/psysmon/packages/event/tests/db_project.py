@@ -0,0 +1,108 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+An in-memory SQLite project database for the unit tests.
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import sqlalchemy as sqa
+from sqlalchemy import MetaData
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+import psysmon.packages.event
+import psysmon.packages.geometry
+
+
+class User(object):
+    ''' The user of the unit test project.
+    '''
+    name = 'unit_test'
+    agency_uri = 'at.uot'
+    author_uri = 'test'
+
+
+class DbProject(object):
+    ''' A project providing an in-memory SQLite database.
+
+    The table mapper classes are created by the databaseFactory functions
+    of the packages and prefixed with the project slug like in
+    :meth:`psysmon.core.project.Project.loadDatabaseStructure`. Only the
+    tables of the first package and the tables they reference are created,
+    because SQLite doesn't support the schema of all packages.
+
+    Parameters
+    ----------
+    packages : List of modules
+        The packages providing the table definitions. The tables of the
+        first package are created.
+    '''
+
+    def __init__(self, packages = None):
+        if packages is None:
+            packages = [psysmon.packages.event, psysmon.packages.geometry]
+
+        self.slug = 'unit_test'
+        self.activeUser = User()
+        self.dbEngine = sqa.create_engine('sqlite://')
+        self.dbMetaData = MetaData(self.dbEngine)
+        self.dbBase = declarative_base(metadata = self.dbMetaData)
+        self.dbSessionClass = sessionmaker(bind = self.dbEngine)
+
+        self.dbTables = {}
+        tables = []
+        for k, cur_package in enumerate(packages):
+            for cur_table in cur_package.databaseFactory(self.dbBase):
+                cur_name = cur_table.__table__.name
+                cur_table.__table__.name = self.slug + '_' + cur_name
+                for cur_index in cur_table.__table__.indexes:
+                    cur_index.name = self.slug + '_' + cur_index.name
+                self.dbTables[cur_name] = cur_table
+                if k == 0:
+                    tables.append(cur_table.__table__)
+
+        # Add the tables referenced by the created tables.
+        for cur_table in tables:
+            for cur_key in cur_table.foreign_keys:
+                if cur_key.column.table not in tables:
+                    tables.append(cur_key.column.table)
+
+        self.dbMetaData.create_all(tables = tables)
+
+
+    def getDbSession(self):
+        ''' Create a sqlAlchemy database session.
+        '''
+        return self.dbSessionClass()
+
+
+    def count(self, table_name):
+        ''' Count the rows of a table.
+        '''
+        table = self.dbTables[table_name].__table__
+        return self.dbEngine.execute(sqa.select([sqa.func.count()]).select_from(table)).scalar()
@@ -0,0 +1,159 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+import sqlalchemy as sqa
+from obspy.core.utcdatetime import UTCDateTime
+
+from psysmon.packages.event.detection_store import DetectionStore
+from psysmon.packages.event.detection_store import coincidence_trigger
+from psysmon.packages.event.tests.db_project import DbProject
+
+
+class DetectionStoreTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.packages.event.detection_store.
+    """
+
+    def setUp(self):
+        self.start_time = UTCDateTime('2015-01-01T00:00:00')
+
+
+    def test_extend(self):
+        ''' Test the adding and sorting of detections.
+        '''
+        store = DetectionStore(capacity = 2)
+        store.extend(start_time = [10., 2., 5.],
+                     end_time = [11., 3., 6.],
+                     rec_stream_id = 1,
+                     method = 'sta_lta')
+        store.add_detections([(self.start_time, self.start_time + 1)],
+                             rec_stream_id = 2,
+                             method = 'manual')
+        self.assertEqual(len(store), 4)
+        self.assertTrue(len(store.array) >= 4)
+        self.assertEqual(store.methods, ['sta_lta', 'manual'])
+
+        store.sort()
+        data = store.data
+        self.assertEqual(list(data['start_time']), [2., 5., 10., self.start_time.timestamp])
+        self.assertEqual(list(data['rec_stream_id']), [1, 1, 1, 2])
+        self.assertEqual(list(data['method']), [0, 0, 0, 1])
+        self.assertEqual(list(data['id']), [-1, -1, -1, -1])
+
+
+    def test_coincidence_trigger(self):
+        ''' Test the association of the detections of several stations.
+        '''
+        # Station 0 has two overlapping detections, which are counted once.
+        # The first event is detected on the stations 0, 1 and 2, the
+        # detection of station 3 at 20 s is not coincident.
+        start_time = np.array([0., 1., 2., 3., 20., 40., 41.])
+        end_time = np.array([5., 6., 7., 4., 21., 42., 43.])
+        group = np.array([0, 0, 1, 2, 3, 0, 1])
+
+        events, links = coincidence_trigger(start_time, end_time, group,
+                                            min_groups = 3)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['start_time'], 0.)
+        self.assertEqual(events[0]['end_time'], 7.)
+        self.assertEqual(events[0]['n_groups'], 3)
+        self.assertEqual(links.tolist(), [[0, 0], [0, 1], [0, 2], [0, 3]])
+
+        events, links = coincidence_trigger(start_time, end_time, group,
+                                            min_groups = 2)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(list(events['start_time']), [0., 40.])
+        self.assertEqual(list(events['end_time']), [7., 43.])
+        self.assertEqual(list(events['n_groups']), [3, 2])
+        self.assertEqual(links.tolist(), [[0, 0], [0, 1], [0, 2], [0, 3],
+                                          [1, 5], [1, 6]])
+
+
+    def test_coincidence_window(self):
+        ''' Test the coincidence of detections separated by a time gap.
+        '''
+        start_time = np.array([0., 3., 6.])
+        end_time = np.array([1., 4., 7.])
+        group = np.array([0, 1, 2])
+
+        events, links = coincidence_trigger(start_time, end_time, group,
+                                            min_groups = 2)
+        self.assertEqual(len(events), 0)
+        self.assertEqual(links.shape, (0, 2))
+
+        # The window extends the detections to overlap the following ones.
+        events, links = coincidence_trigger(start_time, end_time, group,
+                                            min_groups = 3,
+                                            window = 6.)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['start_time'], 0.)
+        self.assertEqual(events[0]['end_time'], 7.)
+        self.assertEqual(events[0]['n_groups'], 3)
+        self.assertEqual(links[:, 1].tolist(), [0, 1, 2])
+
+
+    def test_write_events(self):
+        ''' Test the writing of the events and the detection links.
+        '''
+        project = DbProject()
+        det_table = project.dbTables['detection'].__table__
+        rows = [{'start_time': self.start_time.timestamp + x,
+                 'end_time': self.start_time.timestamp + x + 3,
+                 'rec_stream_id': x % 3,
+                 'method': 'sta_lta',
+                 'catalog_id': 1} for x in [0, 1, 2, 30]]
+        project.dbEngine.execute(det_table.insert(), rows)
+
+        store = DetectionStore.load(project, catalog_id = 1, page_size = 3)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.methods, ['sta_lta'])
+        self.assertEqual(list(store.data['id']), [1, 2, 3, 4])
+
+        events, links = coincidence_trigger(store.data['start_time'],
+                                            store.data['end_time'],
+                                            store.data['rec_stream_id'],
+                                            min_groups = 3)
+        ev_ids = store.write_events(project, events, links,
+                                    catalog_id = 1,
+                                    statement_size = 2)
+        self.assertEqual(len(ev_ids), 1)
+
+        ev_table = project.dbTables['event'].__table__
+        ev_rows = project.dbEngine.execute(sqa.select([ev_table])).fetchall()
+        self.assertEqual(len(ev_rows), 1)
+        self.assertEqual(ev_rows[0].start_time, self.start_time.timestamp)
+        self.assertEqual(ev_rows[0].end_time, self.start_time.timestamp + 5)
+
+        link_table = project.dbTables['detection_to_event'].__table__
+        link_rows = project.dbEngine.execute(sqa.select([link_table]).order_by(link_table.c.det_id)).fetchall()
+        self.assertEqual([(x.ev_id, x.det_id) for x in link_rows],
+                         [(ev_ids[0], 1), (ev_ids[0], 2), (ev_ids[0], 3)])
+
+
+
+def suite():
+    return unittest.makeSuite(DetectionStoreTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
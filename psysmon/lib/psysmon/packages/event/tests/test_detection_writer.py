@@ -0,0 +1,148 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import sqlalchemy as sqa
+from obspy.core.utcdatetime import UTCDateTime
+
+from psysmon.packages.event.detection_writer import DetectionWriter
+from psysmon.packages.event.job_checkpoint import load_checkpoints
+from psysmon.packages.event.tests.db_project import DbProject
+
+
+class DetectionWriterTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.packages.event.detection_writer.DetectionWriter
+    """
+
+    def setUp(self):
+        self.project = DbProject()
+        self.start_time = UTCDateTime('2015-01-01T00:00:00')
+
+
+    def test_flush_size(self):
+        ''' Test the write of the rows when the flush size is reached.
+        '''
+        writer = DetectionWriter(project = self.project, flush_size = 10,
+                                 flush_interval = 3600., statement_size = 3)
+        for k in range(25):
+            writer.add_detection(start_time = self.start_time + k,
+                                 end_time = self.start_time + k + 0.5,
+                                 method = 'test',
+                                 rec_stream_id = 1)
+        self.assertEqual(self.project.count('detection'), 20)
+        self.assertEqual(writer.n_buffered, 5)
+
+        writer.close()
+        self.assertEqual(self.project.count('detection'), 25)
+        self.assertEqual(writer.n_buffered, 0)
+
+        table = self.project.dbTables['detection'].__table__
+        rows = self.project.dbEngine.execute(sqa.select([table]).order_by(table.c.start_time)).fetchall()
+        self.assertEqual([x.start_time for x in rows], [(self.start_time + k).timestamp for k in range(25)])
+        self.assertEqual(rows[0].method, 'test')
+        self.assertEqual(rows[0].agency_uri, 'at.uot')
+
+
+    def test_flush_interval(self):
+        ''' Test the write of the rows when the flush interval has passed.
+        '''
+        writer = DetectionWriter(project = self.project, flush_size = 1000,
+                                 flush_interval = 0.)
+        writer.add_event(start_time = self.start_time,
+                         end_time = self.start_time + 1,
+                         comment = 'test')
+        self.assertEqual(self.project.count('event'), 1)
+        self.assertEqual(writer.n_buffered, 0)
+
+
+    def test_flush_on_error(self):
+        ''' Test the write of the buffered rows if an error occurs.
+        '''
+        def run():
+            with DetectionWriter(project = self.project) as writer:
+                writer.add_detection(start_time = self.start_time,
+                                     end_time = self.start_time + 1,
+                                     method = 'test')
+                writer.add_event(start_time = self.start_time,
+                                 end_time = self.start_time + 1)
+                raise RuntimeError('detection failed')
+
+        self.assertRaises(RuntimeError, run)
+        self.assertEqual(self.project.count('detection'), 1)
+        self.assertEqual(self.project.count('event'), 1)
+
+
+    def test_checkpoint(self):
+        ''' Test the write of the checkpoints together with the rows.
+        '''
+        scnl = ('ST01', 'HHZ', 'XX', None)
+        writer = DetectionWriter(project = self.project, flush_size = 1000,
+                                 flush_interval = 3600.)
+        for k in range(3):
+            with writer.batch():
+                writer.add_detection(start_time = self.start_time + k * 10,
+                                     end_time = self.start_time + k * 10 + 1,
+                                     method = 'test',
+                                     run_id = 'run_1')
+                writer.set_checkpoint(run_id = 'run_1',
+                                      job = 'test',
+                                      scnl = scnl,
+                                      resume_time = self.start_time + k * 10 + 5,
+                                      written_time = self.start_time + k * 10 + 10)
+        self.assertEqual(load_checkpoints(self.project, run_id = 'run_1', job = 'test'), {})
+
+        writer.flush()
+        self.assertEqual(self.project.count('detection'), 3)
+        self.assertEqual(self.project.count('job_checkpoint'), 1)
+        checkpoints = load_checkpoints(self.project, run_id = 'run_1', job = 'test')
+        self.assertEqual(checkpoints, {('ST01', 'HHZ', 'XX', ''): (self.start_time + 25,
+                                                                   self.start_time + 30)})
+
+        # The rows and checkpoint of a failed batch are discarded.
+        def run():
+            with writer.batch():
+                writer.add_detection(start_time = self.start_time + 40,
+                                     end_time = self.start_time + 41,
+                                     method = 'test',
+                                     run_id = 'run_1')
+                writer.set_checkpoint(run_id = 'run_1',
+                                      job = 'test',
+                                      scnl = scnl,
+                                      resume_time = self.start_time + 45,
+                                      written_time = self.start_time + 50)
+                raise RuntimeError('detection failed')
+
+        self.assertRaises(RuntimeError, run)
+        self.assertEqual(writer.n_buffered, 0)
+        writer.close()
+        self.assertEqual(self.project.count('detection'), 3)
+        checkpoints = load_checkpoints(self.project, run_id = 'run_1', job = 'test')
+        self.assertEqual(checkpoints[('ST01', 'HHZ', 'XX', '')][1], self.start_time + 30)
+
+
+
+def suite():
+    return unittest.makeSuite(DetectionWriterTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
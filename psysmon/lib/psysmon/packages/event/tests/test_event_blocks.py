@@ -0,0 +1,199 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from obspy.core import Trace, Stream
+from obspy.core.utcdatetime import UTCDateTime
+
+from psysmon.packages.event.core import Event
+from psysmon.packages.event.event_processor import EventProcessor
+from psysmon.packages.event.pn_amplitude_features import ComputeAmplitudeFeatures
+from psysmon.core.processingStack import ProcessingStack
+from psysmon.core.processingStack import ResultBag
+from psysmon.packages.event.job_checkpoint import load_checkpoints
+from psysmon.packages.event.job_checkpoint import load_last_ids
+from psysmon.packages.event.job_checkpoint import NO_SCNL
+from psysmon.packages.event.tests.db_project import DbProject
+
+
+class StreamProject(object):
+    ''' A project providing the data of a stream.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rid = '/project/test'
+
+    def init_worker_process(self):
+        pass
+
+    def request_data_stream(self, start_time, end_time, scnl, read_only = False):
+        return self.stream.slice(starttime = start_time, endtime = end_time)
+
+
+class EventBlocksTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.packages.event.event_processor.EventProcessor.get_event_blocks
+    """
+
+    def setUp(self):
+        self.start_time = UTCDateTime('2015-01-01T00:00:00')
+        self.processor = EventProcessor(project = None, output_dir = '')
+
+
+    def test_event_blocks(self):
+        ''' Test the grouping of the events into blocks.
+        '''
+        limits = [(100, 110), (3000, 3010), (3590, 3605), (3600, 7800),
+                  (3700, 3710), (9000, 9005)]
+        events = [Event(start_time = self.start_time + x[0],
+                        end_time = self.start_time + x[1]) for x in limits]
+        blocks = self.processor.get_event_blocks(events = events,
+                                                 pre_event_time = 20,
+                                                 post_event_time = 10,
+                                                 block_length = 3600)
+
+        self.assertEqual(len(blocks), 3)
+
+        # The event crossing the hour is included in the first block
+        # including its post-event time.
+        self.assertEqual(blocks[0][0], self.start_time + 80)
+        self.assertEqual(blocks[0][1], self.start_time + 3615)
+        self.assertEqual(blocks[0][2], events[:3])
+
+        # An event longer than the block length gets its own block which
+        # also contains the events inside its time span.
+        self.assertEqual(blocks[1][0], self.start_time + 3580)
+        self.assertEqual(blocks[1][1], self.start_time + 7810)
+        self.assertEqual(blocks[1][2], events[3:5])
+
+        self.assertEqual(blocks[2][0], self.start_time + 8980)
+        self.assertEqual(blocks[2][1], self.start_time + 9015)
+        self.assertEqual(blocks[2][2], events[5:])
+
+        # All events are contained in their block.
+        for block_start, block_end, block_events in blocks:
+            for cur_event in block_events:
+                self.assertTrue(cur_event.start_time - 20 >= block_start)
+                self.assertTrue(cur_event.end_time + 10 <= block_end)
+
+
+    def test_parallel_processing(self):
+        ''' Test that the parallel processing equals the serial processing.
+        '''
+        np.random.seed(42)
+        traces = []
+        for cur_station in ['ST01', 'ST02']:
+            cur_trace = Trace(data = np.random.randn(3 * 3600 * 10))
+            cur_trace.stats.station = cur_station
+            cur_trace.stats.channel = 'HHZ'
+            cur_trace.stats.network = 'XX'
+            cur_trace.stats.sampling_rate = 10.
+            cur_trace.stats.starttime = self.start_time
+            traces.append(cur_trace)
+        project = StreamProject(Stream(traces = traces))
+        scnl = [(x.stats.station, x.stats.channel, x.stats.network, x.stats.location) for x in traces]
+
+        events = []
+        for k, cur_start in enumerate(range(100, 10000, 700)):
+            events.append(Event(start_time = self.start_time + cur_start,
+                                end_time = self.start_time + cur_start + 30,
+                                db_id = k + 1))
+
+        csv_files = []
+        for n_workers in [1, 3]:
+            processing_stack = ProcessingStack(name = 'pstack',
+                                               project = project,
+                                               nodes = [ComputeAmplitudeFeatures(), ])
+            processor = EventProcessor(project = project, output_dir = '',
+                                       processing_stack = processing_stack)
+            blocks = processor.get_event_blocks(events = events,
+                                                pre_event_time = 20,
+                                                post_event_time = 10,
+                                                block_length = 3600)
+            self.assertTrue(len(blocks) > 1)
+
+            result_bag = ResultBag()
+            processed = []
+            for cur_event, resource_id, results in processor.iter_block_results(blocks = blocks,
+                                                                                  scnl = scnl,
+                                                                                  pre_event_time = 20,
+                                                                                  post_event_time = 10,
+                                                                                  n_workers = n_workers):
+                processed.append(cur_event)
+                result_bag.add(resource_id = resource_id, results = results)
+            self.assertEqual(processed, events)
+
+            output_dir = tempfile.mkdtemp()
+            try:
+                result_bag.save(output_dir = output_dir, scnl = scnl)
+                cur_files = {}
+                for cur_name in os.listdir(output_dir):
+                    with open(os.path.join(output_dir, cur_name), 'rb') as fid:
+                        cur_files[cur_name] = fid.read()
+                csv_files.append(cur_files)
+            finally:
+                shutil.rmtree(output_dir)
+
+        self.assertTrue(len(csv_files[0]) > 0)
+        self.assertEqual(csv_files[0], csv_files[1])
+
+
+    def test_resume_events(self):
+        ''' Test the events remaining after the checkpoint of an interrupted run.
+        '''
+        project = DbProject()
+        processor = EventProcessor(project = project, output_dir = '')
+        limits = [(100, 110, 1), (200, 210, 3), (200, 205, 2), (200, 220, 5), (300, 310, 4)]
+        events = [Event(start_time = self.start_time + x[0],
+                        end_time = self.start_time + x[1],
+                        db_id = x[2]) for x in limits]
+        events = sorted(events, key = lambda x: (x.start_time, x.db_id))
+        self.assertEqual([x.db_id for x in events], [1, 2, 3, 5, 4])
+
+        # The run was interrupted after the second of the events starting
+        # at 200 s.
+        processor.write_checkpoint(run_id = 'run_1', last_event = events[2])
+        resume_time = load_checkpoints(project, run_id = 'run_1',
+                                       job = processor.job_name)[NO_SCNL][1]
+        last_id = load_last_ids(project, run_id = 'run_1',
+                                job = processor.job_name)[NO_SCNL]
+        self.assertEqual(resume_time, self.start_time + 200)
+        self.assertEqual(last_id, 3)
+        pending = [x for x in events if processor.is_pending(x, resume_time, last_id)]
+        self.assertEqual([x.db_id for x in pending], [5, 4])
+
+        # A checkpoint without an event id skips all events starting at
+        # the resume time.
+        pending = [x for x in events if processor.is_pending(x, resume_time, None)]
+        self.assertEqual([x.db_id for x in pending], [4, ])
+
+
+def suite():
+    return unittest.makeSuite(EventBlocksTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -122,6 +122,37 @@ class EventCatalogTestCase(unittest.TestCase):
         self.assertEqual(event.parent, catalog)
 
 
+    def test_get_event(self):
+        ''' Test the get_event method.
+        '''
+        catalog = ev_core.Catalog(name = 'test')
+
+        start_time = UTCDateTime('2000-01-01T00:00:00')
+        events = []
+        for k in range(10):
+            events.append(ev_core.Event(start_time = start_time + k * 60,
+                                        end_time = start_time + k * 60 + 90,
+                                        db_id = k + 1))
+        catalog.add_events(events[::-1])
+
+        self.assertEqual(catalog.get_event(), events)
+        self.assertEqual(catalog.get_event(db_id = 3), [events[2], ])
+
+        # The events overlapping the time span are returned.
+        cur_events = catalog.get_event(start_time = start_time + 130,
+                                       end_time = start_time + 200)
+        self.assertEqual(cur_events, events[1:4])
+
+        # The index is updated when changing an event.
+        events[0].start_time = start_time + 1000
+        events[0].end_time = start_time + 1010
+        catalog.reindex_events([events[0], ])
+        self.assertEqual(catalog.get_event(start_time = start_time + 1005), [events[0], ])
+
+        catalog.clear_events()
+        self.assertEqual(catalog.get_event(), [])
+
+
     def test_write_to_database(self):
         ''' Test the write_to_database method.
         '''
@@ -198,6 +229,90 @@ class EventCatalogTestCase(unittest.TestCase):
         self.assertEqual(tmp.events[1].ev_catalog_id, catalog.db_id)
 
 
+    def test_bulk_write_events(self):
+        ''' Test the bulk writing of the catalog events in chunks.
+        '''
+        catalog = ev_core.Catalog(name = 'test')
+        catalog.write_to_database(self.project)
+
+        start_time = UTCDateTime('2000-01-01T00:00:00')
+        events = []
+        for k in range(25):
+            events.append(ev_core.Event(start_time = start_time + k * 60,
+                                        end_time = start_time + k * 60 + 10,
+                                        public_id = 'ev_%02d' % k))
+        catalog.add_events(events)
+        ids = catalog.write_events_to_database(self.project,
+                                               events = events,
+                                               chunk_size = 10)
+
+        self.assertEqual(ids, [x.db_id for x in events])
+        self.assertEqual(len(set(ids)), 25)
+        self.assertTrue(all([x.changed is False for x in events]))
+        self.assertEqual(catalog.get_event(db_id = ids[3]), [events[3], ])
+
+        # Change some events and update them in the database.
+        events[3].end_time = start_time + 200
+        events[3].changed = True
+        events[20].public_id = 'changed'
+        events[20].changed = True
+        catalog.write_to_database(self.project)
+
+        db_event_orm = self.project.dbTables['event']
+        db_session = self.project.getDbSession()
+        result = db_session.query(db_event_orm).order_by(db_event_orm.id).all()
+        db_session.close()
+        self.assertEqual(len(result), 25)
+        self.assertEqual([x.public_id for x in result][19:22], ['ev_19', 'changed', 'ev_21'])
+        self.assertEqual(result[3].end_time, (start_time + 200).timestamp)
+        self.assertEqual(result[4].end_time, (start_time + 250).timestamp)
+
+
+    def test_load_events(self):
+        ''' Test the paged loading of the events from the database.
+        '''
+        catalog = ev_core.Catalog(name = 'test')
+        catalog.write_to_database(self.project)
+
+        start_time = UTCDateTime('2000-01-01T00:00:00')
+        events = []
+        for k in range(25):
+            events.append(ev_core.Event(start_time = start_time + k * 60,
+                                        end_time = start_time + k * 60 + k + 1))
+        catalog.add_events(events)
+        catalog.write_to_database(self.project)
+        ids = [x.db_id for x in events]
+
+        load_catalog = ev_core.Catalog(name = 'load',
+                                       db_id = catalog.db_id)
+        load_catalog.load_events(self.project, page_size = 10)
+        self.assertEqual([x.db_id for x in load_catalog.events], ids)
+
+        # Load the events with the given ids.
+        load_catalog.clear_events()
+        load_catalog.load_events(self.project,
+                                 event_id = ids[5:8],
+                                 page_size = 2)
+        self.assertEqual([x.db_id for x in load_catalog.events], ids[5:8])
+
+        # Iterate over the events without adding them to the catalog.
+        load_catalog.clear_events()
+        cur_events = list(load_catalog.iter_events(self.project,
+                                                   start_time = start_time + 600,
+                                                   min_event_length = 15,
+                                                   page_size = 3))
+        self.assertEqual([x.db_id for x in cur_events], ids[14:])
+        self.assertEqual(load_catalog.events, [])
+
+        # Load the events as a structured array.
+        event_array = load_catalog.load_event_array(self.project, page_size = 7)
+        self.assertEqual(len(event_array), 25)
+        self.assertEqual(list(event_array['id']), ids)
+        self.assertEqual(list(event_array['end_time'] - event_array['start_time']),
+                         range(1, 26))
+        self.assertEqual(list(event_array['ev_type_id']), [-1] * 25)
+
+
 
     def test_write_bulletin_to_database(self):
         ''' Test the import of a bulletin into the database.
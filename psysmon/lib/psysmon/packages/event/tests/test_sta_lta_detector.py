@@ -0,0 +1,487 @@
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import multiprocessing
+
+import numpy as np
+from obspy.core import Trace, Stream
+from obspy.core.utcdatetime import UTCDateTime
+
+from psysmon.packages.event.detect_sta_lta import StaLtaDetector
+from psysmon.packages.event.detect_sta_lta import StaLtaState
+from psysmon.packages.tracedisplay.processingNodes import filter_stateful
+from psysmon.packages.tracedisplay.processingNodes import FilterBandPass
+from psysmon.packages.tracedisplay.processingNodes import Detrend
+from psysmon.core.processingStack import ProcessingStack
+from psysmon.core.waveclient import get_chunk_windows
+
+
+class TraceProject(object):
+    ''' A project providing the data of a stream in chunks.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def init_worker_process(self):
+        pass
+
+    def iter_data_stream(self, start_time, end_time, scnl, chunk_length,
+                         overlap = 0., read_only = False):
+        self.overlap = overlap
+        for window_start, window_end in get_chunk_windows(start_time, end_time, chunk_length):
+            stream = Stream()
+            # The chunks include their end time like the chunks of the
+            # waveclients.
+            for cur_trace in self.stream:
+                stream += cur_trace.slice(window_start - overlap, window_end)
+            yield (window_start, window_end, stream)
+
+
+class GatedTraceProject(TraceProject):
+    ''' A project waiting for a gate before providing the last chunk.
+    '''
+
+    def __init__(self, stream, gate):
+        TraceProject.__init__(self, stream)
+        self.gate = gate
+
+    def iter_data_stream(self, start_time, end_time, scnl, chunk_length,
+                         overlap = 0., read_only = False):
+        for window_start, window_end, stream in TraceProject.iter_data_stream(self, start_time, end_time,
+                                                                              scnl, chunk_length,
+                                                                              overlap = overlap,
+                                                                              read_only = read_only):
+            if window_end >= end_time and not self.gate.wait(5):
+                raise RuntimeError("The results of the first chunks have not been received.")
+            yield (window_start, window_end, stream)
+
+
+class StaLtaDetectorTestCase(unittest.TestCase):
+    """
+    Test suite for psysmon.packages.event.detect_sta_lta.StaLtaDetector
+    """
+
+    def setUp(self):
+        self.start_time = UTCDateTime('2015-01-01T00:00:00')
+        self.sps = 100.
+        np.random.seed(42)
+        self.data = np.random.randn(int(600 * self.sps))
+        # Add events, the second one spans the chunk limit at 300 s.
+        for cur_start in [100, 295, 450]:
+            ind = int(cur_start * self.sps)
+            self.data[ind:ind + int(10 * self.sps)] *= 20
+
+
+    def create_trace(self, start_ind, end_ind):
+        ''' Create a trace of a part of the test data.
+        '''
+        trace = Trace(data = self.data[start_ind:end_ind].copy())
+        trace.stats.station = 'STAT'
+        trace.stats.channel = 'HHZ'
+        trace.stats.network = 'XX'
+        trace.stats.sampling_rate = self.sps
+        trace.stats.starttime = self.start_time + start_ind / self.sps
+        return trace
+
+
+    def detect(self, chunk_length):
+        ''' Run the detection on consecutive chunks of the test data.
+        '''
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3)
+        state = StaLtaState()
+        n_chunk = int(chunk_length * self.sps)
+        detections = []
+        for start_ind in range(0, len(self.data), n_chunk):
+            trace = self.create_trace(start_ind, start_ind + n_chunk)
+            detections.extend(detector.process_trace(trace, state = state,
+                                                     valid_from = self.start_time + 10))
+        detections.extend(state.close_events())
+        return sorted(detections)
+
+
+    def test_chunked_detection(self):
+        ''' Test that the chunked detection equals the single pass detection.
+        '''
+        single = self.detect(chunk_length = 600)
+        chunked = self.detect(chunk_length = 300)
+        self.assertEqual(len(single), len(chunked))
+        for (single_start, single_end), (chunk_start, chunk_end) in zip(single, chunked):
+            self.assertAlmostEqual(single_start.timestamp, chunk_start.timestamp, places = 4)
+            self.assertAlmostEqual(single_end.timestamp, chunk_end.timestamp, places = 4)
+
+        # The event spanning the chunk limit is not split.
+        spanning = [x for x in chunked if x[0] < self.start_time + 300 < x[1]]
+        self.assertEqual(len(spanning), 1)
+        self.assertTrue(spanning[0][0] >= self.start_time + 295)
+
+
+    def detect_scnl(self, nodes, intervals):
+        ''' Run the detection of a SCNL using a processing stack.
+        '''
+        # Add an offset to the data.
+        trace = self.create_trace(0, len(self.data))
+        trace.data += 100.
+        project = TraceProject(Stream(traces = [trace, ]))
+        scnl = ('STAT', 'HHZ', 'XX', '')
+
+        results = {}
+        for cur_interval in intervals:
+            detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                      lta_len = 10, thr = 3, project = project,
+                                      processing_stack = ProcessingStack(name = 'pstack',
+                                                                         project = project,
+                                                                         nodes = nodes))
+            detections = []
+            detector.detect_scnl(start_time = self.start_time + 10,
+                                 end_time = self.start_time + 600,
+                                 scnl = [scnl, ],
+                                 interval = cur_interval,
+                                 callback = lambda x, y, checkpoint = None: detections.extend(x))
+            results[cur_interval] = sorted(detections)
+        return results, project
+
+
+    def test_chunked_detect_scnl(self):
+        ''' Test that the chunked detection of a SCNL equals a single pass.
+        '''
+        filter_node = FilterBandPass()
+        filter_node.pref_manager.set_value('max. frequ.', 20)
+        results, project = self.detect_scnl(nodes = [filter_node, ],
+                                            intervals = [600, 100, 37])
+        # The stateful stack is continued without a preceding window.
+        self.assertEqual(project.overlap, 0)
+
+        single = results[600]
+        self.assertTrue(len(single) >= 3)
+        # The event at the start of the second chunk is detected and the
+        # event spanning the chunk limit is not split.
+        self.assertTrue(any([x[0] <= self.start_time + 101 and x[1] >= self.start_time + 109 for x in single]))
+        self.assertTrue(any([x[0] <= self.start_time + 296 and x[1] >= self.start_time + 304 for x in single]))
+        for cur_interval in [100, 37]:
+            chunked = results[cur_interval]
+            self.assertEqual(len(chunked), len(single))
+            for (single_start, single_end), (chunk_start, chunk_end) in zip(single, chunked):
+                self.assertAlmostEqual(single_start.timestamp, chunk_start.timestamp, places = 4)
+                self.assertAlmostEqual(single_end.timestamp, chunk_end.timestamp, places = 4)
+
+
+    def test_chunked_detect_scnl_pre_roll(self):
+        ''' Test the chunked detection with a processing stack which is not stateful.
+        '''
+        detrend_node = Detrend()
+        filter_node = FilterBandPass()
+        filter_node.pref_manager.set_value('max. frequ.', 20)
+        results, project = self.detect_scnl(nodes = [detrend_node, filter_node],
+                                            intervals = [600, 100])
+        # Each chunk is processed with a preceding window of length lta_len.
+        self.assertEqual(project.overlap, 10)
+
+        single = results[600]
+        chunked = results[100]
+        self.assertTrue(len(single) >= 3)
+        self.assertEqual(len(chunked), len(single))
+        for (single_start, single_end), (chunk_start, chunk_end) in zip(single, chunked):
+            self.assertAlmostEqual(single_start.timestamp, chunk_start.timestamp, delta = 0.1)
+        # The event spanning the chunk limit is not split.
+        self.assertTrue(any([x[0] <= self.start_time + 296 and x[1] >= self.start_time + 304 for x in chunked]))
+
+
+    def test_event_limits(self):
+        ''' Test the single pass event limits against a direct search.
+        '''
+        detector = StaLtaDetector(thr = 1.)
+        np.random.seed(1)
+        thrf = np.random.rand(5000) * 2
+        sta = np.random.rand(5000)
+
+        state = StaLtaState()
+        event_marker, open_end = detector.compute_event_limits(thrf, sta,
+                                                               state = state,
+                                                               first_valid = 20,
+                                                               stop_delay = 10)
+        event_on = thrf >= 1.
+        event_on[:20] = True
+        event_start = np.flatnonzero(event_on[1:] & ~event_on[:-1]) + 1
+        # More events than the initial buffer size.
+        self.assertTrue(len(event_start) > 256)
+        self.assertEqual([x[0] for x in event_marker], list(event_start))
+        for cur_start, cur_end, cur_stop in event_marker:
+            self.assertEqual(cur_stop, sta[max(cur_start - 10, 0)])
+            end_ind = np.flatnonzero(sta[cur_start:] < cur_stop)
+            if len(end_ind) > 0:
+                self.assertEqual(cur_end, cur_start + end_ind[0])
+            else:
+                self.assertIsNone(cur_end)
+        self.assertEqual(open_end, [])
+        self.assertEqual(state.event_on, bool(event_on[-1]))
+
+        # The open events are ended in the same pass as the new events.
+        state.open_events = [(None, 0.999), (None, 0.001)]
+        state.event_on = True
+        event_marker, open_end = detector.compute_event_limits(thrf, sta,
+                                                               state = state,
+                                                               stop_delay = 10)
+        self.assertTrue(len(event_marker) > 256)
+        self.assertEqual(open_end, [np.flatnonzero(sta < 0.999)[0], np.flatnonzero(sta < 0.001)[0]])
+        np.testing.assert_array_equal(state.sta_tail, sta[-10:])
+
+
+    def test_gap_resets_state(self):
+        ''' Test the reset of the state at a data gap.
+        '''
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3)
+        state = StaLtaState()
+        detector.process_trace(self.create_trace(0, 30000), state = state)
+        self.assertEqual(state.n_processed, 30000)
+        self.assertEqual(len(state.open_events), 1)
+
+        # A trace following a gap ends the open event at the gap.
+        detections = detector.process_trace(self.create_trace(31000, 40000), state = state)
+        self.assertEqual(detections[0][1], self.start_time + 29999 / self.sps)
+        self.assertEqual(state.n_processed, 9000)
+
+
+    def test_parallel_detection(self):
+        ''' Test that the parallel detection equals the serial detection.
+        '''
+        traces = []
+        for k, cur_station in enumerate(['ST01', 'ST02', 'ST03']):
+            cur_trace = self.create_trace(0, len(self.data))
+            cur_trace.data = np.roll(cur_trace.data, k * 5000)
+            cur_trace.stats.station = cur_station
+            traces.append(cur_trace)
+        project = TraceProject(Stream(traces = traces))
+        scnl = [(x.stats.station, x.stats.channel, x.stats.network, x.stats.location) for x in traces]
+
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3, project = project,
+                                  processing_stack = ProcessingStack(name = 'pstack',
+                                                                     project = project,
+                                                                     nodes = []))
+        serial = []
+        detector.detect_scnl(start_time = self.start_time + 10,
+                             end_time = self.start_time + 600,
+                             scnl = scnl,
+                             interval = 100,
+                             callback = lambda x, y, checkpoint = None: serial.extend([(y, ) + z for z in x]))
+
+        parallel = []
+        checkpoints = {}
+        def collect(detections, cur_scnl, checkpoint = None):
+            parallel.extend([(cur_scnl, ) + z for z in detections])
+            checkpoints.setdefault(cur_scnl, []).append(checkpoint)
+        detector.detect_parallel(start_time = self.start_time + 10,
+                                 end_time = self.start_time + 600,
+                                 scnl = scnl,
+                                 interval = 100,
+                                 n_workers = 2,
+                                 callback = collect)
+
+        self.assertTrue(len(serial) > 0)
+        self.assertEqual(sorted(serial), sorted(parallel))
+
+        # The event of ST01 at 295 s spans the interval limit at 300 s and
+        # must not be split by the workers.
+        st01 = [x for x in parallel if x[0][0] == 'ST01']
+        self.assertTrue(any([x[1] <= self.start_time + 296 and x[2] >= self.start_time + 304 for x in st01]))
+
+        # The results are passed to the callback per interval with the
+        # checkpoints in increasing order.
+        for cur_scnl in scnl:
+            cur_checkpoints = checkpoints[cur_scnl]
+            written_times = [x[1] for x in cur_checkpoints if x is not None]
+            self.assertTrue(len(written_times) >= 5)
+            self.assertEqual(written_times, sorted(written_times))
+
+
+    def test_parallel_detection_streaming(self):
+        ''' Test that the parallel results are received while the workers run.
+        '''
+        trace = self.create_trace(0, len(self.data))
+        scnl = (trace.stats.station, trace.stats.channel, trace.stats.network, trace.stats.location)
+        gate = multiprocessing.Event()
+        project = GatedTraceProject(Stream(traces = [trace, ]), gate)
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3, project = project,
+                                  processing_stack = ProcessingStack(name = 'pstack',
+                                                                     project = project,
+                                                                     nodes = []))
+
+        # The worker waits for the gate before processing the last
+        # interval. The gate is opened by the callback of the first
+        # interval.
+        results = []
+        def collect(detections, cur_scnl, checkpoint = None):
+            results.append(detections)
+            gate.set()
+        detector.detect_parallel(start_time = self.start_time + 10,
+                                 end_time = self.start_time + 600,
+                                 scnl = [scnl, ],
+                                 interval = 100,
+                                 n_workers = 1,
+                                 callback = collect)
+        self.assertTrue(len(results) >= 5)
+
+        # An error of a worker is raised in the calling process.
+        gate.clear()
+        self.assertRaises(RuntimeError, detector.detect_parallel,
+                          start_time = self.start_time + 10,
+                          end_time = self.start_time + 600,
+                          scnl = [scnl, ],
+                          interval = 100,
+                          n_workers = 1,
+                          callback = lambda x, y, checkpoint = None: None)
+
+
+    def test_resume_detection(self):
+        ''' Test the resume of an interrupted detection at a checkpoint.
+        '''
+        trace = self.create_trace(0, len(self.data))
+        project = TraceProject(Stream(traces = [trace, ]))
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3, project = project,
+                                  processing_stack = ProcessingStack(name = 'pstack',
+                                                                     project = project,
+                                                                     nodes = []))
+        results = []
+        detector.detect_scnl(start_time = self.start_time + 10,
+                             end_time = self.start_time + 600,
+                             scnl = [scnl, ],
+                             interval = 100,
+                             callback = lambda x, y, checkpoint = None: results.append((x, checkpoint)))
+        complete = sorted([z for x in results for z in x[0]])
+
+        # Interrupt the detection after the interval ending at 300 s. The
+        # event starting at 295 s is still open at the checkpoint.
+        n_done = [x[1][1] for x in results].index(self.start_time + 300) + 1
+        resume_time, written_time = results[n_done - 1][1]
+        self.assertTrue(resume_time < self.start_time + 300)
+        self.assertTrue(resume_time >= self.start_time + 294)
+
+        detections = [z for x in results[:n_done] for z in x[0]]
+        resumed = []
+        detector.detect_scnl(start_time = resume_time,
+                             end_time = self.start_time + 600,
+                             scnl = [scnl, ],
+                             interval = 100,
+                             callback = lambda x, y, checkpoint = None: resumed.extend(x))
+        detections.extend([x for x in resumed if x[1] >= written_time])
+        detections = sorted(detections)
+
+        self.assertEqual(len(detections), len(complete))
+        for (exp_start, exp_end), (cur_start, cur_end) in zip(complete, detections):
+            self.assertAlmostEqual(exp_start.timestamp, cur_start.timestamp, places = 4)
+            self.assertAlmostEqual(exp_end.timestamp, cur_end.timestamp, places = 4)
+
+
+    def test_resume_detection_filter(self):
+        ''' Test the resume of a detection using a filter.
+
+        The filter state is not stored in the checkpoint. The filter of the
+        resumed detection starts from rest lta_len before the resume time.
+        '''
+        trace = self.create_trace(0, len(self.data))
+        project = TraceProject(Stream(traces = [trace, ]))
+        scnl = ('STAT', 'HHZ', 'XX', '')
+        filter_node = FilterBandPass()
+        filter_node.pref_manager.set_value('max. frequ.', 20)
+        detector = StaLtaDetector(cf_type = 'square', sta_len = 1,
+                                  lta_len = 10, thr = 3, project = project,
+                                  processing_stack = ProcessingStack(name = 'pstack',
+                                                                     project = project,
+                                                                     nodes = [filter_node, ]))
+        results = []
+        detector.detect_scnl(start_time = self.start_time + 10,
+                             end_time = self.start_time + 600,
+                             scnl = [scnl, ],
+                             interval = 100,
+                             callback = lambda x, y, checkpoint = None: results.append((x, checkpoint)))
+        complete = sorted([z for x in results for z in x[0]])
+
+        n_done = [x[1][1] for x in results].index(self.start_time + 300) + 1
+        resume_time, written_time = results[n_done - 1][1]
+        detections = [z for x in results[:n_done] for z in x[0]]
+        resumed = []
+        detector.detect_scnl(start_time = resume_time,
+                             end_time = self.start_time + 600,
+                             scnl = [scnl, ],
+                             interval = 100,
+                             callback = lambda x, y, checkpoint = None: resumed.extend(x))
+        detections.extend([x for x in resumed if x[1] >= written_time])
+        detections = sorted(detections)
+
+        # The filter transient has decayed within lta_len, the detections
+        # differ by not more than one sample.
+        self.assertEqual(len(detections), len(complete))
+        for (exp_start, exp_end), (cur_start, cur_end) in zip(complete, detections):
+            self.assertAlmostEqual(exp_start.timestamp, cur_start.timestamp, delta = 1. / self.sps)
+            self.assertAlmostEqual(exp_end.timestamp, cur_end.timestamp, delta = 1. / self.sps)
+
+
+    def test_stateful_filter(self):
+        ''' Test the continuation of the filter state.
+        '''
+        single = Stream(traces = [self.create_trace(0, 60000)])
+        filter_stateful(single, {}, 'bandpass', corners = 4, freqmin = 1, freqmax = 10)
+
+        state = {}
+        chunked = []
+        for start_ind in range(0, 60000, 7000):
+            cur_stream = Stream(traces = [self.create_trace(start_ind, start_ind + 7000)])
+            filter_stateful(cur_stream, state, 'bandpass', corners = 4, freqmin = 1, freqmax = 10)
+            chunked.append(cur_stream[0].data)
+
+        np.testing.assert_allclose(np.concatenate(chunked), single[0].data, atol = 1e-10)
+
+
+    def test_stateful_stack(self):
+        ''' Test the check of the processing stack state.
+        '''
+        filter_node = FilterBandPass()
+        stack = ProcessingStack(name = 'pstack', project = None,
+                                nodes = [filter_node, ])
+        self.assertTrue(stack.is_stateful())
+
+        # A zero phase filter can't be continued.
+        filter_node.pref_manager.set_value('zero_phase', True)
+        self.assertFalse(stack.is_stateful())
+        filter_node.pref_manager.set_value('zero_phase', False)
+
+        # The detrend depends on the whole processed data.
+        detrend_node = Detrend()
+        stack = ProcessingStack(name = 'pstack', project = None,
+                                nodes = [detrend_node, filter_node])
+        self.assertFalse(stack.is_stateful())
+        detrend_node.toggleEnabled()
+        self.assertTrue(stack.is_stateful())
+
+
+
+def suite():
+    return unittest.makeSuite(StaLtaDetectorTestCase, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -255,35 +255,33 @@ class ComputePpsdNode(psysmon.core.packageNodes.CollectionNode):
                 paz['poles'] = comp_param.tf_poles
                 paz['zeros'] = comp_param.tf_zeros
 
-                # Get the waveform data. Split the request into days to avoid
-                # memory overload.
-                days_between = (cur_end_time - cur_start_time) / 86400.
-                process_days = [cur_start_time + x * 86400 for x in range(0, int(days_between))]
-                cur_stream = obspy.core.Stream()
-                for cur_process_day in process_days:
-                    cur_process_end = cur_process_day + 86400
-                    self.logger.info('Load data stream for time interval: %s to %s.',
+                # Get the waveform data in daily chunks and add them to the
+                # ppsd one by one to avoid memory overload. The data of the
+                # next day is prefetched while the current day is processed.
+                ppsd = None
+                chunks = self.project.iter_data_stream(start_time = cur_start_time,
+                                                       end_time = cur_end_time,
+                                                       scnl = [cur_scnl,],
+                                                       chunk_length = 86400,
+                                                       read_only = True)
+                for cur_process_day, cur_process_end, cur_stream in chunks:
+                    if not cur_stream:
+                        continue
+
+                    if ppsd is None:
+                        # Create the ppsd instance.
+                        stats = cur_stream.traces[0].stats
+                        ppsd = obspy.signal.PPSD(stats, paz = paz, ppsd_length = ppsd_length);
+
+                    self.logger.info('Adding the data of time interval %s to %s to the ppsd.',
                                      cur_process_day.isoformat(),
                                      cur_process_end.isoformat())
+                    ppsd.add(cur_stream)
 
-                    st = self.project.request_data_stream(start_time = cur_process_day,
-                                                          end_time = cur_process_end,
-                                                          scnl = [cur_scnl,])
-                    st = st.copy()
-                    cur_stream += st
-
-
-                if not cur_stream:
+                if ppsd is None:
                     self.logger.info('No data found for the given timespan.')
                     continue
 
-                # Create the ppsd instance and add the stream.
-                stats = cur_stream.traces[0].stats
-                ppsd = obspy.signal.PPSD(stats, paz = paz, ppsd_length = ppsd_length);
-
-                self.logger.info("Adding the stream to the ppsd.")
-                ppsd.add(cur_stream)
-
                 ppsd_id = ppsd.id.replace('.','_')
                 output_dir = self.pref_manager.get_value('output_dir')
                 image_filename = os.path.join(output_dir, 'images', 'ppsd_%s_%s_%s.png' % (ppsd_id, cur_start_time.isoformat().replace(':',''), cur_end_time.isoformat().replace(':','')))
@@ -38,7 +38,6 @@ from psysmon.core.gui_preference_dialog import ListbookPrefDialog
 from psysmon.packages.tracedisplay.plugins_processingstack import PStackEditField
 from psysmon.core.processingStack import ProcessingStack
 
-import obspy.core
 from obspy.core.utcdatetime import UTCDateTime
 import matplotlib.mlab as mlab
 
@@ -214,12 +213,11 @@ class ComputePsdNode(psysmon.core.packageNodes.CollectionNode):
                                            project = self.project,
                                            nodes = self.pref_manager.get_value('processing_stack'))
 
-	# Split the timespan into processing chunks.
+        # Split the timespan into processing windows. Each window starts
+        # with the overlapping part of the previous window.
         overlap_length = window_length * (1 - window_overlap/100.)
-
+        pre_roll = window_length - overlap_length
         windows_between = int((end_time - start_time)/overlap_length)
-        window_list = [start_time + x * overlap_length for x in range(windows_between)]
-	window_list[0] = start_time
 
         # Process each SCNL
         for cur_scnl in self.pref_manager.get_value('scnl_list'):
@@ -242,8 +240,16 @@ class ComputePsdNode(psysmon.core.packageNodes.CollectionNode):
 
             psd_data = {}
 
-            # Compute the psd for each window.
-            for k, cur_window_start in enumerate(window_list):
+            # Compute the psd for each window. The data of the next window
+            # is prefetched while the current window is processed.
+            chunks = self.project.iter_data_stream(start_time = start_time + pre_roll,
+                                                   end_time = start_time + pre_roll + windows_between * overlap_length,
+                                                   scnl = [cur_scnl,],
+                                                   chunk_length = overlap_length,
+                                                   overlap = pre_roll,
+                                                   read_only = True)
+            for k, (chunk_start, chunk_end, cur_stream) in enumerate(chunks):
+                cur_window_start = start_time + k * overlap_length
                 self.logger.info("Computing window %s.", str(cur_window_start))
 
 
@@ -260,12 +266,6 @@ class ComputePsdNode(psysmon.core.packageNodes.CollectionNode):
                 geom_stream = cur_channel.get_stream(start_time = cur_window_start,
                                                      end_time = cur_window_start + window_length)
 
-                # Get the waveform data.
-                cur_stream = self.request_stream(start_time = cur_window_start,
-                                                 end_time = cur_window_start + window_length,
-                                                 scnl = [cur_scnl,])
-                cur_stream = cur_stream.copy()
-
                 if cur_stream:
                     self.logger.info("Processing stream %s.", cur_stream)
                     # Detrend the data.
@@ -358,31 +358,14 @@ class ComputePsdNode(psysmon.core.packageNodes.CollectionNode):
 
 
 
-    def request_stream(self, start_time, end_time, scnl):
+    def request_stream(self, start_time, end_time, scnl, read_only = False):
         ''' Request a data stream from the waveclient.
 
+        If read_only is True, the returned traces are read-only views of the
+        waveclient stock.
         '''
-        data_sources = {}
-        for cur_scnl in scnl:
-            if cur_scnl in self.project.scnlDataSources.keys():
-                if self.project.scnlDataSources[cur_scnl] not in data_sources.keys():
-                    data_sources[self.project.scnlDataSources[cur_scnl]] = [cur_scnl, ]
-                else:
-                    data_sources[self.project.scnlDataSources[cur_scnl]].append(cur_scnl)
-            else:
-                if self.project.defaultWaveclient not in data_sources.keys():
-                    data_sources[self.project.defaultWaveclient] = [cur_scnl, ]
-                else:
-                    data_sources[self.project.defaultWaveclient].append(cur_scnl)
-
-        stream = obspy.core.Stream()
-
-        for cur_name in data_sources.iterkeys():
-            curWaveclient = self.project.waveclient[cur_name]
-            curStream =  curWaveclient.getWaveform(startTime = start_time,
-                                                   endTime = end_time,
-                                                   scnl = scnl)
-            stream += curStream
-
-        return stream
+        return self.project.request_data_stream(start_time = start_time,
+                                                end_time = end_time,
+                                                scnl = scnl,
+                                                read_only = read_only)
 
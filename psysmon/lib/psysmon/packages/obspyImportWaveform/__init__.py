@@ -19,7 +19,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 name = "obspyImportWaveform"
-version = "0.0.2"
+version = "0.0.3"
 author = "Stefan Mertl"
 minPsysmonVersion = "0.0.1"
 description = "The obspyImportWaveform packages"
@@ -34,12 +34,17 @@ version 0.0.2 - 2016-01-27
 Removed the location field. The location and channel values in the obspy
 trace header is used to build the stream name LOCATION:CHANNEL.
 
+version 0.0.3 - 2026-10-18
+Added the end_time column and the indexes of the recorder stream time
+spans. The end time of existing traceheaders is computed when migrating the
+table.
+
 '''
 
 def databaseFactory(base):
     from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey
     from sqlalchemy.orm import relationship
-    from sqlalchemy import ForeignKeyConstraint, UniqueConstraint
+    from sqlalchemy import ForeignKeyConstraint, UniqueConstraint, Index
 
     tables = []
 
@@ -47,6 +52,8 @@ def databaseFactory(base):
     class Traceheader(base):
         __tablename__ = 'traceheader'
         __table_args__ = (
+                          Index('ix_th_stream_begin', 'recorder_serial', 'stream', 'begin_time'),
+                          Index('ix_th_stream_end', 'recorder_serial', 'stream', 'end_time'),
                           {'mysql_engine': 'InnoDB'}
                          )
 
@@ -62,6 +69,8 @@ def databaseFactory(base):
         numsamp = Column(Integer, nullable=False)
         begin_date = Column(String(26), nullable=False)
         begin_time = Column(Float(53), nullable=False)
+        end_time = Column(Float(53), nullable=True,
+                          info={'migration_value': lambda t: t.c.begin_time + t.c.numsamp * 1. / t.c.sps})
         agency_uri = Column(String(20))
         author_uri = Column(String(20))
         creation_time = Column(String(30))
@@ -36,6 +36,7 @@ import logging
 from psysmon.core.gui import psyContextMenu
 from psysmon.core.packageNodes import CollectionNode
 from psysmon.core.preferences_manager import CustomPrefItem
+from psysmon.core.waveclient import PsysmonDbWaveClient
 import wx
 import wx.aui
 from obspy.core import read, Trace, Stream
@@ -92,11 +93,21 @@ class ImportWaveform(CollectionNode):
         self.logger.debug('dbData: %s', dbData)
 
         if len(dbData) > 0:
+            # The time-span of the imported data.
+            start_time = op_utcdatetime.UTCDateTime(min([x.begin_time for x in dbData]))
+            end_time = op_utcdatetime.UTCDateTime(max([x.end_time for x in dbData]))
+
             dbSession = self.project.getDbSession()
             dbSession.add_all(dbData)
             dbSession.commit()
             dbSession.close()
 
+            # Invalidate the cached traceheaders of the imported time-span.
+            for cur_waveclient in self.project.waveclient.itervalues():
+                if isinstance(cur_waveclient, PsysmonDbWaveClient):
+                    cur_waveclient.header_cache.invalidate(start_time = start_time,
+                                                           end_time = end_time)
+
 
     ## Return a tuple of values to be inserted into the traceheader database.
     def getDbData(self, filename, format, Trace):
@@ -117,7 +128,7 @@ class ImportWaveform(CollectionNode):
             relativeFilename = relativeFilename[1:]
             labels = ['id', 'file_type', 'wf_id', 'filename', 'orig_path',
                       'network', 'recorder_serial', 'stream', 
-                      'sps', 'numsamp', 'begin_date', 'begin_time',
+                      'sps', 'numsamp', 'begin_date', 'begin_time', 'end_time',
                       'agency_uri', 'author_uri', 'creation_time']
             header2Insert = dict(zip(labels, (None, format, wfDirId,
                             relativeFilename, os.path.dirname(filename),
@@ -126,6 +137,7 @@ class ImportWaveform(CollectionNode):
                             Trace.stats.sampling_rate, Trace.stats.npts,
                             Trace.stats.starttime.isoformat(' '),
                             Trace.stats.starttime.timestamp,
+                            Trace.stats.starttime.timestamp + Trace.stats.npts / float(Trace.stats.sampling_rate),
                             self.project.activeUser.author_uri,
                             self.project.activeUser.agency_uri,
                             op_utcdatetime.UTCDateTime().isoformat())))
@@ -19,7 +19,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 name = "pick"                                 # The package name.
-version = "0.0.1"                               # The package version.
+version = "0.0.2"                               # The package version.
 author = "Stefan Mertl"                         # The package author.
 minPsysmonVersion = "0.0.1"                     # The minimum pSysmon version required.
 description = "Handle traveltime and amplitude picks."            # The package description.
@@ -34,6 +34,13 @@ plugin_modules = ['plugin_pick_tool', ]
 # Specify the module(s) where to search for processing node classes.
 processing_node_modules = []
 
+'''
+Database change history.
+version 0.0.2 - 2026-10-18
+Added the indexes of the pick times and the event picks.
+
+'''
+
 
 def databaseFactory(base):
     from sqlalchemy import Column
@@ -43,6 +50,7 @@ def databaseFactory(base):
     from sqlalchemy import Float
     from sqlalchemy import ForeignKey
     from sqlalchemy import UniqueConstraint
+    from sqlalchemy import Index
     from sqlalchemy.orm import relationship
 
     tables = []
@@ -85,6 +93,8 @@ def databaseFactory(base):
     class PickOrm(base):
         __tablename__ = 'pick'
         __table_args__ = (
+                          Index('ix_pick_catalog_time', 'catalog_id', 'time'),
+                          Index('ix_pick_event_label', 'ev_id', 'label'),
                           {'mysql_engine': 'InnoDb'}
                          )
 
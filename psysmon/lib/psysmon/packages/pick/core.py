@@ -20,10 +20,11 @@
 
 import logging
 import psysmon
+import psysmon.core.database_util as db_util
 import obspy.core.utcdatetime as utcdatetime
 import warnings
-import numpy as np
 import sqlalchemy
+from psysmon.core.indexing import TimeIndex
 
 
 
@@ -137,6 +138,24 @@ class Library(object):
 
 
 
+# The data type of the pick arrays returned by Catalog.load_pick_array.
+pick_array_dtype = [('id', 'i8'),
+                    ('stream_id', 'i8'),
+                    ('ev_id', 'i8'),
+                    ('time', 'f8'),
+                    ('amp1', 'f8'),
+                    ('amp2', 'f8')]
+
+
+def get_pick_station(pick):
+    ''' Get the name of the station of a pick.
+    '''
+    if pick.channel is None:
+        return None
+    return pick.channel.parent_station.name
+
+
+
 class Catalog(object):
 
     def __init__(self, name, mode = 'time', description = None,
@@ -176,6 +195,13 @@ class Catalog(object):
         # The picks of the catalog.
         self.picks = []
 
+        # The index of the picks used to search the picks.
+        self.pick_index = TimeIndex(start_key = lambda x: x.time.timestamp,
+                                    keys = {'db_id': lambda x: x.db_id,
+                                            'label': lambda x: x.label,
+                                            'event_id': lambda x: x.event_id,
+                                            'station': get_pick_station})
+
 
     def add_picks(self, picks):
         ''' Add one or more picks to the picks.
@@ -188,6 +214,21 @@ class Catalog(object):
         for cur_pick in picks:
             cur_pick.parent = self
         self.picks.extend(picks)
+        self.pick_index.add(picks)
+
+
+    def reindex_picks(self, picks):
+        ''' Update the index after changing the picks.
+
+        Call this method after changing the time, label, event_id, db_id
+        or channel of picks contained in the catalog.
+
+        Parameters
+        ----------
+        picks : list of :class:`Pick`
+            The changed picks.
+        '''
+        self.pick_index.update(picks)
 
 
     def get_pick(self, start_time = None, end_time = None, station = None, **kwargs):
@@ -212,49 +253,73 @@ class Catalog(object):
 
         event_id : Integer
             The ID of the event to which the pick is associated.
+
+        Returns
+        -------
+        picks : list of :class:`Pick`
+            The matching picks sorted by time.
+        '''
+        search_keys = self.get_search_keys(station = station, **kwargs)
+        if start_time is not None:
+            start_time = start_time.timestamp
+        if end_time is not None:
+            end_time = end_time.timestamp
+
+        return self.pick_index.query(start_time = start_time,
+                                     end_time = end_time,
+                                     **search_keys)
+
+
+    def get_nearest_pick(self, pick_time, start_time = None, end_time = None,
+                         station = None, **kwargs):
+        ''' Get the pick nearest to the specified pick time.
+
+        The picks to search can be limited using the arguments of
+        :meth:`get_pick`.
         '''
-        ret_picks = self.picks
+        search_keys = self.get_search_keys(station = station, **kwargs)
+        if start_time is not None:
+            start_time = start_time.timestamp
+        if end_time is not None:
+            end_time = end_time.timestamp
 
+        return self.pick_index.nearest(pick_time.timestamp,
+                                       start_time = start_time,
+                                       end_time = end_time,
+                                       **search_keys)
+
+
+    def get_search_keys(self, station = None, **kwargs):
+        ''' Get the values of the hash indexes to search.
+        '''
         valid_keys = ['db_id', 'label', 'event_id']
 
+        search_keys = {}
         for cur_key, cur_value in kwargs.iteritems():
             if cur_key in valid_keys:
-                ret_picks = [x for x in ret_picks if getattr(x, cur_key) == cur_value]
+                search_keys[cur_key] = cur_value
             else:
                 warnings.warn('Search attribute %s is not existing.' % cur_key, RuntimeWarning)
 
-        if start_time is not None:
-            ret_picks = [x for x in ret_picks if x.time >= start_time]
-
-        if end_time is not None:
-            ret_picks = [x for x in ret_picks if x.time <= end_time]
-
         if station is not None:
-            ret_picks = [x for x in ret_picks if x.channel.parent_station.name == station]
+            search_keys['station'] = station
 
-        return ret_picks
+        return search_keys
 
 
-    def get_nearest_pick(self, pick_time, **kwargs):
-        ''' Get the pick nearest to the specified pick time.
-        '''
-        picks = self.get_pick(**kwargs)
-        nearest_pick = None
-        if picks:
-            nearest_pick = picks[0]
-            dist = np.abs(pick_time - nearest_pick.time)
-            for cur_pick in picks[1:]:
-                cur_dist = np.abs(pick_time - cur_pick.time)
-                if cur_dist < dist:
-                    dist = cur_dist
-                    nearest_pick = cur_pick
-
-        return nearest_pick
+    def write_to_database(self, project, only_changed_picks = True, chunk_size = None):
+        ''' Write the catalog to the database.
 
+        The changed picks are written in bulk.
 
-    def write_to_database(self, project, only_changed_picks = True):
-        ''' Write the catalog to the database.
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
 
+        chunk_size : Integer
+            The number of picks written in one transaction. If None, all
+            picks are written in one transaction.
         '''
         if self.db_id is None:
             # If the db_id is None, insert a new catalog.
@@ -301,16 +366,66 @@ class Catalog(object):
                 raise RuntimeError("The event catalog with ID=%d was not found in the database.", self.db_id)
 
 
-        # Write or update all events of the catalog to the database.
-        for cur_pick in [x for x in self.picks if x.changed is True]:
-            cur_pick.write_to_database(project)
+        # Write or update all picks of the catalog to the database.
+        self.write_picks_to_database(project,
+                                     picks = [x for x in self.picks if x.changed is True],
+                                     chunk_size = chunk_size)
+
+
+    def write_picks_to_database(self, project, picks, chunk_size = None):
+        ''' Write picks of the catalog to the database in bulk.
+
+        New picks are inserted, the existing ones are updated. The database
+        ids of the inserted picks are set. Picks without a recorder stream
+        are skipped.
+
+        Parameters
+        ----------
+        project : :class:`psysmon.core.project.Project`
+            The project providing the database.
+
+        picks : list of :class:`Pick`
+            The picks to write.
+
+        chunk_size : Integer
+            The number of picks written in one transaction. If None, all
+            picks are written in one transaction.
+
+        Returns
+        -------
+        ids : List of Integer
+            The database ids of the picks. None for skipped picks.
+        '''
+        rows = [x.get_db_values() for x in picks]
+        write_picks = [x for x, y in zip(picks, rows) if y is not None]
+        write_rows = [x for x in rows if x is not None]
+        try:
+            db_util.bulk_write(project.dbEngine,
+                               table = project.dbTables['pick'],
+                               rows = write_rows,
+                               chunk_size = chunk_size,
+                               return_ids = True)
+        finally:
+            # Set the ids of the picks inserted before a possible error.
+            inserted = []
+            for cur_pick, cur_row in zip(write_picks, write_rows):
+                if cur_pick.db_id is None and cur_row['id'] is not None:
+                    cur_pick.db_id = cur_row['id']
+                    inserted.append(cur_pick)
+            self.reindex_picks(inserted)
+
+        for cur_pick in write_picks:
+            cur_pick.changed = False
+
+        return [x['id'] if x is not None else None for x in rows]
 
 
     def load_picks(self, project, start_time = None, end_time = None,
-            pick_id = None, event_id = None):
+            pick_id = None, event_id = None, page_size = 1000):
         ''' Load picks from the database.
 
-        The query can be limited using the allowed keyword arguments.
+        The query can be limited using the allowed keyword arguments. The
+        picks are loaded in pages using :meth:`iter_picks`.
 
         Parameters
         ----------
@@ -320,11 +435,47 @@ class Catalog(object):
         end_time : :class:`obspy.core.utcdatetime.UTCDateTime`
             The end of the time-span to load.
 
-        pick_id : Integer
-            The database ID of the pick.
+        pick_id : List of Integer
+            The database IDs of the picks.
 
         event_id : List of Integer
             The id of the event to which the pick is associated to.
+
+        page_size : Integer
+            The number of picks loaded with one database query.
+        '''
+        for cur_picks in self.iter_picks(project,
+                                         start_time = start_time,
+                                         end_time = end_time,
+                                         pick_id = pick_id,
+                                         event_id = event_id,
+                                         page_size = page_size,
+                                         pages = True):
+            self.add_picks(cur_picks)
+
+
+    def iter_picks(self, project, start_time = None, end_time = None,
+                   pick_id = None, event_id = None, page_size = 1000, pages = False):
+        ''' Iterate over the picks of the catalog in the database.
+
+        The picks are loaded page by page ordered by their database id.
+        Only one page of picks is held in memory. The picks are not added to
+        the catalog. The arguments limiting the query are the same as in
+        :meth:`load_picks`.
+
+        Parameters
+        ----------
+        page_size : Integer
+            The number of picks loaded with one database query.
+
+        pages : Boolean
+            If True, yield the lists of the picks of each page instead of
+            the single picks.
+
+        Returns
+        -------
+        picks : generator
+            The generator yielding the :class:`Pick` instances.
         '''
         if project is None:
             raise RuntimeError("The project is None. Can't query the database without a project.")
@@ -334,30 +485,93 @@ class Catalog(object):
             pick_table = project.dbTables['pick']
             query = db_session.query(pick_table).\
                     filter(pick_table.catalog_id == self.db_id)
+            query = query.filter(*self.get_picks_filter(pick_table,
+                                                        start_time = start_time,
+                                                        end_time = end_time,
+                                                        pick_id = pick_id,
+                                                        event_id = event_id))
+
+            for cur_page in db_util.iter_query_pages(query,
+                                                     id_column = pick_table.id,
+                                                     page_size = page_size):
+                cur_picks = []
+                for cur_orm in cur_page:
+                    try:
+                        cur_picks.append(Pick.from_orm(cur_orm, inventory = project.geometry_inventory))
+                    except:
+                        self.logger.exception("Error when creating an pick object from database values for pick %d. Skipping this pick.", cur_orm.id)
+                # Release the ORM instances of the page.
+                db_session.expunge_all()
+
+                if pages:
+                    yield cur_picks
+                else:
+                    for cur_pick in cur_picks:
+                        yield cur_pick
+        finally:
+            db_session.close()
 
-            if start_time:
-                query = query.filter(pick_table.time >= start_time.timestamp)
 
-            if end_time:
-                query = query.filter(pick_table.time <= end_time.timestamp)
+    def load_pick_array(self, project, start_time = None, end_time = None,
+                        pick_id = None, event_id = None, page_size = 10000):
+        ''' Load the picks as a numpy structured array.
+
+        Only the numeric columns of the picks are selected, no pick objects
+        are created. The picks are not added to the catalog. The arguments
+        limiting the query are the same as in :meth:`load_picks`.
+
+        Returns
+        -------
+        picks : :class:`numpy.ndarray`
+            The structured array with the fields id, stream_id, ev_id, time,
+            amp1 and amp2 ordered by the id. A missing ev_id is set to -1,
+            a missing amp2 to NaN.
+        '''
+        if project is None:
+            raise RuntimeError("The project is None. Can't query the database without a project.")
 
-            if pick_id:
-                query = query.filter(pick_table.id in pick_id)
+        pick_table = project.dbTables['pick']
+        columns = [pick_table.id,
+                   pick_table.stream_id,
+                   sqlalchemy.func.coalesce(pick_table.ev_id, -1).label('ev_id'),
+                   pick_table.time,
+                   pick_table.amp1,
+                   pick_table.amp2]
+        query = sqlalchemy.select(columns).where(pick_table.catalog_id == self.db_id)
+        for cur_filter in self.get_picks_filter(pick_table,
+                                                start_time = start_time,
+                                                end_time = end_time,
+                                                pick_id = pick_id,
+                                                event_id = event_id):
+            query = query.where(cur_filter)
+
+        return db_util.query_to_array(project.dbEngine,
+                                      query = query,
+                                      dtype = pick_array_dtype,
+                                      id_column = pick_table.id,
+                                      page_size = page_size)
+
+
+    def get_picks_filter(self, pick_table, start_time = None, end_time = None,
+                         pick_id = None, event_id = None):
+        ''' Get the filter expressions of a picks query.
+        '''
+        filters = []
+        if start_time:
+            filters.append(pick_table.time >= start_time.timestamp)
 
-            if event_id:
-                query = query.filter(sqlalchemy.or_(pick_table.ev_id == x for x in event_id))
+        if end_time:
+            filters.append(pick_table.time <= end_time.timestamp)
 
-            picks_to_add = []
-            for cur_orm in query:
-                try:
-                    cur_pick = Pick.from_orm(cur_orm, inventory = project.geometry_inventory)
-                    picks_to_add.append(cur_pick)
-                except:
-                    self.logger.exception("Error when creating an pick object from database values for pick %d. Skipping this pick.", cur_orm.id)
-            self.add_picks(picks_to_add)
+        if pick_id:
+            if isinstance(pick_id, (int, long)):
+                pick_id = [pick_id, ]
+            filters.append(pick_table.id.in_(pick_id))
 
-        finally:
-            db_session.close()
+        if event_id:
+            filters.append(pick_table.ev_id.in_(event_id))
+
+        return filters
 
     def delete_picks_from_db(self, project, picks):
         ''' Delete picks from the database and the catalog.
@@ -366,12 +580,14 @@ class Catalog(object):
             res = cur_pick.delete_from_db(project = project)
             if res == 1:
                 self.picks.remove(cur_pick)
+                self.pick_index.remove([cur_pick, ])
 
 
     def clear_picks(self):
         ''' Clear the picks list.
         '''
         self.picks = []
+        self.pick_index.clear()
 
 
     @classmethod
@@ -471,21 +687,72 @@ class Pick(object):
         return '/pick/' + str(self.db_id)
 
 
-    def write_to_database(self, project):
-        ''' Write the pick to the pSysmon database.
+    def get_stream(self):
+        ''' Get the recorder stream assigned to the channel at the pick time.
+
+        Returns
+        -------
+        stream : :class:`psysmon.packages.geometry.inventory.RecorderStream`
+            The recorder stream. None if no unique stream was found.
         '''
         stream_timebox = self.channel.get_stream(start_time = self.time,
                                                  end_time = self.time)
 
         if not stream_timebox:
             self.logger.error('No stream in channel %s found for the time pick: %f.', self.channel.scnl, self.time)
-            return
+            return None
 
         if len(stream_timebox) > 1:
             self.logger.error("More than one stream found for channel %s and time pick %f. This shouldn't happen. Check your geometry database for miss-assigend streams.", self.channel.scnl, self.time)
-            return
+            return None
+
+        return stream_timebox[0].item
+
+
+    def get_db_values(self):
+        ''' Get the values of the pick database table row.
+
+        Returns
+        -------
+        values : dict
+            The column values of the pick. The key 'id' holds the db_id.
+            None if no recorder stream was found for the pick.
+        '''
+        stream = self.get_stream()
+        if stream is None:
+            return None
+
+        if self.creation_time is not None:
+            creation_time = self.creation_time.isoformat()
+        else:
+            creation_time = None
+
+        if self.parent is not None:
+            catalog_id = self.parent.db_id
         else:
-            stream = stream_timebox[0].item
+            catalog_id = None
+
+        return {'id': self.db_id,
+                'catalog_id': catalog_id,
+                'stream_id': stream.id,
+                'ev_id': self.event_id,
+                'label': self.label,
+                'time': self.time.timestamp,
+                'amp1': self.amp1,
+                'amp2': self.amp2,
+                'first_motion': self.first_motion,
+                'error': self.error,
+                'agency_uri': self.agency_uri,
+                'author_uri': self.author_uri,
+                'creation_time': creation_time}
+
+
+    def write_to_database(self, project):
+        ''' Write the pick to the pSysmon database.
+        '''
+        stream = self.get_stream()
+        if stream is None:
+            return
 
         if self.db_id is None:
             # If the db_id is None, insert a new pick.
@@ -518,6 +785,8 @@ class Pick(object):
             db_session.commit()
             self.db_id = pick_orm.id
             db_session.close()
+            if self.parent is not None:
+                self.parent.reindex_picks([self, ])
         else:
             # If the db_id is not None, update the existing pick.
             db_session = project.getDbSession()
@@ -363,6 +363,7 @@ class PickTool(InteractivePlugin):
                 nearest_pick.amp1 = snap_y
                 if event_id:
                     nearest_pick.event_id = event_id
+                cur_catalog.reindex_picks([nearest_pick, ])
                 nearest_pick.write_to_database(self.parent.project)
                 cur_pick = nearest_pick
 
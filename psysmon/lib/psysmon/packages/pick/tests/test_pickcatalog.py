@@ -236,6 +236,18 @@ class PickCatalogTestCase(unittest.TestCase):
 
         self.assertEqual(len(load_catalog.picks), 2)
 
+        # Load the picks with the given ids.
+        load_catalog.clear_picks()
+        load_catalog.load_picks(self.project, pick_id = [pick2.db_id, ])
+        self.assertEqual([x.db_id for x in load_catalog.picks], [pick2.db_id, ])
+
+        # Load the picks as a structured array.
+        pick_array = load_catalog.load_pick_array(self.project, page_size = 1)
+        self.assertEqual(list(pick_array['id']), [pick1.db_id, pick2.db_id])
+        self.assertEqual(list(pick_array['amp1']), [10, 20])
+        self.assertEqual(list(pick_array['ev_id']), [-1, -1])
+        self.assertTrue(all(pick_array['amp2'] != pick_array['amp2']))
+
 
 
 def suite():
@@ -25,6 +25,109 @@ from psysmon.core.preferences_manager import IntegerSpinPrefItem
 from psysmon.core.preferences_manager import CheckBoxPrefItem
 import numpy as np
 import scipy as sp
+import scipy.signal
+
+
+def get_filter_coefficients(btype, sps, corners, freqmin = None, freqmax = None, freq = None):
+    ''' Design a butterworth filter.
+
+    The filter design follows the filters of :mod:`obspy.signal.filter`.
+    The numerator and denominator coefficients are used, because the
+    second-order sections filter functions are not available in the
+    supported scipy versions.
+
+    Parameters
+    ----------
+    btype : String (bandpass, lowpass, highpass)
+        The type of the filter.
+
+    sps : float
+        The sampling rate of the data.
+
+    corners : Integer
+        The number of corners of the filter.
+
+    freqmin : float
+        The lower corner frequency of the bandpass filter.
+
+    freqmax : float
+        The upper corner frequency of the bandpass filter.
+
+    freq : float
+        The corner frequency of the lowpass or highpass filter.
+
+    Returns
+    -------
+    b : :class:`numpy.ndarray`
+        The numerator coefficients of the filter.
+
+    a : :class:`numpy.ndarray`
+        The denominator coefficients of the filter.
+    '''
+    fe = 0.5 * sps
+    if btype == 'bandpass':
+        if freqmax / fe - 1.0 > -1e-6:
+            # The upper corner frequency is above the Nyquist frequency.
+            return get_filter_coefficients('highpass', sps, corners, freq = freqmin)
+        if freqmin / fe > 1:
+            raise ValueError('The selected low corner frequency is above the Nyquist frequency.')
+        wn = [freqmin / fe, freqmax / fe]
+        btype = 'band'
+    elif btype == 'lowpass':
+        wn = min(freq / fe, 1.)
+    elif btype == 'highpass':
+        wn = freq / fe
+        if wn > 1:
+            raise ValueError('The selected corner frequency is above the Nyquist frequency.')
+    else:
+        raise ValueError('The filter type %s is not supported.' % btype)
+
+    return scipy.signal.iirfilter(corners, wn, btype = btype,
+                                  ftype = 'butter', output = 'ba')
+
+
+def filter_stateful(stream, state, btype, corners, **kwargs):
+    ''' Apply a causal butterworth filter continuing the previous data.
+
+    The filter state of each trace is saved in the state dictionary. If a
+    trace continues the previously filtered trace with the same id, the
+    filter is initialized with the saved state. Otherwise, the filter
+    starts from rest like :meth:`obspy.core.Stream.filter`.
+
+    Parameters
+    ----------
+    stream : :class:`obspy.core.Stream`
+        The data to filter.
+
+    state : Dictionary
+        The filter state of the traces.
+
+    btype : String (bandpass, lowpass, highpass)
+        The type of the filter.
+
+    corners : Integer
+        The number of corners of the filter.
+
+    kwargs :
+        The corner frequencies passed to :func:`get_filter_coefficients`.
+    '''
+    for tr in stream.traces:
+        sps = tr.stats.sampling_rate
+        cur_state = state.get(tr.id, None)
+        if cur_state is None or cur_state['sps'] != sps or abs(tr.stats.starttime - cur_state['next_time']) >= 0.5 / sps:
+            b, a = get_filter_coefficients(btype, sps, corners, **kwargs)
+            zi = np.zeros(max(len(a), len(b)) - 1)
+        else:
+            b = cur_state['b']
+            a = cur_state['a']
+            zi = cur_state['zi']
+
+        tr.data, zi = scipy.signal.lfilter(b, a, tr.data.astype(np.float64), zi = zi)
+        state[tr.id] = {'sps': sps,
+                        'next_time': tr.stats.endtime + 1. / sps,
+                        'b': b,
+                        'a': a,
+                        'zi': zi}
 
 
 class Detrend(ProcessingNode):
@@ -114,6 +217,7 @@ class FilterBandPass(ProcessingNode):
 
     '''
     nodeClass = 'common'
+    stateful = True
 
     def __init__(self, **kwargs):
         ''' The constructor
@@ -166,21 +270,39 @@ class FilterBandPass(ProcessingNode):
 
 
 
-    def execute(self, stream, process_limits = None):
+    def is_stateful(self):
+        ''' Check if the node continues the processing of the previous data.
+
+        A zero phase filter can't be continued.
+        '''
+        return not self.pref_manager.get_value('zero_phase')
+
+
+    def execute(self, stream, process_limits = None, state = None):
         ''' Execute the stack node.
 
         Parameters
         ----------
         stream : :class:`obspy.core.Stream`
             The data to process.
+
+        state : Dictionary
+            The filter state of the previously processed data. A zero
+            phase filter can't be continued and ignores the state.
         '''
         #self.logger.debug('Executing the processing node.')
-        stream.filter('bandpass',
-                      freqmin = self.pref_manager.get_value('min. frequ.'),
-                      freqmax = self.pref_manager.get_value('max. frequ.'),
-                      corners = self.pref_manager.get_value('corners'),
-                      zerophase = self.pref_manager.get_value('zero_phase')
-                     )
+        if state is not None and self.is_stateful():
+            filter_stateful(stream, state, 'bandpass',
+                            corners = self.pref_manager.get_value('corners'),
+                            freqmin = self.pref_manager.get_value('min. frequ.'),
+                            freqmax = self.pref_manager.get_value('max. frequ.'))
+        else:
+            stream.filter('bandpass',
+                          freqmin = self.pref_manager.get_value('min. frequ.'),
+                          freqmax = self.pref_manager.get_value('max. frequ.'),
+                          corners = self.pref_manager.get_value('corners'),
+                          zerophase = self.pref_manager.get_value('zero_phase')
+                         )
 
 
 
@@ -189,6 +311,7 @@ class FilterLowPass(ProcessingNode):
 
     '''
     nodeClass = 'common'
+    stateful = True
 
     def __init__(self, **kwargs):
         ''' The constructor
@@ -234,19 +357,36 @@ class FilterLowPass(ProcessingNode):
 
 
 
-    def execute(self, stream, process_limits = None):
+    def is_stateful(self):
+        ''' Check if the node continues the processing of the previous data.
+
+        A zero phase filter can't be continued.
+        '''
+        return not self.pref_manager.get_value('zero_phase')
+
+
+    def execute(self, stream, process_limits = None, state = None):
         ''' Execute the stack node.
 
         Parameters
         ----------
         stream : :class:`obspy.core.Stream`
             The data to process.
+
+        state : Dictionary
+            The filter state of the previously processed data. A zero
+            phase filter can't be continued and ignores the state.
         '''
         #self.logger.debug('Executing the processing node.')
-        stream.filter('lowpass',
-                      freq = self.pref_manager.get_value('frequ.'),
-                      zerophase = self.pref_manager.get_value('zero_phase')
-                     )
+        if state is not None and self.is_stateful():
+            filter_stateful(stream, state, 'lowpass',
+                            corners = self.pref_manager.get_value('corners'),
+                            freq = self.pref_manager.get_value('frequ.'))
+        else:
+            stream.filter('lowpass',
+                          freq = self.pref_manager.get_value('frequ.'),
+                          zerophase = self.pref_manager.get_value('zero_phase')
+                         )
 
 
 
@@ -256,6 +396,7 @@ class FilterHighPass(ProcessingNode):
 
     '''
     nodeClass = 'common'
+    stateful = True
 
     def __init__(self, **kwargs):
         ''' The constructor
@@ -297,19 +438,36 @@ class FilterHighPass(ProcessingNode):
         #self.logger = logging.getLogger(loggerName)
 
 
-    def execute(self, stream, process_limits = None):
+    def is_stateful(self):
+        ''' Check if the node continues the processing of the previous data.
+
+        A zero phase filter can't be continued.
+        '''
+        return not self.pref_manager.get_value('zero_phase')
+
+
+    def execute(self, stream, process_limits = None, state = None):
         ''' Execute the stack node.
 
         Parameters
         ----------
         stream : :class:`obspy.core.Stream`
             The data to process.
+
+        state : Dictionary
+            The filter state of the previously processed data. A zero
+            phase filter can't be continued and ignores the state.
         '''
         #self.logger.debug('Executing the processing node.')
-        stream.filter('highpass',
-                      freq = self.pref_manager.get_value('frequ.'),
-                      zerophase = self.pref_manager.get_value('zero_phase')
-                     )
+        if state is not None and self.is_stateful():
+            filter_stateful(stream, state, 'highpass',
+                            corners = self.pref_manager.get_value('corners'),
+                            freq = self.pref_manager.get_value('frequ.'))
+        else:
+            stream.filter('highpass',
+                          freq = self.pref_manager.get_value('frequ.'),
+                          zerophase = self.pref_manager.get_value('zero_phase')
+                         )
 
 
 class ConvertToSensorUnits(ProcessingNode):
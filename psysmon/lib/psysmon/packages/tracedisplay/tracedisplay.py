@@ -34,6 +34,7 @@ import psysmon.core.gui as psygui
 import psysmon.core.packageNodes
 from psysmon.core.packageNodes import CollectionNode
 from psysmon.core.processingStack import ProcessingStack
+from psysmon.core.waveclient import stream_view
 from psysmon.packages.geometry.inventory import Inventory
 from psysmon.packages.geometry.db_inventory import DbInventory
 from obspy.core.utcdatetime import UTCDateTime
@@ -2076,28 +2077,11 @@ class DataManager():
 
         This method overwrites the existing stream.
         '''
-        dataSources = {}
-        for curScnl in scnl:
-            if curScnl in self.project.scnlDataSources.keys():
-                if self.project.scnlDataSources[curScnl] not in dataSources.keys():
-                    dataSources[self.project.scnlDataSources[curScnl]] = [curScnl, ]
-                else:
-                    dataSources[self.project.scnlDataSources[curScnl]].append(curScnl)
-            else:
-                if self.project.defaultWaveclient not in dataSources.keys():
-                    dataSources[self.project.defaultWaveclient] = [curScnl, ]
-                else:
-                    dataSources[self.project.defaultWaveclient].append(curScnl)
-
-        self.origStream = Stream()
-
-        for curName in dataSources.iterkeys():
-            self.logger.debug("curName: %s", curName)
-            curWaveclient = self.project.waveclient[curName]
-            curStream =  curWaveclient.getWaveform(startTime = startTime,
-                                                   endTime = endTime,
-                                                   scnl = scnl)
-            self.origStream += curStream
+        self.origStream = self.project.request_data_stream(start_time = startTime,
+                                                           end_time = endTime,
+                                                           scnl = scnl,
+                                                           read_only = True,
+                                                           prefetch = True)
 
 
 
@@ -2122,16 +2106,11 @@ class DataManager():
         ''' Add a stream to the existing stream.
 
         '''
-        if scnl in self.project.scnlDataSources.keys():
-            dataSource = self.project.scnlDataSources[scnl] 
-        else:
-            dataSource = self.project.defaultWaveclient
-
-        curWaveClient = self.project.waveclient[dataSource]
-
-        curStream = curWaveClient.getWaveform(startTime = startTime,
-                                              endTime = endTime,
-                                              scnl = scnl)
+        curStream = self.project.request_data_stream(start_time = startTime,
+                                                     end_time = endTime,
+                                                     scnl = scnl,
+                                                     read_only = True,
+                                                     prefetch = True)
 
         self.origStream = self.origStream + curStream
         return curStream
@@ -2150,7 +2129,7 @@ class DataManager():
         # TODO: Add the real processing stack class.
         if not scnl:
             # No SCNL is specified, process the whole stream.
-            self.procStream = self.origStream.copy()
+            self.procStream = stream_view(self.origStream)
             #self.procStream.detrend(type = 'constant')
             self.processingStack.execute(self.procStream)
         else:
@@ -2160,7 +2139,7 @@ class DataManager():
                                                    channel = curScnl[1],
                                                    network = curScnl[2],
                                                    location = curScnl[3])
-                curStream = curStream.copy()
+                curStream = stream_view(curStream)
                 self.processingStack.execute(curStream)
                 self.procStream += curStream
 
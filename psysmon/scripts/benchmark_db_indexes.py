@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# LICENSE
+#
+# This file is part of pSysmon.
+#
+# If you use pSysmon in any program or publication, please inform and
+# acknowledge its author Stefan Mertl (stefan@mertl-research.at).
+#
+# pSysmon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Benchmark the time span queries of the traceheader table.
+
+A SQLite database with a generated traceheader table is created. The
+waveclient time span query is timed using the end time computed from the
+number of samples without indexes and using the stored end time with the
+recorder stream time indexes.
+
+Usage: benchmark_db_indexes.py [N_ROWS] [DB_FILE]
+
+:copyright:
+    Stefan Mertl
+
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/licenses/gpl-3.0.html)
+'''
+
+import sys
+import time
+import random
+
+import sqlalchemy as sqa
+from sqlalchemy.ext.declarative import declarative_base
+
+import psysmon.packages.obspyImportWaveform as obspy_import
+
+
+def fill_table(engine, table, n_rows, n_recorders = 50, file_length = 3600., sps = 100):
+    ''' Fill the traceheader table with hourly files of 3 streams per recorder.
+    '''
+    streams = ['00:HHZ', '00:HHN', '00:HHE']
+    n_files = n_rows // (n_recorders * len(streams))
+    start_time = 1.4e9
+    rows = []
+    for cur_recorder in range(n_recorders):
+        for cur_stream in streams:
+            for k in range(n_files):
+                begin_time = start_time + k * file_length
+                rows.append({'file_type': 'mseed',
+                             'wf_id': 1,
+                             'filename': 'R%03d_%s_%06d.msd' % (cur_recorder, cur_stream[-1], k),
+                             'orig_path': '',
+                             'recorder_serial': 'R%03d' % cur_recorder,
+                             'stream': cur_stream,
+                             'sps': sps,
+                             'numsamp': int(file_length * sps),
+                             'begin_date': '',
+                             'begin_time': begin_time,
+                             'end_time': begin_time + file_length})
+                if len(rows) >= 10000:
+                    engine.execute(table.insert(), rows)
+                    rows = []
+    if rows:
+        engine.execute(table.insert(), rows)
+
+    return start_time, start_time + n_files * file_length, n_recorders
+
+
+def time_queries(engine, table, header_end, requests):
+    ''' Time the stream queries and return the mean query time.
+    '''
+    t_start = time.time()
+    n_rows = 0
+    for cur_serial, cur_start, cur_end in requests:
+        query = sqa.select([table.c.filename, table.c.begin_time, header_end]).\
+                where(table.c.recorder_serial == cur_serial).\
+                where(table.c.stream == '00:HHZ').\
+                where(header_end > cur_start).\
+                where(table.c.begin_time < cur_end)
+        n_rows += len(engine.execute(query).fetchall())
+    return (time.time() - t_start) / len(requests), n_rows
+
+
+def run():
+    n_rows = 1000000
+    db_file = ''
+    if len(sys.argv) > 1:
+        n_rows = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        db_file = sys.argv[2]
+
+    engine = sqa.create_engine('sqlite:///' + db_file)
+    tables = obspy_import.databaseFactory(declarative_base())
+    header = [x for x in tables if x.__tablename__ == 'traceheader'][0]
+    table = header.__table__
+
+    # Create the table without the indexes.
+    indexes = list(table.indexes)
+    table.indexes.clear()
+    table.create(engine)
+
+    print "Filling the traceheader table with %d rows..." % n_rows
+    t_start = time.time()
+    start_time, end_time, n_recorders = fill_table(engine, table, n_rows)
+    print "...done in %.1f s." % (time.time() - t_start)
+
+    # Random requests of 10 minute windows.
+    random.seed(0)
+    requests = []
+    for k in range(50):
+        cur_start = random.uniform(start_time, end_time - 600)
+        requests.append(('R%03d' % random.randrange(n_recorders), cur_start, cur_start + 600))
+
+    computed_end = (table.c.begin_time + table.c.numsamp * 1. / table.c.sps).label('end_time')
+    t_computed, n_computed = time_queries(engine, table, computed_end, requests)
+    t_stored, n_stored = time_queries(engine, table, table.c.end_time, requests)
+
+    print "Creating the indexes..."
+    for cur_index in indexes:
+        cur_index.create(engine)
+    engine.execute('ANALYZE')
+    t_indexed, n_indexed = time_queries(engine, table, table.c.end_time, requests)
+
+    if not n_computed == n_stored == n_indexed:
+        print "The queries returned different results."
+
+    print "Mean query time:"
+    print "    computed end time, no indexes: %8.3f ms" % (t_computed * 1000)
+    print "    stored end time, no indexes:   %8.3f ms" % (t_stored * 1000)
+    print "    stored end time, indexes:      %8.3f ms" % (t_indexed * 1000)
+    print "    speedup: %.0fx" % (t_computed / t_indexed)
+
+
+if __name__ == '__main__':
+    run()
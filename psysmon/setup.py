@@ -139,7 +139,9 @@ def configuration(parent_package = '', top_path = None):
 
     # LIBSIGNAL
     path = os.path.join(root_dir, 'core', 'src')
-    files = [os.path.join(path, 'moving_average.c'), ]
+    files = [os.path.join(path, 'moving_average.c'),
+             os.path.join(path, 'event_limits.c'),
+             os.path.join(path, 'sta_lta.c')]
     printRaw(files)
     config.add_extension(get_lib_name('signal'),
                          sources = files)